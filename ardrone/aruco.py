@@ -64,72 +64,80 @@ _Handle = ct.POINTER(ct.c_int32)
 _Size = ct.c_uint64
 _ImagePtr = ct.POINTER(_Image)
 
-# Load the DLL
-_dll = native.load_dll('libcaruco')
-if _dll is None:
-  raise ImportError('Could not load caruco native library.')
-
-# Function return and argument types
-_dll.aruco_error_last_str.restype = ct.c_char_p
-
-_dll.aruco_board_new.restype = _Handle
-_dll.aruco_board_free.argtypes = ( _Handle, )
-_dll.aruco_board_draw_3d_axis.argtypes = ( _Handle, _ImagePtr, _Handle )
-_dll.aruco_board_draw_3d_cube.argtypes = ( _Handle, _ImagePtr, _Handle )
-_dll.aruco_board_get_extrinsics.argtypes = ( _Handle, ct.POINTER(ct.c_float), ct.POINTER(ct.c_float) )
-
-_dll.aruco_board_configuration_new.restype = _Handle
-_dll.aruco_board_configuration_free.argtypes = ( _Handle, )
-_dll.aruco_board_configuration_save_to_file.restype = _Status
-_dll.aruco_board_configuration_save_to_file.argtypes = ( _Handle, ct.c_char_p )
-_dll.aruco_board_configuration_read_from_file.restype = _Status
-_dll.aruco_board_configuration_read_from_file.argtypes = ( _Handle, ct.c_char_p )
-_dll.aruco_board_configuration_marker_ids.argtypes = ( _Handle, ct.POINTER(ct.c_int) )
-
-_dll.aruco_detect_board.restype = _Status
-_dll.aruco_detect_board.argtypes = ( _Handle, _Handle, _Handle, _Handle, ct.c_float, ct.POINTER(ct.c_float) )
-
-_dll.aruco_camera_parameters_new.restype = _Handle
-_dll.aruco_camera_parameters_free.argtypes = ( _Handle, )
-_dll.aruco_camera_parameters_is_valid.argtypes = ( _Handle, )
-_dll.aruco_camera_parameters_save_to_file.restype = _Status
-_dll.aruco_camera_parameters_save_to_file.argtypes = ( _Handle, ct.c_char_p )
-_dll.aruco_camera_parameters_read_from_file.restype = _Status
-_dll.aruco_camera_parameters_read_from_file.argtypes = ( _Handle, ct.c_char_p )
-_dll.aruco_camera_parameters_read_from_xml_file.restype = _Status
-_dll.aruco_camera_parameters_read_from_xml_file.argtypes = ( _Handle, ct.c_char_p )
-_dll.aruco_camera_parameters_resize.argtypes = ( _Handle, ct.POINTER(_Size) )
-_dll.aruco_camera_parameters_get_camera_matrix.argtypes = ( _Handle, ct.POINTER(ct.c_float) )
-_dll.aruco_camera_parameters_get_distortion_coeffs.argtypes = ( _Handle, ct.POINTER(ct.c_float) )
-
-_dll.aruco_marker_new.restype = _Handle
-_dll.aruco_marker_free.argtypes = ( _Handle, )
-_dll.aruco_marker_copy_from.argtypes = ( _Handle, _Handle )
-_dll.aruco_marker_is_valid.argtypes = ( _Handle, )
-_dll.aruco_marker_id.argtypes = ( _Handle, )
-_dll.aruco_marker_calculate_extrinsics.restype = _Status
-_dll.aruco_marker_calculate_extrinsics.argtypes = ( _Handle, ct.c_float, _Handle )
-_dll.aruco_marker_draw.argtypes = (
-    _Handle, _ImagePtr,
-    ct.c_float, ct.c_float, ct.c_float, ct.c_int, ct.c_int
-)
-_dll.aruco_marker_centroid_x.argtypes = (_Handle, )
-_dll.aruco_marker_centroid_y.argtypes = (_Handle, )
-_dll.aruco_marker_draw_3d_axis.argtypes = ( _Handle, _ImagePtr, _Handle )
-_dll.aruco_marker_draw_3d_cube.argtypes = ( _Handle, _ImagePtr, _Handle )
-
-_dll.aruco_detect_markers.restype = _Status
-_dll.aruco_detect_markers.argtypes = ( _ImagePtr, _Handle )
-_dll.aruco_detect_markers_full.restype = _Status
-_dll.aruco_detect_markers_full.argtypes = ( _ImagePtr, _Handle, _Handle, ct.c_float )
-
-_dll.aruco_marker_vector_new.restype = _Handle
-_dll.aruco_marker_vector_free.argtypes = ( _Handle, )
-_dll.aruco_marker_vector_clear.argtypes = ( _Handle, )
-_dll.aruco_marker_vector_size.argtypes = ( _Handle, )
-_dll.aruco_marker_vector_element.restype = _Handle
-_dll.aruco_marker_vector_element.argtypes = ( _Handle, _Size )
-_dll.aruco_marker_vector_push_back.argtypes = ( _Handle, _Handle )
+def _configure(dll):
+  """Set the return and argument types of the functions in the caruco
+  library *dll*. Called when the library is first used.
+
+  """
+  dll.aruco_error_last_str.restype = ct.c_char_p
+
+  dll.aruco_board_new.restype = _Handle
+  dll.aruco_board_free.argtypes = ( _Handle, )
+  dll.aruco_board_draw_3d_axis.argtypes = ( _Handle, _ImagePtr, _Handle )
+  dll.aruco_board_draw_3d_cube.argtypes = ( _Handle, _ImagePtr, _Handle )
+  dll.aruco_board_get_extrinsics.argtypes = ( _Handle, ct.POINTER(ct.c_float), ct.POINTER(ct.c_float) )
+
+  dll.aruco_board_configuration_new.restype = _Handle
+  dll.aruco_board_configuration_free.argtypes = ( _Handle, )
+  dll.aruco_board_configuration_save_to_file.restype = _Status
+  dll.aruco_board_configuration_save_to_file.argtypes = ( _Handle, ct.c_char_p )
+  dll.aruco_board_configuration_read_from_file.restype = _Status
+  dll.aruco_board_configuration_read_from_file.argtypes = ( _Handle, ct.c_char_p )
+  dll.aruco_board_configuration_marker_ids.argtypes = ( _Handle, ct.POINTER(ct.c_int) )
+
+  dll.aruco_detect_board.restype = _Status
+  dll.aruco_detect_board.argtypes = ( _Handle, _Handle, _Handle, _Handle, ct.c_float, ct.POINTER(ct.c_float) )
+
+  # Older builds of the native library do not provide batched board
+  # detection. In that case detect_boards() falls back to calling
+  # aruco_detect_board for each board in turn.
+  if hasattr(dll, 'aruco_detect_boards'):
+    dll.aruco_detect_boards.restype = _Status
+    dll.aruco_detect_boards.argtypes = (
+        ct.POINTER(_Handle), ct.POINTER(_Handle), ct.POINTER(_Handle), ct.c_size_t,
+        _Handle, ct.c_float, ct.POINTER(ct.c_float) )
+
+  dll.aruco_camera_parameters_new.restype = _Handle
+  dll.aruco_camera_parameters_free.argtypes = ( _Handle, )
+  dll.aruco_camera_parameters_is_valid.argtypes = ( _Handle, )
+  dll.aruco_camera_parameters_save_to_file.restype = _Status
+  dll.aruco_camera_parameters_save_to_file.argtypes = ( _Handle, ct.c_char_p )
+  dll.aruco_camera_parameters_read_from_file.restype = _Status
+  dll.aruco_camera_parameters_read_from_file.argtypes = ( _Handle, ct.c_char_p )
+  dll.aruco_camera_parameters_read_from_xml_file.restype = _Status
+  dll.aruco_camera_parameters_read_from_xml_file.argtypes = ( _Handle, ct.c_char_p )
+  dll.aruco_camera_parameters_resize.argtypes = ( _Handle, ct.POINTER(_Size) )
+  dll.aruco_camera_parameters_get_camera_matrix.argtypes = ( _Handle, ct.POINTER(ct.c_float) )
+  dll.aruco_camera_parameters_get_distortion_coeffs.argtypes = ( _Handle, ct.POINTER(ct.c_float) )
+
+  dll.aruco_marker_new.restype = _Handle
+  dll.aruco_marker_free.argtypes = ( _Handle, )
+  dll.aruco_marker_copy_from.argtypes = ( _Handle, _Handle )
+  dll.aruco_marker_is_valid.argtypes = ( _Handle, )
+  dll.aruco_marker_id.argtypes = ( _Handle, )
+  dll.aruco_marker_calculate_extrinsics.restype = _Status
+  dll.aruco_marker_calculate_extrinsics.argtypes = ( _Handle, ct.c_float, _Handle )
+  dll.aruco_marker_draw.argtypes = (
+      _Handle, _ImagePtr,
+      ct.c_float, ct.c_float, ct.c_float, ct.c_int, ct.c_int
+  )
+  dll.aruco_marker_centroid_x.argtypes = (_Handle, )
+  dll.aruco_marker_centroid_y.argtypes = (_Handle, )
+  dll.aruco_marker_draw_3d_axis.argtypes = ( _Handle, _ImagePtr, _Handle )
+  dll.aruco_marker_draw_3d_cube.argtypes = ( _Handle, _ImagePtr, _Handle )
+
+  dll.aruco_detect_markers.restype = _Status
+  dll.aruco_detect_markers.argtypes = ( _ImagePtr, _Handle )
+  dll.aruco_detect_markers_full.restype = _Status
+  dll.aruco_detect_markers_full.argtypes = ( _ImagePtr, _Handle, _Handle, ct.c_float )
+
+  dll.aruco_marker_vector_new.restype = _Handle
+  dll.aruco_marker_vector_free.argtypes = ( _Handle, )
+  dll.aruco_marker_vector_clear.argtypes = ( _Handle, )
+  dll.aruco_marker_vector_size.argtypes = ( _Handle, )
+  dll.aruco_marker_vector_element.restype = _Handle
+  dll.aruco_marker_vector_element.argtypes = ( _Handle, _Size )
+  dll.aruco_marker_vector_push_back.argtypes = ( _Handle, _Handle )
 
 class ArucoError(Exception):
   """An exception which wraps an error returned from the aruco library.
@@ -148,16 +156,31 @@ class ArucoError(Exception):
       return str(self.msg)
     return "%s: %s" % (self.code, self.msg)
 
+# The DLL is only loaded, which is slow, when it is first used. Finding it is
+# quick so that importing this module still fails if it is not there. A DLL
+# which is there but cannot be loaded raises ArucoError when first used.
+if native.find_dll('libcaruco') is None:
+  raise ImportError('Could not find caruco native library.')
+_dll = native.LazyDLL('libcaruco', _configure, error=ArucoError)
+
+def load():
+  """Load the native aruco library now rather than when it is first used.
+  Raises ArucoError if it cannot be loaded.
+
+  """
+  _dll.load()
+
 # Internal classes
 
 class _HandleWrapper(object):
   """A wrapper around an aruco handle. Set the class attributes ``_new``,
-  ``_free`` and (optionally) ``_copy`` in a derived class.
+  ``_free`` and (optionally) ``_copy`` in a derived class to the names of the
+  corresponding library functions.
 
   """
   def __init__(self):
-    assert _dll is not None
-    self.handle = self.__class__._new()
+    self.handle = None
+    self.handle = getattr(_dll, self.__class__._new)()
 
   def __enter__(self):
     return self
@@ -170,14 +193,14 @@ class _HandleWrapper(object):
 
   def copy_from(self, other_handle):
     if hasattr(self.__class__, '_copy'):
-      self.__class__._copy(self.handle, other_handle)
+      getattr(_dll, self.__class__._copy)(self.handle, other_handle)
     else:
       raise NotImplementedError('Copy not implemented')
 
   def close(self):
     if self.handle is None:
       return
-    self.__class__._free(self.handle)
+    getattr(_dll, self.__class__._free)(self.handle)
     self.handle = None
 
 def _to_image(image, allow_read_only=True):
@@ -248,8 +271,8 @@ def _to_image(image, allow_read_only=True):
   return ct.byref(im)
 
 class _MarkerVector(_HandleWrapper):
-  _new = _dll.aruco_marker_vector_new
-  _free = _dll.aruco_marker_vector_free
+  _new = 'aruco_marker_vector_new'
+  _free = 'aruco_marker_vector_free'
 
   def clear(self):
     _dll.aruco_marker_vector_clear(self.handle)
@@ -276,8 +299,8 @@ class Board(_HandleWrapper):
   """This class encapsulates the orientation and position of a detected board.
 
   """
-  _new = _dll.aruco_board_new
-  _free = _dll.aruco_board_free
+  _new = 'aruco_board_new'
+  _free = 'aruco_board_free'
 
   def draw_3d_axis(self, image, params):
     """Draw the 3d axis of this object into an image.
@@ -317,9 +340,9 @@ class BoardConfiguration(_HandleWrapper):
   """This class defines a board with several markers.
 
   """
-  _new = _dll.aruco_board_configuration_new
-  _free = _dll.aruco_board_configuration_free
-  _copy = _dll.aruco_board_configuration_copy_from
+  _new = 'aruco_board_configuration_new'
+  _free = 'aruco_board_configuration_free'
+  _copy = 'aruco_board_configuration_copy_from'
 
   def save_to_file(self, path):
     """Save the board configuration to a file.
@@ -349,13 +372,52 @@ class BoardConfiguration(_HandleWrapper):
     _dll.aruco_board_configuration_marker_ids(self.handle, ids)
     return ids[:]
 
+class BoardIndex(object):
+  """An index from marker id to the boards which contain that marker.
+
+  Build one of these once for all the boards in the arena and re-use it for
+  every frame. Markers are then assigned to their boards with one dictionary
+  lookup each rather than by scanning the id list of every board.
+
+  *configurations* is a sequence of BoardConfiguration instances. Boards are
+  referred to by their index in this sequence.
+
+  """
+  def __init__(self, configurations):
+    self.configurations = list(configurations)
+    self._boards_by_id = {}
+    for board_idx, config in enumerate(self.configurations):
+      for marker_id in config.marker_ids():
+        self._boards_by_id.setdefault(marker_id, []).append(board_idx)
+
+  def __len__(self):
+    return len(self.configurations)
+
+  def boards_for_id(self, marker_id):
+    """Return a sequence of board indices for boards containing *marker_id*."""
+    return self._boards_by_id.get(marker_id, ())
+
+  def bucket(self, markers):
+    """Split *markers* by board in one pass.
+
+    Returns a dictionary mapping board index to a list of the markers in
+    *markers* which belong to that board. Boards with no markers present do
+    not appear in the dictionary.
+
+    """
+    buckets = {}
+    for m in markers:
+      for board_idx in self._boards_by_id.get(m.id(), ()):
+        buckets.setdefault(board_idx, []).append(m)
+    return buckets
+
 class CameraParameters(_HandleWrapper):
   """Parameters of the camera.
 
   """
-  _new = _dll.aruco_camera_parameters_new
-  _free = _dll.aruco_camera_parameters_free
-  _copy = _dll.aruco_camera_parameters_copy_from
+  _new = 'aruco_camera_parameters_new'
+  _free = 'aruco_camera_parameters_free'
+  _copy = 'aruco_camera_parameters_copy_from'
 
   def is_valid(self):
     """Return True iff the parameters are valid."""
@@ -419,9 +481,9 @@ class CameraParameters(_HandleWrapper):
 class Marker(_HandleWrapper):
   """This class represents a marker.
   """
-  _new = _dll.aruco_marker_new
-  _free = _dll.aruco_marker_free
-  _copy = _dll.aruco_marker_copy_from
+  _new = 'aruco_marker_new'
+  _free = 'aruco_marker_free'
+  _copy = 'aruco_marker_copy_from'
 
   def is_valid(self):
     """Return True iff the marker is valid."""
@@ -505,6 +567,51 @@ def detect_board(markers, configuration, params, marker_size):
   _dll.aruco_detect_board(mv.handle, configuration.handle, b.handle, params.handle, marker_size, ct.byref(lik))
   return (b, lik.value)
 
+def detect_boards(markers, index, params, marker_size):
+  """Detects every board which has at least one marker in *markers*.
+
+  *markers* is a sequence of markers as returned from detect_markers.
+
+  *index* is a BoardIndex describing the boards to look for.
+
+  *params* is an instance of CameraParameters which must have been
+  initialised to the camera intrinsics.
+
+  *marker_size* is the size of the marker images in metres.
+
+  Returns a dictionary mapping board index (see BoardIndex) to a pair
+  *board, lik* as returned by detect_board. Boards with no visible markers are
+  not present in the dictionary.
+
+  """
+  buckets = index.bucket(markers)
+  board_idxs = sorted(buckets.keys())
+  if len(board_idxs) == 0:
+    return {}
+
+  if not hasattr(_dll, 'aruco_detect_boards'):
+    return dict((board_idx,
+      detect_board(buckets[board_idx], index.configurations[board_idx], params, marker_size))
+      for board_idx in board_idxs)
+
+  n_boards = len(board_idxs)
+  mvs, boards = [], []
+  for board_idx in board_idxs:
+    mv = _MarkerVector()
+    [mv.push_back(m) for m in buckets[board_idx]]
+    mvs.append(mv)
+    boards.append(Board())
+
+  HandleArray = _Handle * n_boards
+  liks = (ct.c_float * n_boards)()
+  _dll.aruco_detect_boards(
+      HandleArray(*[mv.handle for mv in mvs]),
+      HandleArray(*[index.configurations[board_idx].handle for board_idx in board_idxs]),
+      HandleArray(*[b.handle for b in boards]),
+      n_boards, params.handle, marker_size, liks)
+
+  return dict((board_idx, (boards[i], float(liks[i]))) for i, board_idx in enumerate(board_idxs))
+
 def detect_markers(image, params=None, marker_size=None):
   """Detects the markers in the image passed.
 
@@ -11,6 +11,9 @@ log = logging.getLogger()
 from . import atcommands as at
 from . import navdata
 from . import videopacket
+from ..util.metrics import registry
+from ..util.profiling import profiler, startup
+from ..util.tracing import tracer
 
 class ConnectionError(Exception):
   """A class used to represent a connection error to the drone.
@@ -63,13 +66,14 @@ class ControlLoop(object):
 
     self._connection = connection
     self._reset_sequence()
-    self._vid_decoder = videopacket.Decoder(video_cb)
+    self._vid_decoder = videopacket.Decoder(video_cb, metric_labels={'host': host})
     self._flying = False
 
-    self.navdata_cb = navdata_cb
+    self.navdata_cb = profiler.wrap(navdata_cb)
 
     # State for navdata
     self._last_navdata_sequence = 0
+    self._navdata_handled = False
 
     # State for control
     self._last_control_sequence = 0
@@ -94,6 +98,22 @@ class ControlLoop(object):
     self._config_current = None
     self._config_to_send = []
     self._config_ack_timeout = 0
+    self._config_last_sent = None
+
+    # Runtime metrics (see ardrone.util.metrics)
+    labels = {'host': host}
+    self._navdata_packets = registry.counter('ardrone_navdata_packets_total',
+        'Navdata packets received.', labels)
+    self._navdata_invalid = registry.counter('ardrone_navdata_invalid_total',
+        'Navdata packets dropped for having an invalid header.', labels)
+    self._navdata_dropped = registry.counter('ardrone_navdata_out_of_sequence_total',
+        'Navdata packets dropped for being out of sequence.', labels)
+    self._at_commands = registry.counter('ardrone_at_commands_total',
+        'AT commands sent to the drone.', labels)
+    self._config_sent = registry.counter('ardrone_config_sent_total',
+        'Configuration commands sent to the drone.', labels)
+    self._config_retries = registry.counter('ardrone_config_retries_total',
+        'Configuration commands re-sent because no acknowledgement arrived.', labels)
   
   def tick(self):
     if self._config_ack_timeout > 0:
@@ -168,10 +188,14 @@ class ControlLoop(object):
     return
 
   def _got_navdata(self, data):
+    trace = tracer.begin('navdata', 'received')
+    self._navdata_packets.inc()
     ndh, packets = navdata.split(data)
 
     if not ndh.valid():
       log.error('Got invalid navdata packet')
+      self._navdata_invalid.inc()
+      tracer.discard(trace)
       return
 
     if ndh.sequence == 1:
@@ -180,6 +204,8 @@ class ControlLoop(object):
     # Check the packet sequence number
     if ndh.sequence <= self._last_navdata_sequence:
       log.error('Dropping out of sequence navdata packet: %s' % (ndh.sequence,))
+      self._navdata_dropped.inc()
+      tracer.discard(trace)
       return
 
     # Record the sequence number
@@ -190,6 +216,7 @@ class ControlLoop(object):
       log.warning('Lost connection, re-establishing navdata connection.')
       self._last_navdata_sequence = 0
       self.start_navdata()
+      tracer.discard(trace)
       return
 
     # Dev. guide pp. 40: watchdog state
@@ -197,6 +224,7 @@ class ControlLoop(object):
     if (ndh.state & navdata.ARDRONE_COM_WATCHDOG_MASK) != 0:
       self._last_navdata_sequence = 0
       self._connection.put(ControlLoop._AT, at.comwdg()) 
+      self._at_commands.inc()
 
     # Is the AR_DRONE_NAVDATA_BOOSTRAP status bit set (Dev. guide fig 7.1)
     if (ndh.state & navdata.ARDRONE_NAVDATA_BOOTSTRAP) != 0:
@@ -211,6 +239,7 @@ class ControlLoop(object):
       self._send(at.ctrl(5))
       self._config_ack_timeout = 0
       self._config_current = None
+      self._config_last_sent = None
 
     if len(self._config_to_send) > 0 and self._config_ack_timeout == 0 and self._config_current is None:
       self._config_current = self._config_to_send[0]
@@ -222,17 +251,37 @@ class ControlLoop(object):
       self._send(at.config(key, value))
       self._config_ack_timeout = 30
 
+      # Sending the same configuration again before an ACK is a retry
+      self._config_sent.inc()
+      if self._config_current == self._config_last_sent:
+        self._config_retries.inc()
+      self._config_last_sent = self._config_current
+
     # Record flying state
     self._flying = (ndh.state & navdata.ARDRONE_FLY_MASK) != 0
 
     for packet in packets:
-      # Send a JSON encoded control packet to the controller
-      self._connection.put(ControlLoop._CONTROL_DATA, packet.json())
+      # Send a JSON encoded control packet to the controller, carrying the
+      # trace along with the demo block which the controller acts upon
+      message = packet.json()
+      if trace is not None and isinstance(packet, navdata.DemoBlock):
+        message = json.loads(message)
+        message['trace'] = tracer.export(trace, 'forwarded')
+        message = json.dumps(message)
+      self._connection.put(ControlLoop._CONTROL_DATA, message)
 
       # Call the navdata callable if one is configured
       if self.navdata_cb is not None:
         self.navdata_cb(packet)
 
+    # Startup is over once the first packet has been handled
+    if not self._navdata_handled:
+      self._navdata_handled = True
+      startup.ready('first navdata')
+
+    # Nothing was forwarded which could continue the trace
+    tracer.discard(trace)
+
   def send_config(self):
     self._config_to_send = []
 #    self._config_to_send.append(('general:navdata_demo', True))
@@ -250,6 +299,8 @@ class ControlLoop(object):
     log.info('Got config len %i' % (len(packet),))
 
   def _got_video(self, packet):
+    # Forwarded video cannot carry the trace so it is matched by contents
+    tracer.handoff(packet, tracer.begin('video', 'received'), 'forwarded')
     self._connection.put(ControlLoop._VIDEO_DATA, packet)
     self._vid_decoder.decode(packet) #comment this out when done elsewhere
 
@@ -269,6 +320,9 @@ class ControlLoop(object):
       return
     self._last_control_sequence = data['seq']
 
+    # Continue the traces of the packets which led to this command
+    traces = [tracer.adopt(t, 'control_received') for t in data.get('trace', ())]
+
     # Extract control state
     state = data['state']
     #log.debug('Control state: %r' % (state,))
@@ -284,6 +338,8 @@ class ControlLoop(object):
 
     # Send the command state
     self._send(at.pcmd(not state['hover'], False, state['roll'], state['pitch'], state['gas'], state['yaw']))
+    for trace in traces:
+      tracer.end(trace, 'at_sent')
 
     # Record this state
     self._last_control_state = state
@@ -294,3 +350,4 @@ class ControlLoop(object):
   def _send(self, cmd):
     log.debug('Sending: %r' % (cmd,))
     self._connection.put(ControlLoop._AT, cmd)
+    self._at_commands.inc(cmd.count('AT*'))
@@ -196,6 +196,48 @@ def checksum(data):
     checksum = ct.c_uint32(checksum.value + d)
   return checksum
 
+def _raw(structure):
+  return ct.string_at(ct.addressof(structure), ct.sizeof(structure))
+
+def join(state, sequence, blocks=(), vision_flag=0):
+  """Return a navdata packet with the *state* bits and *sequence* number
+  containing the option *blocks* (structures from this module whose header
+  ids are already set) followed by a checksum block. This is the reverse of
+  :py:func:`split` and is used to simulate the drone.
+
+  >>> demo = DemoBlock()
+  >>> demo.header.id = NAVDATA_DEMO_TAG
+  >>> demo.altitude = 1000
+  >>> packet = join(ARDRONE_FLY_MASK, 7, [demo])
+  >>> header, blocks = split(packet)
+  >>> header.valid(), header.sequence, header.state
+  (True, 7, 1)
+  >>> [type(b).__name__ for b in blocks]
+  ['DemoBlock', 'ChecksumBlock']
+  >>> blocks[0].altitude
+  1000
+  >>> blocks[1].checksum == ct.c_int32(checksum(bytearray(packet[:-8])).value).value
+  True
+
+  """
+  header = NavDataHeader()
+  header.header = NAVDATA_HEADER.value
+  header.state = ct.c_int32(state).value
+  header.sequence = sequence
+  header.vision_flag = vision_flag
+
+  parts = [_raw(header)]
+  for block in blocks:
+    block.header.size = ct.sizeof(block)
+    parts.append(_raw(block))
+  body = b''.join(parts)
+
+  cks = ChecksumBlock()
+  cks.header.id = NAVDATA_CKS_TAG
+  cks.header.size = ct.sizeof(cks)
+  cks.checksum = ct.c_int32(sum(bytearray(body)) & 0xffffffff).value
+  return body + _raw(cks)
+
 class Matrix3x3(ct.LittleEndianStructure):
   """A 3x3 matrix (as expressed in navdata.c).
 
@@ -7,6 +7,9 @@ decode video packets from the drone.
 
 """
 from .. import native
+from ..util.metrics import registry
+from ..util.profiling import profiler
+from ..util.scheduler import monotonic
 
 import ctypes as ct
 import os
@@ -21,15 +24,29 @@ class Decoder(object):
   corresponding to the raw decoded video frame. If ``None``, no attempt is
   made to call it.
 
+  *metric_labels* is a dictionary of labels (e.g. the drone's address) for
+  the packet, frame and decode time metrics in ``ardrone.util.metrics``.
+
   """
-  def __init__(self, vid_cb = None):
+  def __init__(self, vid_cb = None, metric_labels = None):
     self.data = []
-    self.vid_cb = vid_cb
+    self.vid_cb = profiler.wrap(vid_cb)
+    self._packets = registry.counter('ardrone_video_packets_total',
+        'Video packets decoded.', metric_labels)
+    self._frames = registry.counter('ardrone_video_frames_total',
+        'Video frames completed by the decoder.', metric_labels)
+    self._decode_time = registry.histogram('ardrone_video_decode_seconds',
+        'Time taken to decode each video packet.', metric_labels)
     self._handle = None
     self._cdll = native.load_dll('libp264')
     if self._cdll is not None:
       # FIXME: The handle is never released. *BAD PROGRAMMER*
-      self._handle = self._cdll.p264_open()
+      # The handle is a pointer, which would be truncated to an int on 64-bit
+      # platforms without the restype.
+      self._cdll.p264_open.restype = ct.c_void_p
+      handle = self._cdll.p264_open()
+      if handle is not None:
+        self._handle = ct.c_void_p(handle)
     else:
       log.error('Could not load any decoder library.')
 
@@ -40,8 +57,13 @@ class Decoder(object):
     if self._handle is None:
       return
 
-    if 1 != self._cdll.p264_process_blockline(self._handle, data, len(data)):
+    start = monotonic()
+    complete = self._cdll.p264_process_blockline(self._handle, data, len(data))
+    self._decode_time.observe(monotonic() - start)
+    self._packets.inc()
+    if 1 != complete:
       return
+    self._frames.inc()
 
     get_image_buffer = self._cdll.p264_get_image_buffer
     get_image_buffer.restype = ct.POINTER(ct.c_char)
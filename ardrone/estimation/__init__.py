@@ -0,0 +1,32 @@
+"""
+State estimation
+================
+
+Estimating the state of the drone from navdata and video.
+
+The navdata stream reports attitude, altitude and velocity estimates at a high
+rate but these drift when integrated. Marker and board detections from the
+video stream give an absolute position but arrive at a lower rate, with more
+latency and only when a marker is in view. The modules in this package combine
+the two.
+
+This package is made up of the following modules:
+
+  - pose: A fixed-size Kalman filter which fuses navdata velocities and
+    altitude with aruco board positions to give a continuous position
+    estimate.
+
+  - sync: Ring buffers of recent navdata and video frames which give the
+    state of the drone at the moment a frame was captured.
+
+.. automodule:: ardrone.estimation.pose
+  :members:
+
+.. automodule:: ardrone.estimation.sync
+  :members:
+
+"""
+
+from . import pose, sync
+
+__all__ = ['pose', 'sync']
@@ -0,0 +1,369 @@
+"""
+Fusing navdata and vision into a pose estimate
+==============================================
+
+A Kalman filter over the drone's position and velocity. Navdata velocities and
+altitude arrive at navdata rate and keep the estimate moving between video
+frames. Positions computed from aruco board extrinsics arrive at video rate and
+stop the estimate from drifting.
+
+The state is a fixed-size vector of six elements: the x, y and z position in
+metres followed by the x, y and z velocity in metres/second. The world frame is
+the frame of the aruco board(s) being observed with z being the height above
+the board. All measurements carry a timestamp in seconds. Measurements may
+arrive out of order (video frames are decoded some time after the navdata
+describing the same instant has arrived) and are slotted into place by
+re-running the filter from the measurement's timestamp.
+
+The navdata units used by the drone are not documented. We assume that
+velocities are in millimetres/second, the altitude is in millimetres and
+angles are in thousandths of a degree.
+
+"""
+
+from __future__ import division
+
+import bisect
+import logging
+import math
+
+import numpy as np
+
+from .sync import TimeSeries
+
+log = logging.getLogger()
+
+"""Measurement matrix selecting the position from the state."""
+_H_POSITION = np.hstack((np.eye(3), np.zeros((3,3))))
+
+"""Measurement matrix selecting the velocity from the state."""
+_H_VELOCITY = np.hstack((np.zeros((3,3)), np.eye(3)))
+
+"""Measurement matrix selecting the height from the state."""
+_H_ALTITUDE = _H_POSITION[2:3,:]
+
+"""Measurement matrix selecting the x, y velocity and height from the state,
+i.e. what a navdata demo block tells us."""
+_H_NAVDATA = np.vstack((_H_VELOCITY[0:2,:], _H_ALTITUDE))
+
+def _field(block, name):
+  """Return the field *name* from either a navdata block or a dictionary as
+  decoded from the block's JSON representation.
+
+  >>> _field({'altitude': 4}, 'altitude')
+  4
+
+  """
+  if isinstance(block, dict):
+    return block[name]
+  return getattr(block, name)
+
+def _wrap_angle(angle):
+  """Wrap an angle in radians onto the interval [-pi, pi).
+
+  >>> round(_wrap_angle(3 * math.pi / 2), 4) == round(-math.pi / 2, 4)
+  True
+
+  """
+  return ((angle + math.pi) % (2 * math.pi)) - math.pi
+
+def rodrigues(rvec):
+  """Convert a Rodrigues rotation vector (as returned by
+  ardrone.aruco.Board.get_extrinsics) into a 3x3 rotation matrix.
+
+  >>> np.allclose(rodrigues((0,0,0)), np.eye(3))
+  True
+  >>> R = rodrigues((0, 0, 0.5 * math.pi))
+  >>> np.allclose(R.dot((1,0,0)), (0,1,0))
+  True
+
+  """
+  rvec = np.asarray(rvec, dtype=np.float64)
+  theta = np.linalg.norm(rvec)
+  if theta < 1e-12:
+    return np.eye(3)
+  k = rvec / theta
+  K = np.array(((0, -k[2], k[1]), (k[2], 0, -k[0]), (-k[1], k[0], 0)))
+  return np.eye(3) + math.sin(theta) * K + (1 - math.cos(theta)) * K.dot(K)
+
+def camera_pose_from_extrinsics(extrinsics):
+  """Convert board extrinsics into the camera's position and yaw in the board
+  frame.
+
+  *extrinsics* is a pair *rvec, tvec* as returned by
+  ardrone.aruco.Board.get_extrinsics. These transform a point in the board
+  frame into the camera frame.
+
+  Returns a pair *position, yaw*. *position* is a 3-element array giving the
+  camera centre in the board frame and *yaw* is the angle in radians of the
+  camera's x-axis in the board's x-y plane.
+
+  >>> p, yaw = camera_pose_from_extrinsics(((0,0,0), (0,0,-2)))
+  >>> np.allclose(p, (0,0,2)), round(yaw, 4)
+  (True, 0.0)
+
+  """
+  rvec, tvec = extrinsics
+  R = rodrigues(rvec)
+  position = -R.T.dot(np.asarray(tvec, dtype=np.float64))
+  cam_x = R.T[:,0]
+  return position, math.atan2(cam_x[1], cam_x[0])
+
+class PoseEstimator(object):
+  """Estimate the position and velocity of the drone.
+
+  *accel_noise* is the standard deviation of the (unmodelled) acceleration of
+  the drone in metres/second^2.
+
+  *velocity_noise*, *altitude_noise* and *position_noise* are the default
+  standard deviations of velocity, altitude and position measurements in
+  metres/second and metres.
+
+  *initial_position* and *initial_variance* give the prior on the position of
+  the drone. The velocity is initially assumed to be zero.
+
+  *history* is the number of past measurements remembered so that late
+  measurements can be slotted in. Measurements older than this window are
+  dropped and counted in the *dropped* attribute.
+
+  *heading_history* is the number of navdata headings remembered so that
+  board poses can be compared with the heading at the time their frame was
+  captured.
+
+  Integrating a constant velocity:
+
+  >>> pe = PoseEstimator()
+  >>> for i in range(21):
+  ...   pe.add_velocity(0.05*i, (1.0, 0.0, 0.0))
+  >>> position, velocity = pe.estimate()
+  >>> round(float(velocity[0]), 2), bool(0.8 < position[0] < 1.1)
+  (1.0, True)
+
+  Between measurements, the estimate may be extrapolated forward in time:
+
+  >>> position, velocity = pe.estimate(2.0)
+  >>> bool(1.8 < position[0] < 2.1)
+  True
+
+  Measurements arriving out of order give the same result as if they had
+  arrived in order:
+
+  >>> a, b = PoseEstimator(), PoseEstimator()
+  >>> a.add_velocity(0.0, (0.5, 0, 0))
+  >>> a.add_position(0.1, (1.0, 2.0, 1.0))
+  >>> a.add_velocity(0.2, (0.5, 0, 0))
+  >>> b.add_velocity(0.0, (0.5, 0, 0))
+  >>> b.add_velocity(0.2, (0.5, 0, 0))
+  >>> b.add_position(0.1, (1.0, 2.0, 1.0))
+  >>> np.allclose(a.estimate()[0], b.estimate()[0])
+  True
+  >>> b.replayed
+  1
+
+  """
+  def __init__(self, accel_noise=1.0,
+      velocity_noise=0.1, altitude_noise=0.05, position_noise=0.05,
+      initial_position=(0.0, 0.0, 0.0), initial_variance=100.0,
+      history=64, heading_history=256):
+    self.accel_noise = accel_noise
+    self.velocity_noise = velocity_noise
+    self.altitude_noise = altitude_noise
+    self.position_noise = position_noise
+
+    # An angle in radians added to the navdata heading to give the heading in
+    # the board frame. See add_board_pose().
+    self.yaw_offset = 0.0
+
+    # The number of measurements dropped for being too old
+    self.dropped = 0
+
+    # The number of measurements which arrived out of order
+    self.replayed = 0
+
+    x = np.zeros(6)
+    x[0:3] = initial_position
+    P = np.eye(6)
+    P[0:3,0:3] *= initial_variance
+
+    # The state before the oldest remembered measurement as a triple giving
+    # time, state vector and covariance.
+    self._base = (None, x, P)
+
+    # The remembered measurements, sorted by time, as lists of when, z, H, R,
+    # and the posterior state and covariance after applying the measurement.
+    # _times is kept in step with _history for bisection.
+    self._max_history = max(1, history)
+    self._history = []
+    self._times = []
+
+    # The most recent posterior
+    self._when, self._x, self._P = self._base
+
+    # Recent navdata headings in radians keyed by time
+    self._headings = TimeSeries(max(1, heading_history), 1, periods={0: 2 * math.pi})
+
+    self._eye = np.eye(6)
+
+  @property
+  def when(self):
+    """The time of the most recent measurement or None if there have been
+    none."""
+    return self._when
+
+  @property
+  def covariance(self):
+    """The 6x6 covariance of the state after the most recent measurement."""
+    return self._P.copy()
+
+  def estimate(self, when=None):
+    """Return the estimated state as a pair *position, velocity* of
+    3-element arrays.
+
+    If *when* is not None, extrapolate the estimate forward to that time.
+
+    """
+    x, P = self._x, self._P
+    if when is not None and self._when is not None:
+      x, P = self._predict(x, P, when - self._when)
+    return x[0:3].copy(), x[3:6].copy()
+
+  def add_position(self, when, position, noise=None):
+    """Add a measurement of the 3D position in metres at time *when*."""
+    noise = self.position_noise if noise is None else noise
+    self._add(when, np.asarray(position, dtype=np.float64), _H_POSITION, (noise ** 2) * np.eye(3))
+
+  def add_velocity(self, when, velocity, noise=None):
+    """Add a measurement of the 3D velocity in metres/second, expressed in the
+    world frame, at time *when*."""
+    noise = self.velocity_noise if noise is None else noise
+    self._add(when, np.asarray(velocity, dtype=np.float64), _H_VELOCITY, (noise ** 2) * np.eye(3))
+
+  def add_altitude(self, when, altitude, noise=None):
+    """Add a measurement of the height in metres at time *when*."""
+    noise = self.altitude_noise if noise is None else noise
+    self._add(when, np.array((altitude,), dtype=np.float64), _H_ALTITUDE, np.array(((noise ** 2,),)))
+
+  def add_navdata(self, when, block):
+    """Add the velocity and altitude from a navdata demo block received at
+    time *when*.
+
+    *block* is either an ardrone.core.navdata.DemoBlock or a dictionary as
+    decoded from the block's JSON representation.
+
+    The body-frame velocities are rotated into the world frame using the
+    block's heading plus *yaw_offset*.
+
+    """
+    psi = math.radians(1e-3 * _field(block, 'psi'))
+    self._headings.append(when, (psi,))
+
+    heading = psi + self.yaw_offset
+    c, s = math.cos(heading), math.sin(heading)
+    vx, vy = 1e-3 * _field(block, 'vx'), 1e-3 * _field(block, 'vy')
+
+    z = np.array((c*vx - s*vy, s*vx + c*vy, 1e-3 * _field(block, 'altitude')))
+    R = np.diag((self.velocity_noise ** 2, self.velocity_noise ** 2, self.altitude_noise ** 2))
+    self._add(when, z, _H_NAVDATA, R)
+
+  def add_board_pose(self, when, extrinsics, noise=None, yaw_gain=0.1):
+    """Add a position measurement from aruco board extrinsics.
+
+    *extrinsics* is a pair *rvec, tvec* as returned by
+    ardrone.aruco.Board.get_extrinsics for a frame captured at time *when*.
+
+    If navdata has been seen, *yaw_offset* is moved a fraction *yaw_gain*
+    of the way towards the difference between the camera's heading in the
+    board frame and the navdata heading at *when*. Set *yaw_gain* to zero to
+    disable this.
+
+    The frame is compared with the heading when it was captured rather than
+    the latest one, which may be a video latency later:
+
+    >>> pe = PoseEstimator()
+    >>> for i in range(5):
+    ...   pe.add_navdata(0.1 * i, {'psi': 10000 * i, 'vx': 0, 'vy': 0, 'altitude': 0})
+    >>> pe.add_board_pose(0.15, ((0,0,0), (0,0,-2)), yaw_gain=1.0)
+    >>> round(math.degrees(pe.yaw_offset), 4)
+    -15.0
+
+    """
+    position, yaw = camera_pose_from_extrinsics(extrinsics)
+    psi = self.heading_at(when)
+    if psi is not None and yaw_gain > 0:
+      error = _wrap_angle(yaw - psi - self.yaw_offset)
+      self.yaw_offset = _wrap_angle(self.yaw_offset + yaw_gain * error)
+    self.add_position(when, position, noise)
+
+  def heading_at(self, when):
+    """Return the navdata heading in radians interpolated at time *when* or
+    None if no navdata has been seen. Times outside the remembered headings
+    are given the nearest one.
+
+    """
+    headings = self._headings
+    if len(headings) == 0:
+      return None
+    if when <= headings.first_key():
+      return float(headings.values(0)[0])
+    if when >= headings.last_key():
+      return float(headings.values(len(headings) - 1)[0])
+    return float(headings.interpolate(when)[0])
+
+  def _add(self, when, z, H, R):
+    base_when = self._base[0]
+    if base_when is not None and when < base_when:
+      self.dropped += 1
+      log.debug('Dropping measurement %.3fs older than estimator history.' % (base_when - when,))
+      return
+
+    idx = bisect.bisect_right(self._times, when)
+    if idx < len(self._times):
+      self.replayed += 1
+    self._history.insert(idx, [when, z, H, R, None, None])
+    self._times.insert(idx, when)
+
+    # Re-run the filter from the state preceding the new measurement
+    if idx == 0:
+      prev_when, x, P = self._base
+    else:
+      prev_when, x, P = [self._history[idx-1][i] for i in (0, 4, 5)]
+
+    for entry in self._history[idx:]:
+      if prev_when is not None:
+        x, P = self._predict(x, P, entry[0] - prev_when)
+      x, P = self._update(x, P, entry[1], entry[2], entry[3])
+      entry[4], entry[5] = x, P
+      prev_when = entry[0]
+
+    self._when, self._x, self._P = prev_when, x, P
+
+    # Forget the oldest measurements
+    while len(self._history) > self._max_history:
+      oldest = self._history.pop(0)
+      self._times.pop(0)
+      self._base = (oldest[0], oldest[4], oldest[5])
+
+  def _predict(self, x, P, dt):
+    if dt <= 0:
+      return x, P
+
+    F = self._eye.copy()
+    F[0:3,3:6] = dt * np.eye(3)
+
+    q = self.accel_noise ** 2
+    Q = np.zeros((6,6))
+    Q[0:3,0:3] = ((dt ** 3) / 3.0) * q * np.eye(3)
+    Q[0:3,3:6] = ((dt ** 2) / 2.0) * q * np.eye(3)
+    Q[3:6,0:3] = Q[0:3,3:6]
+    Q[3:6,3:6] = dt * q * np.eye(3)
+
+    return F.dot(x), F.dot(P).dot(F.T) + Q
+
+  def _update(self, x, P, z, H, R):
+    y = z - H.dot(x)
+    S = H.dot(P).dot(H.T) + R
+
+    # K = P H^T S^-1. Both P and S are symmetric.
+    K = np.linalg.solve(S, H.dot(P)).T
+
+    return x + K.dot(y), (self._eye - K.dot(H)).dot(P)
@@ -0,0 +1,371 @@
+"""
+Aligning video frames with navdata
+==================================
+
+Navdata packets arrive at a higher rate than video frames and video frames
+take some time to arrive and decode. Using whatever navdata sample arrived
+last to interpret a new frame applies stale attitude to the frame. This is
+particularly bad when the drone is yawing.
+
+This module keeps short ring buffers of recent navdata samples and decoded
+frames and answers "what was the state of the drone when frame k was
+captured?" by interpolating between the navdata samples either side of the
+frame's capture time. Lookups are O(log n) in the length of the buffers.
+
+Frames may be related to navdata in three ways:
+
+  - By local arrival time, less a configurable video latency.
+
+  - By the drone's own capture time. A VisionBlock's ``time_capture`` field
+    gives the drone clock time at which the last picture was captured. The
+    offset between the drone clock and the local clock is estimated from the
+    navdata stream.
+
+  - By the drone's frame counter, the ``num_frames`` field of a DemoBlock.
+
+The seconds part of a drone timestamp is only 11 bits wide and so the drone
+clock wraps every 2048 seconds. Drone times are unwrapped by taking the
+multiple of 2048 seconds which puts them closest to the latest drone time
+seen, which is correct as long as successive vision blocks are less than 1024
+seconds apart.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+
+"""The DemoBlock fields recorded for each navdata sample."""
+NAVDATA_FIELDS = ('theta', 'phi', 'psi', 'altitude', 'vx', 'vy', 'vz', 'num_frames')
+
+"""The period of angles measured in thousandths of a degree."""
+_MILLIDEGREE_PERIOD = 360000.0
+
+"""The period in seconds after which the drone's TSECDEC clock wraps."""
+TSECDEC_PERIOD = 2048.0
+
+def tsecdec_to_seconds(stamp):
+  """Convert a drone timestamp in TSECDEC format (as used by
+  VisionBlock.time_capture) into seconds. The upper 11 bits are seconds and
+  the lower 21 bits are microseconds.
+
+  >>> tsecdec_to_seconds((3 << 21) + 500000)
+  3.5
+
+  """
+  return (stamp >> 21) + 1e-6 * (stamp & ((1 << 21) - 1))
+
+def unwrap_drone_time(seconds, reference):
+  """Return the drone time *seconds* (as returned by tsecdec_to_seconds())
+  plus whichever multiple of TSECDEC_PERIOD puts it closest to the unwrapped
+  drone time *reference*.
+
+  >>> unwrap_drone_time(2047.5, 2047.0)
+  2047.5
+  >>> unwrap_drone_time(0.5, 2047.0)
+  2048.5
+  >>> unwrap_drone_time(2047.5, 2048.5)
+  2047.5
+
+  """
+  return seconds + TSECDEC_PERIOD * round((reference - seconds) / TSECDEC_PERIOD)
+
+def _field(block, name):
+  if isinstance(block, dict):
+    return block[name]
+  return getattr(block, name)
+
+def _block_type(block):
+  """Return the navdata block type as used in its JSON representation."""
+  if isinstance(block, dict):
+    return block.get('type')
+  # Avoid importing navdata (and hence ctypes structures) just for isinstance
+  if hasattr(block, 'num_frames'):
+    return 'demo'
+  if hasattr(block, 'time_capture'):
+    return 'vision'
+  return None
+
+class TimeSeries(object):
+  """A fixed-capacity ring buffer of samples with non-decreasing keys.
+
+  Each sample is a key (usually a time in seconds) and a fixed-length vector
+  of values. Appending is O(1) and finding or interpolating a sample by key is
+  O(log n). Once the buffer is full, appending a sample discards the oldest.
+  Samples whose key is less than the newest key are dropped and counted in the
+  *dropped* attribute.
+
+  *capacity* is the maximum number of samples held.
+
+  *width* is the number of values in each sample.
+
+  *periods* optionally maps a value column to the period of that column (e.g.
+  360 for an angle in degrees). Such columns are interpolated the short way
+  round.
+
+  >>> ts = TimeSeries(4, 1, periods={0: 360.0})
+  >>> for t, v in ((0.0, 350.0), (1.0, 10.0), (2.0, 20.0)):
+  ...   _ = ts.append(t, (v,))
+  >>> float(ts.interpolate(0.5)[0])
+  0.0
+  >>> float(ts.interpolate(1.5)[0])
+  15.0
+  >>> ts.interpolate(2.5) is None
+  True
+  >>> ts.append(1.5, (0.0,))
+  False
+  >>> ts.dropped
+  1
+
+  When full, the oldest samples are discarded:
+
+  >>> for t in (3.0, 4.0):
+  ...   _ = ts.append(t, (0.0,))
+  >>> len(ts), ts.first_key(), ts.last_key()
+  (4, 1.0, 4.0)
+
+  """
+  def __init__(self, capacity, width, periods=None):
+    self.capacity = capacity
+    self.width = width
+    self.dropped = 0
+    self._periods = dict(periods or {})
+    self._keys = np.zeros(capacity)
+    self._values = np.zeros((capacity, width))
+    self._start = 0
+    self._count = 0
+
+  def __len__(self):
+    return self._count
+
+  def _physical(self, idx):
+    return (self._start + idx) % self.capacity
+
+  def key(self, idx):
+    """Return the key of the *idx*-th oldest sample."""
+    return float(self._keys[self._physical(idx)])
+
+  def values(self, idx):
+    """Return a copy of the values of the *idx*-th oldest sample."""
+    return self._values[self._physical(idx)].copy()
+
+  def first_key(self):
+    return self.key(0) if self._count > 0 else None
+
+  def last_key(self):
+    return self.key(self._count - 1) if self._count > 0 else None
+
+  def append(self, key, values):
+    """Append a sample. Returns False if the sample was dropped for being out
+    of order."""
+    if self._count > 0 and key < self.last_key():
+      self.dropped += 1
+      return False
+
+    if self._count < self.capacity:
+      idx = self._physical(self._count)
+      self._count += 1
+    else:
+      idx = self._start
+      self._start = (self._start + 1) % self.capacity
+
+    self._keys[idx] = key
+    self._values[idx,:] = values
+    return True
+
+  def bisect(self, key):
+    """Return the number of samples whose key is less than or equal to
+    *key*."""
+    lo, hi = 0, self._count
+    keys, start, capacity = self._keys, self._start, self.capacity
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if keys[(start + mid) % capacity] <= key:
+        lo = mid + 1
+      else:
+        hi = mid
+    return lo
+
+  def interpolate(self, key):
+    """Return the values linearly interpolated at *key* or None if *key* lies
+    outside the range of keys held."""
+    if self._count == 0 or key < self.first_key() or key > self.last_key():
+      return None
+
+    idx = self.bisect(key)
+    if idx >= self._count:
+      return self.values(self._count - 1)
+
+    k0, k1 = self.key(idx - 1), self.key(idx)
+    v0, v1 = self.values(idx - 1), self.values(idx)
+    alpha = (key - k0) / (k1 - k0) if k1 > k0 else 1.0
+
+    delta = v1 - v0
+    for col, period in self._periods.items():
+      delta[col] = ((delta[col] + 0.5 * period) % period) - 0.5 * period
+    rv = v0 + alpha * delta
+    for col, period in self._periods.items():
+      rv[col] = ((rv[col] + 0.5 * period) % period) - 0.5 * period
+    return rv
+
+class Synchroniser(object):
+  """Match decoded video frames with the navdata describing the drone's state
+  when they were captured.
+
+  *navdata_capacity* and *frame_capacity* give the number of navdata samples
+  and frames remembered.
+
+  *video_latency* is the assumed time in seconds between a frame being
+  captured and it being decoded. It is used for frames with no capture time.
+
+  States are returned as dictionaries with keys from NAVDATA_FIELDS.
+
+  >>> s = Synchroniser()
+  >>> for i in range(5):
+  ...   s.add_navdata(0.1 * i, {'type': 'demo', 'theta': 0, 'phi': 0,
+  ...     'psi': 1000 * i, 'altitude': 1000, 'vx': 0, 'vy': 0, 'vz': 0,
+  ...     'num_frames': 2 * i})
+  >>> k = s.add_frame(0.25, 'frame data')
+  >>> s.frame(k)
+  'frame data'
+  >>> int(round(s.state_at_frame(k)['psi']))
+  2500
+  >>> int(round(s.state_at_drone_frame(3)['psi']))
+  1500
+
+  Frames for which there is not yet navdata return None:
+
+  >>> s.state_at_frame(s.add_frame(1.0, None)) is None
+  True
+
+  """
+  def __init__(self, navdata_capacity=256, frame_capacity=16, video_latency=0.0):
+    self.video_latency = video_latency
+
+    periods = { NAVDATA_FIELDS.index('psi'): _MILLIDEGREE_PERIOD }
+    self._by_time = TimeSeries(navdata_capacity, len(NAVDATA_FIELDS), periods)
+    self._by_frame = TimeSeries(navdata_capacity, len(NAVDATA_FIELDS), periods)
+
+    # Decoded frames as a ring of (frame index, capture time, frame) triples
+    self._frames = [None] * frame_capacity
+    self._next_frame = 0
+
+    # Estimated local time minus drone time. We take the minimum seen since
+    # that is the one least inflated by network latency.
+    self._clock_offset = None
+
+    # The latest drone time seen, unwrapped (see unwrap_drone_time())
+    self._drone_time = None
+
+  def add_navdata(self, when, block):
+    """Record a navdata block which arrived at local time *when* (in
+    seconds).
+
+    *block* is either a navdata block object or a dictionary as decoded from
+    the block's JSON representation. Demo blocks are recorded as samples.
+    Vision blocks are used to estimate the offset between the drone and local
+    clocks. Other blocks are ignored.
+
+    """
+    block_type = _block_type(block)
+    if block_type == 'demo':
+      values = [_field(block, f) for f in NAVDATA_FIELDS]
+      self._by_time.append(when, values)
+      self._by_frame.append(_field(block, 'num_frames'), values)
+    elif block_type == 'vision':
+      drone_time = self._unwrap(tsecdec_to_seconds(_field(block, 'time_capture')))
+      self._drone_time = max(self._drone_time, drone_time) if self._drone_time is not None else drone_time
+      offset = when - drone_time
+      if self._clock_offset is None or offset < self._clock_offset:
+        self._clock_offset = offset
+
+  def _unwrap(self, drone_time):
+    if self._drone_time is None:
+      return drone_time
+    return unwrap_drone_time(drone_time, self._drone_time)
+
+  def drone_to_local_time(self, drone_time):
+    """Convert a time in seconds on the drone's clock to local time or return
+    None if the offset between the clocks is not yet known. *drone_time* may
+    be wrapped, as returned by tsecdec_to_seconds().
+
+    >>> s = Synchroniser()
+    >>> s.add_navdata(100.0, {'type': 'vision', 'time_capture': 2047 << 21})
+    >>> s.drone_to_local_time(2047.5)
+    100.5
+
+    After the drone clock wraps:
+
+    >>> s.add_navdata(101.5, {'type': 'vision', 'time_capture': 0})
+    >>> s.drone_to_local_time(0.5)
+    101.5
+
+    """
+    if self._clock_offset is None:
+      return None
+    return self._unwrap(drone_time) + self._clock_offset
+
+  def add_frame(self, when, frame, capture_time=None):
+    """Record a decoded frame and return its frame index.
+
+    *when* is the local time at which the frame was decoded.
+
+    *frame* is the frame data. It is only stored so that it may be retrieved
+    via frame() and may be None.
+
+    *capture_time* is optionally the frame's capture time on the drone's clock
+    in TSECDEC format (see VisionBlock.time_capture). If it is None or the
+    clock offset is not yet known, the capture time is taken to be *when*
+    less *video_latency*.
+
+    """
+    capture = None
+    if capture_time is not None:
+      capture = self.drone_to_local_time(tsecdec_to_seconds(capture_time))
+    if capture is None:
+      capture = when - self.video_latency
+
+    k = self._next_frame
+    self._frames[k % len(self._frames)] = (k, capture, frame)
+    self._next_frame += 1
+    return k
+
+  def _frame_entry(self, k):
+    entry = self._frames[k % len(self._frames)]
+    if entry is None or entry[0] != k:
+      return None
+    return entry
+
+  def frame(self, k):
+    """Return the data for frame *k* or None if it is no longer held."""
+    entry = self._frame_entry(k)
+    return entry[2] if entry is not None else None
+
+  def frame_time(self, k):
+    """Return the local capture time of frame *k* or None if it is no longer
+    held."""
+    entry = self._frame_entry(k)
+    return entry[1] if entry is not None else None
+
+  def state_at_time(self, when):
+    """Return the state interpolated at local time *when* or None if *when* is
+    outside of the navdata held."""
+    return self._to_state(self._by_time.interpolate(when))
+
+  def state_at_frame(self, k):
+    """Return the state when frame *k* (as returned by add_frame) was
+    captured or None if it is not known."""
+    when = self.frame_time(k)
+    if when is None:
+      return None
+    return self.state_at_time(when)
+
+  def state_at_drone_frame(self, num_frames):
+    """Return the state interpolated at the drone's frame counter
+    *num_frames* (see DemoBlock.num_frames) or None if it is not known."""
+    return self._to_state(self._by_frame.interpolate(num_frames))
+
+  def _to_state(self, values):
+    if values is None:
+      return None
+    return dict(zip(NAVDATA_FIELDS, [float(v) for v in values]))
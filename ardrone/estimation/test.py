@@ -0,0 +1,9 @@
+import unittest
+import doctest
+
+from . import pose, sync
+
+def load_tests(loader, tests, ignore):
+  tests.addTests(doctest.DocTestSuite(pose))
+  tests.addTests(doctest.DocTestSuite(sync))
+  return tests
@@ -1,13 +1,62 @@
 """Module to handle importing native modules via ctypes.
 
+Libraries are looked for in the ``native`` directory next to this module.
+Both finding and loading a library are remembered so that asking for the same
+library again, e.g. once per video decoder, does not touch the filesystem.
+Modules which wrap a library can use :py:class:`LazyDLL` to put off loading it
+until one of its functions is first called.
+
 """
 
 import ctypes
 import os
 import logging
+import sys
+import threading
 
 log = logging.getLogger()
 
+# Platform suffices in the order they are tried. The native suffix for this
+# platform is tried first since it is almost always the one which exists.
+if sys.platform.startswith('win'):
+  _SUFFICES = ('.dll', '', '.so')
+else:
+  _SUFFICES = ('.so', '', '.dll')
+
+# Maps library names to their paths (or None if not found) and loaded DLLs
+# (or None if loading failed).
+_found = {}
+_loaded = {}
+_lock = threading.Lock()
+
+def find_dll(name):
+  """Find a DLL in the lib directory under ardrone/native without loading it.
+
+  *name* is the filename (without platform extension, e.g. ".dll", ".so") of
+  the DLL to find.
+
+  Returns the path to the DLL or None if there is no such file.
+
+  """
+  if name in _found:
+    return _found[name]
+
+  # Find out which directory _this_ file is in and hence the native libdir
+  native_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'native')
+
+  path = None
+  for lib_dir in ['', 'bin', 'lib']:
+    for suffix in _SUFFICES:
+      dllpath = os.path.join(native_dir, lib_dir, name + suffix)
+      if os.path.isfile(dllpath):
+        path = dllpath
+        break
+    if path is not None:
+      break
+
+  _found[name] = path
+  return path
+
 def load_dll(name):
   """Attempt to load a DLL from the lib directory under ardrone/native.
   Appropriate platform suffices are attempted.
@@ -15,26 +64,77 @@ def load_dll(name):
   *name* is the filename (without platform extension, e.g. ".dll", ".so") of
   the DLL to load.
 
-  Returns a ctyles CDLL instance if successful or None on failure.
+  Returns a ctyles CDLL instance if successful or None on failure. The result
+  is remembered and returned by later calls with the same *name*.
 
   """
+  with _lock:
+    if name in _loaded:
+      return _loaded[name]
 
-  # Find out which directour _this_ file is in
-  this_dir = os.path.abspath(os.path.dirname(__file__))
+    dll = None
+    dllpath = find_dll(name)
+    if dllpath is None:
+      log.error('Failed to find DLL "%s" in the native directory.' % (name,))
+    else:
+      try:
+        dll = ctypes.CDLL(dllpath)
+      except OSError as e:
+        log.error('Error loading %s: %s' % (dllpath, str(e)))
 
-  # And hence the native libdir
-  native_dir = os.path.join(this_dir, 'native')
+    _loaded[name] = dll
+    return dll
 
-  for lib_dir in ['', 'bin', 'lib']:
-    for suffix in ['', '.so', '.dll']:
-      dllpath = os.path.join(native_dir, lib_dir, name + suffix)
-      if os.path.exists(dllpath):
-        try:
-          dll = ctypes.CDLL(dllpath)
-          return dll
-        except OSError as e:
-          # Report DLL load errors and try to continue
-          log.warning('Error loading %s: %s' % (dllpath, str(e)))
-
-  log.error('Failed to find or load DLL "%s" in the native directory.' % (name,))
-  return None
+class LazyDLL(object):
+  """Stands in for the DLL *name*, loading it with :py:func:`load_dll` when
+  one of its attributes is first looked up. *configure*, if not None, is then
+  called with the CDLL instance to set the return and argument types of its
+  functions before it is used.
+
+  Raises *error*, called with a message, on each use if the DLL cannot be
+  loaded.
+
+  >>> dll = LazyDLL('no-such-library', error=ImportError)
+  >>> dll.loaded
+  False
+  >>> dll.load()
+  Traceback (most recent call last):
+    ...
+  ImportError: Could not load the no-such-library native library.
+
+  """
+  def __init__(self, name, configure=None, error=OSError):
+    self.name = name
+    self._configure = configure
+    self._error = error
+    self._dll = None
+    self._lock = threading.Lock()
+
+  @property
+  def loaded(self):
+    """True once the DLL has been loaded and configured."""
+    return self._dll is not None
+
+  def load(self):
+    """Load and configure the DLL if that has not been done already and
+    return the CDLL instance.
+
+    """
+    if self._dll is not None:
+      return self._dll
+
+    with self._lock:
+      if self._dll is None:
+        dll = load_dll(self.name)
+        if dll is None:
+          raise self._error('Could not load the %s native library.' % (self.name,))
+        if self._configure is not None:
+          self._configure(dll)
+        self._dll = dll
+    return self._dll
+
+  def __getattr__(self, name):
+    # Only called for attributes not found normally, i.e. the DLL's functions
+    if name.startswith('__') and name.endswith('__'):
+      raise AttributeError(name)
+    return getattr(self.load(), name)
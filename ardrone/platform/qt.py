@@ -6,6 +6,7 @@ Support for Qt applications
 import logging
 
 from ..util import qtcompat as qt
+from ..util.profiling import profiler
 
 try:
   QtCore = qt.import_module('QtCore')
@@ -243,6 +244,8 @@ class Connection(base.Connection):
           else:
             self.got_packet(connection, data)
 
+      ready_read = profiler.wrap(ready_read,
+          'readyRead %s:%s' % (bind_host.toString(), bind[1]))
       QObject.connect(socket, SIGNAL('readyRead()'), ready_read)
 
     self._sockets[connection] = (socket, QtNetwork.QHostAddress(send[0]), send[1])
@@ -14,4 +14,7 @@ The Qt-based GUI controller
 .. automodule:: ardrone.qtgui.eventlog
   :members:
 
+.. automodule:: ardrone.qtgui.videowidget
+  :members:
+
 """
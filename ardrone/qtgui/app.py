@@ -20,18 +20,14 @@ try:
 except ImportError as e:
   raise ImportError('Qt appears not to be installed: %s' % (str(e),))
 
+from ..util.profiling import profiler, startup
+
 # Extract the various Qt modules we want to use
 QtCore = qt.import_module('QtCore')
 QtGui = qt.import_module('QtGui')
 
-# Annoyingly PySide and PyQt4 have different ways of dealing with .ui files at
-# runtime.
-if qt.USES_PYSIDE:
-  from PySide.QtUiTools import QUiLoader
-else:
-  from PyQt4 import uic
-
 from .mainwindowcontroller import MainWindowController
+from .videowidget import VideoWidget
 
 class Application(QtGui.QApplication):
   """A sub-class of QApplication which loads the main .ui file and creates a
@@ -75,11 +71,7 @@ class Application(QtGui.QApplication):
     """
     ui_file = os.path.join(Application.__resource_dir, 'mainwindow.ui')
 
-    if qt.USES_PYSIDE:
-      loader = QUiLoader()
-      self._main_window = loader.load(ui_file)
-    else:
-      self._main_window = uic.loadUi(ui_file)
+    self._main_window = qt.load_ui(ui_file, (VideoWidget,))
 
 def main():
   """The main entry point for the application. Call this from your script to
@@ -93,7 +85,12 @@ def main():
     log.setLevel(logging.INFO)
 
   # Create the main application
+  startup.mark('imports')
   app = Application()
+  startup.mark('application')
+
+  # Profile the event loop if asked to (see ardrone.util.profiling)
+  profiler.start()
 
   # Enter the application main loop
   sys.exit(app.exec_())
@@ -6,6 +6,8 @@ Detecting the drone
 import logging
 
 from ..util import qtcompat as qt
+from ..util.profiling import profiler
+from ..util.scheduler import UI
 
 QtCore = qt.import_module('QtCore')
 QtGui = qt.import_module('QtGui')
@@ -14,7 +16,12 @@ QtNetwork = qt.import_module('QtNetwork')
 log = logging.getLogger()
 
 class DroneDetector(QtCore.QObject):
-  """An object which polls the drone and fixed intervals to see if it can be detected."""
+  """An object which polls the drone and fixed intervals to see if it can be detected.
+
+  If *scheduler* (an :py:class:`ardrone.util.scheduler.Scheduler`) is given
+  the drone is polled by it as a UI priority task, otherwise by a Qt timer.
+
+  """
 
   """Successfully getting this URL counts as detecting the drone."""
   __detect_url = QtCore.QUrl('ftp://192.168.1.1/licenses.txt')
@@ -33,17 +40,20 @@ class DroneDetector(QtCore.QObject):
   """A signal emitted when the drone detection state *changes*. The new state is passed."""
   droneDetectionStateChanged = qt.Signal(bool)
 
-  def __init__(self, poll_interval=5000):
+  def __init__(self, poll_interval=5000, scheduler=None):
     super(DroneDetector, self).__init__()
 
     # Initially no drone is detected
     self.droneDetectionState = False
 
     # Set up a timer to try to detect the drone every 10 seconds
-    self._detect_timer = QtCore.QTimer()
-    self._detect_timer.setInterval(poll_interval)
-    self._detect_timer.timeout.connect(self._detectDrone)
-    self._detect_timer.start()
+    if scheduler is None:
+      self._detect_timer = QtCore.QTimer()
+      self._detect_timer.setInterval(poll_interval)
+      self._detect_timer.timeout.connect(profiler.wrap(self._detectDrone))
+      self._detect_timer.start()
+    else:
+      scheduler.add('drone_detection', self._detectDrone, poll_interval / 1000.0, priority=UI)
 
     # Attempt to detect the drone for the first time
     self._detectDrone()
@@ -6,10 +6,13 @@ Logging events to a UI widget
 
 import logging
 import os
+import threading
 import time
 
 from cgi import escape as html_escape
 from ..util import qtcompat as qt
+from ..util.profiling import profiler
+from ..util.scheduler import LOGGING
 
 # Get a reference to an appropriate global logger.
 log = logging.getLogger()
@@ -18,13 +21,6 @@ log = logging.getLogger()
 QtCore = qt.import_module('QtCore')
 QtGui = qt.import_module('QtGui')
 
-# Annoyingly PySide and PyQt4 have different ways of dealing with .ui files at
-# runtime.
-if qt.USES_PYSIDE:
-  from PySide.QtUiTools import QUiLoader
-else:
-  from PyQt4 import uic
-
 class LogView(QtGui.QTableView):
   """A view of log data represented in a LogModel.
 
@@ -81,16 +77,151 @@ def _level_to_pixmap(level):
 
   return QtGui.QApplication.style().standardIcon(icon)
 
+class RecordRing(object):
+  """A ring buffer holding at most *capacity* log records in the order they
+  were added, fed from any thread.
+
+  Records are queued with :py:meth:`add` and only become rows once the GUI
+  thread moves them into the ring in a batch with :py:meth:`take_pending`,
+  :py:meth:`evict` and :py:meth:`extend`. The oldest rows are evicted to make
+  room. Evicted rows, and queued records which would be evicted straight
+  away, are passed in order to *spill* (a callable taking a record) if it is
+  not None.
+
+  >>> spilled = []
+  >>> ring = RecordRing(3, spill=spilled.append)
+  >>> ring.extend([0, 1])
+  2
+  >>> for i in range(2, 7):
+  ...   ring.add(i)
+  >>> pending = ring.take_pending()
+  >>> ring.evict(ring.overflow(len(pending)))
+  2
+  >>> ring.extend(pending)
+  3
+  >>> len(ring), [ring[i] for i in range(len(ring))], spilled
+  (3, [4, 5, 6], [0, 1, 2, 3])
+
+  Queued records can be spilled without becoming rows:
+
+  >>> ring.add(7)
+  >>> ring.spill_pending()
+  1
+  >>> len(ring), spilled[-1]
+  (3, 7)
+
+  """
+  def __init__(self, capacity, spill=None):
+    if capacity < 1:
+      raise ValueError('The capacity must be at least one.')
+    self.capacity = capacity
+    self.spill = spill
+    self._rows = [None] * capacity
+    self._start = 0
+    self._count = 0
+    self._pending = []
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return self._count
+
+  def __getitem__(self, row):
+    if row < 0 or row >= self._count:
+      raise IndexError('Row %i out of range.' % (row,))
+    return self._rows[(self._start + row) % self.capacity]
+
+  def add(self, record):
+    """Queue *record*. May be called from any thread."""
+    with self._lock:
+      self._pending.append(record)
+
+  def take_pending(self):
+    """Return the queued records and clear the queue."""
+    with self._lock:
+      pending, self._pending = self._pending, []
+    return pending
+
+  def spill_pending(self):
+    """Spill the queued records, leaving the rows untouched. Returns the
+    number spilled. May be called from any thread.
+
+    """
+    pending = self.take_pending()
+    self._spill(pending)
+    return len(pending)
+
+  def overflow(self, count):
+    """Return the number of rows which must be evicted to make room for
+    *count* more.
+
+    """
+    return min(self._count, max(0, self._count + count - self.capacity))
+
+  def evict(self, count):
+    """Remove and spill the oldest *count* rows. Returns the number
+    removed.
+
+    """
+    count = min(count, self._count)
+    evicted = [self[row] for row in range(count)]
+    for row in range(count):
+      self._rows[(self._start + row) % self.capacity] = None
+    self._start = (self._start + count) % self.capacity
+    self._count -= count
+    self._spill(evicted)
+    return count
+
+  def extend(self, records):
+    """Append as many of the last of *records* as there is room for as rows
+    and spill the rest. Returns the number of rows added.
+
+    """
+    room = self.capacity - self._count
+    if len(records) > room:
+      self._spill(records[:len(records) - room])
+      records = records[len(records) - room:]
+    for record in records:
+      self._rows[(self._start + self._count) % self.capacity] = record
+      self._count += 1
+    return len(records)
+
+  def _spill(self, records):
+    if self.spill is not None:
+      for record in records:
+        self.spill(record)
+
 class LogModel(QtCore.QAbstractTableModel, logging.Handler):
-  """A simple logging.Handler sub-class which logs to a QTextEdit.
+  """A logging.Handler sub-class which is also a table model of the most
+  recent *capacity* log records.
+
+  Records may be logged from any thread. They are queued and added to the
+  model in one batch every *interval* milliseconds by a timer in the thread
+  which created the model, so that a burst of records costs one insertion
+  and one repaint. Once the model is full the oldest rows are removed.
+
+  If *spill* is a filename, removed rows are appended to that file, formatted
+  with the handler's formatter, rather than being lost. So are records still
+  queued when the handler is closed.
+
+  If *scheduler* (an :py:class:`ardrone.util.scheduler.Scheduler`) is given
+  records are added by it as a logging priority task, after everything else
+  which is due, otherwise by a Qt timer.
 
   """
-  def __init__(self):
+  def __init__(self, capacity=5000, interval=100, spill=None, scheduler=None):
     logging.Handler.__init__(self)
     QtCore.QAbstractTableModel.__init__(self)
 
-    # The actual records stored in a list
-    self._records = []
+    self._spill_file = None
+    spill_cb = None
+    if spill is not None:
+      self._spill_file = open(spill, 'a')
+      spill_cb = lambda r: self._spill_file.write(self.format(r) + '\n')
+    if self.formatter is None:
+      self.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+
+    # The actual records stored in a ring
+    self._records = RecordRing(capacity, spill_cb)
 
     # A tuple giving a name and callables to extract the text and icon from the
     # record. If the callable is None, no corresponding information should be returned.
@@ -100,6 +231,16 @@ class LogModel(QtCore.QAbstractTableModel, logging.Handler):
         ('Message', None, lambda r: r.getMessage())
     )
 
+    # Add queued records periodically
+    self._scheduler = scheduler
+    if scheduler is None:
+      self._flush_timer = QtCore.QTimer()
+      self._flush_timer.setInterval(interval)
+      self._flush_timer.timeout.connect(profiler.wrap(self._add_pending, 'LogModel._add_pending'))
+      self._flush_timer.start()
+    else:
+      scheduler.add('event_log', self._add_pending, interval / 1000.0, priority=LOGGING)
+
   def headerData(self, section, orientation, role):
     if role != QtCore.Qt.DisplayRole:
       return None
@@ -130,29 +271,54 @@ class LogModel(QtCore.QAbstractTableModel, logging.Handler):
     return cb(self._records[row])
 
   def emit(self, record):
-    self.beginInsertRows(QtCore.QModelIndex(), len(self._records), len(self._records))
-    self._records.append(record)
+    self._records.add(record)
+
+  def close(self):
+    if self._scheduler is None:
+      self._flush_timer.stop()
+    else:
+      self._scheduler.remove('event_log')
+    # This may be called by logging.shutdown() once the view has gone, so the
+    # queued records are only written out and the model is left alone.
+    self._records.spill_pending()
+    if self._spill_file is not None:
+      self._spill_file.close()
+      self._spill_file = None
+    logging.Handler.close(self)
+
+  def _add_pending(self):
+    pending = self._records.take_pending()
+    if len(pending) == 0:
+      return
+
+    evict = self._records.overflow(len(pending))
+    if evict > 0:
+      self.beginRemoveRows(QtCore.QModelIndex(), 0, evict-1)
+      self._records.evict(evict)
+      self.endRemoveRows()
+
+    first = len(self._records)
+    count = min(len(pending), self._records.capacity - first)
+    self.beginInsertRows(QtCore.QModelIndex(), first, first + count - 1)
+    self._records.extend(pending)
     self.endInsertRows()
 
-def create_event_log_dock_widget():
-  """Create and return a new event log QDockWidget.
+def create_event_log_dock_widget(capacity=5000, spill=None, scheduler=None):
+  """Create and return a new event log QDockWidget showing the last
+  *capacity* log records. See :py:class:`LogModel` for *spill* and
+  *scheduler*.
 
   """
   # We should make use of the real resource manager for this(!)
   resource_dir = os.path.join(os.path.dirname(__file__), 'res')
   ui_file = os.path.join(resource_dir, 'dock_eventlog.ui')
 
-  if qt.USES_PYSIDE:
-    loader = QUiLoader()
-    loader.registerCustomWidget(LogView)
-    dock_widget = loader.load(ui_file)
-  else:
-    dock_widget = uic.loadUi(ui_file)
-    
+  dock_widget = qt.load_ui(ui_file, (LogView,))
+
   # Find the log area and wire in our custom log handler
   log_view = dock_widget.findChild(LogView, 'logView')
   if log_view is not None:
-    log_model = LogModel()
+    log_model = LogModel(capacity, spill=spill, scheduler=scheduler)
     log_view.setModel(log_model)
     log.addHandler(log_model)
   else:
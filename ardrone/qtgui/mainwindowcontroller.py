@@ -4,22 +4,27 @@ The main GUI window
 
 """
 
+import glob
 import logging
 import os
 import json
+import re
+import time
 
 from ..util import qtcompat as qt
+from ..util import scheduler
 from cgi import escape as html_escape
 
 # Import the actual drone control stuff.
 from ..core.controlloop import ControlLoop
 from ..core import navdata
 from ..platform import qt as platform
+from ..vision.archive import FrameWriter
 
 # Utility widgets
 from .dronedetection import *
 from .eventlog import create_event_log_dock_widget
-#from .statusdisplay import StatusDisplay
+from .videowidget import FRAME_SIZE, VideoWidget
 
 QtCore = qt.import_module('QtCore')
 QtGui = qt.import_module('QtGui')
@@ -52,7 +57,12 @@ class MainWindowController(QtCore.QObject):
     # Record the widget we're controlling.
     self._widget = widget
 
-    log_dock = create_event_log_dock_widget()
+    # Periodic tasks. The control loop tick takes priority over everything
+    # else and logging runs last. Timing statistics are available from
+    # self.scheduler.stats().
+    self.scheduler = scheduler.QtScheduler()
+
+    log_dock = create_event_log_dock_widget(scheduler=self.scheduler)
     self._widget.addDockWidget(QtCore.Qt.BottomDockWidgetArea, log_dock)
 
     # Initialise the drone control loop and attempt to open a connection.
@@ -67,7 +77,7 @@ class MainWindowController(QtCore.QObject):
       status_bar.addPermanentWidget(self._drone_detect_label)
 
       # Set up drone detection.
-      self._drone_detector = DroneDetector()
+      self._drone_detector = DroneDetector(scheduler=self.scheduler)
 
       # Wire the drone detector into the label
       self._drone_detector.droneDetectionStateChanged.connect(self._drone_detect_label.setState)
@@ -80,15 +90,21 @@ class MainWindowController(QtCore.QObject):
     else:
       log.error('No status bar found on QMainWindow.')
 
-    # Show null video frame
-    self._cam_label = self._widget.findChild(QtGui.QLabel, 'camLabel')
-    if self._cam_label is not None:
-      self._cam_label.setPixmap(QtGui.QPixmap.fromImage(QtGui.QImage(320,240,QtGui.QImage.Format_RGB16)))
+    # The video widget shows a null frame until video arrives
+    self._video = self._widget.findChild(VideoWidget, 'videoWidget')
+    if self._video is None:
+      log.error('No video widget found on QMainWindow.')
     else:
-      log.error('No camera label found on QMainWindow.')
+      self._video.set_scheduler(self.scheduler)
 
     # No video frame as yet
-    self._last_frame = None
+    self._have_frame = False
+
+    # The archive video frames are being recorded to, if any
+    self._recording = None
+
+    # The number of the next image to save, found when the first is saved
+    self._next_image = None
 
     # Wire up our actions
     self._connect_action('actionFlatTrim', self.flat_trim)
@@ -99,17 +115,15 @@ class MainWindowController(QtCore.QObject):
     self._connect_action('actionStartVideo', self.start_video)
     self._connect_action('actionStartNavdata', self.start_navdata)
     self._connect_action('actionSaveImage', self.save_image)
+    self._connect_action('actionRecordVideo', self.record_video)
 
-    #self._status_display = StatusDisplay()
-    #self._widget.centralWidget().layout().addWidget(self._status_display.widget)
-    #for i in range(40):
-    #  self._status_display.new_pose(1,2,3,4)
-    #  self._status_display.new_pose(4,3,2,1)
+    # A rolling plot of attitude and altitude next to the video, created by
+    # _get_status_display() when the first pose arrives so that matplotlib is
+    # not imported while starting up. False if it could not be created.
+    self._status_display = None
 
-    self._tick_timer = QtCore.QTimer()
-    self._tick_timer.setInterval(25)
-    self._tick_timer.timeout.connect(self._control.tick)
-    self._tick_timer.start()
+    self.scheduler.add('tick', self._control.tick, 0.025, priority=scheduler.CONTROL)
+    self.scheduler.start()
 
   def _connect_action(self, name, cb):
     # Find the action.
@@ -123,16 +137,43 @@ class MainWindowController(QtCore.QObject):
 
   def _vid_cb(self, data):
     """Update the image in the camera window."""
-    self._last_frame = QtGui.QImage(data, 320, 240, QtGui.QImage.Format_RGB16)
-    self._cam_label.setPixmap(QtGui.QPixmap(self._last_frame))
+    self._have_frame = True
+    if self._video is not None:
+      self._video.set_frame(data)
+    if self._recording is not None:
+      self._recording.append(data)
+
+  def _get_status_display(self):
+    """Return the status display, creating it if necessary, or None if
+    matplotlib could not be imported. The window works without it.
+
+    """
+    if self._status_display is None:
+      try:
+        from .statusdisplay import StatusDisplay
+      except ImportError as e:
+        log.warning('Not showing the status display since matplotlib could not be imported: %s' % (str(e),))
+        self._status_display = False
+      else:
+        self._status_display = StatusDisplay(scheduler=self.scheduler)
+        self._widget.centralWidget().layout().addWidget(self._status_display.widget)
+    return self._status_display if self._status_display is not False else None
 
   def _navdata_cb(self, block):
     if isinstance(block, navdata.DemoBlock):
       self.batteryPercentage = block.vbat_flying_percentage
-      #self._status_display.new_pose(block.theta, block.psi, block.phi, block.altitude)
+      status_display = self._get_status_display()
+      if status_display is not None:
+        status_display.new_pose(block.theta, block.psi, block.phi, block.altitude)
     elif isinstance(block, navdata.VisionDetectBlock):
       # Parse the features from the block
       features = json.loads(block.json())['features']
+      # Feature positions are given in the range [0, 1000)
+      if self._video is not None:
+        sx, sy = FRAME_SIZE[0] / 1000.0, FRAME_SIZE[1] / 1000.0
+        self._video.set_overlays(boxes=[
+          ((f['xc'] - f['width'] / 2.0) * sx, (f['yc'] - f['height'] / 2.0) * sy,
+            f['width'] * sx, f['height'] * sy) for f in features])
     elif isinstance(block, navdata.ChecksumBlock):
       # This is handled by the control loop, we'll just ignore this
       pass
@@ -164,10 +205,6 @@ class MainWindowController(QtCore.QObject):
     log.info('Flat trim')
     self._control.flat_trim()
 
-  def _video_cb(self, im):
-    print('Image: %s' % (str(im),))
-    self._cam_label.setPixmap(QtGui.QPixmap.fromImage(im))
-
   @qt.Slot()
   def start_video(self):
     log.info('Start video')
@@ -180,17 +217,39 @@ class MainWindowController(QtCore.QObject):
 
   @qt.Slot()
   def save_image(self):
-    if self._last_frame is None:
+    if not self._have_frame or self._video is None:
       log.error('No video frame to save')
       return
 
-    # Search for the next available video image filename
-    i=0
-    imagepath = os.path.abspath('image_%06d.png' % i)
-    while os.path.exists(imagepath):
-      i += 1
-      imagepath =  os.path.abspath('image_%06d.png' % i)
+    # Number images after the last one already saved. The directory is only
+    # listed for the first image.
+    if self._next_image is None:
+      numbers = []
+      for path in glob.glob('image_*.png'):
+        match = re.match(r'image_(\d+)\.png$', os.path.basename(path))
+        if match is not None:
+          numbers.append(int(match.group(1)))
+      self._next_image = max(numbers) + 1 if len(numbers) > 0 else 0
+
+    imagepath = os.path.abspath('image_%06d.png' % self._next_image)
+    self._next_image += 1
 
     log.info('Saving image to: ' + imagepath)
-    self._last_frame.save(imagepath)
+    self._video.image().save(imagepath)
+
+  @qt.Slot(bool)
+  def record_video(self, checked):
+    """Start recording every video frame to a new frame archive (see
+    :py:mod:`ardrone.vision.archive`) if *checked* and stop otherwise.
+
+    """
+    if self._recording is not None:
+      log.info('Recorded %i frames to: %s' % (len(self._recording), self._recording.path))
+      self._recording.close()
+      self._recording = None
+
+    if checked:
+      path = os.path.abspath(time.strftime('video_%Y%m%d_%H%M%S.frames'))
+      log.info('Recording video to: ' + path)
+      self._recording = FrameWriter(path, FRAME_SIZE)
 
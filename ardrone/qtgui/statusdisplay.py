@@ -1,3 +1,5 @@
+from __future__ import division
+
 import logging, os
 log = logging.getLogger()
 
@@ -6,21 +8,31 @@ from matplotlib.figure import Figure
 
 import numpy as np
 from ..util import qtcompat as qt
+from ..util.profiling import profiler
+from ..util.rolling import RollingBuffer
+from ..util.scheduler import UI, monotonic
 
 # Extract the various Qt modules we want to use
 QtCore = qt.import_module('QtCore')
 QtGui = qt.import_module('QtGui')
 
-# Annoyingly PySide and PyQt4 have different ways of dealing with .ui files at
-# runtime.
-if qt.USES_PYSIDE:
-  from PySide.QtUiTools import QUiLoader
-else:
-  from PyQt4 import uic
+# The signals plotted, each on its own axes.
+FIELDS = ('theta', 'phi', 'psi', 'altitude')
+
+# The highest rate at which navdata arrives (Hz).
+MAX_RATE = 200
 
 class MatplotlibCanvas(FigureCanvas):
-  """Ultimately, this is a QWidget (as well as a FigureCanvasAgg, etc.)."""
-  def __init__(self, parent=None, width=5, height=4, dpi=100):
+  """Ultimately, this is a QWidget (as well as a FigureCanvasAgg, etc.).
+
+  Each of the signals in FIELDS is plotted as one line on its own axes
+  against time relative to the newest sample. Lines are drawn with blitting:
+  the axes are only redrawn in full when the canvas is resized or a signal
+  leaves the current y range, otherwise just the lines are redrawn over a
+  saved background.
+
+  """
+  def __init__(self, parent=None, width=5, height=4, dpi=100, window=30.0):
     fig = Figure(figsize=(width, height), dpi=dpi)
     super(MatplotlibCanvas, self).__init__(fig)
     self.setParent(parent)
@@ -30,67 +42,117 @@ class MatplotlibCanvas(FigureCanvas):
     self.psi = self.figure.add_subplot(2,2,3)
     self.altitude = self.figure.add_subplot(2,2,4)
 
-    self.theta.hold(False)
-    self.phi.hold(False)
-    self.psi.hold(False)
-    self.altitude.hold(False)
+    self.lines = {}
+    for name in FIELDS:
+      axes = getattr(self, name)
+      axes.set_title(name)
+      axes.set_xlim(-window, 0)
+      self.lines[name], = axes.plot([], [], animated=True)
 
-    self.theta.set_title('theta')
-    self.phi.set_title('phi')
-    self.psi.set_title('psi')
-    self.altitude.set_title('altitude')
+    # The background of each axes without its line, saved after each full draw
+    self._backgrounds = {}
+    self.mpl_connect('draw_event', self._on_draw)
 
     FigureCanvas.setSizePolicy(self,
                                QtGui.QSizePolicy.Expanding,
                                QtGui.QSizePolicy.Expanding)
     FigureCanvas.updateGeometry(self)
 
+  def set_window(self, window):
+    """Show the last *window* seconds of samples."""
+    for name in FIELDS:
+      getattr(self, name).set_xlim(-window, 0)
+    self.draw()
+
+  def update_lines(self, times, values):
+    """Plot the samples taken at *times* with *values*, a dictionary mapping
+    each name in FIELDS to an array.
+
+    """
+    if len(times) == 0:
+      return
+    relative = times - times[-1]
+
+    full_redraw = len(self._backgrounds) != len(FIELDS)
+    for name in FIELDS:
+      self.lines[name].set_data(relative, values[name])
+      full_redraw = self._fit_y(getattr(self, name), values[name]) or full_redraw
+
+    if full_redraw:
+      # Lines are drawn by _on_draw
+      self.draw()
+      return
+
+    for name in FIELDS:
+      axes = getattr(self, name)
+      self.restore_region(self._backgrounds[name])
+      axes.draw_artist(self.lines[name])
+      self.blit(axes.bbox)
+
+  def _fit_y(self, axes, values):
+    # Widen the y range of axes to fit values, returning True if it changed
+    finite = values[np.isfinite(values)]
+    if len(finite) == 0:
+      return False
+    low, high = axes.get_ylim()
+    lowest, highest = float(finite.min()), float(finite.max())
+    if lowest >= low and highest <= high:
+      return False
+    margin = 0.1 * max(highest - lowest, abs(highest), 1.0)
+    axes.set_ylim(min(low, lowest - margin), max(high, highest + margin))
+    return True
+
+  def _on_draw(self, event):
+    for name in FIELDS:
+      axes = getattr(self, name)
+      self._backgrounds[name] = self.copy_from_bbox(axes.bbox)
+      axes.draw_artist(self.lines[name])
+
 class StatusDisplay(QtCore.QObject):
-  def __init__(self, *args, **kwargs):
+  """A rolling plot of the last *window* seconds of the drone's attitude and
+  altitude, redrawn *rate* times a second while new samples arrive.
+
+  Samples are kept in a :py:class:`ardrone.util.rolling.RollingBuffer` large
+  enough for a full window at the highest navdata rate so
+  :py:meth:`new_pose` is cheap enough to call for every navdata packet.
+
+  If *scheduler* (an :py:class:`ardrone.util.scheduler.Scheduler`) is given
+  the plot is redrawn by it as a UI priority task, otherwise by a Qt timer.
+
+  """
+  def __init__(self, window=30.0, rate=10, scheduler=None, *args, **kwargs):
     super(StatusDisplay, self).__init__(*args, **kwargs)
 
     # We should make use of the real resource manager for this(!)
     resource_dir = os.path.join(os.path.dirname(__file__), 'res')
     ui_file = os.path.join(resource_dir, 'status_display.ui')
 
-    self._thetas = np.array([], dtype=np.float32)
-    self._psis = np.array([], dtype=np.float32)
-    self._phis = np.array([], dtype=np.float32)
-    self._altitudes = np.array([], dtype=np.float32)
+    self._window = window
+    self._samples = RollingBuffer(int(window * MAX_RATE) + 1, FIELDS, dtype=np.float32)
+    self._drawn_version = self._samples.version
 
-    if qt.USES_PYSIDE:
-      loader = QUiLoader()
-      loader.registerCustomWidget(MatplotlibCanvas)
-      self.widget = loader.load(ui_file)
-    else:
-      self.widget = uic.loadUi(ui_file)
+    self.widget = qt.load_ui(ui_file, (MatplotlibCanvas,))
 
     self._canvas = self.widget.findChild(MatplotlibCanvas, 'statusPlot')
-    self._update_timer = None
+    self._canvas.set_window(window)
 
-  def new_pose(self, theta, psi, phi, altitude):
-    self._thetas = np.append(self._thetas, theta)
-    self._phis = np.append(self._phis, phi)
-    self._psis = np.append(self._psis, psi)
-    self._altitudes = np.append(self._altitudes, altitude)
+    if scheduler is None:
+      self._update_timer = QtCore.QTimer()
+      self._update_timer.setInterval(int(1000 / rate))
+      self._update_timer.timeout.connect(profiler.wrap(self._update, 'StatusDisplay._update'))
+      self._update_timer.start()
+    else:
+      scheduler.add('status_display', self._update, 1 / rate, priority=UI)
 
-    if self._update_timer is None:
-      self._update_timer = True
-      QtCore.QTimer.singleShot(2000, self._update)
+  def new_pose(self, theta, psi, phi, altitude, when=None):
+    """Add a sample taken at time *when* in seconds (by default now)."""
+    when = monotonic() if when is None else when
+    self._samples.append(when, theta=theta, phi=phi, psi=psi, altitude=altitude)
 
   def _update(self):
-    self._update_timer = None
-
-    kw = { }
-    
-    self._canvas.theta.plot(self._thetas, **kw)
-    self._canvas.psi.plot(self._psis, **kw)
-    self._canvas.phi.plot(self._phis, **kw)
-    self._canvas.altitude.plot(self._altitudes, **kw)
-
-    self._canvas.theta.set_title('theta')
-    self._canvas.phi.set_title('phi')
-    self._canvas.psi.set_title('psi')
-    self._canvas.altitude.set_title('altitude')
+    if self._samples.version == self._drawn_version:
+      return
+    self._drawn_version = self._samples.version
 
-    self._canvas.draw()
+    times, values = self._samples.window(self._window)
+    self._canvas.update_lines(times, values)
@@ -7,8 +7,8 @@ __modules = []
 try:
   from ..util import qtcompat
 
-  from . import app, mainwindowcontroller
-  __modules.extend([app, mainwindowcontroller])
+  from . import app, eventlog, mainwindowcontroller
+  __modules.extend([app, eventlog, mainwindowcontroller])
 except ImportError as e:
   print('Skipping qtgui tests since Qt could not be imported: %s' % (str(e),))
 
@@ -0,0 +1,167 @@
+"""
+Showing the video stream
+========================
+
+A widget which paints decoded video frames without allocating anything per
+frame. Frames are copied into one persistent buffer which a single QImage
+wraps, and the widget is repainted at most *max_fps* times a second however
+quickly frames arrive: a frame which arrives while a repaint is pending
+simply replaces the one which would have been shown.
+
+Detection results may be drawn over the frame with
+:py:meth:`VideoWidget.set_overlays`. They are painted directly on top of the
+frame in ``paintEvent`` rather than by drawing into a copy of the frame.
+
+"""
+
+from __future__ import division
+
+import logging
+
+import numpy as np
+
+from ..util import qtcompat as qt
+from ..util.profiling import profiler
+from ..util.scheduler import UI
+
+QtCore = qt.import_module('QtCore')
+QtGui = qt.import_module('QtGui')
+
+log = logging.getLogger()
+
+# The size of the frames decoded from the drone's video stream.
+FRAME_SIZE = (320, 240)
+
+class VideoWidget(QtGui.QWidget):
+  """Paint RGB565 video frames of *frame_size* (width, height), scaled to fit
+  the widget, at most *max_fps* times a second.
+
+  The *received* and *painted* attributes count the frames passed to
+  :py:meth:`set_frame` and the repaints requested to show a new frame. The
+  difference is the number of frames which were never shown.
+
+  """
+  def __init__(self, parent=None, frame_size=FRAME_SIZE, max_fps=30):
+    super(VideoWidget, self).__init__(parent)
+
+    self.frame_size = frame_size
+    self.received = 0
+    self.painted = 0
+
+    # The frame buffer and the image wrapping it. The image does not own the
+    # buffer so the array must live as long as the image.
+    width, height = frame_size
+    self._pixels = np.zeros((height, width), dtype=np.uint16)
+    self._image = QtGui.QImage(self._pixels.data, width, height,
+        width * 2, QtGui.QImage.Format_RGB16)
+
+    self._markers = []
+    self._boxes = []
+
+    # The overlays as last given to set_overlays() so that repeats are ignored
+    self._marker_key = ()
+    self._box_key = ()
+
+    # Set while a new frame has not been shown
+    self._pending = False
+    self._max_fps = max_fps
+    self._scheduler = None
+
+    # Limits the repaint rate. While it is running, new frames wait for it.
+    self._throttle = QtCore.QTimer()
+    self._throttle.setSingleShot(True)
+    self._throttle.setInterval(int(1000 / max_fps))
+    self._throttle.timeout.connect(profiler.wrap(self._show_pending, 'VideoWidget._show_pending'))
+
+    self.setSizePolicy(QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Expanding)
+    self.setAttribute(QtCore.Qt.WA_OpaquePaintEvent)
+
+  def set_scheduler(self, scheduler, name='video'):
+    """Repaint from a UI priority task called *name* of *scheduler* (an
+    :py:class:`ardrone.util.scheduler.Scheduler`) rather than the widget's own
+    timer. New frames are then shown when the task next runs.
+
+    """
+    self._throttle.stop()
+    self._scheduler = scheduler
+    scheduler.add(name, self._show_pending, 1 / self._max_fps, priority=UI)
+
+  def sizeHint(self):
+    return QtCore.QSize(*self.frame_size)
+
+  def set_frame(self, data):
+    """Show the frame in *data*, a sequence of bytes of RGB565 pixels."""
+    frame = np.frombuffer(data, dtype=np.uint16, count=self._pixels.size)
+    self._pixels.reshape(-1)[:] = frame
+    self.received += 1
+    self._request_show()
+
+  def set_overlays(self, markers=None, boxes=None):
+    """Draw *markers* and *boxes* over the frame until they are next set.
+    *markers* is a sequence of *(id, corners)* pairs where *corners* is a
+    sequence of (x, y) points in frame pixels. *boxes* is a sequence of
+    (x, y, width, height, ...) tuples in frame pixels such as
+    :py:class:`ardrone.vision.box.Box`. Either may be None to leave it
+    unchanged.
+
+    Overlays are drawn with the next frame shown, at most *max_fps* times a
+    second, and setting the same overlays again does nothing.
+
+    """
+    changed = False
+    if markers is not None:
+      key = tuple((marker_id, tuple(tuple(p) for p in corners)) for marker_id, corners in markers)
+      if key != self._marker_key:
+        self._marker_key = key
+        self._markers = [(str(marker_id), QtGui.QPolygonF([QtCore.QPointF(x, y) for x, y in corners]))
+            for marker_id, corners in key]
+        changed = True
+    if boxes is not None:
+      key = tuple(tuple(b[:4]) for b in boxes)
+      if key != self._box_key:
+        self._box_key = key
+        self._boxes = [QtCore.QRectF(*b) for b in key]
+        changed = True
+    if changed:
+      self._request_show()
+
+  def image(self):
+    """Return a copy of the current frame as a QImage."""
+    return self._image.copy()
+
+  def paintEvent(self, event):
+    painter = QtGui.QPainter(self)
+    target = QtCore.QRectF(self.rect())
+    painter.drawImage(target, self._image)
+
+    if len(self._markers) > 0 or len(self._boxes) > 0:
+      # Draw in frame pixels
+      painter.scale(target.width() / self.frame_size[0], target.height() / self.frame_size[1])
+      painter.setBrush(QtCore.Qt.NoBrush)
+
+      painter.setPen(QtGui.QPen(QtGui.QColor(255, 0, 255), 0))
+      for rect in self._boxes:
+        painter.drawRect(rect)
+
+      painter.setPen(QtGui.QPen(QtGui.QColor(0, 255, 0), 0))
+      for marker_id, polygon in self._markers:
+        painter.drawPolygon(polygon)
+        painter.drawText(polygon.boundingRect().center(), marker_id)
+
+    painter.end()
+
+  def _request_show(self):
+    # Repaint now unless a repaint was made too recently or the scheduler
+    # repaints, in which case it is made later.
+    self._pending = True
+    if self._scheduler is None and not self._throttle.isActive():
+      self._show_pending()
+
+  def _show_pending(self):
+    if not self._pending:
+      return
+    self._pending = False
+    self.painted += 1
+    self.update()
+    if self._scheduler is None:
+      self._throttle.start()
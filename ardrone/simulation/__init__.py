@@ -0,0 +1,40 @@
+"""
+Simulation
+==========
+
+Simulating the drone so that controllers can be tuned without flying.
+
+This package is made up of the following modules:
+
+  - model: Discrete transfer function models of each axis of the drone fitted
+    by least squares to logs of commands and responses.
+
+  - identification: Loading characterisation runs and navdata recordings
+    and fitting models to every axis at once with the uncertainty of each
+    fit.
+
+  - closedloop: Vectorised closed loop step response simulation of many
+    candidate controllers against a model with rise time, overshoot and
+    settling time metrics and a parameter sweep across a process pool.
+
+  - server: A simulated drone which speaks the AT command, navdata and video
+    protocols on the local machine for testing without hardware. It is not
+    imported with the package since it loads ``ardrone.core``.
+
+.. automodule:: ardrone.simulation.model
+  :members:
+
+.. automodule:: ardrone.simulation.identification
+  :members:
+
+.. automodule:: ardrone.simulation.closedloop
+  :members:
+
+.. automodule:: ardrone.simulation.server
+  :members:
+
+"""
+
+from . import model, identification, closedloop
+
+__all__ = ['model', 'identification', 'closedloop']
@@ -0,0 +1,261 @@
+"""
+Closed loop simulation
+======================
+
+Controllers can be tuned offline by running them in closed loop against a
+:py:class:`ardrone.simulation.model.DiscreteModel` of the drone and measuring
+the step response. Each controller is described in the same way as the
+controllers in ``multi_uav.Controllers``: a reference *r*, a pre-compensating
+gain *k*, an output *hard_limit* and the coefficients ``(g, cu, ce1, ce0)``
+returned by its ``coefficients()`` method such that::
+
+  e[k] = k * (r - y[k])
+  u[k] = g * ((cu * u[k-1]) - (ce1 * e[k-1]) + (ce0 * e[k]))
+
+Any object with those attributes and method may be simulated, including the
+``multi_uav`` controllers themselves.
+
+Many candidate controllers are simulated at once as one set of array
+operations per time step. :py:func:`sweep` additionally splits a large grid of
+candidate parameters across a pool of worker processes.
+
+"""
+
+from __future__ import division
+
+import itertools
+import multiprocessing
+
+import numpy as np
+
+def simulate(model, coefficients, k, reference, hard_limit, steps):
+  """Simulate a batch of controllers against *model* for *steps* samples,
+  starting at rest. *coefficients* is an array of shape (N, 4) and *k*,
+  *reference* and *hard_limit* are scalars or arrays of length N.
+
+  Returns a pair of arrays of shape (N, steps) giving the model outputs and
+  the (limited) controller outputs.
+
+  A proportional controller on a unit-gain first order lag leaves a steady
+  state error:
+
+  >>> from .model import DiscreteModel
+  >>> m = DiscreteModel([-0.5], [0.5], 0.04)
+  >>> y, u = simulate(m, [[1, 0, 0, 1]], 1.0, 1.0, 10.0, 50)
+  >>> float(round(y[0,-1], 3))
+  0.5
+
+  """
+  coefficients = np.atleast_2d(np.asarray(coefficients, dtype=np.float64))
+  batch = coefficients.shape[0]
+  k = np.broadcast_to(np.asarray(k, dtype=np.float64), (batch,))
+  reference = np.broadcast_to(np.asarray(reference, dtype=np.float64), (batch,))
+  hard_limit = np.broadcast_to(np.asarray(hard_limit, dtype=np.float64), (batch,))
+  g, cu, ce1, ce0 = [coefficients[:,i] for i in range(4)]
+
+  state = model.initial_state(batch)
+  ys = np.zeros((batch, steps))
+  us = np.zeros((batch, steps))
+  u_prev = np.zeros(batch)
+  e_prev = np.zeros(batch)
+
+  with np.errstate(over='ignore', invalid='ignore'):
+    for i in range(steps):
+      y = model.output(state)
+      e = k * (reference - y)
+      u_prev = g * (((cu * u_prev) - (ce1 * e_prev)) + (ce0 * e))
+      e_prev = e
+      u = np.clip(u_prev, -hard_limit, hard_limit)
+      model.step(state, u)
+      ys[:,i] = y
+      us[:,i] = u
+
+  return ys, us
+
+def step_metrics(y, reference, T, settle_band=0.02):
+  """Measure step responses from rest. *y* is an array of shape (N, steps)
+  of responses to a step of size *reference* (a scalar or array of length N)
+  sampled every *T* seconds.
+
+  Returns a dictionary of arrays of length N. Since controllers without
+  integral action do not reach the reference, the first three are measured
+  relative to the final value of the response (the mean over its last tenth):
+
+  - 'rise_time': time taken to go from 10% to 90% of the final value (NaN if
+    never reached).
+  - 'overshoot': peak excursion beyond the final value as a fraction of the
+    final value (infinite if the response is not finite or does not move
+    towards the reference).
+  - 'settling_time': time after which the response stays within
+    *settle_band* of the final value (NaN if it has not settled by the end).
+  - 'steady_state_error': the difference between the final value and the
+    reference as a fraction of the reference.
+
+  >>> y = np.array([[0.0, 0.5, 0.95, 1.1, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0]])
+  >>> m = step_metrics(y, 1.0, 0.1)
+  >>> [float(round(m[key][0], 3)) for key in
+  ...  ('rise_time', 'overshoot', 'settling_time', 'steady_state_error')]
+  [0.1, 0.1, 0.4, 0.0]
+  >>> m = step_metrics(0.5 * y, 1.0, 0.1)
+  >>> [float(round(m[key][0], 3)) for key in
+  ...  ('rise_time', 'overshoot', 'settling_time', 'steady_state_error')]
+  [0.1, 0.1, 0.4, 0.5]
+
+  """
+  y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+  batch, steps = y.shape
+  reference = np.broadcast_to(np.asarray(reference, dtype=np.float64), (batch,))
+  scale = np.where(reference == 0, 1.0, reference)[:,np.newaxis]
+  tail = max(steps // 10, 1)
+
+  with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+    # Normalise so that every response should go from 0 to 1
+    n = y / scale
+    final = n[:,-tail:].mean(axis=1)
+    ok = np.all(np.isfinite(n), axis=1) & (final > 0)
+    steady_state_error = np.where(ok, np.abs(1.0 - final), np.inf)
+
+    # Normalise again so that every response ends at 1
+    n = np.where(ok[:,np.newaxis], n / np.where(ok, final, 1.0)[:,np.newaxis], np.inf)
+
+    def first_at_least(level):
+      above = n >= level
+      idx = np.argmax(above, axis=1).astype(np.float64)
+      idx[~np.any(above, axis=1)] = np.nan
+      return idx
+
+    rise_time = (first_at_least(0.9) - first_at_least(0.1)) * T
+
+    overshoot = np.where(ok, np.maximum(np.max(n, axis=1) - 1.0, 0.0), np.inf)
+
+    outside = np.abs(n - 1.0) > settle_band
+    last_outside = steps - 1 - np.argmax(outside[:,::-1], axis=1)
+    settling_time = np.where(np.any(outside, axis=1), (last_outside + 1) * T, 0.0)
+    settling_time[outside[:,-1]] = np.nan
+
+  return {
+    'rise_time': rise_time,
+    'overshoot': overshoot,
+    'settling_time': settling_time,
+    'steady_state_error': steady_state_error,
+  }
+
+def evaluate(model, controllers, steps=250, reference=None):
+  """Simulate a step response for each object in *controllers* (see the
+  module documentation for what they must provide) and return the dictionary
+  of :py:func:`step_metrics`. The step is to each controller's reference
+  unless *reference* is given.
+
+  >>> from .model import DiscreteModel
+  >>> class Proportional(object):
+  ...   def __init__(self, k):
+  ...     self.k, self.r, self.hard_limit = k, 1.0, 100.0
+  ...   def coefficients(self):
+  ...     return (1.0, 0.0, 0.0, 1.0)
+  >>> m = DiscreteModel([-0.5], [0.5], 0.04)
+  >>> metrics = evaluate(m, [Proportional(1.0), Proportional(2.0)])
+  >>> [float(round(e, 2)) for e in metrics['steady_state_error']]
+  [0.5, 0.33]
+
+  The ``multi_uav`` controllers themselves may be evaluated. Against a slower
+  model, a lead-lag controller settles sooner and with less steady state
+  error than a proportional controller with the same gain:
+
+  >>> from multi_uav.Controllers import LeadLagController, ProportionalController
+  >>> m = DiscreteModel([-0.9], [0.1], 0.04)
+  >>> lead_lag = LeadLagController(None, None, None, None, 1.0, 0.15, 0.025, 0.04, 1.0, 0.5, 100.0)
+  >>> proportional = ProportionalController(None, None, None, None, 1.0, 1.0, 0.5, 100.0)
+  >>> metrics = evaluate(m, [lead_lag, proportional])
+  >>> [float(round(e, 2)) for e in metrics['steady_state_error']]
+  [0.5, 0.91]
+  >>> [float(round(t, 2)) for t in metrics['settling_time']]
+  [0.8, 1.36]
+
+  """
+  coefficients = [c.coefficients() for c in controllers]
+  k = [c.k for c in controllers]
+  if reference is None:
+    reference = [c.r for c in controllers]
+  hard_limit = [c.hard_limit for c in controllers]
+  y, u = simulate(model, coefficients, k, reference, hard_limit, steps)
+  return step_metrics(y, reference, model.T)
+
+def grid(**ranges):
+  """Return a list of parameter dictionaries, one for every combination of
+  the values given for each keyword.
+
+  >>> sorted(sorted(p.items()) for p in grid(a=[1, 2], b=[3]))
+  [[('a', 1), ('b', 3)], [('a', 2), ('b', 3)]]
+
+  """
+  names = sorted(ranges.keys())
+  return [dict(zip(names, values))
+      for values in itertools.product(*[ranges[n] for n in names])]
+
+def _evaluate_chunk(args):
+  model, controller_class, fixed, params, steps, reference = args
+  controllers = []
+  for p in params:
+    kwargs = dict(fixed)
+    kwargs.update(p)
+    controllers.append(controller_class(None, None, None, None, **kwargs))
+  return evaluate(model, controllers, steps, reference)
+
+def sweep(model, controller_class, params, fixed=None, steps=250,
+    reference=None, processes=None, chunk_size=512):
+  """Evaluate a controller for every parameter dictionary in *params* (see
+  :py:func:`grid`).
+
+  Each candidate is created as ``controller_class(None, None, None, None,
+  **kwargs)`` where *kwargs* are the parameters in *fixed* updated by those
+  of the candidate. The four leading arguments are the drone, feedback type,
+  output type and stability key taken by the ``multi_uav.Controllers``
+  classes which are not needed for simulation.
+
+  Candidates are simulated in chunks of *chunk_size* across a pool of
+  *processes* worker processes (by default one per CPU). If *processes* is 1
+  everything is done in this process.
+
+  Returns the dictionary of :py:func:`step_metrics` for all candidates in
+  order, with an additional 'params' entry giving the list of candidate
+  parameters.
+
+  """
+  params = list(params)
+  fixed = fixed if fixed is not None else {}
+  chunks = [(model, controller_class, fixed, params[i:i+chunk_size], steps, reference)
+      for i in range(0, len(params), chunk_size)]
+
+  if processes == 1 or len(chunks) <= 1:
+    results = [_evaluate_chunk(c) for c in chunks]
+  else:
+    pool = multiprocessing.Pool(processes)
+    try:
+      results = pool.map(_evaluate_chunk, chunks)
+    finally:
+      pool.close()
+      pool.join()
+
+  metrics = {}
+  for key in ('rise_time', 'overshoot', 'settling_time', 'steady_state_error'):
+    metrics[key] = np.concatenate([r[key] for r in results]) if results else np.zeros(0)
+  metrics['params'] = params
+  return metrics
+
+def best(metrics, key='settling_time', max_overshoot=None,
+    max_steady_state_error=None):
+  """Return the index of the candidate in *metrics* (as returned by
+  :py:func:`sweep`) with the smallest finite value of *key*, optionally only
+  considering candidates with at most *max_overshoot* and
+  *max_steady_state_error*. Returns None if there is no such candidate.
+
+  """
+  values = np.asarray(metrics[key], dtype=np.float64)
+  ok = np.isfinite(values)
+  if max_overshoot is not None:
+    ok &= np.asarray(metrics['overshoot']) <= max_overshoot
+  if max_steady_state_error is not None:
+    ok &= np.asarray(metrics['steady_state_error']) <= max_steady_state_error
+  if not np.any(ok):
+    return None
+  return int(np.flatnonzero(ok)[np.argmin(values[ok])])
@@ -0,0 +1,275 @@
+"""
+System identification
+======================
+
+Turning characterisation runs and navdata recordings into models of each axis
+of the drone.
+
+Signals are loaded into a dictionary mapping a name (e.g. 'pitch' or 'vx') to
+a pair of arrays of sample times and values. Two sources are supported:
+
+- The directories written by the ``ac622-control_characterisation`` scripts
+  which hold ``command_dump.dat`` (the pitch command) and one
+  ``<name>_dump.dat`` file for each logged navdata value. See
+  :py:func:`load_characterisation`.
+
+- JSON-lines recordings where each line is a record with a 'type', a 'when'
+  time in seconds and a 'what'. Records of type 'state_from_drone' whose
+  'what' is a demo navdata block give the theta, phi, psi, altitude, vx, vy
+  and vz signals. Records whose 'what' is a control packet (a dictionary with
+  a 'state' giving roll, pitch, yaw and gas as sent to the control loop) give
+  the command signals. See :py:func:`load_recording`.
+
+:py:func:`align` resamples commands and responses onto a common time base and
+:py:func:`identify` then fits first and second order ARX models (see
+:py:mod:`ardrone.simulation.model`) for every axis, and for a range of input
+delays, with a single batched least squares solve. Each fit comes with the
+standard errors of its coefficients and its residuals so that poorly
+determined models can be spotted.
+
+"""
+
+from __future__ import division
+
+import json
+import os
+
+import numpy as np
+
+from .model import DiscreteModel, load_log, regressors, resample
+
+# The (command, response) pair for each axis.
+AXES = (('pitch', 'vx'), ('roll', 'vy'), ('gas', 'altitude'), ('yaw', 'psi'))
+
+# The (na, nb) orders fitted by default: first and second order.
+ORDERS = ((1, 1), (2, 2))
+
+# Navdata fields in demo blocks and command fields in control packets.
+NAVDATA_FIELDS = ('theta', 'phi', 'psi', 'altitude', 'vx', 'vy', 'vz')
+COMMAND_FIELDS = ('roll', 'pitch', 'yaw', 'gas')
+
+def load_characterisation(directory):
+  """Load the signals in a characterisation run *directory*. The command log
+  gives the 'pitch' signal and every other ``<name>_dump.dat`` file gives the
+  signal *name*. Empty logs are ignored.
+
+  """
+  signals = {}
+  for filename in sorted(os.listdir(directory)):
+    if not filename.endswith('_dump.dat'):
+      continue
+    name = filename[:-len('_dump.dat')]
+    if name == 'command':
+      name = 'pitch'
+    times, values = load_log(os.path.join(directory, filename))
+    if len(times) > 0:
+      signals[name] = (times, values)
+  return signals
+
+def load_recording(lines):
+  """Load the signals in a JSON-lines recording. *lines* is an iterable of
+  lines (e.g. an open file) or a filename.
+
+  >>> records = [
+  ...   {'type': 'state_from_drone', 'when': 0.0,
+  ...    'what': {'type': 'demo', 'vx': 1.0, 'theta': 2.0}},
+  ...   {'type': 'state_to_drone', 'when': 0.5,
+  ...    'what': {'seq': 1, 'state': {'pitch': -0.5, 'roll': 0.0}}},
+  ...   {'type': 'state_from_drone', 'when': 1.0,
+  ...    'what': {'type': 'demo', 'vx': 3.0, 'theta': 4.0}},
+  ... ]
+  >>> signals = load_recording([json.dumps(r) for r in records])
+  >>> sorted(signals.keys())
+  ['pitch', 'roll', 'theta', 'vx']
+  >>> signals['vx'][0].tolist(), signals['vx'][1].tolist()
+  ([0.0, 1.0], [1.0, 3.0])
+
+  """
+  if isinstance(lines, str):
+    with open(lines) as f:
+      return load_recording(f)
+
+  samples = {}
+  for line in lines:
+    line = line.strip()
+    if len(line) == 0:
+      continue
+    record = json.loads(line)
+    what = record.get('what')
+    if not isinstance(what, dict) or 'when' not in record:
+      continue
+
+    if record.get('type') == 'state_from_drone' and what.get('type') == 'demo':
+      fields, source = NAVDATA_FIELDS, what
+    elif isinstance(what.get('state'), dict):
+      fields, source = COMMAND_FIELDS, what['state']
+    else:
+      continue
+
+    for name in fields:
+      if name in source:
+        samples.setdefault(name, []).append((record['when'], source[name]))
+
+  signals = {}
+  for name, values in samples.items():
+    data = np.array(values, dtype=np.float64)
+    order = np.argsort(data[:,0], kind='mergesort')
+    signals[name] = (data[order,0], data[order,1])
+  return signals
+
+def align(signals, axes=AXES, T=0.04):
+  """Resample the command and response of each axis in *axes* whose signals
+  are present in *signals* every *T* seconds over the time for which all of
+  them overlap. Commands are held between samples and responses
+  interpolated.
+
+  Returns a tuple *(axes, u, y)* where *axes* is the list of axes which were
+  present and *u* and *y* are arrays with one row of commands and responses
+  for each of them.
+
+  >>> signals = {
+  ...   'pitch': (np.array([0.0, 1.0]), np.array([0.0, 1.0])),
+  ...   'vx': (np.array([0.5, 2.0]), np.array([0.0, 3.0])),
+  ... }
+  >>> present, u, y = align(signals, T=0.25)
+  >>> present
+  [('pitch', 'vx')]
+  >>> u.tolist(), y.tolist()
+  ([[0.0, 0.0, 1.0]], [[0.0, 0.5, 1.0]])
+
+  """
+  present = [axis for axis in axes if axis[0] in signals and axis[1] in signals]
+  if len(present) == 0:
+    return present, np.zeros((0, 0)), np.zeros((0, 0))
+
+  names = set(name for axis in present for name in axis)
+  start = max(signals[name][0][0] for name in names)
+  end = min(signals[name][0][-1] for name in names)
+  count = max(int(np.floor((end - start) / T + 1e-9)) + 1, 0)
+
+  u = np.array([resample(signals[c][0], signals[c][1], T, start, count, hold=True)
+      for c, r in present])
+  y = np.array([resample(signals[r][0], signals[r][1], T, start, count)
+      for c, r in present])
+  return present, u.reshape(len(present), count), y.reshape(len(present), count)
+
+class Fit(object):
+  """A model fitted by :py:func:`identify`.
+
+  *axis* is the (command, response) pair and *model* the fitted
+  :py:class:`ardrone.simulation.model.DiscreteModel`. *stderr* gives the
+  standard error of each coefficient, with the a coefficients first and then
+  the b coefficients. *residuals* are the one-step-ahead prediction errors.
+  *rms* is their root mean square and *rsquared* is the fraction of the
+  variance of the response which the model explains.
+
+  """
+  def __init__(self, axis, model, stderr, residuals, rsquared):
+    self.axis = axis
+    self.model = model
+    self.stderr = stderr
+    self.residuals = residuals
+    self.rms = float(np.sqrt(np.mean(residuals ** 2))) if len(residuals) > 0 else float('nan')
+    self.rsquared = rsquared
+
+  def __repr__(self):
+    return 'Fit(%s->%s, %r, rsquared=%.3f)' % (self.axis[0], self.axis[1],
+        self.model, self.rsquared)
+
+  @property
+  def coefficients(self):
+    """The a then b coefficients of the model in one array."""
+    return np.concatenate((self.model.a, self.model.b))
+
+  def confidence_intervals(self, z=1.96):
+    """Return arrays of the lower and upper bounds of the coefficients
+    *z* standard errors either side of their fitted values (95% confidence
+    for the default).
+
+    """
+    c = self.coefficients
+    return c - z * self.stderr, c + z * self.stderr
+
+def fit_batch(u, y, na, nb, delays, first=None):
+  """Fit models of order (*na*, *nb*) to each row of *u* and *y* (arrays of
+  shape (M, N)) for each delay in *delays* with one batched least squares
+  solve.
+
+  Returns a tuple *(theta, stderr, residuals, rsquared)* with arrays of shape
+  (len(delays), M, na+nb), (len(delays), M, na+nb), (len(delays), M, N -
+  first) and (len(delays), M). *first* is as for
+  :py:func:`ardrone.simulation.model.regressors` and defaults to the history
+  needed by the longest delay.
+
+  """
+  u = np.atleast_2d(np.asarray(u, dtype=np.float64))
+  y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+  delays = list(delays)
+  if first is None:
+    first = max(na, nb + max(delays))
+
+  # phi has shape (delays, M, rows, params)
+  built = [regressors(u, y, na, nb, d, first) for d in delays]
+  phi = np.array([b[0] for b in built])
+  target = np.array([b[1] for b in built])
+  rows, params = phi.shape[2], phi.shape[3]
+  if rows <= params:
+    raise ValueError('Not enough samples to fit a model of this order.')
+
+  # Solve the normal equations for every delay and axis at once
+  normal = np.einsum('dmri,dmrj->dmij', phi, phi)
+  rhs = np.einsum('dmri,dmr->dmi', phi, target)
+  # A tiny ridge keeps degenerate (e.g. constant input) problems solvable
+  ridge = 1e-12 * np.maximum(np.trace(normal, axis1=2, axis2=3), 1e-300)
+  normal = normal + ridge[...,np.newaxis,np.newaxis] * np.eye(params)
+  inverse = np.linalg.inv(normal)
+  theta = np.einsum('dmij,dmj->dmi', inverse, rhs)
+
+  residuals = target - np.einsum('dmri,dmi->dmr', phi, theta)
+  rss = np.sum(residuals ** 2, axis=2)
+  variance = rss / (rows - params)
+  stderr = np.sqrt(np.maximum(variance[...,np.newaxis] *
+      np.diagonal(inverse, axis1=2, axis2=3), 0.0))
+
+  spread = np.sum((target - target.mean(axis=2)[...,np.newaxis]) ** 2, axis=2)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    rsquared = np.where(spread > 0, 1.0 - rss / spread, 0.0)
+  return theta, stderr, residuals, rsquared
+
+def identify(signals, axes=AXES, T=0.04, orders=ORDERS, delays=range(0, 6)):
+  """Fit models of each order in *orders* (pairs of (na, nb)) to every axis in
+  *axes* whose signals are present in *signals* (see :py:func:`align`). For
+  each axis and order, the input delay in *delays* (in samples) which gives
+  the smallest residuals is chosen.
+
+  Returns a dictionary mapping each axis to a list of :py:class:`Fit`, one
+  for each order.
+
+  >>> true = DiscreteModel([-0.9], [0.5], 0.04, delay=2)
+  >>> t = 0.04 * np.arange(500)
+  >>> u = np.sign(np.sin(t))
+  >>> signals = {'pitch': (t, u), 'vx': (t, true.response(u))}
+  >>> fits = identify(signals)
+  >>> first, second = fits[('pitch', 'vx')]
+  >>> first.model.delay, float(round(first.model.a[0], 6)), float(round(first.model.b[0], 6))
+  (2, -0.9, 0.5)
+  >>> bool(first.rsquared > 0.999999 and first.rms < 1e-6)
+  True
+
+  """
+  present, u, y = align(signals, axes, T)
+  fits = dict((axis, []) for axis in present)
+  if len(present) == 0:
+    return fits
+
+  delays = list(delays)
+  first = max(max(na, nb + max(delays)) for na, nb in orders)
+  for na, nb in orders:
+    theta, stderr, residuals, rsquared = fit_batch(u, y, na, nb, delays, first)
+    best = np.argmin(np.sum(residuals ** 2, axis=2), axis=0)
+    for m, axis in enumerate(present):
+      d = best[m]
+      model = DiscreteModel(theta[d,m,:na], theta[d,m,na:], T, delays[d])
+      fits[axis].append(Fit(axis, model, stderr[d,m], residuals[d,m],
+        float(rsquared[d,m])))
+  return fits
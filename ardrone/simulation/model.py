@@ -0,0 +1,220 @@
+"""
+Discrete-time models of the drone
+=================================
+
+The response of one axis of the drone to its control input (for example the
+forward velocity *vx* in response to a pitch command) is modelled by a
+discrete transfer function with sample period *T*::
+
+          b_1 q^-1 + ... + b_nb q^-nb
+  y = q^-d ---------------------------- u
+          1 + a_1 q^-1 + ... + a_na q^-na
+
+where *q^-1* delays a signal by one sample and *d* is an additional delay in
+samples. Equivalently, as a difference equation::
+
+  y[k] = - a_1 y[k-1] - ... - a_na y[k-na]
+         + b_1 u[k-d-1] + ... + b_nb u[k-d-nb]
+
+The coefficients are fitted by least squares to logs of commands and responses
+such as those recorded by the ``ac622-control_characterisation`` scripts.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+
+class DiscreteModel(object):
+  """A discrete transfer function with denominator coefficients *a* (a_1 to
+  a_na), numerator coefficients *b* (b_1 to b_nb), sample period *T* seconds
+  and extra input *delay* in samples.
+
+  The model may be run for many independent inputs at once. Create a state
+  with :py:meth:`initial_state` and advance it with :py:meth:`step`.
+
+  A first order lag with unit steady-state gain:
+
+  >>> m = DiscreteModel([-0.5], [0.5], 0.04)
+  >>> m.gain
+  1.0
+  >>> y = m.response(np.ones(20))
+  >>> float(y[0]), float(y[1]), float(y[2])
+  (0.0, 0.5, 0.75)
+  >>> bool(abs(y[-1] - 1) < 1e-4)
+  True
+
+  """
+  def __init__(self, a, b, T, delay=0):
+    self.a = np.asarray(a, dtype=np.float64).ravel()
+    self.b = np.asarray(b, dtype=np.float64).ravel()
+    self.T = T
+    self.delay = int(delay)
+
+  def __repr__(self):
+    return 'DiscreteModel(a=%s, b=%s, T=%r, delay=%d)' % (
+        [float(x) for x in self.a], [float(x) for x in self.b], self.T, self.delay)
+
+  @property
+  def gain(self):
+    """The steady-state gain of the model (infinite if it has a pole at
+    z = 1).
+
+    """
+    den = 1.0 + self.a.sum()
+    if den == 0:
+      return float('inf')
+    return float(self.b.sum() / den)
+
+  def is_stable(self):
+    """Return True if every pole of the model lies inside the unit circle."""
+    if len(self.a) == 0:
+      return True
+    return bool(np.all(np.abs(np.roots(np.concatenate(([1.0], self.a)))) < 1.0))
+
+  def initial_state(self, batch=1):
+    """Return the state of *batch* independent copies of the model at rest. The
+    state is a pair of arrays holding past outputs and past inputs.
+
+    """
+    return (np.zeros((batch, len(self.a))),
+        np.zeros((batch, len(self.b) + self.delay)))
+
+  def output(self, state):
+    """Return the current output of each copy of the model in *state*."""
+    ys, us = state
+    y = np.zeros(ys.shape[0])
+    if len(self.a) > 0:
+      y -= ys.dot(self.a)
+    if len(self.b) > 0:
+      y += us[:,self.delay:].dot(self.b)
+    return y
+
+  def step(self, state, u):
+    """Record the current output and the input *u* (one value per copy) and
+    advance *state* by one sample in place. Returns the output before the
+    step.
+
+    """
+    ys, us = state
+    y = self.output(state)
+    if ys.shape[1] > 0:
+      ys[:,1:] = ys[:,:-1]
+      ys[:,0] = y
+    if us.shape[1] > 0:
+      us[:,1:] = us[:,:-1]
+      us[:,0] = u
+    return y
+
+  def response(self, u):
+    """Return the output of the model, starting at rest, to the input
+    sequence *u*.
+
+    """
+    u = np.asarray(u, dtype=np.float64)
+    state = self.initial_state()
+    y = np.zeros(len(u))
+    for k in range(len(u)):
+      y[k] = self.step(state, u[k:k+1])[0]
+    return y
+
+def load_log(filename):
+  """Load a log of (time, value) lines as written by the characterisation
+  ``Logger``. Returns arrays of times and values sorted by time.
+
+  """
+  data = np.loadtxt(filename, ndmin=2)
+  if data.shape[0] == 0:
+    return np.zeros(0), np.zeros(0)
+  order = np.argsort(data[:,0], kind='mergesort')
+  return data[order,0], data[order,1]
+
+def resample(times, values, T, start, count, hold=False):
+  """Sample the signal given by *times* and *values* every *T* seconds
+  starting at *start*, *count* times. If *hold* is True, the last value at or
+  before each sample time is used (appropriate for commands) otherwise values
+  are linearly interpolated.
+
+  >>> t = np.array([0.0, 1.0, 2.0])
+  >>> v = np.array([0.0, 10.0, 0.0])
+  >>> resample(t, v, 0.5, 0.0, 4).tolist()
+  [0.0, 5.0, 10.0, 5.0]
+  >>> resample(t, v, 0.5, 0.0, 4, hold=True).tolist()
+  [0.0, 0.0, 10.0, 10.0]
+
+  """
+  sample_times = start + T * np.arange(count)
+  if not hold:
+    return np.interp(sample_times, times, values)
+  idxs = np.clip(np.searchsorted(times, sample_times, side='right') - 1, 0, len(values) - 1)
+  return values[idxs]
+
+def regressors(u, y, na, nb, delay=0, first=None):
+  """Return the regressor matrix and target vector for fitting a model with
+  *na* denominator and *nb* numerator coefficients and *delay* samples of
+  extra delay to the input *u* and output *y*.
+
+  *u* and *y* may have any number of leading dimensions, in which case each
+  pair of signals along the last axis gets its own regressors. The first
+  *first* samples are used only as history. By default this is the fewest
+  possible, ``max(na, nb + delay)``. Pass the same larger value when fitting
+  models of several orders or delays to the same data so that their
+  residuals line up.
+
+  Returns a pair *(phi, target)* of arrays of shape (..., N - first, na + nb)
+  and (..., N - first) such that ``target = phi . (a_1, ..., a_na, b_1, ...,
+  b_nb)`` for an exact model.
+
+  >>> phi, target = regressors(np.arange(5), 10 * np.arange(5), 1, 1)
+  >>> phi.tolist()
+  [[0, 0], [-10, 1], [-20, 2], [-30, 3]]
+  >>> target.tolist()
+  [10, 20, 30, 40]
+
+  """
+  u = np.asarray(u)
+  y = np.asarray(y)
+  n = y.shape[-1]
+  if first is None:
+    first = max(na, nb + delay)
+  if first < max(na, nb + delay):
+    raise ValueError('Too little history for a model of this order.')
+  columns = [-y[...,first-i:n-i] for i in range(1, na+1)]
+  columns += [u[...,first-delay-j:n-delay-j] for j in range(1, nb+1)]
+  return np.stack(columns, axis=-1), y[...,first:]
+
+def fit(u, y, T, na=1, nb=1, delay=0):
+  """Fit a :py:class:`DiscreteModel` with *na* denominator and *nb* numerator
+  coefficients and *delay* samples of extra delay to the uniformly sampled
+  input *u* and output *y* by least squares. See
+  :py:mod:`ardrone.simulation.identification` for fitting many models at
+  once along with their uncertainties.
+
+  >>> true = DiscreteModel([-1.2, 0.36], [0.1, 0.06], 0.04, delay=2)
+  >>> u = np.sign(np.sin(np.arange(400) / 7.0))
+  >>> m = fit(u, true.response(u), 0.04, na=2, nb=2, delay=2)
+  >>> bool(np.allclose(m.a, true.a) and np.allclose(m.b, true.b))
+  True
+
+  """
+  phi, target = regressors(np.asarray(u, dtype=np.float64),
+      np.asarray(y, dtype=np.float64), na, nb, delay)
+  if phi.shape[0] < na + nb:
+    raise ValueError('Not enough samples to fit a model of this order.')
+  theta = np.linalg.lstsq(phi, target, rcond=-1)[0]
+  return DiscreteModel(theta[:na], theta[na:], T, delay)
+
+def fit_logs(command_file, response_file, T=0.04, na=1, nb=1, delay=0):
+  """Fit a model from a command log and a response log (e.g. the
+  ``command_dump.dat`` and ``vx_dump.dat`` files written by
+  ``impulse_response.py``). Both are resampled every *T* seconds over the time
+  they overlap. Returns the fitted :py:class:`DiscreteModel`.
+
+  """
+  ct, cv = load_log(command_file)
+  rt, rv = load_log(response_file)
+  start = max(ct[0], rt[0])
+  count = int(np.floor((min(ct[-1], rt[-1]) - start) / T)) + 1
+  u = resample(ct, cv, T, start, count, hold=True)
+  y = resample(rt, rv, T, start, count)
+  return fit(u, y, T, na, nb, delay)
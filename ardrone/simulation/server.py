@@ -0,0 +1,735 @@
+"""
+Simulated drone server
+======================
+
+A drone which runs on the local machine and speaks the same network protocol
+as the real thing so that the control loop, the user interface and
+``multi_uav`` can be run, load tested and soak tested without hardware.
+
+A :py:class:`SimulatedDrone` holds the state of one drone:
+
+- AT commands (REF, PCMD, CONFIG, CTRL, COMWDG, FTRIM and ZAP) are parsed and
+  acted upon. Commands with a sequence number not greater than the last one
+  received are ignored unless the sequence number is 1, as on the drone.
+
+- The navdata state bits follow the bootstrap handshake which
+  ``ardrone.core.controlloop.ControlLoop`` relies on. Once navdata has been
+  requested, the NAVDATA_BOOTSTRAP bit is set and only the checksum block is
+  sent until a CONFIG command arrives. Every CONFIG command sets the command
+  ACK bit (COMMAND_MASK) which is cleared by CTRL mode 5. If no AT command
+  arrives for *watchdog_timeout* seconds the COM_WATCHDOG bit is set until a
+  COMWDG command arrives.
+
+- The pitch, roll, gas and yaw commands drive discrete-time models of the vx,
+  vy, altitude and psi axes (see :py:mod:`ardrone.simulation.model`). The
+  defaults are simple lags and integrators but models identified from flight
+  logs with :py:mod:`ardrone.simulation.identification` may be given
+  instead.
+
+Packets are built with :py:func:`ardrone.core.navdata.join`. A
+:py:class:`DroneServer` binds the AT, navdata and video ports for one drone and
+serves it from a thread. Navdata is sent at a configurable rate between 15 and
+200 Hz (by default 15 Hz in demo mode and 200 Hz otherwise, like the drone).
+Video is streamed by replaying P264 packets recorded with
+:py:func:`record_video`.
+
+Since the control loop binds the same port numbers locally as the drone
+listens on, the drone and the client need different addresses. Every address
+in 127.0.0.0/8 refers to the local machine on Linux so many drones may be run
+on one host by giving each its own address. :py:func:`serve_many` does this and
+:py:func:`loopback_config` returns matching connection settings in the same
+form as ``multi_uav.network_config``. From the command line::
+
+  python -m ardrone.simulation.server --count 4 --rate 200
+
+"""
+
+from __future__ import division
+
+import argparse
+import ctypes as ct
+import logging
+import math
+import select
+import socket
+import struct
+import sys
+import threading
+
+from ..core import navdata
+from ..util.scheduler import monotonic
+from .model import DiscreteModel
+
+log = logging.getLogger()
+
+# The range of navdata rates supported by the drone and the rates it uses in
+# demo and full navdata mode.
+MIN_RATE = 15
+MAX_RATE = 200
+DEMO_RATE = 15
+FULL_RATE = 200
+
+# Bits of the REF command argument
+REF_EMERGENCY = 1 << 8
+REF_TAKE_OFF = 1 << 9
+
+# Major control states reported in the top 16 bits of a demo block's ctrl_state
+CTRL_DEFAULT = 0
+CTRL_INIT = 1
+CTRL_LANDED = 2
+CTRL_FLYING = 3
+CTRL_HOVERING = 4
+CTRL_TAKEOFF = 6
+CTRL_LANDING = 8
+
+# State bits which are always set on a working drone
+_ALWAYS_ON = (navdata.ARDRONE_PIC_VERSION_MASK | navdata.ARDRONE_ATCODEC_THREAD_ON |
+    navdata.ARDRONE_NAVDATA_THREAD_ON | navdata.ARDRONE_VIDEO_THREAD_ON |
+    navdata.ARDRONE_ACQ_THREAD_ON)
+
+# The packet sent by a client to start navdata or video
+_START = b'\x01\x00\x00\x00'
+
+# Each recorded video packet is preceded by its time and length
+_RECORD_HEADER = struct.Struct('<dI')
+
+def decode_float(value):
+  """Convert an AT command argument holding the bit pattern of a 32-bit float
+  (as sent by ``ardrone.core.atcommands.pcmd``) back to a float.
+
+  >>> decode_float('-1090519040')
+  -0.5
+  >>> decode_float('0')
+  0.0
+
+  """
+  return ct.c_float.from_buffer_copy(ct.c_int32(int(value))).value
+
+def parse_at(data):
+  """Parse a packet of AT commands. Returns a list of *(name, sequence,
+  args)* tuples where *args* is a list of the remaining arguments as strings
+  with any quotes removed. Malformed commands are logged and skipped.
+
+  >>> parse_at(b'AT*REF=1,290718208\\rAT*CONFIG=2,"general:navdata_demo","TRUE"\\r')
+  [('REF', 1, ['290718208']), ('CONFIG', 2, ['general:navdata_demo', 'TRUE'])]
+  >>> parse_at(b'AT*COMWDG=3\\rgarbage\\r')
+  [('COMWDG', 3, [])]
+
+  """
+  if not isinstance(data, str):
+    data = data.decode('ascii', 'replace')
+
+  commands = []
+  for command in data.split('\r'):
+    command = command.strip()
+    if len(command) == 0:
+      continue
+    if not command.startswith('AT*') or '=' not in command:
+      log.warning('Ignoring malformed AT command: %r' % (command,))
+      continue
+    name, _, rest = command[3:].partition('=')
+    args = [a[1:-1] if a.startswith('"') and a.endswith('"') else a
+        for a in rest.split(',')]
+    try:
+      sequence = int(args[0])
+    except ValueError:
+      log.warning('Ignoring AT command with bad sequence: %r' % (command,))
+      continue
+    commands.append((name, sequence, args[1:]))
+  return commands
+
+def default_models(T=0.04):
+  """Return a dictionary of models for the 'vx', 'vy', 'altitude' and 'psi'
+  axes sampled every *T* seconds. Velocities follow tilt commands with a lag
+  of 0.4 seconds up to 2.5 m/s, altitude rises at up to 1 m/s and psi turns at
+  up to 100 degrees/s. Units are those of the navdata demo block: mm, mm/s
+  and millidegrees.
+
+  >>> models = default_models()
+  >>> round(models['vx'].gain)
+  -2500
+  >>> models['altitude'].response([1.0] * 3).tolist()
+  [0.0, 40.0, 80.0]
+
+  """
+  pole = math.exp(-T / 0.4)
+  return {
+    # Pitching nose down (negative pitch) flies forwards
+    'vx': DiscreteModel([-pole], [-2500.0 * (1 - pole)], T),
+    'vy': DiscreteModel([-pole], [2500.0 * (1 - pole)], T),
+    'altitude': DiscreteModel([-1.0], [1000.0 * T], T),
+    'psi': DiscreteModel([-1.0], [100000.0 * T], T),
+  }
+
+class SimulatedDrone(object):
+  """The state of one simulated drone.
+
+  *models* maps 'vx', 'vy', 'altitude' and 'psi' to
+  :py:class:`ardrone.simulation.model.DiscreteModel` instances driven by the
+  pitch, roll, gas and yaw commands respectively. All models must have the
+  same sample period. Missing axes use :py:func:`default_models`.
+
+  *max_tilt* is the tilt in millidegrees reported for a full pitch or roll
+  command, *takeoff_altitude* the altitude in mm at which take off completes
+  and *watchdog_timeout* the time in seconds without AT commands after which
+  the COM_WATCHDOG bit is set. If *com_lost_timeout* is not None, the
+  COM_LOST bit is set after that long without AT commands until navdata is
+  requested again. *battery* is the initial charge in percent which drains by
+  *drain* percent per second of flight.
+
+  Times passed to the methods are in seconds on any clock which only moves
+  forwards.
+
+  The drone starts in the navdata bootstrap state once navdata is requested:
+
+  >>> d = SimulatedDrone(watchdog_timeout=5.0)
+  >>> d.start_navdata(0.0)
+  >>> bool(d.state & navdata.ARDRONE_NAVDATA_BOOTSTRAP)
+  True
+  >>> d.blocks()
+  []
+
+  Configuring navdata ends the bootstrap and sets the command ACK bit until
+  the client acknowledges it:
+
+  >>> d.handle_at(b'AT*CONFIG=1,"general:navdata_demo","TRUE"\\r', 0.0)
+  >>> bool(d.state & navdata.ARDRONE_NAVDATA_BOOTSTRAP)
+  False
+  >>> bool(d.state & navdata.ARDRONE_COMMAND_MASK)
+  True
+  >>> d.handle_at(b'AT*CTRL=2,5,0\\r', 0.0)
+  >>> bool(d.state & navdata.ARDRONE_COMMAND_MASK)
+  False
+  >>> [type(b).__name__ for b in d.blocks()]
+  ['DemoBlock']
+
+  Take off and fly forwards:
+
+  >>> d.handle_at(b'AT*REF=3,290718208\\r', 0.0)
+  >>> d.advance(5.0)
+  >>> d.flying, d.altitude >= d.takeoff_altitude
+  (True, True)
+  >>> d.handle_at(b'AT*PCMD=4,1,0,-1090519040,0,0\\r', 5.0)
+  >>> d.advance(10.0)
+  >>> int(round(d.vx)), int(round(d.theta))
+  (1250, -6000)
+
+  Commands which are out of sequence are ignored:
+
+  >>> d.handle_at(b'AT*REF=2,290717696\\r', 10.0)
+  >>> d.flying
+  True
+
+  The watchdog fires when commands stop arriving and puts the drone into
+  hover:
+
+  >>> d.advance(13.0)
+  >>> bool(d.state & navdata.ARDRONE_COM_WATCHDOG_MASK), d.progressive
+  (True, False)
+  >>> d.handle_at(b'AT*COMWDG=5\\r', 13.0)
+  >>> bool(d.state & navdata.ARDRONE_COM_WATCHDOG_MASK)
+  False
+
+  """
+  def __init__(self, models=None, max_tilt=12000.0, takeoff_altitude=800.0,
+      watchdog_timeout=2.0, com_lost_timeout=None, battery=100.0, drain=0.05):
+    self.models = default_models()
+    if models is not None:
+      self.models.update(models)
+    periods = set(m.T for m in self.models.values())
+    if len(periods) != 1:
+      raise ValueError('All models must have the same sample period.')
+    self.T = periods.pop()
+    self._model_state = dict((name, m.initial_state()) for name, m in self.models.items())
+
+    self.max_tilt = max_tilt
+    self.takeoff_altitude = takeoff_altitude
+    self.watchdog_timeout = watchdog_timeout
+    self.com_lost_timeout = com_lost_timeout
+    self.battery = battery
+    self.drain = drain
+
+    self.state = _ALWAYS_ON
+    self.config = {}
+    self.navdata_demo = True
+    self.num_frames = 0
+    self.commands = 0
+
+    # Flight state
+    self.flying = False
+    self.emergency = False
+    self.ctrl_state = CTRL_LANDED
+    self.progressive = False
+    self.command = {'roll': 0.0, 'pitch': 0.0, 'gas': 0.0, 'yaw': 0.0}
+    self.theta = self.phi = self.psi = 0.0
+    self.altitude = self.vx = self.vy = self.vz = 0.0
+
+    self._last_sequence = 0
+    self._last_ref = 0
+    self._last_command_time = None
+    self._time = None
+
+  def start_navdata(self, now):
+    """Handle a request from the client to start sending navdata."""
+    self.state |= navdata.ARDRONE_NAVDATA_BOOTSTRAP
+    self.state &= ~navdata.ARDRONE_COM_LOST_MASK
+    self._last_command_time = now
+    if self._time is None:
+      self._time = now
+
+  def handle_at(self, data, now):
+    """Act on a packet of AT commands received at time *now*."""
+    for name, sequence, args in parse_at(data):
+      if sequence == 1:
+        self._last_sequence = 0
+      if sequence <= self._last_sequence:
+        log.debug('Ignoring out of sequence AT command: %s %s' % (name, sequence))
+        continue
+      self._last_sequence = sequence
+      self._last_command_time = now
+      self.commands += 1
+
+      handler = getattr(self, '_at_' + name.lower(), None)
+      if handler is None:
+        log.debug('Ignoring AT command: %s' % (name,))
+        continue
+      try:
+        handler(*args)
+      except (TypeError, ValueError) as e:
+        log.warning('Bad arguments to AT command %s %r: %s' % (name, args, e))
+
+  def _at_ref(self, value):
+    value = int(value)
+    pressed = (value & REF_EMERGENCY) != 0 and (self._last_ref & REF_EMERGENCY) == 0
+    self._last_ref = value
+
+    if pressed:
+      if self.emergency:
+        self.emergency = False
+      elif self.flying:
+        # Cut the motors
+        self.emergency = True
+        self._land_now()
+      return
+
+    if self.emergency:
+      return
+    if (value & REF_TAKE_OFF) != 0 and not self.flying:
+      self.flying = True
+      self.ctrl_state = CTRL_TAKEOFF
+    elif (value & REF_TAKE_OFF) == 0 and self.flying and self.ctrl_state != CTRL_LANDING:
+      self.ctrl_state = CTRL_LANDING
+
+  def _at_pcmd(self, flag, roll, pitch, gas, yaw):
+    self.progressive = (int(flag) & 1) != 0
+    self.command = {
+      'roll': decode_float(roll), 'pitch': decode_float(pitch),
+      'gas': decode_float(gas), 'yaw': decode_float(yaw),
+    }
+
+  def _at_config(self, key, value):
+    self.config[key] = value
+    if key.lower() == 'general:navdata_demo':
+      self.navdata_demo = value.upper() == 'TRUE'
+    self.state &= ~navdata.ARDRONE_NAVDATA_BOOTSTRAP
+    self.state |= navdata.ARDRONE_COMMAND_MASK
+
+  def _at_ctrl(self, mode, filesize=0):
+    if int(mode) == 5:
+      self.state &= ~navdata.ARDRONE_COMMAND_MASK
+
+  def _at_comwdg(self):
+    self.state &= ~navdata.ARDRONE_COM_WATCHDOG_MASK
+
+  def _at_ftrim(self):
+    pass
+
+  def _at_zap(self, channel):
+    self.config['video:video_channel'] = channel
+
+  def _land_now(self):
+    self.flying = False
+    self.ctrl_state = CTRL_LANDED
+    self.progressive = False
+    self.theta = self.phi = 0.0
+    self.altitude = self.vx = self.vy = self.vz = 0.0
+    for name, m in self.models.items():
+      if name != 'psi':
+        self._model_state[name] = m.initial_state()
+
+  def advance(self, now):
+    """Update the watchdogs and run the dynamics up to time *now*."""
+    if self._time is None:
+      self._time = now
+    if self._last_command_time is None:
+      self._last_command_time = now
+
+    silence = now - self._last_command_time
+    if silence > self.watchdog_timeout and not (self.state & navdata.ARDRONE_COM_WATCHDOG_MASK):
+      self.state |= navdata.ARDRONE_COM_WATCHDOG_MASK
+      self.progressive = False
+    if self.com_lost_timeout is not None and silence > self.com_lost_timeout:
+      self.state |= navdata.ARDRONE_COM_LOST_MASK
+
+    while self._time + self.T <= now:
+      self._step()
+      self._time += self.T
+
+  def _step(self):
+    if not self.flying:
+      return
+    self.battery = max(self.battery - self.drain * self.T, 0.0)
+
+    command = self.command if self.progressive else dict.fromkeys(self.command, 0.0)
+    gas = command['gas']
+    if self.ctrl_state == CTRL_TAKEOFF:
+      gas = 1.0
+    elif self.ctrl_state == CTRL_LANDING:
+      gas = -1.0
+
+    inputs = {'vx': command['pitch'], 'vy': command['roll'], 'altitude': gas, 'psi': command['yaw']}
+    outputs = {}
+    for name, m in self.models.items():
+      m.step(self._model_state[name], [inputs[name]])
+      outputs[name] = float(m.output(self._model_state[name])[0])
+
+    previous = self.altitude
+    self.vx, self.vy = outputs['vx'], outputs['vy']
+    self.altitude = outputs['altitude']
+    self.vz = (self.altitude - previous) / self.T
+    self.psi = (outputs['psi'] + 180000.0) % 360000.0 - 180000.0
+    self.theta = command['pitch'] * self.max_tilt
+    self.phi = command['roll'] * self.max_tilt
+
+    if self.ctrl_state == CTRL_TAKEOFF and self.altitude >= self.takeoff_altitude:
+      self.ctrl_state = CTRL_HOVERING
+    elif self.ctrl_state == CTRL_LANDING and self.altitude <= 0:
+      self._land_now()
+    elif self.ctrl_state in (CTRL_FLYING, CTRL_HOVERING):
+      self.ctrl_state = CTRL_FLYING if self.progressive else CTRL_HOVERING
+
+  def navdata_state(self):
+    """Return the state bits to send in the next navdata packet."""
+    state = self.state
+    if self.flying:
+      state |= navdata.ARDRONE_FLY_MASK
+    if self.emergency:
+      state |= navdata.ARDRONE_EMERGENCY_MASK
+    if self.navdata_demo:
+      state |= navdata.ARDRONE_NAVDATA_DEMO_MASK
+    if self.battery < 20:
+      state |= navdata.ARDRONE_VBAT_LOW
+    return state
+
+  def blocks(self):
+    """Return the option blocks to send in the next navdata packet: none
+    during the bootstrap, a demo block in demo mode and demo and vision detect
+    blocks otherwise.
+
+    """
+    if self.state & navdata.ARDRONE_NAVDATA_BOOTSTRAP:
+      return []
+
+    demo = navdata.DemoBlock()
+    demo.header.id = navdata.NAVDATA_DEMO_TAG
+    demo.ctrl_state = self.ctrl_state << 16
+    demo.vbat_flying_percentage = int(self.battery)
+    demo.theta, demo.phi, demo.psi = self.theta, self.phi, self.psi
+    demo.altitude = int(round(self.altitude))
+    demo.vx, demo.vy, demo.vz = self.vx, self.vy, self.vz
+    demo.num_frames = self.num_frames & 0xffffffff
+    if self.navdata_demo:
+      return [demo]
+
+    detect = navdata.VisionDetectBlock()
+    detect.header.id = navdata.NAVDATA_VISION_DETECT_TAG
+    return [demo, detect]
+
+def read_packets(f):
+  """Yield *(time, data)* pairs for each video packet recorded in the file
+  *f* by :py:func:`write_packets`.
+
+  >>> import io
+  >>> f = io.BytesIO()
+  >>> write_packets(f, [(0.5, b'abc'), (0.75, b'de')])
+  >>> _ = f.seek(0)
+  >>> [(t, bytes(d)) for t, d in read_packets(f)] == [(0.5, b'abc'), (0.75, b'de')]
+  True
+
+  """
+  while True:
+    header = f.read(_RECORD_HEADER.size)
+    if len(header) < _RECORD_HEADER.size:
+      return
+    when, size = _RECORD_HEADER.unpack(header)
+    data = f.read(size)
+    if len(data) < size:
+      log.warning('Truncated video recording')
+      return
+    yield when, data
+
+def write_packets(f, packets):
+  """Write *(time, data)* pairs of video packets to the file *f*."""
+  for when, data in packets:
+    f.write(_RECORD_HEADER.pack(when, len(data)))
+    f.write(data)
+
+def record_video(filename, host='0.0.0.0', port=5562, duration=None):
+  """Record the raw video packets forwarded by a control loop to its video
+  data port (5562 by default) into *filename* for :py:class:`DroneServer` to
+  replay. Records for *duration* seconds or until interrupted.
+
+  """
+  sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  sock.bind((host, port))
+  start = monotonic()
+  count = 0
+  with open(filename, 'wb') as f:
+    try:
+      while duration is None or monotonic() - start < duration:
+        readable, _, _ = select.select([sock], [], [], 0.5)
+        if len(readable) == 0:
+          continue
+        data = sock.recv(65536)
+        write_packets(f, [(monotonic() - start, data)])
+        count += 1
+    except KeyboardInterrupt:
+      pass
+  sock.close()
+  log.info('Recorded %i video packets to %s' % (count, filename))
+  return count
+
+class DroneServer(threading.Thread):
+  """Serve a :py:class:`SimulatedDrone` on the AT, navdata and video ports of
+  *host* from a thread. A port of 0 picks any free port. The bound addresses
+  are available as *at_address*, *nav_address* and *vid_address*.
+
+  *rate* is the navdata rate in Hz (between 15 and 200). If None, it follows
+  the drone's navdata mode. *video* is the filename of a recording made with
+  :py:func:`record_video` (or a list of *(time, data)* pairs) which is
+  replayed in a loop once the client requests video. *drone* defaults to a
+  new :py:class:`SimulatedDrone`.
+
+  Navdata is only sent once the client has asked for it:
+
+  >>> server = DroneServer(host='127.0.0.1', at_port=0, nav_port=0, vid_port=0, rate=100)
+  >>> server.start()
+  >>> client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  >>> client.settimeout(5)
+  >>> _ = client.sendto(b'\\x01\\x00\\x00\\x00', server.nav_address)
+  >>> header, blocks = navdata.split(client.recv(4096))
+  >>> header.sequence, bool(header.state & navdata.ARDRONE_NAVDATA_BOOTSTRAP)
+  (1, True)
+  >>> _ = client.sendto(b'AT*CONFIG=1,"general:navdata_demo","TRUE"\\r', server.at_address)
+  >>> while bool(header.state & navdata.ARDRONE_NAVDATA_BOOTSTRAP):
+  ...   header, blocks = navdata.split(client.recv(4096))
+  >>> [type(b).__name__ for b in blocks]
+  ['DemoBlock', 'ChecksumBlock']
+  >>> server.stop()
+  >>> client.close()
+
+  """
+  def __init__(self, drone=None, host='127.0.0.1', at_port=5556, nav_port=5554,
+      vid_port=5555, rate=None, video=None):
+    super(DroneServer, self).__init__()
+    self.daemon = True
+
+    if rate is not None and not (MIN_RATE <= rate <= MAX_RATE):
+      raise ValueError('Navdata rate must be between %i and %i Hz.' % (MIN_RATE, MAX_RATE))
+    self.drone = drone if drone is not None else SimulatedDrone()
+    self.rate = rate
+
+    if isinstance(video, str):
+      with open(video, 'rb') as f:
+        video = list(read_packets(f))
+    self._video = list(video) if video is not None else []
+    if len(self._video) > 0:
+      first = self._video[0][0]
+      self._video = [(t - first, data) for t, data in self._video]
+      # Leave a gap of one average packet interval before looping
+      self._video_length = self._video[-1][0] * len(self._video) / max(len(self._video) - 1, 1)
+
+    self._at = self._bind(host, at_port)
+    self._nav = self._bind(host, nav_port)
+    self._vid = self._bind(host, vid_port)
+    self.at_address = self._at.getsockname()
+    self.nav_address = self._nav.getsockname()
+    self.vid_address = self._vid.getsockname()
+
+    self._nav_client = None
+    self._vid_client = None
+    self._sequence = 0
+    self._next_navdata = None
+    self._video_start = None
+    self._video_index = 0
+    self._stopping = False
+
+  def _bind(self, host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    return sock
+
+  def stop(self):
+    """Stop serving and close the sockets."""
+    self._stopping = True
+    if self.is_alive():
+      self.join()
+    for sock in (self._at, self._nav, self._vid):
+      sock.close()
+
+  def navdata_period(self):
+    """The time between navdata packets in seconds."""
+    if self.rate is not None:
+      return 1.0 / self.rate
+    return 1.0 / (DEMO_RATE if self.drone.navdata_demo else FULL_RATE)
+
+  def run(self):
+    sockets = [self._at, self._nav, self._vid]
+    while not self._stopping:
+      now = monotonic()
+      deadlines = [now + 0.1]
+      if self._next_navdata is not None:
+        deadlines.append(self._next_navdata)
+      if self._video_start is not None:
+        deadlines.append(self._next_video_time())
+
+      readable, _, _ = select.select(sockets, [], [], max(min(deadlines) - now, 0.0))
+      now = monotonic()
+      for sock in readable:
+        self._receive(sock, now)
+
+      self.drone.advance(now)
+      if self._next_navdata is not None and now >= self._next_navdata:
+        self._send_navdata()
+        period = self.navdata_period()
+        self._next_navdata += period
+        if self._next_navdata < now:
+          # Skip missed packets rather than sending a burst
+          self._next_navdata = now + period
+      while self._video_start is not None and now >= self._next_video_time():
+        self._send_video()
+
+  def _receive(self, sock, now):
+    try:
+      data, address = sock.recvfrom(65536)
+    except socket.error as e:
+      log.debug('Error receiving: %s' % (e,))
+      return
+
+    if sock is self._at:
+      self.drone.handle_at(data, now)
+    elif sock is self._nav:
+      log.info('Starting navdata to %s:%s' % address)
+      self._nav_client = address
+      self._sequence = 0
+      self._next_navdata = now
+      self.drone.start_navdata(now)
+    elif sock is self._vid and len(self._video) > 0:
+      log.info('Starting video to %s:%s' % address)
+      self._vid_client = address
+      self._video_start = now
+      self._video_index = 0
+
+  def _send(self, sock, data, address):
+    try:
+      sock.sendto(data, address)
+    except socket.error as e:
+      log.debug('Error sending to %s:%s: %s' % (address[0], address[1], e))
+
+  def _send_navdata(self):
+    self._sequence += 1
+    packet = navdata.join(self.drone.navdata_state(), self._sequence, self.drone.blocks())
+    self._send(self._nav, packet, self._nav_client)
+
+  def _next_video_time(self):
+    loops, index = divmod(self._video_index, len(self._video))
+    return self._video_start + loops * self._video_length + self._video[index][0]
+
+  def _send_video(self):
+    data = self._video[self._video_index % len(self._video)][1]
+    self._send(self._vid, data, self._vid_client)
+    self._video_index += 1
+    self.drone.num_frames += 1
+
+def loopback_host(index):
+  """Return the loopback address of the *index*-th simulated drone."""
+  return '127.0.0.%i' % (10 + index,)
+
+def loopback_config(index):
+  """Return settings for ``ardrone.core.controlloop.ControlLoop`` (in the same
+  form as ``multi_uav.network_config``) which connect to the *index*-th drone
+  started by :py:func:`serve_many`. The ports which the control loop binds on
+  every address are offset by 100 for each drone so that many control loops
+  can run in one process.
+
+  >>> config = loopback_config(1)
+  >>> config['host'], config['bind_host'], config['control_port']
+  ('127.0.0.11', '127.0.1.11', 5660)
+
+  """
+  offset = 100 * index
+  return {
+    'host': loopback_host(index),
+    'control_host': '127.0.0.1',
+    'at_port': 5556,
+    'nav_port': 5554,
+    'vid_port': 5555,
+    'config_port': 5559 + offset,
+    'control_port': 5560 + offset,
+    'control_data_port': 5561 + offset,
+    'video_data_port': 5562 + offset,
+    'control_data_listening_port': 3456 + offset,
+    'video_data_listening_port': 3457 + offset,
+    'bind_host': '127.0.1.%i' % (10 + index,),
+  }
+
+def serve_many(count, rate=None, video=None, **kwargs):
+  """Start *count* simulated drones, the *i*-th on :py:func:`loopback_host`
+  (*i*). *rate* and *video* are passed to each :py:class:`DroneServer` and
+  any other keyword arguments to each :py:class:`SimulatedDrone`. Returns the
+  list of running servers.
+
+  """
+  if isinstance(video, str):
+    with open(video, 'rb') as f:
+      video = list(read_packets(f))
+  servers = []
+  for index in range(count):
+    server = DroneServer(SimulatedDrone(**kwargs), host=loopback_host(index),
+        rate=rate, video=video)
+    server.start()
+    log.info('Simulated drone %i on %s' % (index, loopback_host(index)))
+    servers.append(server)
+  return servers
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Run simulated drones.')
+  parser.add_argument('--count', type=int, default=1, help='number of drones')
+  parser.add_argument('--rate', type=float, default=None,
+      help='navdata rate in Hz (default: 15 in demo mode, 200 otherwise)')
+  parser.add_argument('--video', default=None, help='recorded video to replay')
+  parser.add_argument('--record-video', default=None, metavar='FILENAME',
+      help='record video forwarded by a control loop instead of simulating')
+  parser.add_argument('--duration', type=float, default=None,
+      help='seconds to record or serve for')
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(level=logging.INFO)
+  if args.record_video is not None:
+    record_video(args.record_video, duration=args.duration)
+    return 0
+
+  servers = serve_many(args.count, rate=args.rate, video=args.video)
+  start = monotonic()
+  try:
+    while args.duration is None or monotonic() - start < args.duration:
+      threading.Event().wait(0.5)
+  except KeyboardInterrupt:
+    pass
+  for server in servers:
+    server.stop()
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
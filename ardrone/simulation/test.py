@@ -0,0 +1,19 @@
+import unittest
+import doctest
+
+from . import closedloop, identification, model, server
+
+__modules = [identification, model, server]
+
+# The closed loop examples simulate the multi_uav controllers, which need Qt
+try:
+  import multi_uav.Controllers
+  __modules.append(closedloop)
+except ImportError as e:
+  print('Skipping closedloop tests since multi_uav could not be imported: %s' % (str(e),))
+
+def load_tests(loader, tests, ignore):
+  global __modules
+  for m in __modules:
+    tests.addTests(doctest.DocTestSuite(m))
+  return tests
@@ -2,7 +2,25 @@
 Miscellaneous utility functions
 ===============================
 
+.. automodule:: ardrone.util.logstore
+  :members:
+
+.. automodule:: ardrone.util.metrics
+  :members:
+
+.. automodule:: ardrone.util.profiling
+  :members:
+
 .. automodule:: ardrone.util.qtcompat
   :members:
 
+.. automodule:: ardrone.util.rolling
+  :members:
+
+.. automodule:: ardrone.util.scheduler
+  :members:
+
+.. automodule:: ardrone.util.tracing
+  :members:
+
 """
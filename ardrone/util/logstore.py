@@ -0,0 +1,432 @@
+"""
+Columnar log storage
+====================
+
+Flight logs, such as those written by the keyboard controller, are JSON lines
+of the form ``{"when": ..., "type": ..., "what": ...}``. Finding the vision
+blocks within a few seconds of a flight means parsing every line. A LogStore
+holds the same records as NumPy columns on disk so that a query only reads
+the columns and time range it asks for.
+
+Records are grouped into tables by type. State packets from the drone are
+split further by the type of the packet they carry, e.g.
+``state_from_drone.vision``. Nested values are flattened into one column each
+(e.g. ``body_v.x``) and every table has a ``when`` column giving the time of
+each record.
+
+Each table is written in chunks of a fixed number of rows and the index
+records the time range covered by each chunk, so a query only opens the
+chunks which overlap it. The layout of a store directory is::
+
+  index.json                        tables, columns and chunk time ranges
+  <table>/<chunk>/<column>.npy      columns of one chunk (uncompressed)
+  <table>/<chunk>.npz               columns of one chunk (compressed)
+
+Uncompressed chunks are memory-mapped when read so that large logs are never
+read into memory as a whole. Compressed chunks are smaller on disk and only
+the columns asked for are decompressed.
+
+Existing JSON-lines logs are converted with :py:func:`convert` or from the
+command line::
+
+  python -m ardrone.util.logstore flight_log.txt flight_log.store
+
+"""
+
+from __future__ import division
+
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+
+from numbers import Number
+
+import numpy as np
+
+log = logging.getLogger()
+
+# The number of rows in each chunk of a table by default.
+DEFAULT_CHUNK_SIZE = 4096
+
+_INDEX = 'index.json'
+_VERSION = 1
+
+def flatten(value, prefix=''):
+  """Return a list of *(name, value)* pairs for the scalar values within
+  *value*, a structure of dictionaries and lists as decoded from JSON. The
+  names of nested values are joined with dots.
+
+  >>> sorted(flatten({'type': 'vision', 'body_v': {'x': 1.0, 'y': 2.0}, 'ids': [3, 4]}))
+  [('body_v.x', 1.0), ('body_v.y', 2.0), ('ids.0', 3), ('ids.1', 4), ('type', 'vision')]
+  >>> flatten('image_000001.png', 'what')
+  [('what', 'image_000001.png')]
+
+  """
+  if isinstance(value, dict):
+    items = value.items()
+  elif isinstance(value, (list, tuple)):
+    items = enumerate(value)
+  else:
+    return [(prefix, value)]
+
+  pairs = []
+  for key, item in items:
+    name = '%s.%s' % (prefix, key) if prefix != '' else str(key)
+    pairs.extend(flatten(item, name))
+  return pairs
+
+def table_name(record):
+  """Return the name of the table for the JSON-lines log *record*: its type,
+  followed by the type of the packet it carries if there is one.
+
+  >>> table_name({'when': 0, 'type': 'state_from_drone', 'what': {'type': 'demo'}})
+  'state_from_drone.demo'
+  >>> table_name({'when': 0, 'type': 'frame_from_drone', 'what': 'image.png'})
+  'frame_from_drone'
+
+  """
+  what = record.get('what')
+  if isinstance(what, dict) and 'type' in what:
+    return '%s.%s' % (record['type'], what['type'])
+  return record['type']
+
+def _to_array(values):
+  # Convert a list of scalars, with None for missing values, into the
+  # narrowest of a boolean, integer, floating point or string array.
+  present = [v for v in values if v is not None]
+  if len(present) == len(values) and all(isinstance(v, bool) for v in values):
+    return np.array(values, dtype=np.bool_)
+  if all(isinstance(v, Number) for v in present):
+    if len(present) == len(values) and not any(isinstance(v, float) for v in values):
+      try:
+        return np.array(values, dtype=np.int64)
+      except OverflowError:
+        pass
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+  return np.array(['' if v is None else v for v in values], dtype='U')
+
+class _TableWriter(object):
+  # The rows of one table waiting to be written as a chunk.
+  def __init__(self):
+    self.columns = collections.OrderedDict([('when', [])])
+    self.rows = 0
+
+  def add(self, when, pairs):
+    self.columns['when'].append(when)
+    for name, value in pairs:
+      if name == 'when':
+        continue
+      column = self.columns.get(name)
+      if column is None:
+        column = self.columns[name] = [None] * self.rows
+      column.append(value)
+    self.rows += 1
+    for column in self.columns.values():
+      if len(column) < self.rows:
+        column.append(None)
+
+  def take(self):
+    columns = collections.OrderedDict((name, _to_array(values))
+        for name, values in self.columns.items())
+    self.__init__()
+    return columns
+
+class LogWriter(object):
+  """Write records to a new store in the directory *path*, which is created
+  if it does not exist. Rows are written in chunks of *chunk_size* and, if
+  *compress* is True, compressed.
+
+  Use as a context manager or call :py:meth:`close` to write the last
+  chunks.
+
+  """
+  def __init__(self, path, chunk_size=DEFAULT_CHUNK_SIZE, compress=False):
+    if chunk_size < 1:
+      raise ValueError('The chunk size must be at least one.')
+    self.path = path
+    self.chunk_size = chunk_size
+    self.compress = compress
+    self._pending = {}
+    self._index = {'version': _VERSION, 'tables': collections.OrderedDict()}
+
+    if not os.path.isdir(path):
+      os.makedirs(path)
+    if os.path.exists(os.path.join(path, _INDEX)):
+      raise ValueError('There is already a log store in %s.' % (path,))
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+  def append(self, table, when, values):
+    """Add a row to *table* for time *when* with the column values in the
+    dictionary *values*, which may be nested.
+
+    """
+    pending = self._pending.get(table)
+    if pending is None:
+      pending = self._pending[table] = _TableWriter()
+    pending.add(when, flatten(values))
+    if pending.rows >= self.chunk_size:
+      self._write_chunk(table)
+
+  def write_record(self, record):
+    """Add a record from a JSON-lines log, a dictionary with 'when', 'type'
+    and 'what' keys, to the table named by :py:func:`table_name`.
+
+    """
+    what = record.get('what')
+    if not isinstance(what, dict):
+      what = {'what': what}
+    self.append(table_name(record), record['when'], what)
+
+  def flush(self):
+    """Write every table's pending rows as a chunk."""
+    for table in list(self._pending.keys()):
+      if self._pending[table].rows > 0:
+        self._write_chunk(table)
+
+  def close(self):
+    """Write the remaining rows and the index."""
+    self.flush()
+    self._write_index()
+
+  def _write_chunk(self, table):
+    columns = self._pending[table].take()
+    when = columns['when']
+
+    entry = self._index['tables'].setdefault(table, {'columns': [], 'chunks': []})
+    for name in columns.keys():
+      if name not in entry['columns']:
+        entry['columns'].append(name)
+
+    chunk = '%06d' % (len(entry['chunks']),)
+    table_dir = os.path.join(self.path, table)
+    if self.compress:
+      if not os.path.isdir(table_dir):
+        os.makedirs(table_dir)
+      filename = chunk + '.npz'
+      with open(os.path.join(table_dir, filename), 'wb') as f:
+        np.savez_compressed(f, **columns)
+    else:
+      filename = chunk
+      chunk_dir = os.path.join(table_dir, chunk)
+      os.makedirs(chunk_dir)
+      for name, array in columns.items():
+        np.save(os.path.join(chunk_dir, name + '.npy'), array)
+
+    entry['chunks'].append({
+      'file': filename,
+      'rows': len(when),
+      'start': float(when.min()),
+      'end': float(when.max()),
+      'sorted': bool(np.all(when[1:] >= when[:-1])),
+      'columns': list(columns.keys()),
+    })
+
+    # Keep the index up to date so that a partly written store can be read
+    self._write_index()
+
+  def _write_index(self):
+    filename = os.path.join(self.path, _INDEX)
+    with open(filename + '.tmp', 'w') as f:
+      json.dump(self._index, f, indent=1)
+    if os.path.exists(filename):
+      os.remove(filename)
+    os.rename(filename + '.tmp', filename)
+
+class LogStore(object):
+  """Read the store in the directory *path*.
+
+  >>> import shutil, tempfile
+  >>> path = os.path.join(tempfile.mkdtemp(), 'log.store')
+  >>> with LogWriter(path, chunk_size=2) as writer:
+  ...   for t in range(5):
+  ...     writer.write_record({'when': t, 'type': 'state_from_drone',
+  ...         'what': {'type': 'demo', 'altitude': 100 * t, 'v': {'x': t / 2}}})
+  ...   writer.write_record({'when': 2.5, 'type': 'frame_from_drone', 'what': 'f.png'})
+  >>> store = LogStore(path)
+  >>> store.tables()
+  ['state_from_drone.demo', 'frame_from_drone']
+  >>> store.columns('state_from_drone.demo')
+  ['when', 'type', 'altitude', 'v.x']
+  >>> store.rows('state_from_drone.demo')
+  5
+
+  Only the columns and chunks asked for are read:
+
+  >>> rows = store.query('state_from_drone.demo', ['altitude'], start=1, end=3)
+  >>> rows['when'].tolist(), rows['altitude'].tolist()
+  ([1, 2], [100, 200])
+  >>> store.query('frame_from_drone')['what'].tolist()
+  ['f.png']
+  >>> shutil.rmtree(os.path.dirname(path))
+
+  """
+  def __init__(self, path, mmap=True):
+    self.path = path
+    self.mmap = mmap
+    with open(os.path.join(path, _INDEX)) as f:
+      self._index = json.load(f, object_pairs_hook=collections.OrderedDict)
+    if self._index.get('version') != _VERSION:
+      raise ValueError('Unsupported log store version: %s' % (self._index.get('version'),))
+
+  def tables(self):
+    """Return a list of the names of the tables in the store."""
+    return list(self._index['tables'].keys())
+
+  def columns(self, table):
+    """Return a list of the names of the columns in *table*."""
+    return list(self._table(table)['columns'])
+
+  def rows(self, table):
+    """Return the number of rows in *table*."""
+    return sum(chunk['rows'] for chunk in self._table(table)['chunks'])
+
+  def time_range(self, table):
+    """Return the earliest and latest times in *table*."""
+    chunks = self._table(table)['chunks']
+    return min(c['start'] for c in chunks), max(c['end'] for c in chunks)
+
+  def query(self, table, columns=None, start=None, end=None):
+    """Return a dictionary mapping the names in *columns* (every column of
+    *table* if None) and 'when' to arrays of their values in the rows of
+    *table* from time *start* up to, but not including, time *end*. Either
+    may be None for no limit.
+
+    Columns which are missing from some rows are NaN (or '' for strings) in
+    those rows. If the rows come from a single uncompressed chunk the arrays
+    are memory-mapped views of the store.
+
+    """
+    entry = self._table(table)
+    if columns is None:
+      columns = entry['columns']
+    names = ['when'] + [name for name in columns if name != 'when']
+    unknown = [name for name in names if name not in entry['columns']]
+    if len(unknown) > 0:
+      raise KeyError('No such columns in %s: %s' % (table, ', '.join(unknown)))
+
+    parts = dict((name, []) for name in names)
+    for chunk in entry['chunks']:
+      if (start is not None and chunk['end'] < start) or (end is not None and chunk['start'] >= end):
+        continue
+
+      reader = self._open_chunk(table, chunk)
+      rows = self._select(reader('when'), chunk['sorted'], start, end)
+      count = len(reader('when')[rows])
+      if count == 0:
+        continue
+      for name in names:
+        if name in chunk['columns']:
+          parts[name].append(reader(name)[rows])
+        else:
+          # Filled in once the type of the column is known
+          parts[name].append(count)
+
+    return dict((name, _concatenate(arrays)) for name, arrays in parts.items())
+
+  def _table(self, table):
+    try:
+      return self._index['tables'][table]
+    except KeyError:
+      raise KeyError('No such table: %s' % (table,))
+
+  def _open_chunk(self, table, chunk):
+    # Return a function returning the named column of chunk.
+    filename = os.path.join(self.path, table, chunk['file'])
+    if filename.endswith('.npz'):
+      archive = np.load(filename)
+      cache = {}
+      def read(name):
+        if name not in cache:
+          cache[name] = archive[name]
+        return cache[name]
+      return read
+
+    mmap_mode = 'r' if self.mmap else None
+    return lambda name: np.load(os.path.join(filename, name + '.npy'), mmap_mode=mmap_mode)
+
+  @staticmethod
+  def _select(when, is_sorted, start, end):
+    # Return an index selecting the rows of a chunk within [start, end).
+    if is_sorted:
+      first = 0 if start is None else int(np.searchsorted(when, start, side='left'))
+      last = len(when) if end is None else int(np.searchsorted(when, end, side='left'))
+      return slice(first, max(first, last))
+
+    mask = np.ones(len(when), dtype=np.bool_)
+    if start is not None:
+      mask &= when >= start
+    if end is not None:
+      mask &= when < end
+    return mask
+
+def _concatenate(parts):
+  # Join the parts of a column read from several chunks. A part which is a
+  # count stands for that many rows from a chunk without the column.
+  arrays = [part for part in parts if not isinstance(part, int)]
+  if len(arrays) == len(parts) == 1:
+    return arrays[0]
+  if len(arrays) > 0 and arrays[0].dtype.kind == 'U':
+    missing = ''
+  else:
+    missing = np.nan
+  parts = [np.full(part, missing) if isinstance(part, int) else part for part in parts]
+  if len(parts) == 0:
+    return np.zeros(0)
+  return np.concatenate(parts)
+
+def convert(lines, path, chunk_size=DEFAULT_CHUNK_SIZE, compress=False):
+  """Convert the JSON-lines log records read from the iterable *lines*
+  (e.g. an open log file) into a new store at *path*. Lines which are blank
+  or cannot be parsed are skipped with a warning. Returns the number of
+  records converted.
+
+  """
+  count, skipped = 0, 0
+  with LogWriter(path, chunk_size, compress) as writer:
+    for line in lines:
+      if line.strip() == '':
+        continue
+      try:
+        record = json.loads(line)
+        writer.write_record(record)
+      except (ValueError, KeyError, TypeError):
+        skipped += 1
+        continue
+      count += 1
+
+  if skipped > 0:
+    log.warning('Skipped %i log lines which could not be parsed.' % (skipped,))
+  return count
+
+def main(argv=None):
+  """Convert a JSON-lines log from the command line."""
+  parser = argparse.ArgumentParser(description='Convert a JSON-lines flight log into a columnar log store.')
+  parser.add_argument('log', help='the JSON-lines log to convert')
+  parser.add_argument('store', help='the directory to write the store to')
+  parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+      help='rows in each chunk (default: %(default)s)')
+  parser.add_argument('--compress', action='store_true',
+      help='compress the chunks rather than leaving them to be memory-mapped')
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(level=logging.INFO)
+
+  with open(args.log) as f:
+    count = convert(f, args.store, args.chunk_size, args.compress)
+
+  store = LogStore(args.store)
+  for table in store.tables():
+    log.info('%s: %i rows, %i columns' % (table, store.rows(table), len(store.columns(table))))
+  log.info('Converted %i records into %s' % (count, args.store))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
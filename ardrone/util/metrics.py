@@ -0,0 +1,257 @@
+"""
+Runtime metrics
+===============
+
+Counters, gauges and histograms describing what the drone software is doing,
+exposed in the Prometheus text format over a small local HTTP server so that a
+ground station dashboard may scrape them.
+
+Metrics are created through a :py:class:`Registry`, usually the module-level
+:py:data:`registry`. Asking for a metric which already exists with the same
+name and labels returns the existing one so modules may simply ask for the
+metrics they update when they are created:
+
+>>> r = Registry()
+>>> packets = r.counter('navdata_packets_total', 'Navdata packets received.',
+...                     {'host': '192.168.1.1'})
+>>> packets.inc()
+>>> r.counter('navdata_packets_total', labels={'host': '192.168.1.1'}) is packets
+True
+>>> battery = r.gauge('battery_percent', 'Battery charge.')
+>>> battery.set(87)
+>>> print(r.expose().strip())
+# HELP battery_percent Battery charge.
+# TYPE battery_percent gauge
+battery_percent 87
+# HELP navdata_packets_total Navdata packets received.
+# TYPE navdata_packets_total counter
+navdata_packets_total{host="192.168.1.1"} 1
+
+Updating a metric takes no lock. Each metric is expected to be updated from
+one thread (usually the Qt event loop) while the HTTP server thread only reads
+it, so a scrape may at worst see a histogram part way through an update.
+
+"""
+
+from __future__ import division
+
+import bisect
+import logging
+import threading
+
+from .scheduler import DEFAULT_EDGES
+
+log = logging.getLogger()
+
+# The port on which metrics are served by default.
+DEFAULT_PORT = 9110
+
+def _format_value(value):
+  if value == float('inf'):
+    return '+Inf'
+  if value == float('-inf'):
+    return '-Inf'
+  if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+    return str(int(value))
+  return repr(value)
+
+def _format_labels(labels):
+  if len(labels) == 0:
+    return ''
+  def escape(v):
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+  return '{%s}' % (','.join('%s="%s"' % (k, escape(v)) for k, v in labels),)
+
+class Metric(object):
+  """The base of all metrics. *labels* is a sorted tuple of (name, value)
+  pairs.
+
+  """
+  kind = None
+
+  def __init__(self, name, help, labels):
+    self.name = name
+    self.help = help
+    self.labels = labels
+
+  def samples(self):
+    """Return a list of (suffix, labels, value) tuples to expose."""
+    raise NotImplementedError('You must override the samples method.')
+
+class Counter(Metric):
+  """A count which only goes up."""
+  kind = 'counter'
+
+  def __init__(self, *args):
+    super(Counter, self).__init__(*args)
+    self.value = 0
+
+  def inc(self, amount=1):
+    self.value += amount
+
+  def samples(self):
+    return [('', self.labels, self.value)]
+
+class Gauge(Metric):
+  """A value which may go up and down."""
+  kind = 'gauge'
+
+  def __init__(self, *args):
+    super(Gauge, self).__init__(*args)
+    self.value = 0
+
+  def set(self, value):
+    self.value = value
+
+  def inc(self, amount=1):
+    self.value += amount
+
+  def dec(self, amount=1):
+    self.value -= amount
+
+  def samples(self):
+    return [('', self.labels, self.value)]
+
+class Histogram(Metric):
+  """A histogram of observations with fixed bucket upper bounds *edges*.
+  Bucket *i* counts observations no greater than ``edges[i]``.
+
+  >>> h = Histogram('decode_seconds', 'Decode time.', (), (0.01, 0.1))
+  >>> for v in (0.005, 0.05, 0.5):
+  ...   h.observe(v)
+  >>> [(suffix, value) for suffix, labels, value in h.samples()]
+  [('_bucket', 1), ('_bucket', 2), ('_bucket', 3), ('_sum', 0.555), ('_count', 3)]
+
+  """
+  kind = 'histogram'
+
+  def __init__(self, name, help, labels, edges=DEFAULT_EDGES):
+    super(Histogram, self).__init__(name, help, labels)
+    self.edges = tuple(edges)
+    self.counts = [0] * (len(self.edges) + 1)
+    self.sum = 0.0
+    self.count = 0
+
+  def observe(self, value):
+    self.counts[bisect.bisect_left(self.edges, value)] += 1
+    self.sum += value
+    self.count += 1
+
+  def samples(self):
+    samples = []
+    total = 0
+    for edge, count in zip(self.edges + (float('inf'),), self.counts):
+      total += count
+      samples.append(('_bucket', self.labels + (('le', _format_value(float(edge))),), total))
+    samples.append(('_sum', self.labels, self.sum))
+    samples.append(('_count', self.labels, self.count))
+    return samples
+
+class Registry(object):
+  """A collection of metrics which may be exposed together."""
+  def __init__(self):
+    self._metrics = {}
+    self._lock = threading.Lock()
+
+  def counter(self, name, help='', labels=None):
+    """Return the :py:class:`Counter` called *name* with *labels* (a
+    dictionary), creating it if necessary.
+
+    """
+    return self._get(Counter, name, help, labels)
+
+  def gauge(self, name, help='', labels=None):
+    """Return the :py:class:`Gauge` called *name* with *labels*, creating it
+    if necessary.
+
+    """
+    return self._get(Gauge, name, help, labels)
+
+  def histogram(self, name, help='', labels=None, edges=DEFAULT_EDGES):
+    """Return the :py:class:`Histogram` called *name* with *labels*, creating
+    it with bucket *edges* if necessary.
+
+    """
+    return self._get(Histogram, name, help, labels, edges)
+
+  def metrics(self):
+    """Return a list of every metric sorted by name and labels."""
+    with self._lock:
+      return [self._metrics[k] for k in sorted(self._metrics.keys())]
+
+  def expose(self):
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+    last_name = None
+    for metric in self.metrics():
+      if metric.name != last_name:
+        lines.append('# HELP %s %s' % (metric.name, metric.help.replace('\n', ' ')))
+        lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+        last_name = metric.name
+      for suffix, labels, value in metric.samples():
+        lines.append('%s%s%s %s' % (metric.name, suffix, _format_labels(labels),
+          _format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+  def serve(self, port=DEFAULT_PORT, host='127.0.0.1'):
+    """Serve the metrics over HTTP on *host* and *port* from a daemon thread.
+    Returns the server. Call its ``shutdown()`` method to stop it.
+
+    >>> r = Registry()
+    >>> r.counter('frames_total', 'Frames.').inc(3)
+    >>> server = r.serve(port=0)
+    >>> try:
+    ...   from urllib2 import urlopen
+    ... except ImportError:
+    ...   from urllib.request import urlopen
+    >>> url = 'http://127.0.0.1:%i/metrics' % (server.server_address[1],)
+    >>> urlopen(url).read().decode().splitlines()[-1]
+    'frames_total 3'
+    >>> server.shutdown()
+    >>> server.server_close()
+
+    """
+    # Imported here since the HTTP server modules are slow to import and most
+    # programs never serve their metrics. Some magic for Python3:
+    try:
+      from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    except ImportError:
+      from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    registry = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+          self.send_error(404)
+          return
+        body = registry.expose().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *args):
+        log.debug('Metrics request: ' + format % args)
+
+    server = HTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    log.info('Serving metrics on http://%s:%i/metrics' % server.server_address[:2])
+    return server
+
+  def _get(self, cls, name, help, labels, *args):
+    labels = tuple(sorted((labels or {}).items()))
+    key = (name, labels)
+    with self._lock:
+      metric = self._metrics.get(key)
+      if metric is None:
+        metric = cls(name, help, labels, *args)
+        self._metrics[key] = metric
+      elif not isinstance(metric, cls):
+        raise ValueError('Metric %s is a %s not a %s.' % (name, metric.kind, cls.kind))
+      return metric
+
+registry = Registry()
@@ -0,0 +1,432 @@
+"""
+Profiling the Qt event loop
+===========================
+
+Everything in the GUI and swarm programs runs from one Qt event loop so a slow
+slot delays every other one, including the handling of navdata and video
+datagrams. A Profiler shows which slots are responsible:
+
+- Slots, timer callbacks and navdata/video callbacks are wrapped with
+  :py:meth:`Profiler.wrap` where they are connected. The wall time of each
+  call is recorded in a histogram for that slot.
+
+- Once started, a Qt timer measures event loop lag: how late it fires
+  relative to when it was due. Lag is time during which no event could be
+  handled.
+
+- Optionally, a thread samples the stack of the event loop thread at a fixed
+  interval and counts each distinct stack. The counts are written in the
+  'folded' format read by ``flamegraph.pl`` and speedscope, with the slot
+  which was running as the root of each stack.
+
+Profiling is off unless switched on by environment variables, in which case
+:py:meth:`Profiler.wrap` returns its argument unchanged and costs nothing:
+
+- ``ARDRONE_PROFILE``: set to anything other than '' or '0' to record slot
+  times and event loop lag. A report is written to stderr at exit.
+
+- ``ARDRONE_PROFILE_STACKS``: a filename to which stack samples are written
+  at exit. Setting it also switches on ``ARDRONE_PROFILE``.
+
+- ``ARDRONE_PROFILE_INTERVAL``: the stack sampling interval in seconds
+  (default 0.005).
+
+The module-level :py:data:`profiler` is configured from the environment when
+this module is first imported. Programs call its :py:meth:`Profiler.start`
+method once the Qt application exists.
+
+Startup
+-------
+
+The module-level :py:data:`startup` is a :py:class:`StartupTimer` which
+records how long after the process started each stage of startup (importing
+the program, creating the application, handling the first navdata packet) was
+reached. Programs call :py:meth:`StartupTimer.mark` as they reach each stage
+and :py:meth:`StartupTimer.ready` once the first navdata packet has been
+handled, at which point the stages are logged and a warning is given if
+startup took longer than its budget:
+
+- ``ARDRONE_STARTUP_BUDGET``: the startup budget in seconds (default 5).
+
+The stages are also part of the profiler's report. Use ``python -X
+importtime`` to find which imports are responsible for a slow start.
+
+"""
+
+from __future__ import division
+
+import atexit
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+from .scheduler import DEFAULT_EDGES, Histogram, monotonic
+
+log = logging.getLogger()
+
+def _name(func):
+  # A readable name for a function or bound method
+  owner = getattr(func, '__self__', None)
+  name = getattr(func, '__name__', repr(func))
+  if owner is not None:
+    return '%s.%s' % (type(owner).__name__, name)
+  return name
+
+def fold(frame, root=None):
+  """Return the stack ending at *frame* in the folded format: the function,
+  file and line of each frame from the outermost in, separated by
+  semicolons. *root*, if given, is added as the outermost frame.
+
+  >>> def inner():
+  ...   return fold(sys._getframe(), root='slot')
+  >>> stack = inner().split(';')
+  >>> stack[0], stack[-1].split(' ')[0]
+  ('slot', 'inner')
+
+  """
+  frames = []
+  while frame is not None:
+    code = frame.f_code
+    frames.append('%s (%s:%i)' % (code.co_name,
+      os.path.basename(code.co_filename), code.co_firstlineno))
+    frame = frame.f_back
+  if root is not None:
+    frames.append(root)
+  frames.reverse()
+  return ';'.join(frames)
+
+class StackSampler(threading.Thread):
+  """Sample the stack of the thread with id *thread_id* every *interval*
+  seconds from a daemon thread. *label* is a function returning the root
+  frame to add to each sample (or None).
+
+  *counts* maps each folded stack to the number of times it was seen.
+
+  """
+  def __init__(self, thread_id, interval=0.005, label=None):
+    super(StackSampler, self).__init__()
+    self.daemon = True
+    self.thread_id = thread_id
+    self.interval = interval
+    self.label = label
+    self.counts = collections.defaultdict(int)
+    self._stop_event = threading.Event()
+
+  def run(self):
+    while not self._stop_event.wait(self.interval):
+      self.sample()
+
+  def sample(self):
+    """Take one sample."""
+    frame = sys._current_frames().get(self.thread_id)
+    if frame is None:
+      return
+    root = self.label() if self.label is not None else None
+    self.counts[fold(frame, root)] += 1
+
+  def stop(self):
+    self._stop_event.set()
+
+  def write(self, f):
+    """Write the samples to the file *f* in the folded format, one stack and
+    count per line.
+
+    """
+    for stack, count in sorted(self.counts.items()):
+      f.write('%s %i\n' % (stack, count))
+
+class Profiler(object):
+  """Record the wall time of Qt slots and the lag of the event loop.
+
+  If *stacks* is a filename, stack samples are taken every *interval* seconds
+  once started and written there when stopped. *clock* returns the current
+  time in seconds and defaults to a monotonic clock.
+
+  >>> now = [0.0]
+  >>> p = Profiler(enabled=True, clock=lambda: now[0])
+  >>> def slot():
+  ...   now[0] += 0.25
+  >>> wrapped = p.wrap(slot)
+  >>> wrapped()
+  >>> wrapped()
+  >>> stats = p.stats()['slots']['slot']
+  >>> stats['count'], stats['mean'], stats['max']
+  (2, 0.25, 0.25)
+
+  When disabled, slots are left alone:
+
+  >>> Profiler().wrap(slot) is slot
+  True
+
+  """
+  def __init__(self, enabled=False, stacks=None, interval=0.005, clock=None,
+      edges=DEFAULT_EDGES):
+    self.enabled = enabled or stacks is not None
+    self.stacks = stacks
+    self.interval = interval
+    self.clock = clock if clock is not None else monotonic
+    self.edges = edges
+
+    self.slots = {}
+    self.lag = Histogram(edges)
+    self.current = None
+    self.sampler = None
+
+    self._lag_timer = None
+    self._lag_interval = None
+    self._last_lag_check = None
+    self._started = False
+
+  @classmethod
+  def from_environment(cls, environ=None):
+    """Create a profiler configured by the environment variables described
+    in the module documentation.
+
+    >>> Profiler.from_environment({}).enabled
+    False
+    >>> p = Profiler.from_environment({'ARDRONE_PROFILE_STACKS': 'out.folded',
+    ...                                'ARDRONE_PROFILE_INTERVAL': '0.01'})
+    >>> p.enabled, p.stacks, p.interval
+    (True, 'out.folded', 0.01)
+
+    """
+    environ = environ if environ is not None else os.environ
+    enabled = environ.get('ARDRONE_PROFILE', '') not in ('', '0')
+    stacks = environ.get('ARDRONE_PROFILE_STACKS') or None
+    interval = float(environ.get('ARDRONE_PROFILE_INTERVAL', 0.005))
+    return cls(enabled, stacks, interval)
+
+  def wrap(self, func, name=None):
+    """Return a function which calls *func* and records its wall time under
+    *name* (by default the function's name and, for methods, class). If
+    profiling is disabled or *func* is None, *func* is returned unchanged.
+
+    """
+    if not self.enabled or func is None:
+      return func
+
+    name = name if name is not None else _name(func)
+    histogram = self.slots.setdefault(name, Histogram(self.edges))
+
+    def wrapper(*args, **kwargs):
+      outer = self.current
+      self.current = name
+      start = self.clock()
+      try:
+        return func(*args, **kwargs)
+      finally:
+        histogram.add(self.clock() - start)
+        self.current = outer
+
+    wrapper.__name__ = getattr(func, '__name__', 'wrapper')
+    wrapper.__doc__ = getattr(func, '__doc__', None)
+    return wrapper
+
+  def check_lag(self):
+    """Record the lag of a periodic check every *interval* seconds since
+    the last check. Called by the lag timer.
+
+    """
+    now = self.clock()
+    if self._last_lag_check is not None:
+      self.lag.add(max(now - self._last_lag_check - self._lag_interval, 0.0))
+    self._last_lag_check = now
+
+  def start(self, lag_interval=0.05):
+    """Start measuring event loop lag every *lag_interval* seconds and, if
+    configured, sampling the stack of the calling thread. Call this from the
+    Qt event loop thread once the application exists. Does nothing if
+    profiling is disabled.
+
+    """
+    if not self.enabled or self._started:
+      return
+    self._started = True
+
+    # Only import Qt when it is needed.
+    from . import qtcompat as qt
+    QtCore = qt.import_module('QtCore')
+
+    self._lag_interval = lag_interval
+    self._lag_timer = QtCore.QTimer()
+    if hasattr(self._lag_timer, 'setTimerType'):
+      self._lag_timer.setTimerType(QtCore.Qt.PreciseTimer)
+    self._lag_timer.setInterval(int(round(1000 * lag_interval)))
+    self._lag_timer.timeout.connect(self.check_lag)
+    self._lag_timer.start()
+
+    if self.stacks is not None:
+      self.sampler = StackSampler(threading.current_thread().ident,
+          self.interval, lambda: self.current)
+      self.sampler.start()
+
+    # Stop while Qt is still running if possible and otherwise at exit
+    app = QtCore.QCoreApplication.instance()
+    if app is not None:
+      app.aboutToQuit.connect(self.stop)
+    atexit.register(self.stop)
+    log.info('Profiling the event loop')
+
+  def stop(self):
+    """Stop profiling, write any stack samples and write a report to
+    stderr.
+
+    """
+    if not self._started:
+      return
+    self._started = False
+
+    if self._lag_timer is not None:
+      self._lag_timer.stop()
+    if self.sampler is not None:
+      self.sampler.stop()
+      with open(self.stacks, 'w') as f:
+        self.sampler.write(f)
+      log.info('Wrote %i stack samples to %s' % (sum(self.sampler.counts.values()), self.stacks))
+    sys.stderr.write(self.report())
+    if len(startup.stages) > 0:
+      sys.stderr.write(startup.report())
+
+  def stats(self):
+    """Return a dictionary with a summary of the event loop 'lag' and a
+    dictionary of 'slots' mapping each slot name to a summary of its wall
+    time (see :py:meth:`ardrone.util.scheduler.Histogram.summary`).
+
+    """
+    return {
+      'lag': self.lag.summary(),
+      'slots': dict((name, h.summary()) for name, h in self.slots.items()),
+    }
+
+  def report(self):
+    """Return a table of the slots which took the most time in total and
+    the event loop lag.
+
+    >>> now = [0.0]
+    >>> p = Profiler(enabled=True, clock=lambda: now[0])
+    >>> def slow():
+    ...   now[0] += 0.5
+    >>> p.wrap(slow)()
+    >>> print(p.report().strip())
+    slot                               calls    total     mean      max
+    slow                                   1    0.500    0.500    0.500
+    event loop lag                         0    0.000        -        -
+
+    """
+    def row(name, h):
+      if h.count == 0:
+        return '%-32s %7i %8.3f %8s %8s' % (name[:32], 0, 0.0, '-', '-')
+      return '%-32s %7i %8.3f %8.3f %8.3f' % (name[:32], h.count, h.total, h.mean, h.max)
+
+    lines = ['%-32s %7s %8s %8s %8s' % ('slot', 'calls', 'total', 'mean', 'max')]
+    for name, h in sorted(self.slots.items(), key=lambda item: -item[1].total):
+      if h.count > 0:
+        lines.append(row(name, h))
+    lines.append(row('event loop lag', self.lag))
+    return '\n'.join(lines) + '\n'
+
+def _process_start():
+  # The wall time at which this process started, or None if it is not known.
+  # Only Linux is supported, from the boot time and the process start time in
+  # clock ticks since boot.
+  try:
+    with open('/proc/stat') as f:
+      boot = [float(line.split()[1]) for line in f if line.startswith('btime ')][0]
+    with open('/proc/self/stat') as f:
+      # Skip the command, which may contain spaces, to the state field
+      fields = f.read().rsplit(')', 1)[1].split()
+    return boot + float(fields[19]) / os.sysconf('SC_CLK_TCK')
+  except (IOError, OSError, IndexError, ValueError, AttributeError):
+    return None
+
+class StartupTimer(object):
+  """Record the time taken to reach each stage of startup. Times are
+  measured by *clock*, a function returning the wall time in seconds, from
+  *origin*, which defaults to the start of the process if it can be found and
+  otherwise to when the timer was created. Startup is expected to be ready
+  within *budget* seconds.
+
+  >>> now = [10.0]
+  >>> s = StartupTimer(budget=1.0, clock=lambda: now[0], origin=10.0)
+  >>> now[0] = 10.25
+  >>> s.mark('imports')
+  0.25
+  >>> now[0] = 10.5
+  >>> s.ready('first navdata')
+  True
+  >>> print(s.report().strip())
+  startup stage                     seconds
+  imports                             0.250
+  first navdata                       0.500
+
+  Only the first time a stage is reached is recorded:
+
+  >>> now[0] = 12.0
+  >>> s.mark('imports')
+  0.25
+
+  """
+  def __init__(self, budget=None, clock=time.time, origin=None):
+    self.budget = budget
+    self.clock = clock
+    if origin is None:
+      origin = _process_start()
+    if origin is None or origin > clock():
+      origin = clock()
+    self.origin = origin
+    self.stages = collections.OrderedDict()
+
+  @classmethod
+  def from_environment(cls, environ=None):
+    """Create a timer with the budget in the environment variable described
+    in the module documentation.
+
+    >>> StartupTimer.from_environment({'ARDRONE_STARTUP_BUDGET': '2.5'}).budget
+    2.5
+
+    """
+    environ = environ if environ is not None else os.environ
+    return cls(float(environ.get('ARDRONE_STARTUP_BUDGET', 5.0)))
+
+  def elapsed(self):
+    """Return the number of seconds since the origin."""
+    return self.clock() - self.origin
+
+  def mark(self, stage):
+    """Record that *stage* has been reached if it has not been already and
+    return the number of seconds from the origin at which it first was.
+
+    """
+    if stage not in self.stages:
+      self.stages[stage] = self.elapsed()
+    return self.stages[stage]
+
+  def ready(self, stage='ready'):
+    """Mark the final *stage* of startup and log the time taken to reach
+    each stage, as a warning if it exceeded the budget. Returns False if
+    startup went over budget and True otherwise.
+
+    """
+    first = stage not in self.stages
+    elapsed = self.mark(stage)
+    within = self.budget is None or elapsed <= self.budget
+    if first:
+      if within:
+        log.info('Startup took %.3f seconds' % (elapsed,))
+      else:
+        log.warning('Startup took %.3f seconds, over its budget of %.3f seconds:\n%s' %
+            (elapsed, self.budget, self.report()))
+    return within
+
+  def report(self):
+    """Return a table of the time at which each stage was reached."""
+    lines = ['%-32s %8s' % ('startup stage', 'seconds')]
+    for stage, elapsed in self.stages.items():
+      lines.append('%-32s %8.3f' % (stage[:32], elapsed))
+    return '\n'.join(lines) + '\n'
+
+profiler = Profiler.from_environment()
+startup = StartupTimer.from_environment()
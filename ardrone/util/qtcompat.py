@@ -53,3 +53,24 @@ else:
   Signal = QtCore.pyqtSignal
   Slot = QtCore.pyqtSlot
   Property = QtCore.pyqtProperty
+
+def load_ui(ui_file, custom_widgets=()):
+  """Load the Qt Designer .ui file *ui_file* and return the top-level widget
+  it describes. *custom_widgets* is a sequence of the classes of any custom
+  widgets used in the file.
+
+  PySide and PyQt4 have different ways of dealing with .ui files at runtime.
+  Either way the loader is only imported the first time a file is loaded
+  since it is slow to import and not needed by programs without a GUI.
+
+  """
+  if USES_PYSIDE:
+    from PySide.QtUiTools import QUiLoader
+    loader = QUiLoader()
+    for widget_class in custom_widgets:
+      loader.registerCustomWidget(widget_class)
+    return loader.load(ui_file)
+
+  # PyQt4 finds custom widgets from the module named in the .ui file.
+  from PyQt4 import uic
+  return uic.loadUi(ui_file)
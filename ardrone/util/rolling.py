@@ -0,0 +1,100 @@
+"""
+Rolling windows of samples
+==========================
+
+A RollingBuffer keeps the most recent samples of several named signals, such
+as the navdata angles, in preallocated NumPy arrays. Appending a sample is
+O(1) and never allocates, and the samples currently held can be read back in
+order as array views without copying, so that plots may be fed from the
+buffer at full navdata rate for a whole flight.
+
+Each sample is written twice, at its position in the ring and again one
+capacity further on, so that the newest *capacity* samples are always
+contiguous in the underlying array.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+
+class RollingBuffer(object):
+  """Keep the last *capacity* samples of the signals named in *fields* along
+  with the time of each sample.
+
+  >>> b = RollingBuffer(3, ('theta', 'phi'))
+  >>> for t in range(5):
+  ...   b.append(t, theta=10 * t, phi=-t)
+  >>> len(b)
+  3
+  >>> b.times().tolist(), b['theta'].tolist(), b['phi'].tolist()
+  ([2.0, 3.0, 4.0], [20.0, 30.0, 40.0], [-2.0, -3.0, -4.0])
+
+  Samples within a time window of the newest one:
+
+  >>> times, values = b.window(1.5)
+  >>> times.tolist(), values['theta'].tolist()
+  ([3.0, 4.0], [30.0, 40.0])
+
+  """
+  def __init__(self, capacity, fields, dtype=np.float64):
+    if capacity < 1:
+      raise ValueError('The capacity must be at least one.')
+    self.capacity = capacity
+    self.fields = tuple(fields)
+    self._times = np.zeros(2 * capacity, dtype=np.float64)
+    self._values = dict((name, np.zeros(2 * capacity, dtype=dtype)) for name in self.fields)
+    self._head = 0
+    self._count = 0
+
+    # Incremented on every append so that readers can tell if they are stale
+    self.version = 0
+
+  def __len__(self):
+    return self._count
+
+  def __getitem__(self, name):
+    """Return a view of the samples of *name*, oldest first."""
+    return self._values[name][self._slice()]
+
+  def clear(self):
+    """Forget every sample."""
+    self._head = 0
+    self._count = 0
+    self.version += 1
+
+  def append(self, when, **values):
+    """Add a sample taken at time *when*. Signals not given are NaN."""
+    head, mirror = self._head, self._head + self.capacity
+    self._times[head] = self._times[mirror] = when
+    for name, array in self._values.items():
+      array[head] = array[mirror] = values.get(name, np.nan)
+    self._head = (head + 1) % self.capacity
+    self._count = min(self._count + 1, self.capacity)
+    self.version += 1
+
+  def times(self):
+    """Return a view of the sample times, oldest first."""
+    return self._times[self._slice()]
+
+  def latest(self):
+    """Return the time of the newest sample or None if there are none."""
+    if self._count == 0:
+      return None
+    return self._times[self._head + self.capacity - 1]
+
+  def window(self, duration):
+    """Return a pair of a view of the times of the samples taken within
+    *duration* seconds of the newest one and a dictionary mapping each signal
+    to a view of its values at those times.
+
+    """
+    times = self.times()
+    first = 0
+    if len(times) > 0:
+      first = int(np.searchsorted(times, times[-1] - duration, side='right'))
+    return times[first:], dict((name, self[name][first:]) for name in self.fields)
+
+  def _slice(self):
+    end = self._head + self.capacity
+    return slice(end - self._count, end)
@@ -0,0 +1,434 @@
+"""
+Scheduling periodic tasks
+=========================
+
+The control loop, controllers, swarm logic and user interface all need to do
+something every so often. Giving each of them its own Qt timer means that
+nothing knows whether the periods actually hold when the machine is loaded
+and a slow user interface update can delay a control tick. A Scheduler runs
+all periodic tasks from one place:
+
+- Deadlines are kept on a monotonic clock and advance by exactly one period
+  each time a task runs so that timing errors do not accumulate. Should the
+  clock ever step backwards (only possible if no monotonic clock could be
+  found) every deadline is moved back with it.
+
+- When several tasks are due, they are run in order of priority (control
+  before anything else, logging last) and then of deadline.
+
+- A task which has missed deadlines either catches up by running once for
+  each missed period (up to a limit) or skips the missed periods and runs
+  once. The latter is usually what you want for control.
+
+- For each task the measured period, the lateness of each run relative to its
+  deadline (jitter) and the run time are recorded in histograms along with
+  counts of overruns and skipped periods. These may be queried at any time via
+  :py:meth:`Scheduler.stats`.
+
+The Scheduler itself does not depend on Qt. Call :py:meth:`Scheduler.run_pending`
+from any loop or use a :py:class:`QtScheduler` which arms a single precise Qt
+timer for the next deadline.
+
+"""
+
+from __future__ import division
+
+import bisect
+import ctypes
+import ctypes.util
+import logging
+import os
+import sys
+import time
+
+log = logging.getLogger()
+
+def _find_monotonic():
+  # Return a function giving the time in seconds on a monotonic clock. Python
+  # 2 has no time.monotonic() so ask the operating system directly.
+  if hasattr(time, 'monotonic'):
+    return time.monotonic
+
+  try:
+    if sys.platform.startswith('win'):
+      counter, frequency = ctypes.c_int64(), ctypes.c_int64()
+      kernel32 = ctypes.windll.kernel32
+      if not kernel32.QueryPerformanceFrequency(ctypes.byref(frequency)):
+        raise OSError('No performance counter.')
+      def monotonic():
+        kernel32.QueryPerformanceCounter(ctypes.byref(counter))
+        return counter.value / frequency.value
+      return monotonic
+
+    class timespec(ctypes.Structure):
+      _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    # CLOCK_MONOTONIC is 6 on OS X and 1 on Linux and most other systems
+    clock_id = 6 if sys.platform == 'darwin' else 1
+    libc = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True)
+    clock_gettime = libc.clock_gettime
+    clock_gettime.argtypes = (ctypes.c_int, ctypes.POINTER(timespec))
+    ts = timespec()
+    if clock_gettime(clock_id, ctypes.byref(ts)) != 0:
+      raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    def monotonic():
+      clock_gettime(clock_id, ctypes.byref(ts))
+      return ts.tv_sec + 1e-9 * ts.tv_nsec
+    return monotonic
+  except (AttributeError, OSError, TypeError) as e:
+    log.warning('No monotonic clock available, using the wall clock: %s' % (e,))
+    return time.time
+
+"""A function returning the time in seconds on a monotonic clock if one can
+be found, otherwise the wall clock."""
+monotonic = _find_monotonic()
+
+# Task priorities. Lower numbers run first.
+CONTROL = 0
+NORMAL = 1
+UI = 2
+LOGGING = 3
+
+# Policies for tasks which have missed deadlines.
+CATCH_UP = 'catch_up'
+SKIP = 'skip'
+
+# Default histogram bucket edges in seconds
+DEFAULT_EDGES = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+    0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+class Histogram(object):
+  """A histogram of non-negative values with fixed bucket *edges*.
+
+  Bucket *i* counts values less than ``edges[i]`` and not less than
+  ``edges[i-1]``. The final bucket counts values not less than the last edge.
+  The count, total and maximum of all values are also recorded.
+
+  >>> h = Histogram((1, 2, 5))
+  >>> for v in (0.5, 1.5, 1.5, 3, 10):
+  ...   h.add(v)
+  >>> h.counts
+  [1, 2, 1, 1]
+  >>> h.count, h.mean, h.max
+  (5, 3.3, 10)
+  >>> h.percentile(50)
+  2
+
+  """
+  def __init__(self, edges=DEFAULT_EDGES):
+    self.edges = tuple(edges)
+    self.counts = [0] * (len(self.edges) + 1)
+    self.count = 0
+    self.total = 0.0
+    self.max = None
+
+  def add(self, value):
+    self.counts[bisect.bisect_right(self.edges, value)] += 1
+    self.count += 1
+    self.total += value
+    self.max = value if self.max is None else max(self.max, value)
+
+  @property
+  def mean(self):
+    if self.count == 0:
+      return None
+    return self.total / self.count
+
+  def percentile(self, p):
+    """Return the upper edge of the bucket containing the *p*-th percentile or
+    the maximum value if it is in the final bucket. Returns None if no values
+    have been added.
+
+    """
+    if self.count == 0:
+      return None
+    target = self.count * p / 100.0
+    seen = 0
+    for edge, count in zip(self.edges, self.counts):
+      seen += count
+      if seen >= target:
+        return edge
+    return self.max
+
+  def summary(self):
+    """Return a dictionary with the count, mean, max, 50th, 90th and 99th
+    percentiles.
+
+    """
+    return {
+      'count': self.count,
+      'mean': self.mean,
+      'max': self.max,
+      'p50': self.percentile(50),
+      'p90': self.percentile(90),
+      'p99': self.percentile(99),
+    }
+
+class Task(object):
+  """A periodic task. Create these with :py:meth:`Scheduler.add` rather than
+  directly.
+
+  The *period*, *jitter* and *run_time* attributes are :py:class:`Histogram`
+  instances in seconds. *runs* counts the number of times *callback* has been
+  called, *skipped* the number of periods which were missed and not made up
+  and *overruns* the number of runs which took longer than *interval*, the
+  requested period in seconds.
+
+  """
+  def __init__(self, name, callback, period, priority, policy, max_catch_up,
+      deadline, edges):
+    self.name = name
+    self.callback = callback
+    self.interval = period
+    self.priority = priority
+    self.policy = policy
+    self.max_catch_up = max_catch_up
+    self.deadline = deadline
+
+    self.period = Histogram(edges)
+    self.jitter = Histogram(edges)
+    self.run_time = Histogram(edges)
+    self.runs = 0
+    self.skipped = 0
+    self.overruns = 0
+    self._last_start = None
+
+  def stats(self):
+    """Return a dictionary describing the performance of this task."""
+    return {
+      'interval': self.interval,
+      'priority': self.priority,
+      'runs': self.runs,
+      'skipped': self.skipped,
+      'overruns': self.overruns,
+      'period': self.period.summary(),
+      'jitter': self.jitter.summary(),
+      'run_time': self.run_time.summary(),
+    }
+
+class Scheduler(object):
+  """Run periodic tasks in order of priority at monotonic-clock deadlines.
+
+  *clock* is a function returning the current time in seconds. It defaults to
+  a monotonic clock where available. *edges* are the bucket edges of the
+  statistics histograms.
+
+  A fake clock makes it easy to see what happens:
+
+  >>> now = [0.0]
+  >>> s = Scheduler(clock=lambda: now[0])
+  >>> ran = []
+  >>> control = s.add('control', lambda: ran.append('control'), 0.125)
+  >>> ui = s.add('ui', lambda: ran.append('ui'), 0.5, priority=UI)
+
+  Both tasks are first due one period after being added:
+
+  >>> s.next_deadline()
+  0.125
+  >>> now[0] = 0.5
+  >>> s.run_pending()
+  2
+  >>> ran
+  ['control', 'ui']
+
+  The control task was late by three periods. It has the default skip policy
+  so it ran once and the missed periods were counted:
+
+  >>> control.runs, control.skipped, control.deadline
+  (1, 3, 0.625)
+
+  A catch up task runs once for every missed period:
+
+  >>> log_task = s.add('log', lambda: None, 1.0, priority=LOGGING,
+  ...                  policy=CATCH_UP)
+  >>> now[0] = 3.5
+  >>> _ = s.run_pending()
+  >>> log_task.runs, log_task.skipped
+  (3, 0)
+
+  Should the clock step backwards, the deadlines follow it rather than
+  waiting for the clock to catch up:
+
+  >>> control.deadline
+  3.625
+  >>> now[0] = 1.5
+  >>> s.run_pending()
+  0
+  >>> control.deadline
+  1.625
+
+  Statistics may be queried at any time:
+
+  >>> stats = s.stats()
+  >>> sorted(stats.keys())
+  ['control', 'log', 'ui']
+  >>> stats['control']['runs']
+  2
+
+  """
+  def __init__(self, clock=None, edges=DEFAULT_EDGES):
+    self.clock = clock if clock is not None else monotonic
+    self.edges = edges
+    self._tasks = {}
+    self._last_now = None
+
+  def add(self, name, callback, period, priority=CONTROL, policy=SKIP,
+      max_catch_up=10, first=None):
+    """Call *callback* every *period* seconds. The task is identified by
+    *name* which replaces any existing task with that name.
+
+    Tasks with lower *priority* are run first when several are due. *policy*
+    is one of CATCH_UP or SKIP and says what to do when deadlines have been
+    missed. A CATCH_UP task is run at most *max_catch_up* times in one go.
+
+    *first* is the time of the first deadline. It defaults to one period from
+    now.
+
+    Returns the new :py:class:`Task`.
+
+    """
+    if period <= 0:
+      raise ValueError('Task period must be positive.')
+    if policy not in (CATCH_UP, SKIP):
+      raise ValueError('Unknown policy: %r' % (policy,))
+    if first is None:
+      first = self._now() + period
+    task = Task(name, callback, period, priority, policy, max_catch_up, first,
+        self.edges)
+    self._tasks[name] = task
+    return task
+
+  def remove(self, name):
+    """Stop running the task called *name*."""
+    self._tasks.pop(name, None)
+
+  def task(self, name):
+    """Return the task called *name* or None if there is no such task."""
+    return self._tasks.get(name)
+
+  def next_deadline(self):
+    """Return the earliest deadline of any task or None if there are no
+    tasks.
+
+    """
+    if len(self._tasks) == 0:
+      return None
+    return min(t.deadline for t in self._tasks.values())
+
+  def run_pending(self):
+    """Run every task which is due. Returns the number of calls made."""
+    now = self._now()
+    due = [t for t in self._tasks.values() if t.deadline <= now]
+    due.sort(key=lambda t: (t.priority, t.deadline))
+
+    calls = 0
+    for task in due:
+      # A task may have been removed by an earlier callback
+      if self._tasks.get(task.name) is not task:
+        continue
+      calls += self._run(task)
+    return calls
+
+  def stats(self):
+    """Return a dictionary mapping each task name to the statistics returned
+    by :py:meth:`Task.stats`.
+
+    """
+    return dict((name, t.stats()) for name, t in self._tasks.items())
+
+  def _now(self):
+    # Read the clock, moving every deadline back by any backward step since
+    # it was last read.
+    now = self.clock()
+    if self._last_now is not None and now < self._last_now:
+      log.warning('The scheduler clock went back by %.3f seconds.' % (self._last_now - now,))
+      for task in self._tasks.values():
+        task.deadline -= self._last_now - now
+        task._last_start = None
+    self._last_now = now
+    return now
+
+  def _run(self, task):
+    now = self._now()
+    missed = int((now - task.deadline) // task.interval)
+    if task.policy == CATCH_UP:
+      runs = min(missed + 1, task.max_catch_up)
+    else:
+      runs = 1
+    task.skipped += missed + 1 - runs
+
+    for i in range(runs):
+      start = self.clock()
+      task.jitter.add(max(start - task.deadline, 0.0))
+      if task._last_start is not None:
+        task.period.add(start - task._last_start)
+      task._last_start = start
+
+      try:
+        task.callback()
+      except Exception as e:
+        log.error('Periodic task %s raised an exception: %s' % (task.name, e))
+
+      run_time = self.clock() - start
+      task.run_time.add(run_time)
+      if run_time > task.interval:
+        task.overruns += 1
+      task.runs += 1
+      task.deadline += task.interval
+
+    # Skip any periods which were not made up
+    if task.deadline <= now:
+      task.deadline += task.interval * (int((now - task.deadline) // task.interval) + 1)
+    return runs
+
+class QtScheduler(Scheduler):
+  """A :py:class:`Scheduler` which runs itself from the Qt event loop. One
+  single-shot timer is armed for the next deadline each time tasks are run.
+  Call :py:meth:`start` once the Qt application has been created.
+
+  """
+  def __init__(self, *args, **kwargs):
+    super(QtScheduler, self).__init__(*args, **kwargs)
+
+    # Only import Qt when it is needed.
+    from . import qtcompat as qt
+    QtCore = qt.import_module('QtCore')
+
+    self._timer = QtCore.QTimer()
+    self._timer.setSingleShot(True)
+    if hasattr(self._timer, 'setTimerType'):
+      self._timer.setTimerType(QtCore.Qt.PreciseTimer)
+    self._timer.timeout.connect(self._timeout)
+    self._running = False
+
+  def start(self):
+    """Start running tasks."""
+    self._running = True
+    self._arm()
+
+  def stop(self):
+    """Stop running tasks."""
+    self._running = False
+    self._timer.stop()
+
+  def add(self, *args, **kwargs):
+    from .profiling import profiler
+    task = super(QtScheduler, self).add(*args, **kwargs)
+    task.callback = profiler.wrap(task.callback, 'task ' + task.name)
+    if self._running:
+      self._arm()
+    return task
+
+  def _timeout(self):
+    self.run_pending()
+    if self._running:
+      self._arm()
+
+  def _arm(self):
+    now = self._now()
+    deadline = self.next_deadline()
+    if deadline is None:
+      self._timer.stop()
+      return
+    delay = max(deadline - now, 0.0)
+    self._timer.start(int(round(1000 * delay)))
@@ -0,0 +1,13 @@
+import unittest
+import doctest
+
+from . import logstore, metrics, profiling, rolling, scheduler, tracing
+
+def load_tests(loader, tests, ignore):
+  tests.addTests(doctest.DocTestSuite(logstore))
+  tests.addTests(doctest.DocTestSuite(metrics))
+  tests.addTests(doctest.DocTestSuite(profiling))
+  tests.addTests(doctest.DocTestSuite(rolling))
+  tests.addTests(doctest.DocTestSuite(scheduler))
+  tests.addTests(doctest.DocTestSuite(tracing))
+  return tests
@@ -0,0 +1,292 @@
+"""
+Tracing latency through the control pipeline
+============================================
+
+A video blockline or navdata packet passes through several stages before the
+PCMD command it leads to is sent to the drone: decoding, marker detection,
+position update, the controllers and a UDP hop from the controlling
+application back to the control loop. A Tracer follows individual packets
+through these stages:
+
+- :py:meth:`Tracer.begin` starts a trace and returns its id. Each stage calls
+  :py:meth:`Tracer.mark` with the id and :py:meth:`Tracer.end` finishes the
+  trace.
+
+- The time between consecutive marks of every finished trace is added to a
+  histogram for that kind of trace and stage, as is the total time from
+  beginning to end. See :py:meth:`Tracer.stats`.
+
+- A trace may cross a UDP hop. :py:meth:`Tracer.export` returns a small
+  dictionary which can be sent in a JSON packet and :py:meth:`Tracer.adopt`
+  continues the trace on the other side. Monotonic clocks are shared by all
+  processes on a host so the timings remain valid across processes. Raw
+  packets which cannot carry a trace (such as forwarded video) are instead
+  matched by their contents with :py:meth:`Tracer.handoff` and
+  :py:meth:`Tracer.resume`.
+
+When a tracer is disabled, :py:meth:`Tracer.begin`, :py:meth:`Tracer.adopt`
+and :py:meth:`Tracer.resume` return None and every other method returns
+immediately when passed None so the cost is one attribute lookup and call per
+stage.
+
+The module-level :py:data:`tracer` is used by the control loop and
+``multi_uav``. It is enabled by setting the ``ARDRONE_TRACE`` environment
+variable and its histograms are also exported through
+:py:data:`ardrone.util.metrics.registry` as ``ardrone_trace_stage_seconds``,
+``ardrone_trace_total_seconds`` and ``ardrone_traces_dropped_total``, labelled
+with the kind of trace and the stage.
+
+"""
+
+from __future__ import division
+
+import collections
+import itertools
+import os
+
+from . import metrics
+from .scheduler import DEFAULT_EDGES, Histogram, monotonic
+
+class Tracer(object):
+  """Follow traces through named stages and gather latency histograms.
+
+  *clock* is a function returning the current time in seconds and defaults
+  to a monotonic clock. *edges* are the bucket edges of the histograms. At
+  most *max_open* traces may be in progress (and the same number handed off)
+  at once. Beyond that the oldest are dropped. If *registry* (a
+  :py:class:`ardrone.util.metrics.Registry`) is given, finished traces are
+  also observed in its histograms.
+
+  >>> now = [0.0]
+  >>> t = Tracer(enabled=True, clock=lambda: now[0])
+  >>> trace = t.begin('video', 'received')
+  >>> now[0] = 0.25
+  >>> t.mark(trace, 'decoded')
+  >>> now[0] = 0.75
+  >>> t.end(trace, 'sent')
+  >>> stats = t.stats()['video']
+  >>> stats['completed'], stats['total']['mean']
+  (1, 0.75)
+  >>> sorted(stats['stages'].keys())
+  ['decoded', 'sent']
+  >>> stats['stages']['sent']['mean']
+  0.5
+
+  A trace crosses a UDP hop in a JSON packet:
+
+  >>> import json
+  >>> trace = t.begin('navdata', 'received')
+  >>> message = json.dumps({'trace': t.export(trace, 'forwarded')})
+  >>> other = Tracer(enabled=True, clock=lambda: now[0])
+  >>> trace = other.adopt(json.loads(message)['trace'], 'status')
+  >>> other.end(trace, 'sent')
+  >>> sorted(other.stats()['navdata']['stages'].keys())
+  ['forwarded', 'sent', 'status']
+
+  A disabled tracer does nothing:
+
+  >>> off = Tracer()
+  >>> off.begin('video') is None
+  True
+  >>> off.mark(None, 'decoded')
+  >>> off.stats()
+  {}
+
+  Timings may be exported as metrics:
+
+  >>> r = metrics.Registry()
+  >>> t = Tracer(enabled=True, clock=lambda: now[0], registry=r)
+  >>> trace = t.begin('video', 'received')
+  >>> now[0] = 1.0
+  >>> t.end(trace, 'sent')
+  >>> labels = {'kind': 'video', 'stage': 'sent'}
+  >>> r.histogram('ardrone_trace_stage_seconds', labels=labels).sum
+  0.25
+
+  """
+  def __init__(self, enabled=False, clock=None, edges=DEFAULT_EDGES, max_open=256,
+      registry=None):
+    self.enabled = enabled
+    self.registry = registry
+    self.clock = clock if clock is not None else monotonic
+    self.edges = edges
+    self.max_open = max_open
+    self.reset()
+
+  def reset(self):
+    """Forget every trace and statistic."""
+    # Trace ids are unique across processes so that adopted traces do not
+    # collide with local ones.
+    self._ids = itertools.count((os.getpid() & 0xffff) << 32)
+    self._open = collections.OrderedDict()
+    self._handed_off = collections.OrderedDict()
+    self._stats = {}
+
+  def begin(self, kind, stage=None):
+    """Start a trace of *kind* (e.g. 'video'), marking *stage* if given.
+    Returns the trace id or None if tracing is disabled.
+
+    """
+    if not self.enabled:
+      return None
+    trace_id = next(self._ids)
+    self._open[trace_id] = (kind, [] if stage is None else [(stage, self.clock())])
+    self._limit(self._open)
+    return trace_id
+
+  def mark(self, trace_id, stage):
+    """Record that trace *trace_id* has reached *stage* now."""
+    if trace_id is None:
+      return
+    trace = self._open.get(trace_id)
+    if trace is not None:
+      trace[1].append((stage, self.clock()))
+
+  def end(self, trace_id, stage=None):
+    """Finish trace *trace_id*, marking *stage* if given, and add its
+    timings to the statistics.
+
+    """
+    if trace_id is None:
+      return
+    if stage is not None:
+      self.mark(trace_id, stage)
+    trace = self._open.pop(trace_id, None)
+    if trace is None:
+      return
+
+    kind, marks = trace
+    stats = self._kind_stats(kind)
+    stats['completed'] += 1
+    for (_, previous), (stage, when) in zip(marks[:-1], marks[1:]):
+      if stage not in stats['stages']:
+        stats['stages'][stage] = Histogram(self.edges)
+        if self.registry is not None:
+          stats['metrics'][stage] = self.registry.histogram('ardrone_trace_stage_seconds',
+              'Time taken to reach a stage from the previous one.',
+              {'kind': kind, 'stage': stage}, self.edges)
+      elapsed = max(when - previous, 0.0)
+      stats['stages'][stage].add(elapsed)
+      if self.registry is not None:
+        stats['metrics'][stage].observe(elapsed)
+    if len(marks) > 0:
+      elapsed = max(marks[-1][1] - marks[0][1], 0.0)
+      stats['total'].add(elapsed)
+      if self.registry is not None:
+        stats['metrics'][None].observe(elapsed)
+
+  def discard(self, trace_id):
+    """Abandon trace *trace_id* without recording it (e.g. a blockline which
+    did not complete a frame).
+
+    """
+    if trace_id is None:
+      return
+    self._open.pop(trace_id, None)
+
+  def export(self, trace_id, stage=None):
+    """Mark *stage* if given and return a JSON-serialisable description of
+    trace *trace_id* to send to another process, which continues it with
+    :py:meth:`adopt`. The trace is no longer in progress here. Returns None
+    if there is no such trace.
+
+    """
+    if trace_id is None:
+      return None
+    if stage is not None:
+      self.mark(trace_id, stage)
+    trace = self._open.pop(trace_id, None)
+    if trace is None:
+      return None
+    return {'id': trace_id, 'kind': trace[0], 'marks': [list(m) for m in trace[1]]}
+
+  def adopt(self, exported, stage=None):
+    """Continue a trace described by *exported* (as returned by
+    :py:meth:`export`), marking *stage* if given. Returns its id or None if
+    tracing is disabled or *exported* is None.
+
+    """
+    if not self.enabled or exported is None:
+      return None
+    trace_id = exported['id']
+    self._open[trace_id] = (exported['kind'], [tuple(m) for m in exported['marks']])
+    self._limit(self._open)
+    if stage is not None:
+      self.mark(trace_id, stage)
+    return trace_id
+
+  def handoff(self, data, trace_id, stage=None):
+    """Hand trace *trace_id* over to whoever receives the packet *data*
+    next, marking *stage* if given. The receiver calls :py:meth:`resume` with
+    the same data.
+
+    """
+    if trace_id is None:
+      return
+    exported = self.export(trace_id, stage)
+    if exported is not None:
+      self._handed_off[self._key(data)] = exported
+      self._limit(self._handed_off)
+
+  def resume(self, data, kind, stage=None):
+    """Continue the trace handed off with the packet *data* or, if there is
+    none (e.g. it was sent by another process), begin a new trace of *kind*.
+    Marks *stage* if given. Returns the trace id or None if tracing is
+    disabled.
+
+    >>> t = Tracer(enabled=True)
+    >>> trace = t.begin('video', 'received')
+    >>> t.handoff(b'packet', trace)
+    >>> t.resume(b'packet', 'video', 'forwarded') == trace
+    True
+    >>> t.resume(b'other', 'video') == trace
+    False
+
+    """
+    if not self.enabled:
+      return None
+    exported = self._handed_off.pop(self._key(data), None)
+    if exported is None:
+      return self.begin(kind, stage)
+    return self.adopt(exported, stage)
+
+  def stats(self):
+    """Return a dictionary mapping each kind of trace to a dictionary with
+    the number of 'completed' and 'dropped' traces, a summary of the 'total'
+    latency and a dictionary of 'stages' mapping each stage to a summary of
+    the time taken to reach it from the previous stage. Summaries are as
+    returned by :py:meth:`ardrone.util.scheduler.Histogram.summary`.
+
+    """
+    return dict((kind, {
+      'completed': s['completed'],
+      'dropped': s['dropped'],
+      'total': s['total'].summary(),
+      'stages': dict((stage, h.summary()) for stage, h in s['stages'].items()),
+    }) for kind, s in self._stats.items())
+
+  def _kind_stats(self, kind):
+    if kind not in self._stats:
+      self._stats[kind] = {'completed': 0, 'dropped': 0,
+          'total': Histogram(self.edges), 'stages': {}, 'metrics': {}}
+      if self.registry is not None:
+        # Metrics are kept with the statistics so that the registry is not
+        # searched for every mark. The total is stored under None.
+        self._stats[kind]['metrics'][None] = self.registry.histogram(
+            'ardrone_trace_total_seconds', 'Time from the beginning to the end of a trace.',
+            {'kind': kind}, self.edges)
+    return self._stats[kind]
+
+  def _limit(self, traces):
+    while len(traces) > self.max_open:
+      _, dropped = traces.popitem(last=False)
+      dropped_kind = dropped['kind'] if isinstance(dropped, dict) else dropped[0]
+      self._kind_stats(dropped_kind)['dropped'] += 1
+      if self.registry is not None:
+        self.registry.counter('ardrone_traces_dropped_total',
+            'Traces dropped since too many were in progress.', {'kind': dropped_kind}).inc()
+
+  def _key(self, data):
+    return (len(data), bytes(data[:64]))
+
+tracer = Tracer(enabled=bool(os.environ.get('ARDRONE_TRACE')), registry=metrics.registry)
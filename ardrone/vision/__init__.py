@@ -0,0 +1,43 @@
+"""
+Vision
+======
+
+Processing the video stream from the drone.
+
+This package is made up of the following modules:
+
+  - archive: Record decoded frames to disk with their times for offline
+    vision work and read them back by frame number or time.
+
+  - box: Detect square boxes in front of the drone from contours.
+
+  - gate: Skip expensive processing of frames which have not changed since
+    the last processed frame.
+
+  - image: Convert decoded video frames into greyscale NumPy arrays.
+
+  - odometry: Sparse pyramidal Lucas-Kanade feature tracking on the downward
+    camera giving the drone's translation over the ground between frames.
+
+The modules are not imported with the package, so that using one (say gate
+from the swarm controller) does not pull OpenCV in through the others. Import
+the one you need, e.g. ``from ardrone.vision import gate``.
+
+.. automodule:: ardrone.vision.archive
+  :members:
+
+.. automodule:: ardrone.vision.box
+  :members:
+
+.. automodule:: ardrone.vision.gate
+  :members:
+
+.. automodule:: ardrone.vision.image
+  :members:
+
+.. automodule:: ardrone.vision.odometry
+  :members:
+
+"""
+
+__all__ = ['archive', 'box', 'gate', 'image', 'odometry']
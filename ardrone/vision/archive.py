@@ -0,0 +1,263 @@
+"""
+Archiving decoded video frames
+==============================
+
+A frame archive holds a sequence of decoded video frames together with the
+time and sequence number of each, so that vision code can be developed and
+benchmarked against recorded flights without decoding any video.
+
+Frames are fixed in size so an archive is simply two files: the frames,
+back to back after a short header, and an index of the time and sequence
+number of each frame. Both are memory-mapped when read, giving random access
+to any frame by number or time without reading the others. The index is kept
+apart from the frames so that searching it by time touches only the index.
+
+An archive is written with :py:class:`FrameWriter`, e.g. from the callback
+given to :py:class:`ardrone.core.videopacket.Decoder`::
+
+  writer = FrameWriter('flight.frames')
+  decoder = Decoder(writer.append)
+
+and read with :py:class:`FrameArchive`::
+
+  archive = FrameArchive('flight.frames')
+  luma = archive.luma(archive.index_at(when))
+
+"""
+
+from __future__ import division
+
+import os
+import struct
+import time
+
+import numpy as np
+
+from .image import FRAME_SIZE, rgb565_to_luma
+
+# The pixel type of each frame format.
+FORMATS = {
+  'rgb565': np.dtype('<u2'),
+  'luma': np.dtype('u1'),
+}
+
+_MAGIC = b'ARFRAMES'
+_VERSION = 1
+
+# magic, version, format, width, height, padded to a fixed size
+_HEADER = struct.Struct('<8sI8sII')
+_HEADER_SIZE = 64
+
+_INDEX_DTYPE = np.dtype([('when', '<f8'), ('sequence', '<i8')])
+
+def _index_path(path):
+  return path + '.index'
+
+class FrameWriter(object):
+  """Append frames of *size* (width, height) in *format* ('rgb565' or
+  'luma') to the archive at *path*. If *path* already exists it must have
+  the same size and format and frames are added to the end of it.
+
+  Use as a context manager or call :py:meth:`close` when done.
+
+  """
+  def __init__(self, path, size=FRAME_SIZE, format='rgb565'):
+    if format not in FORMATS:
+      raise ValueError('Unknown frame format: %s' % (format,))
+    self.path = path
+    self.size = tuple(size)
+    self.format = format
+    self.frame_bytes = size[0] * size[1] * FORMATS[format].itemsize
+
+    if os.path.exists(path):
+      header = _read_header(path)
+      if header != (format, self.size):
+        raise ValueError('%s holds %s frames of %ix%i.' % (path, header[0],
+          header[1][0], header[1][1]))
+      # Drop any partly written frame or index entry
+      self.count = _count_frames(path, self.frame_bytes)
+      self._frames = open(path, 'r+b')
+      self._frames.truncate(_HEADER_SIZE + self.count * self.frame_bytes)
+      self._frames.seek(0, os.SEEK_END)
+      self._index = open(_index_path(path), 'r+b')
+      self._index.truncate(self.count * _INDEX_DTYPE.itemsize)
+      self._index.seek(0, os.SEEK_END)
+    else:
+      self.count = 0
+      self._frames = open(path, 'wb')
+      header = _HEADER.pack(_MAGIC, _VERSION, format.encode('ascii'), size[0], size[1])
+      self._frames.write(header.ljust(_HEADER_SIZE, b'\0'))
+      self._index = open(_index_path(path), 'wb')
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+  def __len__(self):
+    return self.count
+
+  def append(self, data, when=None, sequence=None):
+    """Add the frame in *data*, a sequence of bytes or a NumPy array of
+    pixels, taken at time *when* (by default now) with *sequence* number (by
+    default the number of frames before it). Returns the frame's number in
+    the archive.
+
+    """
+    if isinstance(data, np.ndarray):
+      data = np.ascontiguousarray(data, dtype=FORMATS[self.format]).tobytes()
+    if len(data) != self.frame_bytes:
+      raise ValueError('Frames must be %i bytes, not %i.' % (self.frame_bytes, len(data)))
+
+    when = time.time() if when is None else when
+    sequence = self.count if sequence is None else sequence
+
+    # The frame is written first so that the index never refers to a frame
+    # which is not there.
+    self._frames.write(data)
+    self._index.write(np.array([(when, sequence)], dtype=_INDEX_DTYPE).tobytes())
+    self.count += 1
+    return self.count - 1
+
+  def flush(self):
+    """Write any buffered frames to disk so that readers can see them."""
+    self._frames.flush()
+    self._index.flush()
+
+  def close(self):
+    if self._frames is None:
+      return
+    self.flush()
+    self._frames.close()
+    self._index.close()
+    self._frames = self._index = None
+
+class FrameArchive(object):
+  """Read the frame archive at *path*.
+
+  >>> import shutil, tempfile
+  >>> path = os.path.join(tempfile.mkdtemp(), 'test.frames')
+  >>> with FrameWriter(path, size=(4, 2)) as writer:
+  ...   for i in range(5):
+  ...     _ = writer.append(np.full((2, 4), 0xffff * (i % 2), dtype=np.uint16),
+  ...         when=10.0 + i / 10, sequence=100 + i)
+  >>> archive = FrameArchive(path)
+  >>> len(archive), archive.format, archive.size
+  (5, 'rgb565', (4, 2))
+  >>> archive[1].shape, hex(int(archive[1][0, 0]))
+  ((2, 4), '0xffff')
+
+  Frames may be found by time, giving the latest frame at or before then, or
+  by sequence number:
+
+  >>> archive.index_at(10.25), archive.index_of(103)
+  (2, 3)
+  >>> archive.between(10.1, 10.3)
+  slice(1, 3, None)
+  >>> archive.luma(1).tolist()
+  [[255, 255, 255, 255], [255, 255, 255, 255]]
+  >>> archive.close()
+  >>> shutil.rmtree(os.path.dirname(path))
+
+  """
+  def __init__(self, path):
+    self.path = path
+    self.format, self.size = _read_header(path)
+    self.frame_bytes = self.size[0] * self.size[1] * FORMATS[self.format].itemsize
+    self.frames = self.times = self.sequences = None
+    self.refresh()
+
+  def refresh(self):
+    """Map any frames appended since the archive was opened."""
+    count = _count_frames(self.path, self.frame_bytes)
+    width, height = self.size
+    if count == 0:
+      self.frames = np.zeros((0, height, width), dtype=FORMATS[self.format])
+      index = np.zeros(0, dtype=_INDEX_DTYPE)
+    else:
+      self.frames = np.memmap(self.path, dtype=FORMATS[self.format], mode='r',
+          offset=_HEADER_SIZE, shape=(count, height, width))
+      index = np.memmap(_index_path(self.path), dtype=_INDEX_DTYPE, mode='r',
+          shape=(count,))
+
+    # The time and sequence number of each frame
+    self.times = index['when']
+    self.sequences = index['sequence']
+
+  def close(self):
+    """Release the mapped files."""
+    self.frames = self.times = self.sequences = None
+
+  def __len__(self):
+    return len(self.frames)
+
+  def __getitem__(self, index):
+    """Return a read-only height x width array of the pixels of frame number
+    *index* (or an array of frames for a slice).
+
+    """
+    return self.frames[index]
+
+  def luma(self, index):
+    """Return frame number *index* as a greyscale image (see
+    :py:func:`ardrone.vision.image.rgb565_to_luma`).
+
+    """
+    if self.format == 'luma':
+      return np.asarray(self.frames[index])
+    return rgb565_to_luma(np.asarray(self.frames[index]), self.size)
+
+  def index_at(self, when):
+    """Return the number of the latest frame at or before time *when*,
+    which is the frame that was showing then. Raises IndexError if *when* is
+    before the first frame.
+
+    """
+    index = int(np.searchsorted(self.times, when, side='right')) - 1
+    if index < 0:
+      raise IndexError('There are no frames before %s.' % (when,))
+    return index
+
+  def index_of(self, sequence):
+    """Return the number of the frame with *sequence* number. Raises KeyError
+    if there is none.
+
+    """
+    matches = np.flatnonzero(self.sequences == sequence)
+    if len(matches) == 0:
+      raise KeyError(sequence)
+    return int(matches[0])
+
+  def between(self, start, end):
+    """Return a slice selecting the frames from time *start* up to, but not
+    including, time *end*.
+
+    """
+    first = int(np.searchsorted(self.times, start, side='left'))
+    last = int(np.searchsorted(self.times, end, side='left'))
+    return slice(first, max(first, last))
+
+def _read_header(path):
+  # Return the (format, size) of the archive at path.
+  with open(path, 'rb') as f:
+    data = f.read(_HEADER_SIZE)
+  if len(data) < _HEADER.size:
+    raise ValueError('%s is not a frame archive.' % (path,))
+  magic, version, format, width, height = _HEADER.unpack(data[:_HEADER.size])
+  if magic != _MAGIC:
+    raise ValueError('%s is not a frame archive.' % (path,))
+  if version != _VERSION:
+    raise ValueError('Unsupported frame archive version: %i' % (version,))
+  format = format.rstrip(b'\0').decode('ascii')
+  if format not in FORMATS:
+    raise ValueError('Unknown frame format: %s' % (format,))
+  return format, (width, height)
+
+def _count_frames(path, frame_bytes):
+  # The number of frames which have been written completely along with their
+  # index entries.
+  frames = (os.path.getsize(path) - _HEADER_SIZE) // frame_bytes
+  index_path = _index_path(path)
+  entries = os.path.getsize(index_path) // _INDEX_DTYPE.itemsize if os.path.exists(index_path) else 0
+  return max(0, min(frames, entries))
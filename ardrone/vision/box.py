@@ -0,0 +1,91 @@
+"""
+Detecting boxes
+===============
+
+The box detector used by the ``qtdronevideo_box_detect`` scripts to spot
+square obstacles in front of the drone, ported to the ``cv2`` API so that it
+may be used (and timed) outside of those scripts.
+
+Edges are found with a Canny detector and thickened by blurring. Contours of
+the thickened edges which are not outermost contours are approximated by
+polygons and kept as boxes if they are:
+
+- large enough: their bounding rectangle covers more than *min_fraction* of
+  the image,
+
+- roughly square: their width and height differ by less than a quarter of
+  their sum,
+
+- solid: the contour fills more than *min_fill* of its bounding rectangle.
+
+A box whose bounding rectangle is wider than *close_width* or taller than
+*close_height* pixels is too close to the drone.
+
+"""
+
+from __future__ import division
+
+import collections
+
+import cv2
+import numpy as np
+
+Box = collections.namedtuple('Box', 'x y width height fill')
+"""A detected box. *x*, *y*, *width* and *height* give its bounding rectangle
+in pixels and *fill* the fraction of the rectangle covered by the contour.
+
+"""
+
+def detect_boxes(image, low_threshold=50, high_threshold=400, blur=35,
+    min_fraction=0.004, min_fill=0.7):
+  """Return a list of the :py:class:`Box` objects detected in *image*, a
+  greyscale or BGR array of bytes.
+
+  >>> image = np.zeros((240, 320), dtype=np.uint8)
+  >>> _ = cv2.rectangle(image, (100, 60), (220, 180), 255, -1)
+  >>> boxes = detect_boxes(image)
+  >>> len(boxes) > 0
+  True
+  >>> all(abs(b.width - b.height) < (b.width + b.height) / 4 for b in boxes)
+  True
+  >>> detect_boxes(np.zeros((240, 320), dtype=np.uint8))
+  []
+
+  """
+  if image.ndim == 3:
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+  edges = cv2.Canny(image, low_threshold, high_threshold)
+  edges = cv2.GaussianBlur(edges, (blur, blur), 0)
+
+  found = cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+  # OpenCV 3 also returns the image
+  contours, hierarchy = found[-2], found[-1]
+  if hierarchy is None:
+    return []
+
+  image_area = edges.shape[0] * edges.shape[1]
+  boxes = []
+  for contour, (_, _, _, parent) in zip(contours, hierarchy[0]):
+    # Outermost contours surround the thickened edges rather than boxes
+    if parent < 0:
+      continue
+    polygon = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+    x, y, w, h = cv2.boundingRect(polygon)
+    if w * h == 0:
+      continue
+    fill = cv2.contourArea(contour) / (w * h)
+    if w * h / image_area > min_fraction and abs(w - h) < (w + h) / 4 and fill > min_fill:
+      boxes.append(Box(x, y, w, h, fill))
+  return boxes
+
+def too_close(boxes, close_width=150, close_height=140):
+  """Return True if any box in *boxes* is too close to the drone.
+
+  >>> too_close([Box(0, 0, 160, 120, 0.9)])
+  True
+  >>> too_close([Box(0, 0, 40, 40, 0.9)])
+  False
+
+  """
+  return any(b.width > close_width or b.height > close_height for b in boxes)
@@ -0,0 +1,156 @@
+"""
+Skipping unchanged frames
+=========================
+
+Marker and box detection is expensive and is usually run on every decoded
+frame, even when the drone is hovering over the same scene and the result
+will be the same as for the previous frame. A ChangeGate sits in front of such
+processing. It compares a small thumbnail of each frame with a thumbnail of
+the last frame which was processed and only runs the processing when the
+scene has changed. Otherwise the last result is reused along with its age so
+that the caller can decide how far to trust it.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from .image import FRAME_SIZE, rgb565_to_luma
+
+class ChangeGate(object):
+  """Decide whether a frame differs enough from the last processed frame to be
+  worth processing.
+
+  Frames are compared via thumbnails made by taking every *step*-th pixel in
+  each direction. A thumbnail pixel counts as changed if its luma differs by
+  more than *pixel_threshold* (out of 255) from the last processed
+  thumbnail. The frame is processed if more than *changed_fraction* of the
+  thumbnail pixels have changed.
+
+  A frame is also processed if the last result is older than *max_age*
+  seconds, so that slow drift and lighting changes are eventually picked up.
+  Set *max_age* to None to disable this.
+
+  Frames may be given as raw RGB565 data, in which case *frame_size* is their
+  (width, height).
+
+  If *region* is not None, only the (width, height) region at the top left of
+  each frame is compared. Use this when the picture does not fill the frame,
+  e.g. the drone's bottom camera is 176x144 but is decoded into a 320x240
+  frame.
+
+  The *processed* and *skipped* attributes count frames which were and were
+  not processed.
+
+  >>> gate = ChangeGate(step=1)
+  >>> count = [0]
+  >>> def detect(frame):
+  ...   count[0] += 1
+  ...   return int(frame.sum())
+  >>> still = np.zeros((4, 4), dtype=np.uint8)
+  >>> gate.process(0.0, still, detect)
+  (0, 0.0)
+  >>> gate.process(0.1, still.copy(), detect)
+  (0, 0.1)
+  >>> moved = still.copy()
+  >>> moved[0,0] = 200
+  >>> gate.process(0.2, moved, detect)
+  (200, 0.0)
+  >>> count[0], gate.processed, gate.skipped
+  (2, 2, 1)
+
+  Old results are not reused:
+
+  >>> gate.process(5.0, moved, detect)
+  (200, 0.0)
+  >>> count[0]
+  3
+
+  Changes outside of the region are ignored:
+
+  >>> gate = ChangeGate(step=1, region=(2, 2))
+  >>> gate.changed(0.0, still)
+  True
+  >>> _ = gate.process(0.0, still, detect)
+  >>> outside = still.copy()
+  >>> outside[3,3] = 200
+  >>> gate.changed(0.1, outside)
+  False
+
+  """
+  def __init__(self, step=8, pixel_threshold=16, changed_fraction=0.01,
+      max_age=1.0, frame_size=FRAME_SIZE, region=None):
+    self.step = step
+    self.pixel_threshold = pixel_threshold
+    self.changed_fraction = changed_fraction
+    self.max_age = max_age
+    self.frame_size = frame_size
+    self.region = region
+
+    self.processed = 0
+    self.skipped = 0
+
+    self._thumbnail = None
+    self._result = None
+    self._when = None
+
+  @property
+  def skip_ratio(self):
+    """The fraction of frames which were skipped."""
+    total = self.processed + self.skipped
+    return self.skipped / total if total > 0 else 0.0
+
+  def reset(self):
+    """Forget the last processed frame so that the next frame is always
+    processed. Counters are not reset."""
+    self._thumbnail = None
+    self._result = None
+    self._when = None
+
+  def thumbnail(self, frame):
+    """Return the thumbnail used to compare *frame*. *frame* is either a 2D
+    array of luma values or raw RGB565 data as passed to the video decoder
+    callback."""
+    if isinstance(frame, np.ndarray) and frame.ndim == 2:
+      if self.region is not None:
+        frame = frame[:self.region[1], :self.region[0]]
+      return frame[::self.step, ::self.step].astype(np.int16)
+    return rgb565_to_luma(frame, self.frame_size, step=self.step, region=self.region).astype(np.int16)
+
+  def changed(self, when, frame):
+    """Return True if *frame*, received at time *when*, should be processed.
+    This does not update the gate's state."""
+    return self._changed(when, self.thumbnail(frame))
+
+  def process(self, when, frame, func):
+    """Process *frame*, received at time *when*, if it has changed.
+
+    *func* is called with *frame* as its only argument and should return the
+    result of processing it.
+
+    Returns a pair *result, age* where *result* is either the value returned by
+    *func* or, if the frame was skipped, the result for the last processed
+    frame. *age* is the time in seconds since the frame which gave *result*
+    was received.
+
+    """
+    thumbnail = self.thumbnail(frame)
+    if not self._changed(when, thumbnail):
+      self.skipped += 1
+      return self._result, when - self._when
+
+    self._result = func(frame)
+    self._thumbnail = thumbnail
+    self._when = when
+    self.processed += 1
+    return self._result, 0.0
+
+  def _changed(self, when, thumbnail):
+    if self._thumbnail is None or self._thumbnail.shape != thumbnail.shape:
+      return True
+    if self.max_age is not None and when - self._when > self.max_age:
+      return True
+
+    changed = np.abs(thumbnail - self._thumbnail) > self.pixel_threshold
+    return bool(changed.mean() > self.changed_fraction)
@@ -0,0 +1,60 @@
+"""
+Converting decoded video frames
+===============================
+
+Video frames from ardrone.core.videopacket.Decoder are 320x240 sequences of
+16-bit little-endian RGB565 pixels. The vision code works on 8-bit greyscale
+images held in NumPy arrays.
+
+"""
+
+import numpy as np
+
+"""The size of a decoded video frame as a (width, height) pair."""
+FRAME_SIZE = (320, 240)
+
+def rgb565_to_luma(data, size=FRAME_SIZE, step=1, region=None):
+  """Convert an RGB565 frame into a greyscale image.
+
+  *data* is a sequence of width*height*2 bytes (or a NumPy array of 16-bit
+  pixels) as passed to the Decoder callback. *size* is the (width, height) of
+  the frame.
+
+  If *step* is greater than one, only every *step*-th pixel of every *step*-th
+  row is converted. This is much cheaper than converting the whole frame when
+  only a thumbnail is required.
+
+  If *region* is not None, only the (width, height) region at the top left of
+  the frame is converted.
+
+  Returns a height x width NumPy array of uint8 luma values, or the size of
+  *region* if given. Both dimensions are divided by *step*, rounding up.
+
+  >>> white = np.array([0xffff] * 6, dtype='<u2').tobytes()
+  >>> rgb565_to_luma(white, (3, 2)).tolist()
+  [[255, 255, 255], [255, 255, 255]]
+  >>> red = np.array([0xf800] * 6, dtype='<u2').tobytes()
+  >>> int(rgb565_to_luma(red, (3, 2))[0,0])
+  76
+  >>> rgb565_to_luma(white, (3, 2), step=2).shape
+  (1, 2)
+  >>> rgb565_to_luma(white, (3, 2), region=(2, 1)).shape
+  (1, 2)
+
+  """
+  width, height = size
+  if isinstance(data, np.ndarray):
+    pixels = data.astype(np.uint16).reshape((height, width))
+  else:
+    pixels = np.frombuffer(data, dtype='<u2').reshape((height, width))
+  if region is not None:
+    pixels = pixels[:region[1], :region[0]]
+  if step > 1:
+    pixels = pixels[::step, ::step]
+
+  # Expand each channel to 0..255 and weight them (ITU-R BT.601 weights scaled
+  # by 256 so we can stay in integer arithmetic).
+  r = ((pixels >> 11) & 0x1f).astype(np.uint32) * 255 // 31
+  g = ((pixels >> 5) & 0x3f).astype(np.uint32) * 255 // 63
+  b = (pixels & 0x1f).astype(np.uint32) * 255 // 31
+  return ((77 * r + 150 * g + 29 * b) >> 8).astype(np.uint8)
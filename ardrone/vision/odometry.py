@@ -0,0 +1,177 @@
+"""
+Visual odometry from the downward camera
+========================================
+
+Estimate how far the drone has moved over the ground between consecutive
+frames from its downward-facing camera.
+
+A bounded set of strong corners is tracked from frame to frame with pyramidal
+Lucas-Kanade optical flow. Only when too many tracks have been lost are new
+corners detected. The median image motion of the surviving tracks is
+converted into a ground-plane translation using the altitude reported in the
+navdata and the camera's focal length. This is far cheaper than computing
+dense optical flow over the whole image and gives a position estimate between
+sightings of markers.
+
+Translations are expressed in the camera's image axes: x is to the right of
+the image and y is towards the bottom of the image. Rotating these into the
+drone's body or world frame is left to the caller.
+
+"""
+
+from __future__ import division
+
+import logging
+import math
+
+import cv2
+import numpy as np
+
+log = logging.getLogger()
+
+"""The horizontal field of view of the drone's downward camera in radians."""
+BOTTOM_CAMERA_FOV = math.radians(64.0)
+
+class VisualOdometry(object):
+  """Track features across consecutive frames and report the camera's
+  translation over the ground.
+
+  *max_features* is the maximum number of features tracked. When fewer than
+  *min_features* remain, new features are detected. *quality* and
+  *min_distance* are passed to the corner detector. No translation is
+  reported for a frame in which fewer than *min_tracks* features were
+  tracked.
+
+  *window_size* and *max_level* give the size of the Lucas-Kanade search
+  window in pixels and the number of pyramid levels above the full-resolution
+  image.
+
+  *focal_length* is the camera's focal length in pixels. If None, it is
+  computed from the width of the first frame and *fov*, the horizontal field
+  of view in radians.
+
+  After each frame the *tracks* attribute gives the number of features
+  successfully tracked and the *detections* attribute counts the number of
+  times new features have been detected. The *position* attribute is the sum
+  of all the translations returned so far.
+
+  Moving the camera 3 pixels to the right and then 2 pixels down at twice the
+  height:
+
+  >>> rng = np.random.RandomState(0)
+  >>> ground = cv2.GaussianBlur((rng.rand(260, 340) * 255).astype(np.uint8), (5, 5), 0)
+  >>> vo = VisualOdometry(focal_length=100.0)
+  >>> vo.process(ground[10:250, 10:330], 1.0) is None
+  True
+  >>> bool(np.allclose(vo.process(ground[10:250, 13:333], 1.0), (0.03, 0), atol=1e-3))
+  True
+  >>> bool(np.allclose(vo.process(ground[12:252, 13:333], 2.0), (0, 0.04), atol=1e-3))
+  True
+  >>> vo.tracks, vo.detections
+  (100, 1)
+
+  A featureless frame gives no estimate:
+
+  >>> vo.process(np.zeros((240, 320), dtype=np.uint8), 1.0) is None
+  True
+
+  """
+  def __init__(self, max_features=100, min_features=40, min_tracks=8,
+      quality=0.01, min_distance=8, window_size=15, max_level=3,
+      focal_length=None, fov=BOTTOM_CAMERA_FOV):
+    self.max_features = max_features
+    self.min_features = min_features
+    self.min_tracks = min_tracks
+    self.quality = quality
+    self.min_distance = min_distance
+    self.focal_length = focal_length
+    self.fov = fov
+
+    self.tracks = 0
+    self.detections = 0
+    self.position = np.zeros(2)
+
+    self._lk_params = dict(winSize=(window_size, window_size), maxLevel=max_level,
+        criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+    self._prev_image = None
+    self._prev_points = None
+
+  def reset(self):
+    """Forget the previous frame and the accumulated position."""
+    self._prev_image = None
+    self._prev_points = None
+    self.tracks = 0
+    self.position = np.zeros(2)
+
+  def process(self, image, altitude):
+    """Process the next frame.
+
+    *image* is a greyscale image as a 2D uint8 NumPy array (see
+    ardrone.vision.image.rgb565_to_luma). *altitude* is the height of the
+    camera above the ground in metres.
+
+    Returns the translation of the camera since the previous frame as a
+    2-element array in metres or None if it could not be estimated (e.g. for
+    the first frame or if too few features could be tracked).
+
+    """
+    if self.focal_length is None:
+      self.focal_length = 0.5 * image.shape[1] / math.tan(0.5 * self.fov)
+
+    translation = None
+    points = None
+
+    if self._prev_image is not None and self._prev_points is not None and len(self._prev_points) > 0:
+      points, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_image, image,
+          self._prev_points, None, **self._lk_params)
+      good = status.ravel() == 1
+      flow = (points - self._prev_points).reshape((-1, 2))[good]
+      points = points[good]
+
+      if len(flow) >= self.min_tracks:
+        # Reject features whose motion disagrees with the majority, e.g. ones
+        # which have latched onto the drone's shadow.
+        median = np.median(flow, axis=0)
+        deviation = np.abs(flow - median).max(axis=1)
+        inliers = deviation <= max(1.0, 3.0 * np.median(deviation))
+        points = points[inliers]
+
+        # Features move across the image in the opposite direction to the
+        # camera.
+        pixels = -np.median(flow[inliers], axis=0)
+        translation = pixels * (altitude / self.focal_length)
+        self.position += translation
+
+    self.tracks = 0 if points is None else len(points)
+
+    if self.tracks < self.min_features:
+      points = self._detect(image, points)
+
+    self._prev_image = image
+    self._prev_points = points
+    return translation
+
+  def _detect(self, image, existing):
+    """Top up the tracked features with new corners away from *existing*."""
+    mask = None
+    count = self.max_features
+    if existing is not None and len(existing) > 0:
+      count -= len(existing)
+      mask = np.full(image.shape, 255, dtype=np.uint8)
+      for x, y in existing.reshape((-1, 2)):
+        cv2.circle(mask, (int(x), int(y)), self.min_distance, 0, -1)
+
+    self.detections += 1
+    if count <= 0:
+      return existing
+
+    corners = cv2.goodFeaturesToTrack(image, count, self.quality, self.min_distance, mask=mask)
+    if corners is None:
+      log.debug('No features found to track.')
+      return existing
+
+    corners = corners.astype(np.float32)
+    if existing is None or len(existing) == 0:
+      return corners
+    return np.vstack((existing, corners))
@@ -0,0 +1,12 @@
+import unittest
+import doctest
+
+from . import archive, box, gate, image, odometry
+
+def load_tests(loader, tests, ignore):
+  tests.addTests(doctest.DocTestSuite(archive))
+  tests.addTests(doctest.DocTestSuite(box))
+  tests.addTests(doctest.DocTestSuite(gate))
+  tests.addTests(doctest.DocTestSuite(image))
+  tests.addTests(doctest.DocTestSuite(odometry))
+  return tests
@@ -0,0 +1,44 @@
+"""
+Benchmarks
+==========
+
+Timing the per-packet and per-frame hot paths: parsing navdata, formatting AT
+commands, decoding video, detecting markers and boxes, routing and status
+updates. Run every benchmark with::
+
+  python -m benchmarks
+
+or a selection of them by name (``--list`` lists them). Results may be saved
+as JSON with ``--output`` and compared with a previously saved baseline with
+``--baseline``, in which case the exit status is 1 if any benchmark has
+slowed down by more than ``--tolerance`` (25% by default)::
+
+  python -m benchmarks --output baseline.json
+  # ... make changes ...
+  python -m benchmarks --baseline baseline.json
+
+Timings depend on the machine so a baseline should only be compared with
+results from the machine it was made on.
+
+This package is made up of the following modules:
+
+  - runner: Registering, timing and comparing benchmarks.
+
+  - fixtures: Synthetic and recorded packets and test images.
+
+  - cases: The benchmarks themselves.
+
+  - record: Writing the recordings in ``data/benchmarks``.
+
+.. automodule:: benchmarks.runner
+  :members:
+
+.. automodule:: benchmarks.fixtures
+  :members:
+
+.. automodule:: benchmarks.cases
+
+.. automodule:: benchmarks.record
+  :members:
+
+"""
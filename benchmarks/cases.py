@@ -0,0 +1,189 @@
+"""
+The benchmarks
+==============
+
+Each benchmark times one call of a per-packet or per-frame hot path, cycling
+through its fixtures so that every call sees a realistic input:
+
+- ``navdata.split``: parse one synthetic navdata packet.
+- ``navdata.split.recorded``: parse one recorded navdata packet (from
+  ``--navdata`` or ``data/benchmarks/navdata.rec``).
+- ``atcommands.pcmd``: format one PCMD command.
+- ``videopacket.decode``: decode one recorded P264 video packet (from
+  ``--video`` or ``data/benchmarks/video.rec``, needs the ``libp264`` native
+  library).
+- ``aruco.detect_markers``: find the markers in one of the board images in
+  ``data/aruco`` (needs the ``libcaruco`` native library).
+- ``vision.detect_boxes``: find the boxes in one of the box images in
+  ``cng22_tests/feature_detection`` scaled to the size of a video frame.
+- ``vision.detect_boxes.archived``: find the boxes in one recorded video
+  frame, converted to greyscale unless recorded that way (from ``--frames``,
+  an archive written by :py:class:`ardrone.vision.archive.FrameWriter`, or
+  ``data/benchmarks/flight.frames``).
+- ``Navigator.route_to_target``: replan routes for three drones after one of
+  them reports a new position and target.
+- ``StatusUpdater.update``: propagate one raw drone status up to the swarm
+  status.
+
+"""
+
+from __future__ import division
+
+import itertools
+import random
+
+from . import fixtures
+from .runner import Skip, benchmark
+
+def _cycle(func, items):
+  # An operation calling func with the next of items each time.
+  items = list(items)
+  if len(items) == 0:
+    raise Skip('no fixtures')
+  source = itertools.cycle(items)
+  return lambda: func(next(source))
+
+def _import(name):
+  # Import and return the module name, skipping the benchmark if it cannot be.
+  try:
+    module = __import__(name)
+    for part in name.split('.')[1:]:
+      module = getattr(module, part)
+    return module
+  except ImportError as e:
+    raise Skip('cannot import %s: %s' % (name, e))
+
+@benchmark('navdata.split')
+def navdata_split(options):
+  navdata = _import('ardrone.core.navdata')
+  return _cycle(navdata.split, fixtures.synthetic_navdata())
+
+@benchmark('navdata.split.recorded')
+def navdata_split_recorded(options):
+  navdata = _import('ardrone.core.navdata')
+  filename = options.get('navdata') or fixtures.NAVDATA_RECORDING
+  return _cycle(navdata.split, fixtures.recorded_packets(filename))
+
+@benchmark('atcommands.pcmd')
+def atcommands_pcmd(options):
+  at = _import('ardrone.core.atcommands')
+  rng = random.Random(0)
+  commands = [dict(left_right_tilt=rng.uniform(-1, 1), front_back_tilt=rng.uniform(-1, 1),
+      vertical_speed=rng.uniform(-1, 1), angular_speed=rng.uniform(-1, 1)) for _ in range(64)]
+  return _cycle(lambda c: at.pcmd(True, False, **c), commands)
+
+@benchmark('videopacket.decode')
+def videopacket_decode(options):
+  videopacket = _import('ardrone.core.videopacket')
+  decoder = videopacket.Decoder()
+  if decoder._handle is None:
+    raise Skip('the libp264 native library is not available')
+  filename = options.get('video') or fixtures.VIDEO_RECORDING
+  return _cycle(decoder.decode, fixtures.recorded_packets(filename))
+
+@benchmark('aruco.detect_markers')
+def aruco_detect_markers(options):
+  aruco = _import('ardrone.aruco')
+  try:
+    aruco.load()
+  except aruco.ArucoError as e:
+    raise Skip(str(e))
+  images = fixtures.load_images(fixtures.ARUCO_IMAGES)
+  if len(images) == 0:
+    raise Skip('cannot load the images in data/aruco (is OpenCV installed?)')
+  return _cycle(aruco.detect_markers, images)
+
+@benchmark('vision.detect_boxes')
+def vision_detect_boxes(options):
+  box = _import('ardrone.vision.box')
+  image = _import('ardrone.vision.image')
+  images = fixtures.load_images(fixtures.BOX_IMAGES, size=image.FRAME_SIZE, colour=False)
+  return _cycle(box.detect_boxes, images)
+
+@benchmark('vision.detect_boxes.archived')
+def vision_detect_boxes_archived(options):
+  box = _import('ardrone.vision.box')
+  filename = options.get('frames') or fixtures.FRAME_ARCHIVE
+  archive = _import('ardrone.vision.archive').FrameArchive(filename)
+  return _cycle(lambda i: box.detect_boxes(archive.luma(i)), range(len(archive)))
+
+@benchmark('Navigator.route_to_target')
+def navigator_route_to_target(options):
+  Navigator = _import('multi_uav.Navigator')
+
+  drones = (1, 2, 3)
+  markers = Navigator.MarkerMap.load(Navigator.DEFAULT_MAP).markers()
+  # Keep each drone in its own part of the map so that reported positions
+  # never collide.
+  share = len(markers) // len(drones)
+  regions = [markers[i*share:(i+1)*share] for i in range(len(drones))]
+  navigator = Navigator.Navigator(drones, [region[0] for region in regions])
+
+  rng = random.Random(0)
+  requests = []
+  for _ in range(64):
+    i = rng.randrange(len(drones))
+    requests.append((rng.choice(regions[i]), rng.choice(markers), drones[i]))
+  return _cycle(lambda r: navigator.route_to_target(*r), requests)
+
+class _DroneController(object):
+  # Just enough of a DroneControl for StatusUpdater.
+  control_network_activity_flag = True
+  video_network_activity_flag = True
+  stability_info = {'gas_stable': True}
+  route = [0, 1]
+  state_id = 2
+  home = -1
+
+  def get_visible_markers(self):
+    return []
+
+  def update_raw(self, status):
+    pass
+
+  def update_drone(self, status):
+    pass
+
+class _SwarmController(object):
+  # Just enough of a SwarmControl for StatusUpdater, keeping separation with a
+  # real Navigator.
+  simulate_flag = False
+  min_separation = -1
+
+  def __init__(self, navigator):
+    self._navigator = navigator
+
+  def handle_event(self, event):
+    pass
+
+  def update(self, status):
+    pass
+
+  def update_separation(self, drone_id, position):
+    self.min_separation = self._navigator.update_separation(drone_id, position)
+
+@benchmark('StatusUpdater.update')
+def status_updater_update(options):
+  StatusUpdater = _import('multi_uav.StatusUpdater')
+  Navigator = _import('multi_uav.Navigator')
+
+  drones = (1, 2, 3)
+  markers = Navigator.MarkerMap.load(Navigator.DEFAULT_MAP).markers()
+  navigator = Navigator.Navigator(drones, markers[:len(drones)])
+  updater = StatusUpdater.StatusUpdater(drones,
+      [_DroneController() for _ in drones], _SwarmController(navigator))
+
+  rng = random.Random(0)
+  statuses = [{
+    'type': 'raw',
+    'drone_id': rng.choice(drones),
+    'marker_id': rng.choice(markers),
+    'marker_distance_x': rng.uniform(-1, 1),
+    'marker_distance_y': rng.uniform(-1, 1),
+    'gas_stable': rng.random() < 0.9,
+    'roll_stable': True,
+    'pitch_stable': True,
+    'altitude': rng.uniform(0, 1500),
+    'vbat_flying_percentage': rng.randint(5, 100),
+  } for _ in range(64)]
+  return _cycle(updater.update, statuses)
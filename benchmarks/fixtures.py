@@ -0,0 +1,100 @@
+"""
+Benchmark fixtures
+==================
+
+Inputs for the benchmarks which are the same from run to run: synthetic
+navdata packets made with a fixed seed, packets recorded with
+:py:func:`ardrone.simulation.server.write_packets`, the test images in
+``data/aruco`` and ``cng22_tests/feature_detection`` and the small navdata,
+video and frame recordings in ``data/benchmarks`` written by
+:py:mod:`benchmarks.record`.
+
+"""
+
+from __future__ import division
+
+import glob
+import os
+import random
+
+# The root of the source tree.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ARUCO_IMAGES = os.path.join(ROOT, 'data', 'aruco', 'board*.png')
+BOX_IMAGES = os.path.join(ROOT, 'cng22_tests', 'feature_detection', 'bx*.jpg')
+
+# The recordings used when none are given on the command line.
+DATA = os.path.join(ROOT, 'data', 'benchmarks')
+NAVDATA_RECORDING = os.path.join(DATA, 'navdata.rec')
+VIDEO_RECORDING = os.path.join(DATA, 'video.rec')
+FRAME_ARCHIVE = os.path.join(DATA, 'flight.frames')
+
+def synthetic_navdata(count=64, seed=0):
+  """Return a list of *count* full (demo and vision detect block) navdata
+  packets with random values.
+
+  >>> from ardrone.core import navdata
+  >>> packets = synthetic_navdata(4)
+  >>> [type(b).__name__ for b in navdata.split(packets[0])[1]]
+  ['DemoBlock', 'VisionDetectBlock', 'ChecksumBlock']
+  >>> synthetic_navdata(4) == packets
+  True
+
+  """
+  # Packets are built without ardrone.simulation, which imports NumPy.
+  from ardrone.core import navdata
+
+  rng = random.Random(seed)
+  state = (navdata.ARDRONE_FLY_MASK | navdata.ARDRONE_NAVDATA_THREAD_ON |
+      navdata.ARDRONE_VIDEO_THREAD_ON | navdata.ARDRONE_COMMAND_MASK)
+
+  packets = []
+  for sequence in range(count):
+    demo = navdata.DemoBlock()
+    demo.header.id = navdata.NAVDATA_DEMO_TAG
+    demo.ctrl_state = 3 << 16
+    demo.vbat_flying_percentage = rng.randint(20, 100)
+    demo.theta, demo.phi = rng.uniform(-5000, 5000), rng.uniform(-5000, 5000)
+    demo.psi = rng.uniform(-180000, 180000)
+    demo.altitude = rng.randint(500, 1500)
+    demo.vx, demo.vy, demo.vz = [rng.uniform(-1000, 1000) for _ in range(3)]
+
+    detect = navdata.VisionDetectBlock()
+    detect.header.id = navdata.NAVDATA_VISION_DETECT_TAG
+
+    packets.append(navdata.join(state, sequence + 1, [demo, detect]))
+  return packets
+
+def recorded_packets(filename):
+  """Return a list of the packets (without their times) recorded in the
+  file *filename*.
+
+  """
+  from ardrone.simulation.server import read_packets
+
+  with open(filename, 'rb') as f:
+    return [data for _, data in read_packets(f)]
+
+def load_images(pattern, size=None, colour=True):
+  """Load the images whose filenames match the glob *pattern* in sorted
+  order, resized to *size* (a (width, height) pair) if given. Images are
+  loaded as RGB arrays if *colour* is True and greyscale otherwise. Returns
+  a list of NumPy arrays, which is empty if OpenCV is not installed.
+
+  """
+  try:
+    import cv2
+  except ImportError:
+    return []
+
+  images = []
+  for filename in sorted(glob.glob(pattern)):
+    image = cv2.imread(filename, cv2.IMREAD_COLOR if colour else cv2.IMREAD_GRAYSCALE)
+    if image is None:
+      continue
+    if size is not None:
+      image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    if colour:
+      image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    images.append(image)
+  return images
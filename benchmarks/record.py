@@ -0,0 +1,128 @@
+"""
+Recording the benchmark fixtures
+================================
+
+Writes the small recordings in ``data/benchmarks`` which the benchmarks use
+when no recording is given on the command line:
+
+- ``navdata.rec``: full (demo and vision detect block) navdata packets sent at
+  200 Hz by a :py:class:`ardrone.simulation.server.SimulatedDrone` taking off
+  and flying forwards, in the format of
+  :py:func:`ardrone.simulation.server.write_packets`.
+
+- ``video.rec``: one P264 video packet for each of the box test images in
+  ``cng22_tests/feature_detection``, in the same format. The drone encodes
+  P264 in hardware so the packets are written by the ``synthetic_stream``
+  tool built with ``native/libp264``. Each picture is a mosaic of 16x16 pixel
+  blocks of its image coded as intra macroblocks, which the real decoder
+  decodes like any other picture.
+
+- ``flight.frames``: the first few box test images as an archive of greyscale
+  frames written by :py:class:`ardrone.vision.archive.FrameWriter`.
+
+The recordings are checked in so this only needs to be run if they change::
+
+  python -m benchmarks.record --stream-tool build/libp264/synthetic_stream
+
+"""
+
+from __future__ import division
+
+import argparse
+import logging
+import os
+import subprocess
+
+from . import fixtures
+
+log = logging.getLogger()
+
+# The number of navdata packets and the time at which recording starts, once
+# the drone has taken off.
+NAVDATA_PACKETS = 96
+NAVDATA_START = 4.0
+
+# The number of frames archived, which are 75 kB each.
+ARCHIVED_FRAMES = 3
+
+def record_navdata(filename, count=NAVDATA_PACKETS):
+  """Record *count* navdata packets from a simulated flight to *filename*."""
+  from ardrone.core import atcommands as at
+  from ardrone.core import navdata
+  from ardrone.simulation.server import FULL_RATE, SimulatedDrone, write_packets
+
+  drone = SimulatedDrone()
+  drone.start_navdata(0.0)
+  at.reset_sequence()
+  for command in (at.config('general:navdata_demo', 'FALSE'), at.ctrl(5), at.ref(take_off=True)):
+    drone.handle_at(command.encode('ascii'), 0.0)
+
+  packets = []
+  for sequence in range(count):
+    now = NAVDATA_START + sequence / FULL_RATE
+    # Keep the watchdog quiet while pitching forwards and turning
+    drone.handle_at(at.pcmd(True, False, front_back_tilt=-0.5, angular_speed=0.25).encode('ascii'), now)
+    drone.advance(now)
+    packets.append((now, navdata.join(drone.navdata_state(), sequence + 1, drone.blocks())))
+
+  with open(filename, 'wb') as f:
+    write_packets(f, packets)
+  log.info('Wrote %i navdata packets to %s' % (len(packets), filename))
+
+def _frames(size):
+  # The box test images as (colour, greyscale) pairs of *size* arrays.
+  import cv2
+  colour = fixtures.load_images(fixtures.BOX_IMAGES, size=size)
+  return [(image, cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)) for image in colour]
+
+def record_video(filename, stream_tool):
+  """Record one P264 packet for each box test image to *filename* with the
+  ``synthetic_stream`` tool at *stream_tool*.
+
+  """
+  import cv2
+  from ardrone.vision.image import FRAME_SIZE
+
+  frames = b''.join(cv2.cvtColor(colour, cv2.COLOR_RGB2YUV_I420).tobytes()
+      for colour, _ in _frames(FRAME_SIZE))
+  with open(filename, 'wb') as f:
+    process = subprocess.Popen([stream_tool], stdin=subprocess.PIPE, stdout=f)
+    process.communicate(frames)
+  if process.returncode != 0:
+    raise RuntimeError('%s failed with status %i' % (stream_tool, process.returncode))
+  log.info('Wrote video packets to %s' % (filename,))
+
+def record_frames(path, count=ARCHIVED_FRAMES):
+  """Record the first *count* box test images as an archive of greyscale
+  frames at *path*.
+
+  """
+  from ardrone.vision.archive import FrameWriter
+  from ardrone.vision.image import FRAME_SIZE
+
+  for p in (path, path + '.index'):
+    if os.path.exists(p):
+      os.remove(p)
+  with FrameWriter(path, FRAME_SIZE, 'luma') as writer:
+    for i, (_, grey) in enumerate(_frames(FRAME_SIZE)[:count]):
+      writer.append(grey, when=i / 15.0)
+    log.info('Wrote %i frames to %s' % (len(writer), path))
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Write the recordings used by the benchmarks.')
+  parser.add_argument('--stream-tool', required=True,
+      help='the synthetic_stream tool built with native/libp264')
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(level=logging.INFO)
+
+  if not os.path.isdir(fixtures.DATA):
+    os.makedirs(fixtures.DATA)
+  record_navdata(fixtures.NAVDATA_RECORDING)
+  record_video(fixtures.VIDEO_RECORDING, args.stream_tool)
+  record_frames(fixtures.FRAME_ARCHIVE)
+  return 0
+
+if __name__ == '__main__':
+  import sys
+  sys.exit(main())
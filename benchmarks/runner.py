@@ -0,0 +1,251 @@
+"""
+Running benchmarks
+==================
+
+A benchmark is a function registered with :py:func:`benchmark` which does any
+expensive setup (loading fixtures, constructing objects) and returns a
+function of no arguments performing one operation, e.g. splitting one
+navdata packet. If the benchmark cannot run (say a native library is
+missing) the setup raises :py:class:`Skip`. Any other exception raised while
+setting up or timing a benchmark is logged and the benchmark recorded as
+failed, so one broken benchmark does not stop the others.
+
+:py:func:`measure` times an operation by calling it in a loop long enough to
+be timed accurately, several times over, and reports the per-operation time
+of the fastest and the median loop. The fastest loop is the least disturbed
+by the rest of the system so it is what results are compared on.
+
+Results are saved as JSON and :py:func:`compare` finds the benchmarks which
+have slowed down relative to a stored baseline.
+
+"""
+
+from __future__ import division
+
+import argparse
+import collections
+import json
+import logging
+import platform
+import sys
+import time
+
+from ardrone.util.scheduler import monotonic
+
+log = logging.getLogger()
+
+# Registered benchmarks in the order they were registered.
+BENCHMARKS = collections.OrderedDict()
+
+# A benchmark is a regression if it takes this fraction longer than the
+# baseline.
+DEFAULT_TOLERANCE = 0.25
+
+class Skip(Exception):
+  """Raised by the setup of a benchmark which cannot run here."""
+  pass
+
+def benchmark(name):
+  """A decorator registering the setup function it decorates as the
+  benchmark *name*. The setup function is passed a dictionary of options
+  (e.g. the filenames of recordings given on the command line) and returns the
+  function to time.
+
+  """
+  def register(setup):
+    BENCHMARKS[name] = setup
+    return setup
+  return register
+
+def measure(operation, repeat=5, min_time=0.2, clock=monotonic):
+  """Time *operation*. The number of calls in each loop is doubled until a
+  loop takes at least *min_time* seconds and then *repeat* loops are timed.
+
+  Returns a dictionary with the per-call time in seconds of the fastest
+  ('best') and median ('median') loops and the number of 'calls' in each.
+
+  >>> result = measure(lambda: None, repeat=3, min_time=0.001)
+  >>> sorted(result.keys())
+  ['best', 'calls', 'median']
+  >>> result['best'] <= result['median']
+  True
+
+  """
+  def run(calls):
+    start = clock()
+    for _ in range(calls):
+      operation()
+    return clock() - start
+
+  calls = 1
+  while True:
+    elapsed = run(calls)
+    if elapsed >= min_time or calls >= 1 << 30:
+      break
+    calls *= 2
+
+  times = sorted(run(calls) / calls for _ in range(repeat))
+  return {'best': times[0], 'median': times[len(times) // 2], 'calls': calls}
+
+def run(names=None, options=None, repeat=5, min_time=0.2):
+  """Run the benchmarks called *names* (every registered benchmark if None)
+  with *options* passed to their setup. Returns a dictionary of results as
+  saved by :py:func:`save`. Skipped benchmarks have a 'skipped' reason and
+  failed benchmarks a 'failed' error rather than timings.
+
+  >>> @benchmark('broken')
+  ... def broken(options):
+  ...   raise ValueError('bad fixture')
+  >>> run(['broken'])['results']['broken']
+  {'failed': 'ValueError: bad fixture'}
+  >>> del BENCHMARKS['broken']
+
+  """
+  options = options if options is not None else {}
+  results = collections.OrderedDict()
+  for name, setup in BENCHMARKS.items():
+    if names is not None and name not in names:
+      continue
+    try:
+      operation = setup(options)
+      results[name] = measure(operation, repeat, min_time)
+    except Skip as e:
+      log.info('Skipping %s: %s' % (name, e))
+      results[name] = {'skipped': str(e)}
+      continue
+    except Exception as e:
+      log.exception('Benchmark %s failed' % (name,))
+      results[name] = {'failed': '%s: %s' % (type(e).__name__, e)}
+      continue
+    log.info('%s: %s' % (name, _format_time(results[name]['best'])))
+
+  return {
+    'when': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'python': platform.python_version(),
+    'machine': platform.platform(),
+    'results': results,
+  }
+
+def save(results, filename):
+  """Save *results* as returned by :py:func:`run` to *filename*."""
+  with open(filename, 'w') as f:
+    json.dump(results, f, indent=2, separators=(',', ': '))
+    f.write('\n')
+
+def load(filename):
+  """Load results saved by :py:func:`save` from *filename*."""
+  with open(filename) as f:
+    return json.load(f)
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+  """Compare the best times in *results* with those in *baseline*. Returns a
+  list of *(name, baseline, current, ratio)* tuples sorted by name for every
+  benchmark timed in both, and a list of the names of those whose ratio is
+  more than 1 + *tolerance*.
+
+  >>> baseline = {'results': {'a': {'best': 1.0}, 'b': {'best': 1.0},
+  ...                         'c': {'skipped': 'no library'}}}
+  >>> results = {'results': {'a': {'best': 1.1}, 'b': {'best': 2.0},
+  ...                        'c': {'best': 1.0}}}
+  >>> rows, regressions = compare(results, baseline)
+  >>> [(name, ratio) for name, _, _, ratio in rows]
+  [('a', 1.1), ('b', 2.0)]
+  >>> regressions
+  ['b']
+
+  """
+  rows, regressions = [], []
+  for name in sorted(results['results'].keys()):
+    current = results['results'][name].get('best')
+    previous = baseline['results'].get(name, {}).get('best')
+    if current is None or previous is None or previous <= 0:
+      continue
+    ratio = current / previous
+    rows.append((name, previous, current, ratio))
+    if ratio > 1.0 + tolerance:
+      regressions.append(name)
+  return rows, regressions
+
+def _format_time(seconds):
+  for scale, unit in ((1.0, 's'), (1e-3, 'ms'), (1e-6, 'us')):
+    if seconds >= scale:
+      return '%.3f %s' % (seconds / scale, unit)
+  return '%.1f ns' % (seconds / 1e-9,)
+
+def report(results, comparison=None):
+  """Return a table of *results* and, if given, the *(rows, regressions)*
+  returned by :py:func:`compare`.
+
+  """
+  ratios = {}
+  regressions = set()
+  if comparison is not None:
+    ratios = dict((row[0], row[3]) for row in comparison[0])
+    regressions = set(comparison[1])
+
+  lines = ['%-36s %12s %12s %9s' % ('benchmark', 'best', 'median', 'baseline')]
+  for name, result in results['results'].items():
+    if 'skipped' in result:
+      lines.append('%-36s %12s  (%s)' % (name, 'skipped', result['skipped']))
+      continue
+    if 'failed' in result:
+      lines.append('%-36s %12s  (%s)' % (name, 'FAILED', result['failed']))
+      continue
+    ratio = '%.2fx' % (ratios[name],) if name in ratios else '-'
+    lines.append('%-36s %12s %12s %9s%s' % (name, _format_time(result['best']),
+      _format_time(result['median']), ratio, ' REGRESSION' if name in regressions else ''))
+  return '\n'.join(lines) + '\n'
+
+def main(argv=None):
+  """Run the benchmarks from the command line. Returns 1 if any benchmark
+  failed or regressed against the baseline and 0 otherwise.
+
+  """
+  # Register the benchmarks
+  from . import cases
+
+  parser = argparse.ArgumentParser(description='Time the per-packet and per-frame hot paths.')
+  parser.add_argument('names', nargs='*', metavar='NAME',
+      help='benchmarks to run (default: all of them)')
+  parser.add_argument('--list', action='store_true', help='list the benchmarks and exit')
+  parser.add_argument('-o', '--output', help='save the results as JSON to this file')
+  parser.add_argument('-b', '--baseline', help='compare the results with those in this file')
+  parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+      help='fraction by which a benchmark may slow down before it is a regression (default: %(default)s)')
+  parser.add_argument('--repeat', type=int, default=5, help='loops to time (default: %(default)s)')
+  parser.add_argument('--min-time', type=float, default=0.2,
+      help='minimum duration of each loop in seconds (default: %(default)s)')
+  parser.add_argument('--navdata',
+      help='navdata packets recorded with ardrone.simulation.server.write_packets (default: data/benchmarks/navdata.rec)')
+  parser.add_argument('--video',
+      help='video packets recorded with ardrone.simulation.server.record_video (default: data/benchmarks/video.rec)')
+  parser.add_argument('--frames',
+      help='decoded frames recorded with ardrone.vision.archive.FrameWriter (default: data/benchmarks/flight.frames)')
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(level=logging.WARNING)
+
+  if args.list:
+    for name in BENCHMARKS.keys():
+      print(name)
+    return 0
+
+  unknown = [name for name in args.names if name not in BENCHMARKS]
+  if len(unknown) > 0:
+    parser.error('unknown benchmarks: %s' % (', '.join(unknown),))
+
+  options = {'navdata': args.navdata, 'video': args.video, 'frames': args.frames}
+  results = run(args.names or None, options, args.repeat, args.min_time)
+  if args.output is not None:
+    save(results, args.output)
+
+  comparison = None
+  if args.baseline is not None:
+    comparison = compare(results, load(args.baseline), args.tolerance)
+
+  sys.stdout.write(report(results, comparison))
+  if any('failed' in result for result in results['results'].values()):
+    return 1
+  if comparison is not None and len(comparison[1]) > 0:
+    return 1
+  return 0
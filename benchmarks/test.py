@@ -0,0 +1,9 @@
+import unittest
+import doctest
+
+from . import fixtures, runner
+
+def load_tests(loader, tests, ignore):
+  tests.addTests(doctest.DocTestSuite(fixtures))
+  tests.addTests(doctest.DocTestSuite(runner))
+  return tests
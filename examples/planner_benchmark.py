@@ -0,0 +1,92 @@
+"""
+``planner_benchmark.py``: benchmarking cooperative route planning
+-----------------------------------------------------------------
+
+Time the multi_uav ReservationPlanner on synthetic grid arenas. For each
+number of drones, random distinct start and goal markers are chosen and all
+drones are planned together. Then one drone at a time is given a new target
+and replanned incrementally, leaving the other drones' reservations in place.
+Every set of routes is checked to be conflict free.
+
+Usage::
+
+  python planner_benchmark.py [grid size] [trials] [drone counts...]
+
+The defaults are a 10x10 grid, 20 trials and 5, 10, 20 and 40 drones.
+
+"""
+from __future__ import division
+
+import os
+import random
+import sys
+import time
+
+# Where is this file?
+this_dir = os.path.abspath(os.path.dirname(__file__))
+
+# Insert a path to load modules from relative to this file
+sys.path.insert(0, os.path.abspath(os.path.join(this_dir, '..')))
+
+from multi_uav.MarkerMap import MarkerMap
+from multi_uav.ReservationPlanner import ReservationPlanner
+
+def grid_map(size):
+  """Return a MarkerMap of a size x size grid with markers numbered row by
+  row."""
+  rows = [[r*size + c for c in range(size)] for r in range(size)]
+  columns = [[r*size + c for r in range(size)] for c in range(size)]
+  marker_map = MarkerMap(rows + columns)
+  marker_map.build()
+  return marker_map
+
+def run(marker_map, n_drones, trials, rng):
+  markers = marker_map.markers()
+  plan_times, replan_times = [], []
+  planned, conflicts = 0, 0
+
+  for trial in range(trials):
+    planner = ReservationPlanner(marker_map)
+    cells = rng.sample(markers, 2 * n_drones)
+    starts = dict((d, cells[d]) for d in range(n_drones))
+    goals = dict((d, cells[n_drones + d]) for d in range(n_drones))
+
+    start = time.time()
+    paths = planner.plan_all(starts, goals)
+    plan_times.append(time.time() - start)
+    planned += len([p for p in paths.values() if p is not None])
+    conflicts += len(planner.conflicts())
+
+    # Give each drone in turn a new, unused target
+    for drone in range(n_drones):
+      used = set(goals.values())
+      goals[drone] = rng.choice([m for m in markers if m not in used])
+      start = time.time()
+      planner.plan(drone, starts[drone], goals[drone])
+      replan_times.append(time.time() - start)
+    conflicts += len(planner.conflicts())
+
+  return {
+    'plan_ms': 1e3 * sum(plan_times) / len(plan_times),
+    'replan_ms': 1e3 * sum(replan_times) / len(replan_times),
+    'planned': planned / (trials * n_drones),
+    'conflicts': conflicts,
+  }
+
+def main():
+  """The main entry point of the program."""
+  size = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+  trials = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+  counts = [int(n) for n in sys.argv[3:]] or [5, 10, 20, 40]
+
+  marker_map = grid_map(size)
+  rng = random.Random(0)
+
+  print('%dx%d grid, %d trials' % (size, size, trials))
+  print('%8s %12s %12s %9s %10s' % ('drones', 'plan all/ms', 'replan/ms', 'planned', 'conflicts'))
+  for n_drones in counts:
+    r = run(marker_map, n_drones, trials, rng)
+    print('%8d %12.2f %12.3f %8.0f%% %10d' % (n_drones, r['plan_ms'], r['replan_ms'], 100 * r['planned'], r['conflicts']))
+
+if __name__ == '__main__':
+  main()
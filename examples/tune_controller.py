@@ -0,0 +1,68 @@
+"""
+``tune_controller.py``: tuning a lead-lag controller without flying
+-------------------------------------------------------------------
+
+Fit a model of forward velocity in response to pitch commands from a
+characterisation run recorded by ``ac622-control_characterisation`` and then
+screen a grid of lead-lag controllers against it in closed loop. The candidates
+are ``multi_uav`` LeadLagController2s with their default, backward difference,
+coefficients, which are what the drones fly. The candidates with the quickest settling time, little
+overshoot and a small steady-state error are printed.
+
+Usage::
+
+  python tune_controller.py [characterisation run directory] [reference]
+
+The default run is ``8sStepHalfMagNH1`` from the dump archive and the default
+reference is a step of 500 mm/s.
+
+"""
+from __future__ import division
+
+import os
+import sys
+import time
+
+import numpy as np
+
+# Where is this file?
+this_dir = os.path.abspath(os.path.dirname(__file__))
+
+# Insert a path to load modules from relative to this file
+sys.path.insert(0, os.path.abspath(os.path.join(this_dir, '..')))
+
+from ardrone.simulation import closedloop, model
+from multi_uav.Controllers import LeadLagController2
+
+def main():
+  """The main entry point of the program."""
+  run = sys.argv[1] if len(sys.argv) > 1 else os.path.join(this_dir, '..',
+      'ac622-control_characterisation', 'dump_archive', '8sStepHalfMagNH1')
+  reference = float(sys.argv[2]) if len(sys.argv) > 2 else 500.0
+
+  m = model.fit_logs(os.path.join(run, 'command_dump.dat'),
+      os.path.join(run, 'vx_dump.dat'), T=0.04, na=2, nb=2, delay=2)
+  print('Fitted %s, steady-state gain %.1f' % (m, m.gain))
+
+  # The command reduces vx, so the pre-compensating gain is negative
+  params = closedloop.grid(
+      k=list(-np.logspace(-6, -2, 30)),
+      a=list(np.linspace(0.01, 1.0, 30)),
+      b=list(np.linspace(0.005, 0.5, 30)))
+  start = time.time()
+  metrics = closedloop.sweep(m, LeadLagController2, params,
+      fixed=dict(T=m.T, reference=reference, error_margin=0.5))
+  print('Screened %d candidates in %.1f seconds' % (len(params), time.time() - start))
+
+  ok = np.isfinite(metrics['settling_time']) & (metrics['overshoot'] <= 0.25) & \
+      (metrics['steady_state_error'] <= 0.5)
+  order = np.flatnonzero(ok)[np.argsort(metrics['settling_time'][ok])]
+  print('%10s %8s %8s %10s %10s %10s %8s' % ('k', 'a', 'b', 'rise/s', 'settle/s', 'overshoot', 'error'))
+  for i in order[:10]:
+    p = metrics['params'][i]
+    print('%10.3g %8.3f %8.3f %10.2f %10.2f %9.0f%% %7.0f%%' % (p['k'], p['a'], p['b'],
+      metrics['rise_time'][i], metrics['settling_time'][i],
+      100 * metrics['overshoot'][i], 100 * metrics['steady_state_error'][i]))
+
+if __name__ == '__main__':
+  main()
@@ -3,10 +3,6 @@ import os
 import signal
 import sys
 import socket, time
-import png
-import numpy as np
-from PIL import Image
-import zlib   
 
 import logging
 #logging.basicConfig(level=logging.DEBUG)
@@ -18,6 +14,7 @@ sys.path.insert(0, os.path.abspath('..'))
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
                                    
 from ardrone.core import videopacket
+from ardrone.vision.archive import FrameWriter
 
 
 
@@ -60,27 +57,21 @@ class ExampleApp(object):
     #an argument
     self._vid_decoder=videopacket.Decoder(self.frame)
 
-    #constructor for png encoder: size of image to be encoded 320x240
-    self.writer=png.Writer(width,height)
+    #archive every decoded frame with the time it arrived to video.frames.
+    #read it back with ardrone.vision.archive.FrameArchive
+    self.writer=FrameWriter('video.frames',(width,height))
 
     
   def run(self):
     self.app.exec_()
+    self.writer.close()
 
   def heartbeat(self):
         pass
 
   #function called after image has been decoded. raw_video_frame is the decoded frame    
   def frame(self, raw_video_frame):
-    print ('frame')
-    #png.from_array(raw_video_frame)
-
-
-    #code from stack overflow: convert from rgb565 to rgb888
-    arr = np.fromstring(raw_video_frame,dtype=np.uint16).astype(np.uint32)
-    arr = 0xFF000000 + ((arr & 0xF800) >> 8) + ((arr & 0x07E0) << 5) + ((arr & 0x001F) << 19)
-    im1=Image.fromstring('RGBA', (width,height), arr, 'raw', 'RGBA', 0, 1)
-    im1.save('s2.jpg')
+    print ('frame %i' % self.writer.append(raw_video_frame))
     
     
 
@@ -10,15 +10,23 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 # Import objects to initialise
 from ardrone.core.controlloop import ControlLoop
 from ardrone.platform import qt as platform
+from ardrone.util.scheduler import QtScheduler
+from ardrone.util import metrics
 from . import DroneControl
 from . import SwarmControl
 from . import StatusUpdater
+from . import Controllers
 
 class AppController(object):
 	"""
 	Initially sets up system in configuration provided. Routes communication of status messages to status updater.
+
+	Runtime metrics are served in the Prometheus text format on http://127.0.0.1:metrics_port/metrics once started (unless metrics_port is None).
 	"""
-	def __init__(self,drones,configs,homes):
+	def __init__(self,drones,configs,homes,metrics_port=metrics.DEFAULT_PORT):
+		self.metrics_port = metrics_port
+		self.metrics_server = None
+
 		# ---- DRONES SETUP ----
 		# List of ControlLoop objects for use in interfacing with drones
 		control_loops = []
@@ -33,12 +41,20 @@ class AppController(object):
 		# List of DroneControl objects for use in managing individual drone actions
 		self.drone_controls = []
 		
+		# One scheduler runs the periodic tasks of the controllers and swarm logic, giving control priority
+		# Timing statistics are available from self.scheduler.stats()
+		self.scheduler = QtScheduler()
+
+		# One bank steps the controllers of every drone at once
+		self.controller_bank = Controllers.ControllerBank(scheduler=self.scheduler)
+
 		# DroneControl
 		for index in range(0,len(drones)):
-			self.drone_controls.append(DroneControl.DroneControl(drones[index],control_loops[index],configs[index],self,homes[index]))
+			self.drone_controls.append(DroneControl.DroneControl(drones[index],control_loops[index],configs[index],self,homes[index],self.controller_bank))
+		self.controller_bank.start()
 
 		# SwarmControl
-		self._swarm_control = SwarmControl.SwarmControl(drones,tuple(self.drone_controls),homes)
+		self._swarm_control = SwarmControl.SwarmControl(drones,tuple(self.drone_controls),homes,self.scheduler)
 
 		# StatusUpdater
 		self._status_updater = StatusUpdater.StatusUpdater(drones,tuple(self.drone_controls),self._swarm_control)
@@ -47,6 +63,9 @@ class AppController(object):
 		"""
 		Start app
 		"""
+		self.scheduler.start()
+		if self.metrics_port is not None:
+			self.metrics_server = metrics.registry.serve(self.metrics_port)
 		self._swarm_control.start_program()
 
 	def finish(self):
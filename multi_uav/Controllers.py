@@ -2,6 +2,8 @@ import os
 import sys
 import json, socket
 
+import numpy as np
+
 # This makes sure the path which python uses to find things when using import
 # can find all our code.
 sys.path.insert(0, os.path.abspath('..'))
@@ -10,13 +12,19 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 # Import qt modules (platform independant)
 import ardrone.util.qtcompat as qt
 QtCore = qt.import_module('QtCore')
+import ardrone.util.scheduler as Scheduler
+from ardrone.util.metrics import registry
+from ardrone.util.profiling import profiler
+from ardrone.util.tracing import tracer
 
 class ControllerManager(object):
 	"""
 	Class to manage all the controllers for one drone.
 	Regulates the packets being sent to the drone so only one command is sent every heartbeat (otherwise we may overload the system).
+
+	The controllers themselves are stepped by a ControllerBank. If bank is given it is shared with other drones' ControllerManagers (and must be started by its owner), otherwise a private bank is created and started.
 	"""
-	def __init__(self,_control):
+	def __init__(self,_control,bank=None):
 		# Store 'pointers'
 		self._control = _control
 
@@ -27,70 +35,222 @@ class ControllerManager(object):
 				'pitch':-1,
 				};
 
-		# Create a little 'heartbeat' timer that will call heartbeat() every so often.
-		self.heartbeat_timer = QtCore.QTimer()
-		self.heartbeat_timer.setInterval(40) # ms
-		self.heartbeat_timer.timeout.connect(self.heartbeat)
-		self.heartbeat_timer.start()
+		# The bank calls heartbeat() after every step
+		if bank is None:
+			bank = ControllerBank()
+			bank.start()
+		self.bank = bank
+		self.bank.add_manager(self)
 
 	def heartbeat(self):
 		"""
-		Get each controller to update its variables and then send them all to the drone at once.
+		Send the outputs of this drone's controllers (already updated by the bank) to the drone at once.
 		"""
-		no_controller_count = 0
-		# Update
+		# Send commands to drone if a controller exists, along with the traces of the packets the controllers have now acted upon
 		for controller in self.controllers.values():
-			# ignore controller if it doesn't exist
-			if controller == -1:
-				no_controller_count = no_controller_count + 1
-				continue
-			# call its function if it does
-			controller.heartbeat()
-		# Send commands to drone if a controller exists
-		if not no_controller_count == 3:
-			self._control._network.sendControl(self._control.drone_input)
+			if not controller == -1:
+				traces = self._control.take_traces()
+				for trace in traces:
+					tracer.mark(trace,'controller')
+				self._control._network.sendControl(self._control.drone_input,traces)
+				return
 
 	def stop_control(self,output_type):
 		"""
 		Removes the current controller for output_type passed.
 		"""
+		if not self.controllers[output_type] == -1:
+			self.bank.remove(self.controllers[output_type])
 		self.controllers[output_type]=-1
 
 	def create_lead_lag_controller(self,*args,**kwargs):
 		"""
 		Creates a lead lag controller of type 1
 		"""
-		new_controller = LeadLagController(*args,**kwargs)
-		self.controllers[new_controller.get_type()] = new_controller		
-		return new_controller
+		return self.add_controller(LeadLagController(*args,**kwargs))
  
 	def create_lead_lag_2_controller(self,*args,**kwargs):
 		"""
 		Creates a lead lag controller of type 2 
 		"""
-		new_controller = LeadLagController2(*args,**kwargs)
-		self.controllers[new_controller.get_type()] = new_controller		
-		return new_controller
+		return self.add_controller(LeadLagController2(*args,**kwargs))
 
 	def create_proportional_controller(self,*args,**kwargs):
 		"""
 		Creates a proportional controller 
 		"""
-		new_controller = ProportionalController(*args,**kwargs)
-		self.controllers[new_controller.get_type()] = new_controller		
+		return self.add_controller(ProportionalController(*args,**kwargs))
+
+	def add_controller(self,new_controller):
+		"""
+		Replace the current controller for new_controller's output type with new_controller
+		"""
+		self.stop_control(new_controller.get_type())
+		self.bank.add(new_controller)
+		self.controllers[new_controller.get_type()] = new_controller
 		return new_controller
 
+class ControllerBank(object):
+	"""
+	Steps every active controller, for any number of drones, with one vectorised calculation per heartbeat.
+
+	Every controller in this module is a first order difference equation on the pre-compensated error e[k] = K * (r - y[k]):
+		u[k] = g * { (cu * u[k-1]) - (ce1 * e[k-1]) + (ce0 * e[k]) }
+	(see the coefficients() method of each controller). The terms are evaluated in the same order as the controllers' original per-controller heartbeats so the outputs are bit for bit the same. Controllers without memory (cu and ce1 zero) have u[k] = g * (ce0 * e[k]). Each controller is given a slot in NumPy arrays holding its coefficients, reference, limits and state, so the cost of a step is one set of array operations however many axes and drones are being controlled.
+	Only reading the feedback values from and writing the outputs to each drone is done per controller.
+
+	error_count and stable hold the stability counter and flag of each slot. A controller is stable once its output has been within its error margin for stable_count heartbeats in a row, and unstable as soon as it is not.
+	"""
+	def __init__(self,capacity=8,interval=40,stable_count=50,scheduler=None):
+		"""
+		capacity is the initial number of slots (more are added as needed).
+		interval is the heartbeat period in ms.
+		If scheduler (an ardrone.util.scheduler.Scheduler) is given, heartbeats are run by it as a control priority task, otherwise by a Qt timer.
+		"""
+		self.stable_count = stable_count
+		self.interval = interval
+		self.scheduler = scheduler
+		self.managers = []
+		self._controllers = []
+		self._allocate(capacity)
+
+		# Heartbeat timing (see ardrone.util.metrics)
+		self.period = registry.histogram('ardrone_controller_period_seconds','Time between controller bank heartbeats.')
+		self.step_time = registry.histogram('ardrone_controller_step_seconds','Time taken to step every controller.')
+		self._last_heartbeat = None
+
+		# Create a little 'heartbeat' timer that will call heartbeat() every so often.
+		if self.scheduler is None:
+			self.heartbeat_timer = QtCore.QTimer()
+			self.heartbeat_timer.setInterval(interval) # ms
+			self.heartbeat_timer.timeout.connect(profiler.wrap(self.heartbeat))
+
+	def start(self):
+		if self.scheduler is None:
+			self.heartbeat_timer.start()
+		else:
+			self.scheduler.add('controller_bank',self.heartbeat,self.interval/1000.0,priority=Scheduler.CONTROL)
+
+	def stop(self):
+		if self.scheduler is None:
+			self.heartbeat_timer.stop()
+		else:
+			self.scheduler.remove('controller_bank')
+
+	def add_manager(self,manager):
+		"""
+		Call manager.heartbeat() after every step
+		"""
+		self.managers.append(manager)
+
+	def heartbeat(self):
+		"""
+		Step every controller then let each ControllerManager send its drone's inputs.
+		"""
+		start = Scheduler.monotonic()
+		if self._last_heartbeat is not None:
+			self.period.observe(start - self._last_heartbeat)
+		self._last_heartbeat = start
+
+		self.step()
+		self.step_time.observe(Scheduler.monotonic() - start)
+		for manager in self.managers:
+			manager.heartbeat()
+
+	def add(self,controller):
+		"""
+		Give controller a slot. Its state starts at zero.
+		"""
+		if not np.any(~self.active):
+			self._allocate(2*len(self.active))
+		slot = int(np.flatnonzero(~self.active)[0])
+
+		self._controllers[slot] = controller
+		self.coefficients[slot] = controller.coefficients()
+		self.k[slot] = controller.k
+		self.reference[slot] = controller.r
+		self.error_margin[slot] = controller.error_margin
+		self.hard_limit[slot] = controller.hard_limit
+		self.u[slot] = 0.0
+		self.e[slot] = 0.0
+		self.error_count[slot] = 0
+		self.stable[slot] = controller.get_stability()
+		self.active[slot] = True
+		controller.slot = slot
+
+	def remove(self,controller):
+		"""
+		Free controller's slot
+		"""
+		if controller.slot is None:
+			return
+		self.active[controller.slot] = False
+		self._controllers[controller.slot] = None
+		controller.slot = None
+
+	def step(self):
+		"""
+		Advance every active controller by one time step and write the outputs to the drones.
+		"""
+		slots = np.flatnonzero(self.active)
+		if len(slots) == 0:
+			return
+
+		# Gather feedback and calculate u[k]
+		y = np.array([self._controllers[slot].y() for slot in slots],dtype=float)
+		e = self.k[slots] * (self.reference[slots] - y)
+		c = self.coefficients[slots]
+		u = c[:,0] * (((c[:,1] * self.u[slots]) - (c[:,2] * self.e[slots])) + (c[:,3] * e))
+		memoryless = (c[:,1] == 0) & (c[:,2] == 0)
+		u[memoryless] = c[memoryless,0] * (c[memoryless,3] * e[memoryless])
+		self.u[slots] = u
+		self.e[slots] = e
+
+		# Stability counters
+		count = np.where(np.abs(u) <= self.error_margin[slots],self.error_count[slots] + 1,0)
+		self.error_count[slots] = count
+		stable = self.stable[slots]
+		now_stable = (count >= self.stable_count) | (stable & (count > 0))
+		changed = slots[now_stable != stable]
+		self.stable[slots] = now_stable
+
+		# Hard limit and send outputs
+		output = np.clip(u,-self.hard_limit[slots],self.hard_limit[slots])
+		for slot, value in zip(slots,output):
+			self._controllers[slot].output(float(value))
+		for slot in changed:
+			self._controllers[slot].set_stability(bool(self.stable[slot]))
+
+	def _allocate(self,capacity):
+		# Grow (or create) the arrays to hold capacity slots
+		old = len(self._controllers)
+		extra = capacity - old
+		self._controllers.extend([None]*extra)
+		if old == 0:
+			self.coefficients = np.zeros((capacity,4))
+			self.k, self.reference, self.error_margin, self.hard_limit, self.u, self.e = [np.zeros(capacity) for count in range(6)]
+			self.error_count = np.zeros(capacity,dtype=int)
+			self.stable = np.zeros(capacity,dtype=bool)
+			self.active = np.zeros(capacity,dtype=bool)
+		else:
+			self.coefficients = np.vstack((self.coefficients,np.zeros((extra,4))))
+			self.k, self.reference, self.error_margin, self.hard_limit, self.u, self.e = [np.concatenate((array,np.zeros(extra))) for array in (self.k,self.reference,self.error_margin,self.hard_limit,self.u,self.e)]
+			self.error_count = np.concatenate((self.error_count,np.zeros(extra,dtype=int)))
+			self.stable = np.concatenate((self.stable,np.zeros(extra,dtype=bool)))
+			self.active = np.concatenate((self.active,np.zeros(extra,dtype=bool)))
+
 class Controller(object):
 	"""
-	Class forming the base functionality of a controller
+	Class forming the base functionality of a controller.
+	Controllers are stepped by a ControllerBank using the coefficients returned by coefficients().
 	"""
 		
 	def __init__(self,_control,feedback_type,output_type,update_key,reference,error_margin,hard_limit=1):
 		# Variables
-		self.error_count = 0
 		self.correction_step = 0.1
 		self.error_margin = error_margin
 		self.r = reference
+		self.slot = None # slot in ControllerBank
 
 		# Assign pointers
 		self._control = _control
@@ -109,49 +269,22 @@ class Controller(object):
 		y = self._control.raw_status[self.feedback_type]
 		return y
 
-	def heartbeat(self):
-		# --- calculations would be here ---#
-
-		# Don't forget to add
-		# self.check_error(error)
-		# self.output(output)
-		# at the end
-		pass
-		
-	def check_error(self,error):
+	def coefficients(self):
 		"""
-		Checks whether the error is within acceptable limits.
-		If it is within limits then the controller has achieved its goal and updates the raw_status accordingly.
+		Returns (g, cu, ce1, ce0) such that u[k] = g * { (cu * u[k-1]) - (ce1 * e[k-1]) + (ce0 * e[k]) } where e[k] = K * (r - y[k])
 		"""
-		#print ("check_error: %s against error_margin: %s" % (error,self.error_margin))
-		# Check whether error is within limits
-		if error <= self.error_margin and error >= -1*self.error_margin:
-			self.error_count = self.error_count + 1
-		else:
-			self.error_count = 0
-		
-		# If error within limits for a suitable length of time then it has achieved its goal
-		if self.error_count == 50:
-			self.set_stability(True)
+		return (0.0,0.0,0.0,0.0)
+
+	def get_stability(self):
+		return bool(self._control.stability_info.get(self.update_key,False))
 
-		elif self.error_count == 0:
-			self.set_stability(False)			
-		
 	def set_stability(self,boolean):
 		# Update status
 		self._control.stability_info[self.update_key] = boolean
 			
 	def output(self,output):
-		# Hard limit output
-		if output >= self.hard_limit:
-			output = self.hard_limit
-		elif output <= -1 * self.hard_limit:
-			output = -1 * self.hard_limit
-			
-		# Print the output
-		#print ("%s correction = %s" % (self.output_type,output))
-		
 		# Send the update to the drone, via the structure in PositionalControl (so it has a copy)
+		# (the ControllerBank has already hard limited it)
 		self._control.drone_input[self.output_type] = output
 		#print (self._control.drone_input[self.output_type])
 
@@ -165,6 +298,9 @@ class ProportionalController(Controller):
 	
 	CONTROLLER:
 	G(s) = K
+
+	DIFFERENCE EQUATION:
+	u[k] = correction_step * e[k]
 	"""
 		
 	def __init__(self,_control,feedback_type,output_type,update_key,k,reference,error_margin,hard_limit=1):
@@ -174,18 +310,8 @@ class ProportionalController(Controller):
 		# Initialise as Controller base class
 		Controller.__init__(self, _control,feedback_type,output_type,update_key,reference,error_margin,hard_limit)
 		
-	def heartbeat(self):
-		# Debug heartbeat
-		#print ("%s beat" % self.output_type)
-		
-		# Calculate output value
-		error = self.r-self.y()
-		psuedo_error = error * self.k
-		correction = self.correction_step * psuedo_error
-	
-		# Continue as per Controller base class
-		self.check_error(correction)
-		self.output(correction)
+	def coefficients(self):
+		return (1.0,0.0,0.0,self.correction_step)
 
 class LeadLagController(Controller):
 	"""
@@ -218,38 +344,19 @@ class LeadLagController(Controller):
 		self.T = T
 		self.k = k
 
-		# Set up calculation variables
-		self.yk = 0		# y[k-1]
-		self.e = [0,0]	# e[k-1],e[k]
-
 		# Initialise as Controller base class
 		Controller.__init__(self, _control,feedback_type,output_type,update_key,reference,error_margin,hard_limit)
 		
-	def heartbeat(self):
-		# Debug heartbeat
-		#print ("%s beat" % self.output_type)
-		
-		# Update latest error with pre-compensation
-		self.e[1] = self.k * (self.r - self.y())
-		
-		# Calculate y[k]
+	def coefficients(self):
 		part_1 = 1 / (self.T + self.b)
-		part_2a = self.yk * self.b
-		part_2b = self.e[0] * self.a
-		part_2c = self.e[1] * (self.T + self.a)
-		self.yk = part_1 * (part_2a - part_2b + part_2c)
-		
-		# Update error
-		self.e[0] = self.e[1]
-		
-		# Continue as per Controller base class
-		self.check_error(self.yk)
-		self.output(self.yk)
+		return (part_1, self.b, self.a, self.T + self.a)
 
 class LeadLagController2(LeadLagController):
 	"""
-	Implementation of a lead-lag controller using Tustin Transformation. Takes a position and returns a correcting velocity
+	Implementation of a lead-lag controller which can use the Tustin Transformation. Takes a position and returns a correcting velocity
 	Controller also pre-compensates by a value of K
+
+	This has always been flown with the same backward difference equation as LeadLagController, and still is unless tustin=True is passed, which switches to the equation below.
 	
 	ANALOGUE CONTROLLER:
 	G(s) = (as + 1) / (bs + 1)
@@ -270,23 +377,12 @@ class LeadLagController2(LeadLagController):
 		(T+2b)
 	"""
 
-def heartbeat(self):
-		# Debug heartbeat
-		#print ("%s beat" % self.output_type)
-		
-		# Update latest error with pre-compensation
-		self.e[1] = self.k * (self.r - self.y())
-		
-		# Calculate y[k]
+	def __init__(self,_control,feedback_type,output_type,update_key,k,a,b,T,reference,error_margin,hard_limit=1,tustin=False):
+		self.tustin = tustin
+		LeadLagController.__init__(self,_control,feedback_type,output_type,update_key,k,a,b,T,reference,error_margin,hard_limit)
+
+	def coefficients(self):
+		if not self.tustin:
+			return LeadLagController.coefficients(self)
 		part_1 = 1 / (self.T + 2*self.b)
-		part_2a = self.yk * (self.T - 2*self.b)
-		part_2b = self.e[0] * (self.T - 2*self.a)
-		part_2c = self.e[1] * (self.T + 2*self.a)
-		self.yk = part_1 * (part_2b - part_2a + part_2c)
-		
-		# Update error
-		self.e[0] = self.e[1]
-		
-		# Continue as per Controller base class
-		self.check_error(self.yk)
-		self.output(self.yk)
+		return (part_1, -(self.T - 2*self.b), -(self.T - 2*self.a), self.T + 2*self.a)
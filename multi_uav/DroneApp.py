@@ -11,6 +11,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 # Import objects to initialise
 from ardrone.core.controlloop import ControlLoop
 from ardrone.platform import qt as platform
+from ardrone.util.profiling import profiler, startup
 from . import network_config as config
 from . import AppController
 
@@ -38,10 +39,14 @@ class DroneApp(object):
 
 		# ---- APPLICATION SETUP ----
 		# Create a QtCoreApplication loop (NB remember to use QApplication instead if wanting GUI features)
+		startup.mark('imports')
 		self.app = QtCore.QCoreApplication(sys.argv)
 		self.app_controller = AppController.AppController(self.drones,self.configs,self.homes)
+		startup.mark('application')
 
 	def run(self):
+		# Profile the event loop if asked to (see ardrone.util.profiling)
+		profiler.start()
 		self.app_controller.start()
 		self.app.exec_()
 	
@@ -15,11 +15,17 @@ QtNetwork = qt.import_module('QtNetwork')
 from . import Controllers as Controller
 from . import DroneStates as State
 from . import ImageProcessor
+from .TransitionMetrics import TransitionMetrics
 import ardrone.core.videopacket as Videopacket
+from ardrone.util.profiling import profiler
+from ardrone.util.tracing import tracer
 
 import logging 
 #logging.basicConfig(level=logging.DEBUG)
 
+# Marker positions are reused while the camera's view is unchanged (see ImageProcessor). Errors from positions older than this many seconds are scaled down in proportion to their age so the controllers stop acting on stale information.
+MARKER_MAX_AGE = 0.5
+
 class DroneControl(object):
 	"""
 	The base class for overseeing actions of an individual drone.
@@ -27,7 +33,7 @@ class DroneControl(object):
 	Acts upon messages from SwarmControl object by changing position (using Controller object) or carrying out standard land, take off, change camera actions (using ControlLoop object).
 	"""
 	
-	def __init__(self,drone_id,_control,network_config,updater,home):
+	def __init__(self,drone_id,_control,network_config,updater,home,controller_bank=None):
 		# --- INITIALISE VARIABLES ---
 		self.home = home
 		self.raw_status = {};
@@ -52,10 +58,15 @@ class DroneControl(object):
 				#'marker_id': [x error,y error]
 				'-1':(0,0),
 				};			
+		self.visible_marker_age = 0.0
 	           
 		self.control_network_activity_flag = False
 		self.video_network_activity_flag = False
 
+		# Latency tracing: the trace of the video packet being decoded and the latest trace of each kind waiting to be sent on by the controllers
+		self.video_trace = None
+		self.traces = {}
+
 		self.holding_marker = False
 		self.route = [home,]
 		self.drone_id = drone_id	
@@ -69,9 +80,12 @@ class DroneControl(object):
 		
 		# --- INITIALISE APPLICATION OBJECTS ----
 		self._im_proc = ImageProcessor.ImageProcessor(self,drone_id)
-		self._vid_decoder = Videopacket.Decoder(self._im_proc.process)
+		self._vid_decoder = Videopacket.Decoder(self._im_proc.process,{'drone': str(drone_id)})
 		self._network = NetworkManager(self._vid_decoder,self,network_config)
-		self._controller_manager = Controller.ControllerManager(self)	
+		self._controller_manager = Controller.ControllerManager(self,controller_bank)
+
+		# The scheduler running the controllers, if any, also runs this drone's control loop ticks (see DroneStates)
+		self.scheduler = self._controller_manager.bank.scheduler
 
 		# Start video and navdata stream on drone
 		self._control.start_navdata()
@@ -84,6 +98,7 @@ class DroneControl(object):
 		self._control.view_camera(1) # channel 1 = downward facing camera
 		
 		# State setup
+		self.transition_metrics = TransitionMetrics()
 		self._state = State.CommunicationState(self,drone_id)
 		self.state_id = 0
 	
@@ -152,18 +167,48 @@ class DroneControl(object):
 	def update_route(self,route):
 		self.route = route
 
-	def update_position(self,marker_data):
-		# Update object's record of marker positions
+	def update_position(self,marker_data,age=0.0,trace=None):
+		tracer.mark(trace,'position')
+		self.follow_trace('video',trace)
+
+		# Update object's record of marker positions and how many seconds old they are (non-zero when an unchanged frame was skipped)
 		self.visible_marker_info = marker_data
+		self.visible_marker_age = age
 
 		# Update record for the marker currently being tracked if there is no new information then keep old information
 		if str(self.raw_status['marker_id']) in marker_data:
-			self.raw_status['marker_distance_x'] = -1 * marker_data[str(self.raw_status['marker_id'])][0]
-			self.raw_status['marker_distance_y'] = -1 * marker_data[str(self.raw_status['marker_id'])][1]
+			weight = self.marker_weight()
+			self.raw_status['marker_distance_x'] = -1 * weight * marker_data[str(self.raw_status['marker_id'])][0]
+			self.raw_status['marker_distance_y'] = -1 * weight * marker_data[str(self.raw_status['marker_id'])][1]
 		
 		# Print to console
 		#print(self.marker_distance)
 
+	def marker_weight(self):
+		"""
+		Returns the factor by which marker errors are scaled given how old they are: 1 up to MARKER_MAX_AGE seconds and falling towards 0 after that
+		"""
+		if self.visible_marker_age <= MARKER_MAX_AGE:
+			return 1.0
+		return MARKER_MAX_AGE / self.visible_marker_age
+
+	def follow_trace(self,kind,trace):
+		"""
+		Carry trace on with the next control packet sent to the drone. Any older trace of the same kind which has not been sent yet is abandoned.
+		"""
+		if trace is None:
+			return
+		tracer.discard(self.traces.get(kind))
+		self.traces[kind] = trace
+
+	def take_traces(self):
+		"""
+		Returns the traces waiting to be sent with the next control packet and forgets them.
+		"""
+		traces = list(self.traces.values())
+		self.traces = {}
+		return traces
+
 	def update(self,status):
 		"""
 		Merge status with local version and send to the status updater with appropriate drone_id label.
@@ -176,8 +221,19 @@ class DroneControl(object):
 		self.raw_status = dict(self.raw_status.items() + status.items())
 
 	def update_drone(self,status):
+		"""
+		Store a new drone status. If any of the fields which the current state's exit conditions depend on have changed, check them straight away so state changes happen within one navdata period.
+		"""
+		changed = [key for key in status.keys() if not self.drone_status.get(key) == status[key]]
 		self.drone_status = status
 
+		now = time.time()
+		for key in changed:
+			self.transition_metrics.status_changed(key,now)
+
+		if self._state.depends_on(changed):
+			self._state.check_exit()
+
 class NetworkManager(object):
 	"""
 	A class which manages the sending and receiving of packets over the network.
@@ -211,22 +267,26 @@ class NetworkManager(object):
 		self.socket_control = QtNetwork.QUdpSocket()
 		if not self.socket_control.bind(QtNetwork.QHostAddress.Any, self.config['control_data_port']):
 			raise RuntimeError('Error binding to port: %s' % (self.socket_control.errorString()))
-		self.socket_control.readyRead.connect(self.readControlData)
+		self.socket_control.readyRead.connect(profiler.wrap(self.readControlData,'readControlData port %s' % self.config['control_data_port']))
     
 		# Set up a UDP listening socket on port for video data
 		self.socket_video = QtNetwork.QUdpSocket()
 		if not self.socket_video.bind(QtNetwork.QHostAddress.Any, self.config['video_data_port']):
 			raise RuntimeError('Error binding to port: %s' % (self.socket_video.errorString()))
-		self.socket_video.readyRead.connect(self.readVideoData)
+		self.socket_video.readyRead.connect(profiler.wrap(self.readVideoData,'readVideoData port %s' % self.config['video_data_port']))
 
 		# 
 		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
-	def sendControl(self,data):
+	def sendControl(self,data,traces=()):
 		# Send state to the drone
 		self.seq += 1
-		#print('state is', json.dumps({'seq': self.seq, 'state': data}))
-		self.sock.sendto(json.dumps({'seq': self.seq, 'state': data}), (self.config['bind_host'], self.config['control_port'])) 
+		packet = {'seq': self.seq, 'state': data}
+		# Carry latency traces over to the control loop
+		if len(traces) > 0:
+			packet['trace'] = [tracer.export(trace,'sent') for trace in traces]
+		#print('state is', json.dumps(packet))
+		self.sock.sendto(json.dumps(packet), (self.config['bind_host'], self.config['control_port'])) 
 	
 	def readControlData(self):
 		"""
@@ -242,16 +302,22 @@ class NetworkManager(object):
 
 	        # Parse the packet
 			self.packet = json.loads(data.decode())
+			trace = tracer.adopt(self.packet.pop('trace',None),'status_received')
 			# Keep packet if it contains status information
 			if self.packet['type'] == 'demo':
 				self.packet['type'] = 'raw' #Change type to conform to status format of application
 				self._update.update(self.packet)
+				tracer.mark(trace,'status')
+				self._update.follow_trace('navdata',trace)
 
 				# Update status of the Control Network when ready
 				if self.ready_control == False:
 					#print("Control Ready")
 					self.ready_control = True
 					self._update.control_network_activity_flag = True
+			else:
+				# Nothing is done with other packets so their traces end here
+				tracer.discard(trace)
 				
 			#Print it prettily
 			#print(json.dumps(self.packet, indent=True))
@@ -266,8 +332,11 @@ class NetworkManager(object):
 			if qt.USES_PYSIDE:
 					data = data.data()
 		
-			# Decode video data and pass result to the ImageProcessor instance
+			# Decode video data and pass result to the ImageProcessor instance. The trace is taken by the ImageProcessor if this packet completes a frame.
+			self._update.video_trace = tracer.resume(data,'video','video_received')
 			self._vid_decoder.decode(data)
+			tracer.discard(self._update.video_trace)
+			self._update.video_trace = None
 			
 			if self.ready_video == False:
 				#print("Video Ready")
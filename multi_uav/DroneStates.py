@@ -10,6 +10,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 # import qt modules (platform independant)
 import ardrone.util.qtcompat as qt
 QtCore = qt.import_module('QtCore')
+from ardrone.util.profiling import profiler
+import ardrone.util.scheduler as Scheduler
 
 class State(object):
 	"""
@@ -18,6 +20,7 @@ class State(object):
 	When requested, the state machine determines whether the current state is valid and changes it if necessary.
 
 	State changes are checked by comparing state exit conditions against the drone status.
+	The drone_status fields named in exit_conditions are the only ones a state depends on, so DroneControl only checks the exit conditions when one of them changes (see depends_on).
 	"""
 
 	def __init__(self,_drone,drone_id):
@@ -40,28 +43,46 @@ class State(object):
 		"""
 		self.check_exit() # State will transition automatically (if allowed sufficient time)
 
+	def depends_on(self,keys):
+		"""
+		Returns True if the exit conditions depend on any of the drone_status fields in keys.
+		"""
+		for key in keys:
+			if key in self.exit_conditions:
+				return True
+		return False
+
 	def check_exit(self):
 		"""
 		Check the exit conditions against drone_status.
-		If state requires changing, return the new state id.
+		If all exit conditions have been met, change to the next state (if there is one).
 		"""
-		exit_state = []
 		#print ("Checking exit conditions %s against drone status %s" % (self.exit_conditions,self._drone.drone_status))
-		# Check exit conditions
-		exit_state.append(False) # Initialise a bool for each drone
 		for key in self.exit_conditions.keys():
-			if self.exit_conditions[key] == self._drone.drone_status[key]:
-				exit_state = True # Set flag for respective drone
-			else:
-				exit_state = False # Set flag for respective drone	
-					
+			if not self.exit_conditions[key] == self._drone.drone_status.get(key):
+				return
+
 		# Only change state if all exit conditions have been met
-		if exit_state == True:
-			self._drone.change_state(self.next_state())
+		state = self.next_state()
+		if state is not None:
+			self._drone.transition_metrics.record(self._drone.state_id,state[1],self.exit_conditions.keys())
+			self._drone.change_state(state)
 	
 	def next_state(self):
 		# Be sure to return tuple of pointer and id of next state
 		pass
+
+	def start_tick(self):
+		"""
+		Call tick() every 30 ms. If the drone has a scheduler (ardrone.util.scheduler.Scheduler) this is a control priority task, named for the drone so a later state's tick replaces an earlier one, otherwise a Qt timer.
+		"""
+		if self._drone.scheduler is None:
+			self.tick_timer = QtCore.QTimer()
+			self.tick_timer.setInterval(30) # ms
+			self.tick_timer.timeout.connect(profiler.wrap(self.tick))
+			self.tick_timer.start()
+		else:
+			self._drone.scheduler.add('tick %s' % (self.drone_id,),self.tick,0.03,priority=Scheduler.CONTROL)
 		
 class CommunicationState(State):
 	"""
@@ -87,14 +108,11 @@ class CommunicationState(State):
 		# Setup timer to enable repeated attempts to reset 
 		self.reset_timer = QtCore.QTimer()
 		self.reset_timer.setInterval(2500) # ms
-		self.reset_timer.timeout.connect(self.restart)
+		self.reset_timer.timeout.connect(profiler.wrap(self.restart))
 		self.reset_timer.start()
 
-		# Tick timer which calls controlloop 
-		self.tick_timer = QtCore.QTimer()
-		self.tick_timer.setInterval(30) # ms
-		self.tick_timer.timeout.connect(self.tick)
-		self.tick_timer.start()
+		# Tick which calls controlloop 
+		self.start_tick()
 
 		#print("--%s--In Communication State--%s--" % (self.drone_id,self.drone_id))
 
@@ -137,17 +155,14 @@ class GroundState(State):
 		# Setup timer to enable repeated attempts to reset and take off the drones at given intervals
 		self.reset_timer = QtCore.QTimer()
 		self.reset_timer.setInterval(7000) # ms
-		self.reset_timer.timeout.connect(self.reset)
+		self.reset_timer.timeout.connect(profiler.wrap(self.reset))
 		
 		self.takeoff_timer = QtCore.QTimer()
 		self.takeoff_timer.setInterval(4000) # ms
-		self.takeoff_timer.timeout.connect(self.take_off)
+		self.takeoff_timer.timeout.connect(profiler.wrap(self.take_off))
 
-		# Tick timer which calls controlloop 
-		self.tick_timer = QtCore.QTimer()
-		self.tick_timer.setInterval(30) # ms
-		self.tick_timer.timeout.connect(self.tick)
-		self.tick_timer.start()
+		# Tick which calls controlloop 
+		self.start_tick()
 
 		#print("--%s--In Ground State--%s--" % (self.drone_id,self.drone_id))
 		self._drone.flat_trim()
@@ -231,8 +246,8 @@ class ControlledState(State):
 		#print("--%s--In Controlled State--%s--" % (self.drone_id,self.drone_id))
 
 	def next_state(self):
-		# Create next state
-		print "----Finished Marker Transition----"
+		# There is no next state
+		print("----Finished Marker Transition----")
 	
 	def hold_marker(self,marker_id):
 		#print ("--%s--holding marker: %s --%s--" % (self.drone_id,marker_id,self.drone_id))
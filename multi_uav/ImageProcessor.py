@@ -1,9 +1,7 @@
 import os
 import sys
-import cv
+import time
 import numpy as np
-from PIL import Image
-import StringIO
 
 # This makes sure the path which python uses to find things when using import
 # can find all our code.
@@ -11,6 +9,17 @@ sys.path.insert(0, os.path.abspath('..'))
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from ardrone.aruco import detect_markers
+from ardrone.vision.gate import ChangeGate
+from ardrone.util.metrics import registry
+from ardrone.util.scheduler import monotonic
+from ardrone.util.tracing import tracer
+
+# Find midpoint of image
+#IMAGE_MIDPOINT = (320/2,240/2)
+IMAGE_MIDPOINT = (176/2,144/2) # need to use this for downward facing camera as image does not take up whole 320x240 but is decoded as such
+
+# The part of each decoded frame filled by the downward facing camera's picture
+IMAGE_REGION = (176,144)
 
 class ImageProcessor(object):
 	"""
@@ -23,11 +32,23 @@ class ImageProcessor(object):
 		# --- INITIALISE APPLICATION OBJECTS ----
 		self._update = _update
 		self._im_viewer = ImageViewer(drone_id)
+		# Skips marker detection while the scene is unchanged, e.g. when hovering. Its processed and skipped counters can be inspected. Only the camera's picture is compared, not the unused rest of the frame.
+		self.gate = ChangeGate(region=IMAGE_REGION)
+		# Time taken to process each frame (see ardrone.util.metrics)
+		self.vision_time = registry.histogram('ardrone_vision_seconds','Time taken to find markers in each video frame.',{'drone': str(drone_id)})
 
 	def process(self,data):
 		"""
 		Function called to request processing of a frame
 		"""
+		# OpenCV is slow to import so wait until the first frame needs it
+		import cv
+
+		# Take over the trace of the video packet which completed this frame
+		trace = self._update.video_trace
+		self._update.video_trace = None
+		tracer.mark(trace,'decoded')
+
 		# --- OPEN_CV FORMAT ---
 		# Create OpenCV header and read in drone video data as RGB565
 		ipl_image = cv.CreateImageHeader((320,240), cv.IPL_DEPTH_8U, 2)		# Downward camera size is actually 176x144
@@ -36,29 +57,40 @@ class ImageProcessor(object):
 		CV_image = cv.CreateImage((320,240), cv.IPL_DEPTH_8U, 3)
 		cv.CvtColor(ipl_image, CV_image, cv.CV_BGR5652BGR)
 
+		# Reuse the last set of markers if the frame has not changed since it was processed. Only detection is skipped, every frame is still shown.
+		start = monotonic()
+		marker_dict, age = self.gate.process(time.time(),data,lambda frame: self.detect(CV_image))
+		self.vision_time.observe(monotonic() - start)
+		tracer.mark(trace,'vision')
+
+		# Draw on marker centerpoints and show the frame
+		for relative_position in marker_dict.values():
+			marker_center = (relative_position[0] + IMAGE_MIDPOINT[0], relative_position[1] + IMAGE_MIDPOINT[1])
+			cv.Line(CV_image,IMAGE_MIDPOINT,marker_center,cv.Scalar(200,200,200))
+		self._im_viewer.show(CV_image)
+
+		# Update DroneControl with info from processed image
+		self._update.update_position(marker_dict,age,trace)
+
+	def detect(self,CV_image):
+		"""
+		Detect markers in an RGB888 OpenCV image and return a dict of marker positions relative to the image centre keyed by marker id
+		"""
 		# --- ARUCO FORMAT ---
 		PIL_image = self.cv2array(CV_image)
 		
-		# Find midpoint of image
-		CV_image_size = cv.GetSize(CV_image)
-		#CV_image_midpoint = (CV_image_size[0]/2,CV_image_size[1]/2)
-		CV_image_midpoint = (176/2,144/2) # need to use this for downward facing camera as image does not take up whole 320x240 but is decoded as such
-		
-		# Detect and draw on marker centerpoints
+		# Detect marker centerpoints
 		marker_dict = {}
 		for m in detect_markers(PIL_image):
 			marker_center = (m.centroid_x(), m.centroid_y())
-			cv.Line(CV_image,CV_image_midpoint,marker_center,cv.Scalar(200,200,200))		
 			# Update relative position
-			relative_position = (marker_center[0] - CV_image_midpoint[0], marker_center[1] - CV_image_midpoint[1])
+			relative_position = (marker_center[0] - IMAGE_MIDPOINT[0], marker_center[1] - IMAGE_MIDPOINT[1])
 			marker_dict[str(m.id())]=relative_position
 
-		# Update DroneControl with info from processed image
-		self._update.update_position(marker_dict)
-		# Show processed image
-		self._im_viewer.show(CV_image)
+		return marker_dict
 		
 	def cv2array(self,im):
+		import cv
 		depth2dtype = {
         cv.IPL_DEPTH_8U: 'uint8',
         cv.IPL_DEPTH_8S: 'int8',
@@ -83,7 +115,12 @@ class ImageViewer(object):
 	"""	
 	def __init__(self,drone_id):
 		self.win_title = "Drone " + str(drone_id) + " Video Stream"
-		cv.NamedWindow(self.win_title,cv.CV_WINDOW_AUTOSIZE)
+		# The window is opened when the first frame is shown
+		self._window_open = False
 
 	def show(self,frame):
+		import cv
+		if not self._window_open:
+			cv.NamedWindow(self.win_title,cv.CV_WINDOW_AUTOSIZE)
+			self._window_open = True
 		cv.ShowImage(self.win_title,frame)
@@ -0,0 +1,178 @@
+import os
+import json
+from collections import deque
+
+# The map used when none is specified
+DEFAULT_MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'arena.map')
+
+class MarkerMap(object):
+	"""
+	A graph of ground markers with precomputed routing tables.
+
+	Markers are nodes and two markers are joined by an edge if a drone can fly directly from one to the other. Edges are undirected and all have the same length.
+	On creation a breadth first search is run from every marker to build tables giving the distance (in hops) between every pair of markers and the next marker to fly to on the shortest route between them.
+	Distance and next hop queries are then O(1) and a whole route is O(route length).
+
+	Maps are loaded from a text file (see load()) and the routing tables may be cached on disk alongside it so they need not be rebuilt each time the application is started.
+
+	Unknown markers and unreachable pairs are given the distance -1 and next hop -1, consistent with the rest of the package where -1 means 'no marker'.
+	"""
+	def __init__(self,chains):
+		"""
+		chains is a sequence of sequences of marker ids. Consecutive markers in each chain are joined by an edge. A chain whose first and last markers are the same is a loop.
+		"""
+		self.chains = [tuple(chain) for chain in chains]
+
+		# adjacency (marker: sorted list of neighbouring markers)
+		neighbours = {}
+		# first successor and predecessor of each marker along the chain it first appears in (used by next())
+		self._forward = {}
+		self._backward = {}
+		for chain in self.chains:
+			for marker in chain:
+				neighbours.setdefault(marker,set())
+			for a, b in zip(chain[:-1],chain[1:]):
+				if a == b:
+					continue
+				neighbours[a].add(b)
+				neighbours[b].add(a)
+				self._forward.setdefault(a,b)
+				self._backward.setdefault(b,a)
+		self._neighbours = dict((marker,sorted(adjacent)) for marker, adjacent in neighbours.items())
+
+		self._distance = None
+		self._next_hop = None
+
+	@classmethod
+	def load(cls,filename,cache=True):
+		"""
+		Load a map from a text file.
+
+		Each line of the file is a chain of whitespace separated integer marker ids. Consecutive markers on a line are joined. A line which starts and ends with the same marker describes a loop.
+		Blank lines and anything after a '#' are ignored. For example, a line of four markers with a branch from the second marker to marker 7 is:
+			25 26 27 28
+			26 7
+
+		If cache is True, routing tables are read from (and if necessary written to) filename + '.cache'.
+		"""
+		chains = []
+		with open(filename) as f:
+			for line in f:
+				line = line.split('#',1)[0].split()
+				if len(line) > 0:
+					chains.append([int(marker) for marker in line])
+
+		marker_map = cls(chains)
+		if cache:
+			marker_map.build(filename + '.cache')
+		else:
+			marker_map.build()
+		return marker_map
+
+	def build(self,cache_file=None):
+		"""
+		Build the routing tables, reading them from cache_file if it holds tables for this map and writing them to cache_file otherwise.
+		"""
+		edges = self.edges()
+		if cache_file is not None and os.path.exists(cache_file):
+			try:
+				with open(cache_file) as f:
+					cached = json.load(f)
+				if [tuple(edge) for edge in cached['edges']] == edges and sorted(int(m) for m in cached['distance']) == self.markers():
+					self._distance = self._int_keys(cached['distance'])
+					self._next_hop = self._int_keys(cached['next_hop'])
+					return
+			except (IOError, ValueError, KeyError) as e:
+				print("Warning: ignoring unreadable routing table cache %s (%s). Originator: MarkerMap" % (cache_file,e))
+
+		self._distance = {}
+		self._next_hop = {}
+		for source in self._neighbours:
+			self._distance[source], self._next_hop[source] = self._search(source)
+
+		if cache_file is not None:
+			try:
+				with open(cache_file,'w') as f:
+					json.dump({'edges':edges,'distance':self._distance,'next_hop':self._next_hop},f)
+			except IOError as e:
+				print("Warning: could not write routing table cache %s (%s). Originator: MarkerMap" % (cache_file,e))
+
+	def markers(self):
+		"""
+		Returns a sorted list of all markers in the map
+		"""
+		return sorted(self._neighbours.keys())
+
+	def edges(self):
+		"""
+		Returns a sorted list of (a,b) pairs with a < b for every edge in the map
+		"""
+		return sorted((a,b) for a, adjacent in self._neighbours.items() for b in adjacent if a < b)
+
+	def neighbours(self,marker):
+		"""
+		Returns the list of markers joined to marker
+		"""
+		return self._neighbours.get(marker,[])
+
+	def __contains__(self,marker):
+		return marker in self._neighbours
+
+	def distance(self,a,b):
+		"""
+		Returns the number of hops on the shortest route between markers a and b, or -1 if there is no route
+		"""
+		self._ensure_built()
+		return self._distance.get(a,{}).get(b,-1)
+
+	def next_hop(self,a,b):
+		"""
+		Returns the next marker to fly to from a on the shortest route to b, or -1 if there is no route or a == b
+		"""
+		self._ensure_built()
+		return self._next_hop.get(a,{}).get(b,-1)
+
+	def route(self,a,b):
+		"""
+		Returns the list of markers on the shortest route from a to b, not including a but including b, in the order they are visited
+		Returns [] if a == b and None if there is no route
+		"""
+		if self.distance(a,b) == -1:
+			return None
+		route = []
+		while a != b:
+			a = self._next_hop[a][b]
+			route.append(a)
+		return route
+
+	def next(self,marker):
+		"""
+		Returns [marker in front of, marker behind] along the first chain marker appears in, with -1 for either if marker is at the end of a chain
+		"""
+		return [self._forward.get(marker,-1),self._backward.get(marker,-1)]
+
+# PRIVATE
+	def _ensure_built(self):
+		if self._distance is None:
+			self.build()
+
+	def _search(self,source):
+		"""
+		Breadth first search from source returning dicts of distance and first hop to every reachable marker
+		"""
+		distance = {source: 0}
+		first_hop = {}
+		queue = deque([source])
+		while queue:
+			marker = queue.popleft()
+			for adjacent in self._neighbours[marker]:
+				if adjacent in distance:
+					continue
+				distance[adjacent] = distance[marker] + 1
+				first_hop[adjacent] = adjacent if marker == source else first_hop[marker]
+				queue.append(adjacent)
+		return distance, first_hop
+
+	def _int_keys(self,table):
+		# JSON object keys are always strings
+		return dict((int(a),dict((int(b),v) for b, v in row.items())) for a, row in table.items())
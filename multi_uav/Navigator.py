@@ -13,6 +13,9 @@ QtCore = qt.import_module('QtCore')
 QtNetwork = qt.import_module('QtNetwork')
 
 # Import required application objects
+from .MarkerMap import MarkerMap, DEFAULT_MAP
+from .ReservationPlanner import ReservationPlanner
+from .SeparationMonitor import SeparationMonitor
 
 class Navigator(object):
 	"""
@@ -26,32 +29,41 @@ class Navigator(object):
 		last element in list = next marker to go to
 
 	Routes should not contain the present marker
+
+	The map of markers is loaded from map_file (see MarkerMap.load for the format). Routing tables for it are precomputed so route and separation queries are lookups rather than searches.
+	Routes to targets are planned cooperatively by a ReservationPlanner so that no two drones are ever planned to be at the same marker at the same time, whatever the shape of the map.
 	"""
 
 # PUBLIC
-	def __init__(self,drones,initial_positions):
+	def __init__(self,drones,initial_positions,map_file=DEFAULT_MAP):
 		# define map
-		self.path = {
-			'type' : 'line',
-			'markers' : (25,26,27,28,29,30,31,32,33,34,35,0,)
-			};
+		self.map = MarkerMap.load(map_file)
 
 		# setup variables
 		self.routes = [] # one route for each drone being controlled
 		for number in drones:
 			self.routes.append([])
 
-		self.positions = initial_positions # one marker id for each drone giving last known position
+		self.positions = list(initial_positions) # one marker id for each drone giving last known position
 		self.targets = [] # 0 or 1  marker id for each drone giving the current target for the drone
 		for number in drones:	
 			self.targets.append(-1)
 	
 		self.drones = drones # tuple of drone ids
 
+		# keeps pairwise separations up to date as drones move
+		self.separation = SeparationMonitor(self.map)
+
+		# reserve each drone's starting position so that plans for other drones avoid it
+		self.planner = ReservationPlanner(self.map)
+		for index in range(0,len(self.drones)):
+			if self.positions[index] in self.map:
+				self.planner.hold(self.drones[index],self.positions[index])
+
 	def route_to_target(self,pos,tgt,drone_id):
 		"""
 		Returns a route from pos to tgt ground references for a single drone. This route is deconflicted with other drone locations and routes.
-		Current implementation only works for a straight line path.
+		The route is the shortest route across the map which does not conflict with other drones' planned routes (see plan_routes).
 		"""
 		# store updated position
 		self.positions[self.drones.index(drone_id)] = pos
@@ -72,45 +84,50 @@ class Navigator(object):
 			return return_value 
 
 		# check position is in current mapping
-		elif pos not in self.path['markers']:
+		elif pos not in self.map:
 			print("Error: Drone has location not on known path. Originator: Navigator")
 
-		# check path is a line
-		elif self.path['type'] == 'line':
-			drone_index = self.drones.index(drone_id)
-			# assume the route will be in one direction and create a route as such
-			posi = pos
-			direction = 0
-			self.routes[drone_index] = []
-			# check that tgt is in path
-			if tgt not in self.path['markers']:
-				print("Error - requested target is not in known path. Originator: Navigator")
-			# check at each stage whether destination or end of line has been reached and discard or send route as appropriate
-			while not self.next(posi)[direction] == tgt:
-				# continue route
-				self.routes[drone_index].append(self.next(posi)[direction])
-
-				# check for end of path
-				if self.routes[drone_index][len(self.routes[drone_index])-1] == -1:
-					# reset route and position
-					self.routes[drone_index] = []
-					posi = pos
-					# change direction
-					direction = 1
-				else:
-					# update posi
-					posi = self.next(posi)[direction]
-			# when next position is the target (i.e. when while loop exits) finish the route, check for deconfliction and return it
-			self.routes[drone_index].append(self.next(posi)[direction])
-			# reverse route
-			self.routes[drone_index].reverse()
-
-			return self.check_deconflict(self.positions)
+		# check that tgt is in the map and reachable
+		elif self.map.distance(pos,tgt) == -1:
+			print("Error - requested target is not in known path. Originator: Navigator")
+
+		else:
+			self.targets[self.drones.index(drone_id)] = tgt
+			return self.plan_routes()
+
+	def plan_routes(self):
+		"""
+		Returns routes for all drones to their targets which are conflict free over time.
+		Drones with no target (-1) hold their position. Routes stop short wherever a drone has to wait for another to pass, in which case the route is just the drone's position.
+		Only drones whose position or target has changed since they were last planned, or who are waiting for another drone, are replanned. All other drones keep their reservations.
+		"""
+		starts = {}
+		goals = {}
+		for index in range(0,len(self.drones)):
+			drone = self.drones[index]
+			pos = self.positions[index]
+			tgt = self.targets[index]
+			if tgt == -1:
+				tgt = pos
+			# drones whose position is unknown cannot be planned
+			if pos not in self.map or tgt not in self.map:
+				self.planner.release(drone)
+				continue
+			if self.planner.request(drone) != (pos,tgt) or self.planner.waiting(drone):
+				starts[drone] = pos
+				goals[drone] = tgt
+		self.planner.plan_all(starts,goals)
+
+		for index in range(0,len(self.drones)):
+			route = self.planner.route(self.drones[index])
+			self.routes[index] = route if route is not None else [-1,]
+		return self.routes
 			
 
 	def route(self,pos):
 		"""
 		A basic algorithm for returning a looping route for all drones around a continuous path. Route is never longer than 6 markers ahead.
+		Drones follow the direction of the chain their position is on in the map file and routes stop early at the end of a chain which is not a loop.
 		"""
 		self.positions = pos
 		# check position is known
@@ -121,22 +138,23 @@ class Navigator(object):
 			return return_value 
 		# check position is in current mapping
 		for location in pos:
-			if location not in self.path['markers']:
+			if location not in self.map:
 				print("Error: Drone has location not on known path. Originator: Navigator")
 				return
-		# check path is a loop
-		if self.path['type'] == 'loop':
-			# for each drone
-			for drone in range(0,len(self.drones)):
-				# calculate the next marker in route
-				posi = pos[drone]
+		# for each drone
+		for drone in range(0,len(self.drones)):
+			# calculate the markers in route (up to 6 ahead)
+			posi = pos[drone]
+			self.routes[drone] = []
+			for number in range(0,6):
 				posi = self.next(posi)[0]
-				self.routes[drone] = [posi,]
-				# calculate remaining markers in route (up to 6 ahead)
-				for number in range(1,6):
-					posi = self.next(posi)[0]
-					self.routes[drone].append(posi)
-				self.routes[drone].reverse()
+				if posi == -1:
+					break
+				self.routes[drone].append(posi)
+			# hold position if at the end of a line
+			if len(self.routes[drone]) == 0:
+				self.routes[drone] = [pos[drone],]
+			self.routes[drone].reverse()
 
 		# return deconflicted routes
 		return self.check_deconflict(self.positions)
@@ -162,50 +180,39 @@ class Navigator(object):
 	def check_deconflict(self,pos):
 		"""
 		A basic deconfliction algorithm which changes the routes of all drones that have unsafe routes
-		Only guarantees deconfliction on maps with no junctions
+		Only guarantees deconfliction on maps with no junctions (plan_routes gives conflict free routes on any map)
 		"""
 		# update position
-		self.position = pos
+		self.positions = pos
 
 		# work out new routes to deconflict drones while maintaining efficient routing to targets
 		# check safety of current routes
 		safe_routes = self.check_rvp()
 		# for unsafe routes, change a drones route to prevent airprox
-		for drone in safe_routes:
-			if drone == False:
+		for drone in range(0,len(safe_routes)):
+			if safe_routes[drone] == False:
 				self.routes[drone] = [self.positions[drone],]
 		return self.routes
 
 	def min_separation(self,pos):
 		"""
 		Returns integer which is the minimum separation between all positions provided
-		Simple (inefficient) algorithm counts one way until reaching end of the line or another position, then does the same the other direction. Then do both these for every position. It takes the minimum value between positions.
-		Algorithm could be optimized but for low number of drones it is sufficient.
+		Separation is the number of markers between two positions on the shortest route between them (so adjacent or shared positions have separation 0).
+		Returns -1 if no two positions are known and connected.
+		Positions are given in the same order as self.drones. Only drones which have moved since the last call cost anything (see SeparationMonitor).
 		"""	
 		self.positions = pos
-		if self.path['type'] == 'line':
-			# initial direction and starting position
-			direction = 0
-			separation = -1 
-
-			# for each drone's position
-			for index in range(0,len(self.drones)):
-				# and for each direction
-				for direction in range(0, 2):
-					l_separation = 0
-					posi = self.next(pos[index])[direction]
-					# keep counting until reach another position or end of the line
-					while posi not in pos and not posi == -1:
-						posi = self.next(posi)[direction]
-						l_separation = l_separation + 1
-					# if reach end of line first, then do nothing
-					if posi == -1:
-						pass
-					# if reach another position first, compare it to the current separation and replace if smaller (or the first)
-					else:
-						if l_separation < separation or separation == -1:
-							separation = l_separation
-			return separation
+		for index in range(0,len(pos)):
+			self.separation.update(self.drones[index],pos[index])
+		return self.separation.min_separation()
+
+	def update_separation(self,drone_id,pos):
+		"""
+		Record a new position for a single drone and return the minimum separation between all drones. This is O(number of drones).
+		"""
+		self.positions[self.drones.index(drone_id)] = pos
+		self.separation.update(drone_id,pos)
+		return self.separation.min_separation()
 # PRIVATE
 	def check_rvp(self):
 		"""
@@ -214,55 +221,21 @@ class Navigator(object):
 		If a drone's route risks collision with another then False is returned for that drone.
 		""" 
 		safe_route = []
-		drone_index = []
-		d_count = 0
-
-		# generate drone_index and other_index list
-		for drone in self.drones:
+		for drone in range(0,len(self.drones)):
 			safe_route.append(True)
-			others = list(self.drones)
-			others.remove(drone)
-			drone_index.append(d_count)
-			d_count = d_count + 1
-		other_index = drone_index
 
 		# for each drone, check against all other drones
-		for drone in drone_index:
-			other_index.remove(drone)
-			for other in other_index:
-				if self.positions[other] in self.routes[drone]:
+		for drone in range(0,len(self.drones)):
+			for other in range(0,len(self.drones)):
+				if other != drone and self.positions[other] in self.routes[drone]:
 					safe_route[drone] = False
-			other_index.append(drone)
 
 		return safe_route
 
 	def next(self,pos):
 		"""
 		Must be passed an integer position
-		Returns a list of markers next to current marker in order [marker in front of,marker behind]
+		Returns a list of markers next to current marker in order [marker in front of,marker behind] along the map chain the marker is on
 		Returns -1 if end of non-looping path
 		"""
-		local_path = list(self.path['markers'])
-
-		if pos == local_path[len(local_path)-1]: # if current position is last position in markers tuple
-			backward = local_path[local_path.index(pos)-1]
-			if self.path['type'] == 'loop':
-				local_path.reverse()
-				forward = local_path.pop()
-			else:
-				forward = -1
-		elif pos == local_path[0]: # if current position is the first position in markers tuple
-			forward = local_path[1]
-			if self.path['type'] == 'loop':
-				backward = local_path.pop()
-			else:
-				backward = -1
-		elif pos == -1:
-			#print "no markers visible"
-			forward = -1
-			backward = -1
-		else:
-			forward = local_path[local_path.index(pos)+1]
-			backward = local_path[local_path.index(pos)-1]
-			
-		return [forward,backward]
+		return self.map.next(pos)
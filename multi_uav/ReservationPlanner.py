@@ -0,0 +1,237 @@
+import heapq
+
+class ReservationPlanner(object):
+	"""
+	A cooperative planner which finds conflict free routes for several drones over a MarkerMap.
+
+	Time is divided into steps. In one step a drone either flies to a neighbouring marker or waits where it is.
+	Each planned route reserves (marker, step) cells, and (marker, marker, step) edges to stop two drones swapping places, in a hash table. Drones are planned one at a time with A* over the time-expanded graph of (marker, step) states, avoiding cells reserved by other drones.
+	Once a drone has reached its goal it is parked there and the marker stays reserved for it.
+	The precomputed map distances are used as the A* heuristic, which is exact when no other drones are in the way.
+
+	Plans are made relative to the step at which they start (usually 0, i.e. 'now'). Replanning one drone only releases and re-reserves that drone's cells so other drones' plans are unaffected.
+	Routes are only guaranteed to be conflict free if every drone always has a reservation, i.e. drones are held (see hold()) before any other drone is planned.
+	"""
+	def __init__(self,marker_map,horizon=64):
+		"""
+		marker_map is a MarkerMap. horizon is the maximum number of steps a plan may take.
+		"""
+		self.map = marker_map
+		self.horizon = horizon
+
+		# reservation tables
+		self._cells = {} # (marker, step): drone
+		self._edges = {} # (from marker, to marker, step): drone
+		self._parked = {} # marker: {drone: step parked from}
+		self._latest = {} # marker: {drone: last step reserved}
+
+		self._plans = {} # drone: (first step, list of markers one per step)
+		self._requests = {} # drone: (start, goal) of the current plan
+
+		# number of states expanded by the last search (useful for benchmarking)
+		self.expanded = 0
+
+	def plan(self,drone,start,goal,step=0):
+		"""
+		Plan a route for drone from start to goal beginning at step, replacing any previous plan for drone.
+		Returns the list of markers the drone occupies at each step from step onwards (starting with start and ending with goal) or None if no route was found within the horizon.
+		If no route is found the drone keeps its previous plan, since other drones have been planned around it, or is parked at start if it had none.
+		"""
+		previous = self._plans.get(drone)
+		previous_request = self._requests.get(drone)
+		self.release(drone)
+		path = self._search(drone,start,goal,step)
+		if path is None:
+			if previous is not None:
+				self._reserve(drone,previous[0],previous[1])
+				self._requests[drone] = previous_request
+			else:
+				self._reserve(drone,step,[start,])
+				self._requests[drone] = (start,goal)
+			return None
+		self._reserve(drone,step,path)
+		self._requests[drone] = (start,goal)
+		return path
+
+	def plan_all(self,starts,goals,step=0):
+		"""
+		Plan routes for several drones. starts and goals are dicts keyed by drone.
+		Drones are planned one at a time in sorted order, earlier drones having priority. Drones not yet planned only reserve their start at the first step so that earlier drones may plan through markers which later drones will leave.
+		If any drone cannot be planned, it is given the highest priority and the drones are planned again. This is repeated up to once per drone after which any drones still without a plan are held at their start. If that would leave routes in conflict, all drones are held.
+		This (prioritised) planning is not complete: some problems which have a solution, such as two drones swapping ends of a line with a short siding, are not solved. The routes returned are always conflict free.
+		Returns a dict of drone: path (or None) as returned by plan().
+		"""
+		order = sorted(starts)
+		for attempt in range(0,len(order)+1):
+			for drone in order:
+				self.release(drone)
+				self._reserve(drone,step,[starts[drone],],park=False)
+			paths = {}
+			for drone in order:
+				paths[drone] = self.plan(drone,starts[drone],goals[drone],step)
+				if paths[drone] is None:
+					self.hold(drone,starts[drone],step)
+			failed = [drone for drone in order if paths[drone] is None]
+			if len(failed) == 0:
+				return paths
+			order = failed + [drone for drone in order if drone not in failed]
+
+		# the failed drones are already held at their start
+		if len(self.conflicts()) > 0:
+			for drone in order:
+				self.hold(drone,starts[drone],step)
+				paths[drone] = None if starts[drone] != goals[drone] else [starts[drone],]
+		return paths
+
+	def hold(self,drone,marker,step=0):
+		"""
+		Park drone at marker from step onwards, replacing any plan it had
+		"""
+		self.release(drone)
+		self._requests[drone] = (marker,marker)
+		self._reserve(drone,step,[marker,])
+
+	def release(self,drone):
+		"""
+		Remove all reservations made for drone
+		"""
+		if drone not in self._plans:
+			return
+		first, path = self._plans.pop(drone)
+		self._requests.pop(drone,None)
+		for offset, marker in enumerate(path):
+			if self._cells.get((marker,first+offset)) == drone:
+				del self._cells[(marker,first+offset)]
+			if offset > 0 and self._edges.get((path[offset-1],marker,first+offset-1)) == drone:
+				del self._edges[(path[offset-1],marker,first+offset-1)]
+			self._latest.get(marker,{}).pop(drone,None)
+		self._parked.get(path[-1],{}).pop(drone,None)
+
+	def request(self,drone):
+		"""
+		Returns the (start, goal) pair drone was last planned with or None
+		"""
+		return self._requests.get(drone)
+
+	def path(self,drone):
+		"""
+		Returns (first step, list of markers) for drone's current plan or None
+		"""
+		return self._plans.get(drone)
+
+	def waiting(self,drone,step=0):
+		"""
+		Returns True if drone's plan has it waiting at step (before reaching its goal)
+		"""
+		marker = self._marker_at(drone,step)
+		goal = self._plans[drone][1][-1] if drone in self._plans else None
+		return marker is not None and marker != goal and marker == self._marker_at(drone,step+1)
+
+	def route(self,drone,step=0):
+		"""
+		Returns drone's route in the order used by Navigator (element 0 = last marker on route, last element = next marker to go to).
+		The route runs from the marker after the drone's position at step until the drone next has to wait. If the drone must wait now, or has arrived, the route is just its position.
+		Returns None if drone has no plan.
+		"""
+		if drone not in self._plans:
+			return None
+		first, path = self._plans[drone]
+		offset = max(step-first,0)
+		route = []
+		while offset+1 < len(path) and path[offset+1] != path[offset]:
+			route.append(path[offset+1])
+			offset = offset + 1
+		if len(route) == 0:
+			route = [self._marker_at(drone,step),]
+		route.reverse()
+		return route
+
+	def conflicts(self):
+		"""
+		Returns a list of (drone, drone, step) triples for every pair of planned drones which share a marker or swap markers at some step. This should always be empty and is intended for testing.
+		"""
+		found = []
+		drones = sorted(self._plans)
+		last = max([first+len(path) for first, path in self._plans.values()] + [0,])
+		for step in range(0,last+1):
+			for index, a in enumerate(drones):
+				for b in drones[index+1:]:
+					a0, b0 = self._marker_at(a,step), self._marker_at(b,step)
+					a1, b1 = self._marker_at(a,step+1), self._marker_at(b,step+1)
+					if a0 == b0 or (a0 == b1 and a1 == b0 and a0 != a1):
+						found.append((a,b,step))
+		return found
+
+# PRIVATE
+	def _marker_at(self,drone,step):
+		# drones are before their first step at their start and stay at their goal after their last
+		if drone not in self._plans:
+			return None
+		first, path = self._plans[drone]
+		return path[min(max(step-first,0),len(path)-1)]
+
+	def _reserve(self,drone,step,path,park=True):
+		self._plans[drone] = (step,list(path))
+		for offset, marker in enumerate(path):
+			self._cells[(marker,step+offset)] = drone
+			if offset > 0 and path[offset-1] != marker:
+				self._edges[(path[offset-1],marker,step+offset-1)] = drone
+			latest = self._latest.setdefault(marker,{})
+			latest[drone] = max(latest.get(drone,step+offset),step+offset)
+		if park:
+			self._parked.setdefault(path[-1],{})[drone] = step+len(path)-1
+
+	def _free(self,drone,marker,step):
+		# is marker free for drone at step?
+		other = self._cells.get((marker,step))
+		if other is not None and other != drone:
+			return False
+		for other, parked in self._parked.get(marker,{}).items():
+			if other != drone and step >= parked:
+				return False
+		return True
+
+	def _can_finish(self,drone,marker,step):
+		# can drone stay at marker from step onwards?
+		for other, last in self._latest.get(marker,{}).items():
+			if other != drone and last > step:
+				return False
+		return True
+
+	def _search(self,drone,start,goal,step):
+		self.expanded = 0
+		if start not in self.map or goal not in self.map or self.map.distance(start,goal) == -1:
+			return None
+		if not self._free(drone,start,step):
+			return None
+
+		# heap entries are (f, h, step, marker); ties go to states closer to the goal
+		h = self.map.distance(start,goal)
+		heap = [(h,h,step,start),]
+		parents = {(start,step): None}
+		last_step = step + self.horizon
+		while heap:
+			f, h, t, marker = heapq.heappop(heap)
+			self.expanded = self.expanded + 1
+			if marker == goal and self._can_finish(drone,marker,t):
+				path = []
+				state = (marker,t)
+				while state is not None:
+					path.append(state[0])
+					state = parents[state]
+				path.reverse()
+				return path
+			if t >= last_step:
+				continue
+			for adjacent in [marker,] + self.map.neighbours(marker):
+				state = (adjacent,t+1)
+				if state in parents or not self._free(drone,adjacent,t+1):
+					continue
+				# do not swap places with another drone
+				other = self._edges.get((adjacent,marker,t))
+				if other is not None and other != drone:
+					continue
+				parents[state] = (marker,t)
+				h = self.map.distance(adjacent,goal)
+				heapq.heappush(heap,(t+1-step+h,h,t+1,adjacent))
+		return None
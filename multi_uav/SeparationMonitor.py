@@ -0,0 +1,95 @@
+class SeparationMonitor(object):
+	"""
+	Keeps track of the separation between every pair of drones on a MarkerMap.
+
+	Separation is the number of markers between two drones on the shortest route between them, as returned by Navigator.min_separation (so drones at adjacent or the same markers have separation 0).
+	Drones at unknown positions (-1) or on disconnected parts of the map have no separation with other drones.
+
+	When one drone moves, only its pairings with the other drones are updated, each with an O(1) lookup in the map's distance table, so an update is O(number of drones).
+	A count of pairs at each separation is kept so the minimum separation is found without scanning every pair.
+	"""
+	def __init__(self,marker_map):
+		self.map = marker_map
+		self.positions = {} # drone: marker
+		self._pairs = {} # (drone, drone): separation
+		self._counts = {} # separation: number of pairs with that separation
+
+	def update(self,drone,marker):
+		"""
+		Record drone's position. Returns True if it has changed.
+		"""
+		if self.positions.get(drone) == marker:
+			return False
+
+		# forget old pairings
+		for other in self.positions:
+			if other != drone:
+				self._remove_pair(self._key(drone,other))
+
+		self.positions[drone] = marker
+
+		# work out new ones
+		for other, other_marker in self.positions.items():
+			if other == drone:
+				continue
+			distance = self.map.distance(marker,other_marker)
+			if distance != -1:
+				separation = max(distance-1,0)
+				self._pairs[self._key(drone,other)] = separation
+				self._counts[separation] = self._counts.get(separation,0) + 1
+		return True
+
+	def update_all(self,positions):
+		"""
+		Record the positions of several drones given as a dict of drone: marker. Returns True if any have changed.
+		"""
+		changed = False
+		for drone, marker in positions.items():
+			changed = self.update(drone,marker) or changed
+		return changed
+
+	def remove(self,drone):
+		"""
+		Stop tracking drone
+		"""
+		if drone not in self.positions:
+			return
+		for other in self.positions:
+			if other != drone:
+				self._remove_pair(self._key(drone,other))
+		del self.positions[drone]
+
+	def separation(self,a,b):
+		"""
+		Returns the separation between drones a and b or -1 if it is not known
+		"""
+		return self._pairs.get(self._key(a,b),-1)
+
+	def min_separation(self):
+		"""
+		Returns the smallest separation between any two drones or -1 if no two drones have a known separation
+		"""
+		if len(self._counts) == 0:
+			return -1
+		return min(self._counts)
+
+	def pairs_within(self,limit):
+		"""
+		Returns a list of ((drone, drone), separation) for every pair of drones whose separation is less than limit
+		"""
+		return [(pair,separation) for pair, separation in self._pairs.items() if separation < limit]
+
+# PRIVATE
+	def _key(self,a,b):
+		# pairs are stored with the drones in a fixed order
+		if repr(a) <= repr(b):
+			return (a,b)
+		return (b,a)
+
+	def _remove_pair(self,key):
+		separation = self._pairs.pop(key,None)
+		if separation is None:
+			return
+		self._counts[separation] = self._counts[separation] - 1
+		if self._counts[separation] == 0:
+			del self._counts[separation]
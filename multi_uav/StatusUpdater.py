@@ -12,6 +12,9 @@ import ardrone.util.qtcompat as qt
 QtCore = qt.import_module('QtCore')
 QtNetwork = qt.import_module('QtNetwork')
 
+# Import helpful classes
+from .SwarmAggregator import SwarmAggregator
+
 class StatusUpdater(object):
 	"""
 	Updates statuses through code, parsing into the required format at each stage.
@@ -58,17 +61,10 @@ class StatusUpdater(object):
 					'battery':0,
 					};
 
-		self.swarm_status = {
-					'type': 'swarm',
-					'position':[-1,-1,], #dirty
-					'talking':False,
-					'height_stable':False,
-					'following_marker':False,
-					'airprox':False,
-					'observing_target':False,
-					'observer':-1,
-					'battery':[],
-					};		
+		# Maintains swarm_status incrementally and sends change events to SwarmControl
+		self.aggregator = SwarmAggregator(self.drones)
+		self.aggregator.subscribe(self._swarm_controller.handle_event)
+		self.swarm_status = self.aggregator.swarm_status
 
 		self.drone_status = []
 		for count in self.drones:
@@ -98,9 +94,11 @@ class StatusUpdater(object):
 			self.drone_status[self.drones.index(status['drone_id'])] = _drone_status
 			# Push out statuses
 			self.push_drone_status(_drone_status)
-			# Update and push swarm status
-			self.parse_drone_for_swarm()
-			self.push_swarm_status(self.swarm_status)
+			# Update separation for the drone which reported so airprox is checked on every update
+			self._swarm_controller.update_separation(status['drone_id'],_drone_status['position'])
+			# Update swarm status and push it only if it has changed
+			if len(self.parse_drone_for_swarm(_drone_status)) > 0:
+				self.push_swarm_status(self.swarm_status)
 
 		else:
 			print("non-raw status passed - StatusUpdater")
@@ -128,60 +126,13 @@ class StatusUpdater(object):
 		if status['type'] == 'swarm':
 			self._swarm_controller.update(status)
 
-	def parse_drone_for_swarm(self):
+	def parse_drone_for_swarm(self,drone_status):
 		"""
 		Parse drone status into format for swarm status.
-		This takes the current swarm_status and updates it.
+		This updates the current swarm_status with only the fields which depend on the reporting drone (see SwarmAggregator).
+		Returns the list of SwarmEvents describing what changed.
 		"""
-		# talking - only True if True for all drones
-		self.swarm_status['talking'] = True
-		for drone in range(0,len(self.drones)):
-			self.swarm_status['talking'] = self.swarm_status['talking'] and self.drone_status[drone]['talking']
-
-		# following_marker - only True if True for all drones
-		self.swarm_status['following_marker'] = True
-		for drone in range(0,len(self.drones)):
-			self.swarm_status['following_marker'] = self.swarm_status['following_marker'] and self.drone_status[drone]['following_marker']
-
-		# height_stable - only True if True for all drones
-
-		self.swarm_status['height_stable'] = True
-		for drone in range(0,len(self.drones)):
-			self.swarm_status['height_stable'] = self.swarm_status['height_stable'] and self.drone_status[drone]['height_stable']
-
-		# position - list of all drone positions. 
-		self.swarm_status['position'] = []
-		for drone in range(0,len(self.drones)):
-			self.swarm_status['position'].append(self.drone_status[drone]['position'])
-
-		# airprox - shortest distance between drones
-		# work out shortest distance between drones
-		closest_dist = self._swarm_controller.min_separation
-		# check distance with airprox
-		if closest_dist < 9:
-			self.swarm_status['airprox'] = True
-		else:
-			self.swarm_status['airprox'] = False
-
-		# separation
-		self.swarm_status['separation'] = closest_dist
-
-		# observing_target (target = marker 0)
-		self.swarm_status['observing_target'] = False
-		for drone in range(0,len(self.drones)):
-			if self.drone_status[drone]['position'] == 0:
-				self.swarm_status['observing_target'] = True
-
-		# observer (drone_id of drone who is over marker 0) (-1 if no drone is observing)
-		self.swarm_status['observer'] = -1
-		for drone in range(0,len(self.drones)):
-			if self.drone_status[drone]['position'] == 0:
-				self.swarm_status['observer'] = self.drones[drone]
-
-		# battery
-		self.swarm_status['battery'] = []
-		for drone in range(0,len(self.drones)):
-			self.swarm_status['battery'].append(self.drone_status[drone]['battery'])
+		return self.aggregator.update(drone_status['drone_id'],drone_status,self._swarm_controller.min_separation)
 
 	def parse_raw_for_drone(self,status):
 		"""
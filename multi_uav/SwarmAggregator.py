@@ -0,0 +1,148 @@
+import time
+
+# Types of SwarmEvent
+AIRPROX_STARTED = 'airprox_started'
+AIRPROX_ENDED = 'airprox_ended'
+OBSERVER_CHANGED = 'observer_changed'
+BATTERY_LOW = 'battery_low'
+POSITION_CHANGED = 'position_changed'
+SWARM_FLAG_CHANGED = 'swarm_flag_changed'
+
+class SwarmEvent(object):
+	"""
+	A change in the swarm status.
+
+	type is one of the event type constants in this module.
+	drone_id is the drone which caused the change (or None if it is not specific to one drone).
+	name is the swarm status field which changed.
+	value and previous are the new and old values of that field (or, for per-drone fields, of that drone's entry).
+	when is the time at which the change was seen (default now).
+	"""
+	def __init__(self,type,drone_id,name,value,previous,when=None):
+		self.type = type
+		self.drone_id = drone_id
+		self.name = name
+		self.value = value
+		self.previous = previous
+		self.when = time.time() if when is None else when
+
+	def __repr__(self):
+		return 'SwarmEvent(%r, drone_id=%r, %s: %r -> %r)' % (self.type,self.drone_id,self.name,self.previous,self.value)
+
+class SwarmAggregator(object):
+	"""
+	Maintains the swarm status from individual drone statuses without rescanning every drone.
+
+	Counts are kept of how many drones are not talking, not following a marker and not height stable so the swarm-wide flags (True only if True for every drone) are O(1) to update.
+	The set of drones over the target marker is kept so the observer is found without a scan.
+	When a drone reports, only the fields which depend on it are updated and a list of SwarmEvents describing what changed is returned. Callbacks registered with subscribe() are also called with each event.
+	"""
+	# swarm status fields which are True only if True for every drone
+	ALL_FLAGS = ('talking','following_marker','height_stable')
+
+	def __init__(self,drones,airprox_limit=9,battery_limit=15,target_marker=0):
+		"""
+		drones is the tuple of drone ids.
+		Airprox is flagged when separation is less than airprox_limit. A BATTERY_LOW event is sent when a drone's battery first falls below battery_limit (percent).
+		The observer is the drone over target_marker.
+		"""
+		self.drones = drones
+		self.airprox_limit = airprox_limit
+		self.battery_limit = battery_limit
+		self.target_marker = target_marker
+
+		self.swarm_status = {
+					'type': 'swarm',
+					'position':[-1 for drone in drones],
+					'talking':False,
+					'height_stable':False,
+					'following_marker':False,
+					'airprox':False,
+					'separation':-1,
+					'observing_target':False,
+					'observer':-1,
+					'battery':[0 for drone in drones],
+					};
+
+		# every drone starts with all flags False
+		self._false_counts = dict((flag,len(drones)) for flag in self.ALL_FLAGS)
+		self._flags = [dict((flag,False) for flag in self.ALL_FLAGS) for drone in drones]
+		self._observers = set() # indices of drones over the target marker
+		self._low_battery = set() # indices of drones whose battery is below battery_limit
+
+		self._subscribers = []
+
+	def subscribe(self,callback,types=None):
+		"""
+		Call callback(event) for every event, or only for events whose type is in types if given
+		"""
+		self._subscribers.append((callback,types))
+
+	def update(self,drone_id,drone_status,separation=None,when=None):
+		"""
+		Update the swarm status with a new drone status (as produced by StatusUpdater.parse_raw_for_drone) from drone_id.
+		separation is the current minimum separation between drones (or None to leave it unchanged).
+		when is the time the status was received (default now).
+		Returns the list of SwarmEvents caused by the update.
+		"""
+		when = time.time() if when is None else when
+		index = self.drones.index(drone_id)
+		status = self.swarm_status
+		events = []
+
+		# swarm-wide flags
+		for flag in self.ALL_FLAGS:
+			value = bool(drone_status[flag])
+			if value == self._flags[index][flag]:
+				continue
+			self._flags[index][flag] = value
+			self._false_counts[flag] = self._false_counts[flag] + (-1 if value else 1)
+			swarm_value = self._false_counts[flag] == 0
+			if swarm_value != status[flag]:
+				events.append(SwarmEvent(SWARM_FLAG_CHANGED,drone_id,flag,swarm_value,status[flag],when))
+				status[flag] = swarm_value
+
+		# position and observer
+		position = drone_status['position']
+		previous = status['position'][index]
+		if position != previous:
+			status['position'][index] = position
+			events.append(SwarmEvent(POSITION_CHANGED,drone_id,'position',position,previous,when))
+			if position == self.target_marker:
+				self._observers.add(index)
+			else:
+				self._observers.discard(index)
+			# the observer is the last drone (in order of self.drones) over the target
+			observer = self.drones[max(self._observers)] if self._observers else -1
+			observing_target = len(self._observers) > 0
+			if observing_target != status['observing_target']:
+				events.append(SwarmEvent(SWARM_FLAG_CHANGED,drone_id,'observing_target',observing_target,status['observing_target'],when))
+				status['observing_target'] = observing_target
+			if observer != status['observer']:
+				events.append(SwarmEvent(OBSERVER_CHANGED,observer if observer != -1 else None,'observer',observer,status['observer'],when))
+				status['observer'] = observer
+
+		# battery
+		battery = drone_status['battery']
+		previous = status['battery'][index]
+		status['battery'][index] = battery
+		if battery < self.battery_limit:
+			if index not in self._low_battery:
+				self._low_battery.add(index)
+				events.append(SwarmEvent(BATTERY_LOW,drone_id,'battery',battery,previous,when))
+		else:
+			self._low_battery.discard(index)
+
+		# airprox
+		if separation is not None:
+			status['separation'] = separation
+			airprox = separation < self.airprox_limit
+			if airprox != status['airprox']:
+				events.append(SwarmEvent(AIRPROX_STARTED if airprox else AIRPROX_ENDED,drone_id,'airprox',airprox,status['airprox'],when))
+				status['airprox'] = airprox
+
+		for event in events:
+			for callback, types in self._subscribers:
+				if types is None or event.type in types:
+					callback(event)
+		return events
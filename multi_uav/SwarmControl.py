@@ -11,10 +11,14 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 import ardrone.util.qtcompat as qt
 QtCore = qt.import_module('QtCore')
 QtNetwork = qt.import_module('QtNetwork')
+import ardrone.util.scheduler as Scheduler
+from ardrone.util.profiling import profiler
 
 # Import helpful classes
 from . import SwarmStates as State
 from . import Navigator
+from . import SwarmAggregator
+from .TransitionMetrics import TransitionMetrics
 
 class SwarmControl(object):
 	"""
@@ -23,7 +27,7 @@ class SwarmControl(object):
 	Uses navigation logic (from Navigator class) and task logic (from Swarm States) to decide on actions.
 	Actions are sent to each drone's Individual Controller.
 	"""
-	def __init__(self,drones,drone_controllers,homes): # Will want to add in _drone2 in time
+	def __init__(self,drones,drone_controllers,homes,scheduler=None): # Will want to add in _drone2 in time
 		# --- STORE VARIABLES ---
 		self.drones = drones # tuple of drone ids
 		self.swarm_status = {};		
@@ -36,19 +40,23 @@ class SwarmControl(object):
 		#self._status_viewer = # add at some point
 		self._navigator = Navigator.Navigator(self.drones,self.homes)	
 
-		# Setup timer to detect for state changes
-		self.check_timer = QtCore.QTimer()
-		self.check_timer.setInterval(1000) # ms
-		self.check_timer.timeout.connect(self.action)
+		# Setup timer to carry out state actions (state changes are detected as the swarm status changes, see handle_event)
+		# If a scheduler (ardrone.util.scheduler.Scheduler) is given, action is run by it behind any control tasks instead
+		self.scheduler = scheduler
+		if self.scheduler is None:
+			self.check_timer = QtCore.QTimer()
+			self.check_timer.setInterval(1000) # ms
+			self.check_timer.timeout.connect(profiler.wrap(self.action))
 
 		# Setup timer to start simulated battery low after event
 		self.simulate_timer = QtCore.QTimer()
 		self.simulate_timer.setInterval(5000) # ms
-		self.simulate_timer.timeout.connect(self.simulate)
+		self.simulate_timer.timeout.connect(profiler.wrap(self.simulate))
 
 		# States
 		self._state = -1
 		self.state_id = -1
+		self.transition_metrics = TransitionMetrics()
 
 		# Simulation
 		self.simulate_flag = False
@@ -67,7 +75,10 @@ class SwarmControl(object):
 		self._state.next_state(0)
 
 		# Start SwarmControl timing loop	
-		self.check_timer.start()
+		if self.scheduler is None:
+			self.check_timer.start()
+		else:
+			self.scheduler.add('swarm_action',self.action,1.0,priority=Scheduler.NORMAL)
 
 	def simulate(self):
 		"""
@@ -89,13 +100,6 @@ class SwarmControl(object):
 
 		Only one state transition should occur every time action is called.
 		"""
-		# Update separation
-		self.min_separation = self._navigator.min_separation(self.swarm_status['position'])
-		# Check whether simulation required
-		#print("drone batteries are: %s" % self.swarm_status['battery'])
-		if not self.swarm_status['observer'] == -1 and self.timer_flag == False:
-			self.timer_flag = True
-			self.simulate_timer.start()
 		# First, go into Setup State
 		if self.state_id == -1:
 			self.transition_to_state(0)
@@ -109,6 +113,30 @@ class SwarmControl(object):
 		elif self.state_id == 2:
 			self.maintain_state()
 
+	def update_separation(self,drone_id,position):
+		"""
+		Called by StatusUpdater whenever a drone reports its position so that the minimum separation is always current.
+		Only the separations involving the reporting drone are recomputed.
+		"""
+		self.min_separation = self._navigator.update_separation(drone_id,position)
+
+	def handle_event(self,event):
+		"""
+		Called with each SwarmEvent as the swarm status changes (see SwarmAggregator for the types of event).
+		The current state's exit conditions are checked if they depend on the field which changed.
+		"""
+		self.transition_metrics.status_changed(event.name,event.when)
+		if not self.state_id == -1 and self._state.depends_on([event.name]):
+			self._state.check_exit([event.name])
+
+		if event.type == SwarmAggregator.OBSERVER_CHANGED:
+			# Start the simulated battery low countdown once a drone first observes the target
+			if not event.value == -1 and self.timer_flag == False:
+				self.timer_flag = True
+				self.simulate_timer.start()
+		if event.type in (SwarmAggregator.AIRPROX_STARTED,SwarmAggregator.BATTERY_LOW,SwarmAggregator.OBSERVER_CHANGED):
+			print("Swarm event: %s" % event)
+
 	def send_routes(self,routes,send_to):
 		"""
 		Function which pipes routes to drones in the form of a list of marker ids.
@@ -24,6 +24,7 @@ class State(object):
 
 	When it is requested to do so, the state machine determines whether it is in the correct state and changes it accordingly.
 	State changes are checked by comparing the current swarm_status against the exit_conditions of the current state.
+	SwarmControl also checks them whenever a swarm_status field they depend on changes (see depends_on), so transitions do not wait for the next request.
 
 	The state ids are:
 	0	- Setup State (i.e. setting up to a pre-mission configuration)
@@ -52,16 +53,29 @@ class State(object):
 		"""
 		pass
 
-	def check_exit(self):
+	def depends_on(self,keys):
+		"""
+		Returns True if the exit conditions for any state depend on any of the swarm_status fields in keys.
+		"""
+		for state in self.state_ids:
+			for key in keys:
+				if key in self.exit_conditions[state]:
+					return True
+		return False
+
+	def check_exit(self,changed=None):
 		"""
 		Check the exit conditions against swarm status.
 		If state requires changing then do so to the correct state and inform SwarmControl of this change.
+		If changed is given, only the exit conditions which depend on those swarm_status fields are checked.
 		"""
-		# Count for conditions which have been met
-		conditions_met_count = 0
-
 		# Check exit condition for each state against all exit conditions for the respective state
 		for state in self.state_ids:
+			if changed is not None and not [key for key in changed if key in self.exit_conditions[state]]:
+				continue
+
+			# Count for conditions which have been met
+			conditions_met_count = 0
 			for key in self.exit_conditions[state].keys():
 				#print ("checking condition against: %s" % key)
 				#print ("comparisson: %s" % ([self.exit_conditions[state][key],self._coop.swarm_status[key]]))
@@ -72,14 +86,23 @@ class State(object):
 			if self.exit_conditional[state] == 'none':
 				pass
 			elif conditions_met_count == len(self.exit_conditions[state]):
-				self.next_state(state)
+				self.exit(state)
+				return
 			elif conditions_met_count > 0 and self.exit_conditional[state] == 'or':
-				self.next_state(state)
+				self.exit(state)
+				return
 			elif conditions_met_count == 0 or self.exit_conditional[state] == 'and':
 				pass
 			else: 
 				print("Unexpected condition grouping - check_exit - SwarmStates")
 
+	def exit(self,state_id):
+		"""
+		Record how long the transition took to happen (see TransitionMetrics) then change to state_id.
+		"""
+		self._coop.transition_metrics.record(self._coop.state_id,state_id,self.exit_conditions[state_id].keys())
+		self.next_state(state_id)
+
 	def next_state(self,state_id):
 		"""
 		Takes a state_id and changes the current state to the relevant object.
@@ -0,0 +1,50 @@
+import time
+
+class TransitionMetrics(object):
+	"""
+	Records how long state machines take to react to status changes.
+
+	The time at which each status field last changed is recorded with status_changed(). When a state transition happens, record() is passed the status fields the transition depends on (the keys of the state's exit conditions) and the latency is taken to be the time since the most recent change to any of them, i.e. the time since the change which allowed the transition.
+	With polled exit checks this is up to one polling period. With event driven checks it should be well under one navdata period.
+	"""
+	def __init__(self):
+		self._changed = {} # status field: time of last change
+		self._transitions = {} # (from state id, to state id): [count, total latency, max latency, last latency]
+
+	def status_changed(self,key,when=None):
+		"""
+		Record that status field key changed at time when (default now)
+		"""
+		self._changed[key] = time.time() if when is None else when
+
+	def record(self,from_id,to_id,keys,when=None):
+		"""
+		Record a transition from state from_id to state to_id at time when (default now) which depends on status fields keys.
+		Returns the latency in seconds or None if none of keys have been seen to change.
+		"""
+		when = time.time() if when is None else when
+		changes = [self._changed[key] for key in keys if key in self._changed]
+		if len(changes) == 0:
+			return None
+		latency = max(when - max(changes),0.0)
+
+		stats = self._transitions.setdefault((from_id,to_id),[0,0.0,0.0,0.0])
+		stats[0] = stats[0] + 1
+		stats[1] = stats[1] + latency
+		stats[2] = max(stats[2],latency)
+		stats[3] = latency
+		return latency
+
+	def summary(self):
+		"""
+		Returns a dict keyed by (from state id, to state id) of dicts giving the 'count' of transitions and the 'mean', 'max' and 'last' latencies in seconds
+		"""
+		summary = {}
+		for transition, stats in self._transitions.items():
+			summary[transition] = {
+				'count' : stats[0],
+				'mean' : stats[1] / stats[0],
+				'max' : stats[2],
+				'last' : stats[3],
+				};
+		return summary
@@ -24,7 +24,17 @@ This package is made up of the following modules:
 
   - Navigator: Handles all logic relating to routing over a known mapped area.
 
-  - Controllers: Manages access to a range of controllers which use the DroneControl module to push control inputs to the drone.
+  - MarkerMap: A graph of ground markers loaded from a map file with precomputed distance and next-hop routing tables.
+
+  - ReservationPlanner: Plans conflict free routes for several drones at once by reserving (marker, time step) cells.
+
+  - SeparationMonitor: Keeps the separation between every pair of drones up to date as individual drones move.
+
+  - SwarmAggregator: Updates the swarm status incrementally from individual drone statuses and emits typed change events.
+
+  - TransitionMetrics: Records the latency between a status change and the state transition it allows.
+
+  - Controllers: Manages access to a range of controllers which use the DroneControl module to push control inputs to the drone. A ControllerBank steps the controllers of every drone together.
 
 It also contains a network_config class where the connection IPs for each drone should be updated before running the application.
 
@@ -55,10 +65,25 @@ It also contains a network_config class where the connection IPs for each drone
 .. automodule:: multi_uav.Navigator
   :members:
 
+.. automodule:: multi_uav.MarkerMap
+  :members:
+
+.. automodule:: multi_uav.ReservationPlanner
+  :members:
+
+.. automodule:: multi_uav.SeparationMonitor
+  :members:
+
+.. automodule:: multi_uav.SwarmAggregator
+  :members:
+
+.. automodule:: multi_uav.TransitionMetrics
+  :members:
+
 .. automodule:: multi_uav.Controllers
   :members:
 """
 
-from . import AppController, SwarmControl, ImageProcessor, DroneControl, DroneApp, Controllers, network_config, DroneStates, SwarmStates, StatusUpdater, Navigator
+from . import AppController, SwarmControl, ImageProcessor, DroneControl, DroneApp, Controllers, network_config, DroneStates, SwarmStates, StatusUpdater, Navigator, MarkerMap, ReservationPlanner, SeparationMonitor, SwarmAggregator, TransitionMetrics
 
-__all__ = ['AppController', 'SwarmControl', 'ImageProcessor', 'DroneControl', 'DroneApp', 'Controllers', 'network_config', 'DroneStates', 'SwarmStates', 'StatusUpdater', 'Navigator']
+__all__ = ['AppController', 'SwarmControl', 'ImageProcessor', 'DroneControl', 'DroneApp', 'Controllers', 'network_config', 'DroneStates', 'SwarmStates', 'StatusUpdater', 'Navigator', 'MarkerMap', 'ReservationPlanner', 'SeparationMonitor', 'SwarmAggregator', 'TransitionMetrics']
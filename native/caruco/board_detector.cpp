@@ -17,3 +17,28 @@ aruco_status_t aruco_detect_board(
       cp->parameters, marker_size_meters);
   FUNC_END;
 }
+
+aruco_status_t aruco_detect_boards(
+    aruco_marker_vector_t**       detected_markers,
+    aruco_board_configuration_t** b_confs,
+    aruco_board_t**               b_detected,
+    size_t                        n_boards,
+    aruco_camera_parameters_t*    cp,
+    float                         marker_size_meters,
+    float*                        liks)
+{
+  FUNC_BEGIN;
+  aruco::BoardDetector d;
+  for(size_t i=0; i<n_boards; ++i)
+  {
+    if((detected_markers[i] == NULL) || detected_markers[i]->vector.empty())
+    {
+      liks[i] = -1.f;
+      continue;
+    }
+    liks[i] = d.detect(
+        detected_markers[i]->vector, b_confs[i]->config, b_detected[i]->board,
+        cp->parameters, marker_size_meters);
+  }
+  FUNC_END;
+}
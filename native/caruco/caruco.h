@@ -226,6 +226,19 @@ aruco_status_t aruco_detect_board(
     float                         marker_size_meters,
     float*                        lik /* output likelihood of detection */);
 
+/* Detect n_boards boards in one call. detected_markers[i] should contain only
+ * those markers which belong to b_confs[i]. The detected board and likelihood
+ * are written to b_detected[i] and liks[i]. Boards with no markers are
+ * skipped and given a likelihood of -1. */
+aruco_status_t aruco_detect_boards(
+    aruco_marker_vector_t**       detected_markers,
+    aruco_board_configuration_t** b_confs,
+    aruco_board_t**               b_detected, /* output */
+    size_t                        n_boards,
+    aruco_camera_parameters_t*    cp,
+    float                         marker_size_meters,
+    float*                        liks /* output likelihoods of detection */);
+
 #ifdef __cplusplus
 }
 #endif
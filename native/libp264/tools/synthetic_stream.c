@@ -0,0 +1,197 @@
+/*
+ * Write a synthetic P264 video stream for benchmarks and tests.
+ *
+ * The P264 encoder in VLIB relies on the drone's hardware so there is no
+ * software encoder to record a stream with on a PC. This program instead
+ * writes intra pictures with the bitstream writer from VLIB in which each
+ * macroblock is a single 16x16 DC prediction plus a DC offset. The offsets
+ * are chosen with the decoder's own reconstruction functions so that the
+ * decoded picture is a 16x16 pixel mosaic of the input.
+ *
+ * Frames of 320x240 YUV 4:2:0 (I420) are read from stdin and each encoded
+ * picture is written to stdout preceded by its time (a little-endian double,
+ * 1/15 s apart) and length (a little-endian 32-bit unsigned integer), the
+ * format of ardrone.simulation.server.write_packets.
+ */
+
+#include <limits.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include <VLIB/video_codec.h>
+#include <VLIB/video_controller.h>
+#include <VLIB/video_packetizer.h>
+#include <VLIB/P264/p264_codec.h>
+#include <VLIB/P264/video_p264.h>
+
+#define WIDTH 320
+#define HEIGHT 240
+#define FRAME_RATE 15
+
+extern C_RESULT p264_pack_controller( video_controller_t* controller );
+extern C_RESULT p264_write_mb_layer( video_controller_t* controller, video_stream_t* stream, video_macroblock_t* mb, int32_t num_macro_blocks );
+
+/* The hardware encoder entry points, which are never called here. */
+C_RESULT video_p264_prepare_slice( video_controller_t* controller, const vp_api_picture_t* blockline )
+{
+  return C_FAIL;
+}
+
+C_RESULT video_p264_encode_MB( uint32_t num_macro_blocks, video_macroblock_t* next_macroblock, int32_t qp )
+{
+  return C_FAIL;
+}
+
+int32_t video_p264_get_encoded_MB( uint32_t num_macro_blocks, video_macroblock_t* next_macroblock )
+{
+  return -1;
+}
+
+static long block_error( const uint8_t* a, const uint8_t* b, int x, int y, int size, int linesize )
+{
+  long error = 0;
+  int i, j;
+  for( j = y; j < y + size; j++ )
+    for( i = x; i < x + size; i++ )
+    {
+      long d = (long)a[j*linesize + i] - (long)b[j*linesize + i];
+      error += d * d;
+    }
+  return error;
+}
+
+/* Choose the luma DC offset of the macroblock at (x, y) which best
+ * reconstructs src into recon, leaving it reconstructed with it. */
+static int16_t choose_luma( uint8_t* recon, const uint8_t* src, int x, int y, uint32_t qp )
+{
+  int16_t dc[16], ac[256], best = 0, d;
+  long best_error = LONG_MAX;
+
+  for( d = -1024; d <= 1024; d++ )
+  {
+    long error;
+    memset( dc, 0, sizeof(dc) );
+    memset( ac, 0, sizeof(ac) );
+    dc[0] = d;
+    video_p264_decode_intra_luma_16x16_MB( dc, ac, recon, x, y, WIDTH, DC_16x16_LUMA_MODE, qp );
+    error = block_error( recon, src, x, y, 16, WIDTH );
+    if( error < best_error )
+    {
+      best_error = error;
+      best = d;
+    }
+  }
+
+  memset( dc, 0, sizeof(dc) );
+  memset( ac, 0, sizeof(ac) );
+  dc[0] = best;
+  video_p264_decode_intra_luma_16x16_MB( dc, ac, recon, x, y, WIDTH, DC_16x16_LUMA_MODE, qp );
+  return best;
+}
+
+/* As choose_luma for the 8x8 chroma block at (x, y) of one chroma plane. */
+static int16_t choose_chroma( uint8_t* recon, const uint8_t* src, int x, int y, uint32_t qp )
+{
+  int16_t dc[4], ac[64], best = 0, d;
+  long best_error = LONG_MAX;
+
+  for( d = -1024; d <= 1024; d++ )
+  {
+    long error;
+    memset( dc, 0, sizeof(dc) );
+    memset( ac, 0, sizeof(ac) );
+    dc[0] = d;
+    video_p264_decode_intra_chroma_8x8_MB( dc, ac, recon, x, y, WIDTH/2, DC_8x8_CHROMA_MODE, qp );
+    error = block_error( recon, src, x, y, 8, WIDTH/2 );
+    if( error < best_error )
+    {
+      best_error = error;
+      best = d;
+    }
+  }
+
+  memset( dc, 0, sizeof(dc) );
+  memset( ac, 0, sizeof(ac) );
+  dc[0] = best;
+  video_p264_decode_intra_chroma_8x8_MB( dc, ac, recon, x, y, WIDTH/2, DC_8x8_CHROMA_MODE, qp );
+  return best;
+}
+
+int main( int argc, char** argv )
+{
+  static uint8_t frame[WIDTH*HEIGHT*3/2], recon[WIDTH*HEIGHT*3/2];
+  video_controller_t controller;
+  p264_codec_t* codec;
+  video_macroblock_t macroblocks[WIDTH/16];
+  MB_p264_t data[WIDTH/16];
+  uint32_t qp, count = 0;
+  int i;
+
+  memset( &controller, 0, sizeof(controller) );
+  if( video_codec_open( &controller, P264_CODEC ) != C_OK )
+  {
+    fprintf( stderr, "Could not open the P264 codec.\n" );
+    return 1;
+  }
+  video_controller_set_format( &controller, WIDTH, HEIGHT );
+  controller.mode = VIDEO_ENCODE;
+  video_controller_set_picture_type( &controller, VIDEO_PICTURE_INTRA );
+  codec = (p264_codec_t*) controller.video_codec;
+  codec->picture_layer.picture_type = VIDEO_PICTURE_INTRA;
+  qp = controller.quant;
+
+  for( i = 0; i < WIDTH/16; i++ )
+    macroblocks[i].data = (int16_t*) &data[i];
+
+  while( fread( frame, sizeof(frame), 1, stdin ) == 1 )
+  {
+    video_stream_t* stream = &controller.in_stream;
+    const uint8_t *y_src = frame, *u_src = frame + WIDTH*HEIGHT, *v_src = u_src + WIDTH*HEIGHT/4;
+    uint8_t *y_rec = recon, *u_rec = recon + WIDTH*HEIGHT, *v_rec = u_rec + WIDTH*HEIGHT/4;
+    double when = (double) count / FRAME_RATE;
+    uint32_t size;
+
+    stream->used = 0;
+    stream->index = 0;
+    stream->length = 32;
+    stream->code = 0;
+    memset( recon, 0, sizeof(recon) );
+
+    for( controller.blockline = 0; controller.blockline < controller.num_blockline; controller.blockline++ )
+    {
+      controller.gobs[controller.blockline].quant = qp;
+      p264_pack_controller( &controller );
+
+      for( i = 0; i < controller.mb_blockline; i++ )
+      {
+        video_macroblock_t* mb = &macroblocks[i];
+        int x = i * 16, y = controller.blockline * 16;
+
+        memset( &data[i], 0, sizeof(data[i]) );
+        mb->intra_type = INTRA_16x16;
+        mb->intra_luma_16x16_mode = DC_16x16_LUMA_MODE;
+        mb->intra_chroma_8x8_mode = DC_8x8_CHROMA_MODE;
+        data[i].intra_16x16.DC_Y[0] = choose_luma( y_rec, y_src, x, y, qp );
+        data[i].intra_16x16.DC_U[0] = choose_chroma( u_rec, u_src, x/2, y/2, qp );
+        data[i].intra_16x16.DC_V[0] = choose_chroma( v_rec, v_src, x/2, y/2, qp );
+      }
+      p264_write_mb_layer( &controller, stream, macroblocks, controller.mb_blockline );
+    }
+
+    video_stuff8( stream );
+    video_write_data( stream, PICTURE_END_CODE, 22 );
+    video_write_data( stream, 0, stream->length + 1 );
+    controller.num_frames++;
+
+    size = stream->used;
+    fwrite( &when, sizeof(when), 1, stdout );
+    fwrite( &size, sizeof(size), 1, stdout );
+    fwrite( stream->bytes, 1, size, stdout );
+    count++;
+  }
+
+  video_codec_close( &controller );
+  fprintf( stderr, "Wrote %u pictures.\n", count );
+  return 0;
+}
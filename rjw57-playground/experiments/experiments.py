@@ -32,11 +32,17 @@ def load_drone_states_from_log(filename=None):
   * 10, The (absolute) change in psi since the last frame in radians
   * 11, The time (in seconds) of this log message which can be used to synchronise with a video frame
 
+  *filename* may also be a log store converted from the log with
+  ardrone.util.logstore, which is much quicker to load.
+
   """
   
   if filename is None:
     filename = '/data/rjw57/ardrone/logs/rjw57_office/rjw57_office_log.txt'
 
+  if os.path.isdir(filename):
+    return load_drone_states_from_store(filename)
+
   log = []
   last_stamp = None
   with open(filename) as log_file:
@@ -52,27 +58,82 @@ def load_drone_states_from_log(filename=None):
           continue
         last_stamp = capture_stamp
 
-        capture_seconds = capture_stamp >> 21
-        capture_useconds = capture_stamp & ((1<<21) - 1)
-        capture_time = (1e-6 * capture_useconds) + capture_seconds
-
         log.append([
-          capture_time,
+          capture_stamp,
           vision['theta_capture'], vision['phi_capture'], vision['psi_capture'], vision['altitude_capture'],
           vision['body_v']['x'], vision['body_v']['y'], vision['body_v']['z'],
           vision['delta_theta'], vision['delta_phi'], vision['delta_psi'],
           record['when']
           ])
 
-  return np.array(log)
+  log = np.array(log, dtype=np.float64)
+  if len(log) > 0:
+    log[:,0] = _capture_times([int(x) for x in log[:,0]])
+  return log
+
+def _capture_times(capture_stamp):
+  """Convert a sequence of drone timestamps (as in VisionBlock.time_capture)
+  into seconds. The drone clock wraps every 2048 seconds so a multiple of that
+  is added after each time it goes backwards by more than half of that.
+
+  """
+  from ardrone.estimation.sync import TSECDEC_PERIOD
+
+  capture_stamp = np.asarray(capture_stamp, dtype=np.int64)
+  capture_seconds = capture_stamp >> 21
+  capture_useconds = capture_stamp & ((1<<21) - 1)
+  capture_time = (1e-6 * capture_useconds) + capture_seconds
+
+  wraps = np.zeros(len(capture_time))
+  wraps[1:] = np.cumsum(np.diff(capture_time) < -0.5 * TSECDEC_PERIOD)
+  return capture_time + TSECDEC_PERIOD * wraps
+
+def load_drone_states_from_store(filename, start=None, end=None):
+  """Return the same array as load_drone_states_from_log() from a log store
+  converted with ardrone.util.logstore, only reading the vision records
+  logged from time *start* up to time *end* (in seconds) if given. Capture
+  times are only unwrapped within the records read so any wraps of the drone
+  clock before *start* are not counted.
+
+  """
+  from ardrone.util.logstore import LogStore
+
+  vision = LogStore(filename).query('state_from_drone.vision', [
+    'time_capture', 'theta_capture', 'phi_capture', 'psi_capture', 'altitude_capture',
+    'body_v.x', 'body_v.y', 'body_v.z', 'delta_theta', 'delta_phi', 'delta_psi',
+  ], start, end)
+
+  capture_stamp = vision['time_capture']
+
+  # Skip duplicate records
+  keep = np.ones(len(capture_stamp), dtype=bool)
+  keep[1:] = capture_stamp[1:] != capture_stamp[:-1]
+
+  return np.column_stack([
+    _capture_times(capture_stamp),
+    vision['theta_capture'], vision['phi_capture'], vision['psi_capture'], vision['altitude_capture'],
+    vision['body_v.x'], vision['body_v.y'], vision['body_v.z'],
+    vision['delta_theta'], vision['delta_phi'], vision['delta_psi'],
+    vision['when'],
+  ])[keep]
 
 def load_video_filenames_from_log(filename=None):
-  """Return a list of (timestamp, filename) pairs for the video filenames."""
+  """Return a list of (timestamp, filename) pairs for the video filenames.
+  *filename* may also be a log store converted from the log with
+  ardrone.util.logstore in the same directory as the log.
+
+  """
   
   if filename is None:
     filename = '/data/rjw57/ardrone/logs/rjw57_office/rjw57_office_log.txt'
 
-  file_base = os.path.dirname(filename)
+  file_base = os.path.dirname(os.path.abspath(filename))
+
+  if os.path.isdir(filename):
+    from ardrone.util.logstore import LogStore
+    frames = LogStore(filename).query('frame_from_drone', ['what'])
+    return [(when, os.path.join(file_base, frame_file))
+        for when, frame_file in zip(frames['when'].tolist(), frames['what'].tolist())]
 
   log = []
   last_stamp = None
@@ -103,9 +164,9 @@ def gen_animation(frames, log):
 def plot_video_frame(frames, log, frame_idx, start_hint=0, png_file=None, fig=None):
   frame_when, frame_file = frames[frame_idx]
 
-  idx = start_hint
-  while idx < len(log) and log[idx, 11] < frame_when:
-    idx += 1
+  # The log is sorted by time so find the first state at or after the frame by
+  # bisection rather than scanning forward from start_hint.
+  idx = start_hint + int(np.searchsorted(log[start_hint:, 11], frame_when))
 
   if idx >= len(log):
     raise IndexError('frame is beyond end of log')
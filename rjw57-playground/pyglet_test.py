@@ -396,16 +396,20 @@ class Scene(pyglet.graphics.Group):
     self.batch.draw()
 
   def update(self, dt):
-    im = self.app.cam_image()
+    im, im_state = self.app.cam_image_and_state()
     im_data = pyglet.image.ImageData(im.shape[1], im.shape[0], 'RGB', str(im.data), -im.shape[1]*3)
     self.camera_image.blit_into(im_data, 0, 0, 0)
 
     demo_block = self.app.state('demo')
     #vision_block = self.app.state('vision')
 
-    if demo_block is not None:
-      self.drone.set_euler_angles(*[demo_block[x]/1000. for x in ('theta', 'phi', 'psi')])
-      self.drone.set_origin((0,demo_block['altitude']/1000. - 1.0,0))
+    # Pose the drone as it was when the camera image was captured so the two
+    # agree, falling back to the latest navdata until that is known.
+    pose_block = im_state if im_state is not None else demo_block
+
+    if pose_block is not None:
+      self.drone.set_euler_angles(*[pose_block[x]/1000. for x in ('theta', 'phi', 'psi')])
+      self.drone.set_origin((0,pose_block['altitude']/1000. - 1.0,0))
       self.drone.set_origin((0,0,0))
 
     if demo_block is not None:
@@ -21,6 +21,10 @@ class Tracker(object):
       recon_mask = np.zeros((recon_dim[1],recon_dim[0],3))
       self.boards.append((config, ids, recon_image, recon_mask, [None, 0]))
 
+    # Index from marker id to board so that each frame's markers can be
+    # assigned to boards in one pass.
+    self._board_index = aruco.BoardIndex([b[0] for b in self.boards])
+
     print('Reading camera parameters from: ' + cp_file)
     self._cam_param = aruco.CameraParameters()
     self._cam_param.read_from_xml_file(cp_file)
@@ -35,23 +39,27 @@ class Tracker(object):
     return np.array(recon_image / np.maximum(recon_mask, 1), dtype=np.uint8)
 
   def new_image(self, image):
+    """Detect boards in *image* and add it to their reconstructions.
+
+    Returns a dictionary mapping the index of each board found to its camera
+    extrinsics as a pair *rvec, tvec*.
+
+    """
     image = np.array(image)
+    found = {}
 
     markers = aruco.detect_markers(image, self._cam_param, self._marker_size)
 
     # Did we find /any/ markers?
     if len(markers) == 0:
-      return
+      return found
 
-    for config, ids, recon_image, recon_mask, detect in self.boards:
-      # Filter markers
-      m = [x for x in markers if x.id() in ids]
+    # Detect all boards with at least one visible marker in one go. Boards not
+    # present are not returned.
+    detections = aruco.detect_boards(markers, self._board_index, self._cam_param, self._marker_size)
 
-      # Skip boards not present
-      if len(m) == 0:
-        continue
-
-      b, l = aruco.detect_board(m, config, self._cam_param, self._marker_size)
+    for board_idx, (b, l) in detections.items():
+      config, ids, recon_image, recon_mask, detect = self.boards[board_idx]
       detect[:] = (b,l)
 
       # Reject if we didn't find board
@@ -60,6 +68,7 @@ class Tracker(object):
 
       # Get camera extrinsics
       rvec, tvec = [np.array(x) for x in b.get_extrinsics()]
+      found[board_idx] = (rvec, tvec)
 
       # Convert Rodrigues vector to rotation matrix
       R = np.zeros((3,3))
@@ -118,3 +127,5 @@ class Tracker(object):
 
       recon=cv2.warpPerspective(undist_image, trans, (w,h))
       recon_image += recon * mask
+
+    return found
@@ -27,16 +27,33 @@ QtCore = qt.import_module('QtCore')
 QtNetwork = qt.import_module('QtNetwork')
 
 from ardrone.core.videopacket import Decoder
+from ardrone.estimation.pose import PoseEstimator
+from ardrone.estimation.sync import Synchroniser
 
 import threading
 
 # Load the tracker module
 from tracker import Tracker
 
+# Rough time in seconds between the drone capturing a frame and it being
+# decoded here, used to match frames with navdata.
+VIDEO_LATENCY = 0.1
+
+# The board whose frame is the world frame of the pose estimate
+REFERENCE_BOARD = 0
+
 class TrackerThread(threading.Thread):
-  def __init__(self, bc_file, cp_file):
+  """Track boards in images passed to put_image() on a background thread.
+
+  If *pose_cb* is not None, it is called from this thread as
+  ``pose_cb(when, extrinsics)`` each time the reference board is found in an
+  image captured at time *when*.
+
+  """
+  def __init__(self, bc_file, cp_file, pose_cb=None):
     super(TrackerThread, self).__init__()
     self._tracker = Tracker(bc_file, cp_file)
+    self._pose_cb = pose_cb
     self._queue = Queue.Queue(maxsize=2)
     self._recon_images = []
 
@@ -45,13 +62,17 @@ class TrackerThread(threading.Thread):
 
   def run(self):
     while True:
-      im = self._queue.get()
-      self._tracker.new_image(im)
+      im, when = self._queue.get()
+      found = self._tracker.new_image(im)
+      if self._pose_cb is not None and when is not None and REFERENCE_BOARD in found:
+        self._pose_cb(when, found[REFERENCE_BOARD])
       self._recon_images = [self._tracker.recon_image(i) for i in range(len(self._tracker.boards))]
 
-  def put_image(self, im):
+  def put_image(self, im, when=None):
+    """Queue *im*, captured at time *when*, for tracking. Images are
+    dropped if the tracker is busy."""
     try:
-      self._queue.put(im, block=False)
+      self._queue.put((im, when), block=False)
     except Queue.Full:
       pass
 
@@ -68,8 +89,20 @@ class TrackerApp(object):
       print('usage: videostream.py camera_params.yml [board_config.abc...]')
       sys.exit(1)
 
+    self._states_lock = threading.Lock()
+    self._states = { }
+
+    # Recent navdata and frames so that frames can be matched with the state
+    # of the drone when they were captured. Protected by _states_lock.
+    self._sync = Synchroniser(video_latency=VIDEO_LATENCY)
+    self._frame_index = None
+
+    # The position of the drone from navdata and the reference board.
+    # Protected by _states_lock.
+    self._pose = PoseEstimator()
+
     # Create the tracker
-    self._tracker = TrackerThread(sys.argv[1], sys.argv[2:])
+    self._tracker = TrackerThread(sys.argv[1], sys.argv[2:], self._board_pose)
     self._tracker.daemon = True
     self._tracker.start()
 
@@ -99,9 +132,6 @@ class TrackerApp(object):
     # we convert the image to this 3-byte per pixel RGB888 format
     self._image_lock = threading.Lock()
     self._image = cv.CreateMat(240, 320, cv.CV_8UC3)
-
-    self._states_lock = threading.Lock()
-    self._states = { }
   
   def cam_image(self):
     with self._image_lock:
@@ -114,9 +144,35 @@ class TrackerApp(object):
       else:
         return None
 
+  def cam_image_state(self):
+    """Return the interpolated demo state of the drone when the image
+    returned by cam_image() was captured or None if it is not known."""
+    with self._states_lock:
+      if self._frame_index is None:
+        return None
+      return self._sync.state_at_frame(self._frame_index)
+
+  def cam_image_and_state(self):
+    """Return the image returned by cam_image() together with the state
+    returned by cam_image_state() for that same image."""
+    with self._image_lock:
+      return np.array(self._image, copy=True), self.cam_image_state()
+
   def boards(self):
     return self._tracker.boards()
 
+  def pose(self, when=None):
+    """Return the estimated position and velocity of the drone in the
+    reference board's frame, extrapolated to *when* if it is not None. See
+    ardrone.estimation.pose.PoseEstimator.estimate()."""
+    with self._states_lock:
+      return self._pose.estimate(when)
+
+  def _board_pose(self, when, extrinsics):
+    # Called from the tracker thread when the reference board is found.
+    with self._states_lock:
+      self._pose.add_board_pose(when, extrinsics)
+
   def quit(self):
     self.app.quit()
 
@@ -139,8 +195,12 @@ class TrackerApp(object):
 
       # Store the packet
       if 'type' in packet:
+        now = time.time()
         with self._states_lock:
           self._states[packet['type']] = packet
+          self._sync.add_navdata(now, packet)
+          if packet['type'] == 'demo':
+            self._pose.add_navdata(now, packet)
 
   def videoSocketReadyRead(self):
     """Called when there is some interesting data to read on the video socket."""
@@ -173,7 +233,14 @@ class TrackerApp(object):
     with self._image_lock:
       cv.CvtColor(self._raw_image_mat, self._image, cv.CV_BGR5652RGB)
 
-    self._tracker.put_image(self._image)
+      # Record the frame. The latest vision block's capture time belongs to
+      # whichever frame the drone last processed rather than this one, so the
+      # capture time is estimated from the video latency instead.
+      with self._states_lock:
+        self._frame_index = self._sync.add_frame(time.time(), None)
+        when = self._sync.frame_time(self._frame_index)
+
+    self._tracker.put_image(self._image, when)
 
 if (__name__ == '__main__'):
   example_app = ExampleApp()
@@ -9,6 +9,7 @@ setup(name='ardrone',
 
     packages=[
       'ardrone', 'ardrone.core', 'ardrone.util', 'ardrone.platform', 'ardrone.qtgui',
+      'ardrone.estimation', 'ardrone.vision', 'ardrone.simulation',
       'ardrone.native',
       'controllers', 'controllers.keyboard'
     ],